@@ -1,20 +1,41 @@
-"""Utility per registrazione e gestione file audio."""
+"""Utility per registrazione e gestione file audio.
+
+La registrazione va su disco mentre procede: il callback di sounddevice copia ogni blocco in
+un buffer circolare preallocato (nessun lock, nessuna allocazione di array), e un thread di
+scrittura lo svuota nel file WAV ogni FLUSH_INTERVAL secondi, aggiornando l'header. La
+memoria resta costante qualunque sia la durata, e dopo un crash il file e' un WAV valido fino
+all'ultimo blocco scritto.
+"""
 
 from __future__ import annotations
 
+import contextlib
+import logging
 import os
+import shutil
 import tempfile
 import threading
+import time
 import types
 from collections.abc import Callable
-from typing import Any
+from typing import IO, Any
+
+log = logging.getLogger("audio")
 
 AUDIO_EXTENSIONS: set[str] = {".mp3", ".wav", ".ogg", ".m4a", ".flac", ".aac", ".wma"}
 
+SAMPLERATE = 44100
+CHANNELS = 1
+# Capienza del buffer circolare: quanto il disco puo' restare indietro prima di perdere audio
+RING_SECONDS = 10
+# Ogni quanto il thread di scrittura svuota il buffer nel file
+FLUSH_INTERVAL = 0.25
+# Ogni quanto i dati scritti vengono forzati su disco (fsync)
+FSYNC_INTERVAL = 5.0
+
 # Lazy import - sounddevice necessario solo per registrazione
 _sd: types.ModuleType | None = None
-_recording_stream: Any = None
-_recording_frames: list[Any] = []
+_recorder: _Recorder | None = None
 _recording_lock: threading.Lock = threading.Lock()
 
 
@@ -51,63 +72,167 @@ def get_temp_wav_path() -> str:
     return path
 
 
-def record_audio(on_chunk: Callable[[int], None] | None = None) -> bool:
-    """Avvia registrazione in background. Ritorna True se avviata."""
-    global _recording_stream, _recording_frames
-    sd = _get_sd()
+class _RingBuffer:
+    """Single-producer, single-consumer ring of int16 frames.
+
+    The audio callback is the only writer of `_head`, the writer thread the only writer of
+    `_tail`; each publishes its counter after touching the data, so no lock is needed.
+    A block that does not fit is dropped whole and counted in `dropped`.
+    """
+
+    def __init__(self, frames: int, channels: int) -> None:
+        import numpy as np
+
+        self._buf = np.zeros((frames, channels), dtype=np.int16)
+        self._size = frames
+        self._head = 0  # frame totali inseriti
+        self._tail = 0  # frame totali estratti
+        self.dropped = 0
+
+    def push(self, block: Any) -> None:
+        n = len(block)
+        if n > self._size - (self._head - self._tail):
+            self.dropped += n
+            return
+        start = self._head % self._size
+        first = min(n, self._size - start)
+        self._buf[start : start + first] = block[:first]
+        if first < n:
+            self._buf[: n - first] = block[first:]
+        self._head += n
+
+    def drain(self, write: Callable[[Any], None]) -> int:
+        """Pass everything pushed so far to `write` (at most two contiguous views); return the frame count."""
+        head = self._head
+        n = head - self._tail
+        if n == 0:
+            return 0
+        start = self._tail % self._size
+        first = min(n, self._size - start)
+        write(self._buf[start : start + first])
+        if first < n:
+            write(self._buf[: n - first])
+        self._tail = head
+        return n
+
+
+class _Recorder:
+    """Input stream feeding a ring buffer, and the thread that writes it to a WAV file."""
+
+    def __init__(self, path: str, on_chunk: Callable[[int], None] | None) -> None:
+        import wave
+
+        self.path = path
+        self.frames = 0
+        self.error: Exception | None = None
+        self._on_chunk = on_chunk
+        self._ring = _RingBuffer(SAMPLERATE * RING_SECONDS, CHANNELS)
+        self._stop = threading.Event()
+        self._file: IO[bytes] = open(path, "wb")  # noqa: SIM115 - chiuso da finish()
+        self._wav = wave.open(self._file, "wb")  # noqa: SIM115 - chiuso da finish()
+        self._wav.setnchannels(CHANNELS)
+        self._wav.setsampwidth(2)  # 16-bit
+        self._wav.setframerate(SAMPLERATE)
+        self._last_sync = time.monotonic()
+        self._stream = _get_sd().InputStream(
+            samplerate=SAMPLERATE, channels=CHANNELS, dtype="int16", callback=self._callback
+        )
+        self._thread = threading.Thread(target=self._run, name="audio-writer", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+        self._stream.start()
+
+    def _callback(self, indata: Any, frames: int, time_info: Any, status: Any) -> None:
+        # Thread audio: solo una copia nel buffer, niente lock ne' allocazioni
+        self._ring.push(indata)
+
+    def _run(self) -> None:
+        while not self._stop.wait(FLUSH_INTERVAL):
+            self._flush()
+        self._flush()
+
+    def _flush(self) -> None:
+        if self.error is not None:
+            return
+        try:
+            # writeframes() aggiorna anche l'header: il file e' un WAV valido dopo ogni blocco
+            written = self._ring.drain(self._wav.writeframes)
+            if not written:
+                return
+            self._file.flush()
+            if time.monotonic() - self._last_sync >= FSYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._last_sync = time.monotonic()
+        except OSError as e:
+            # Disco pieno o rimosso: il file resta valido fino all'ultimo blocco scritto
+            self.error = e
+            log.error("Scrittura registrazione fallita: %s", e)
+            return
+        self.frames += written
+        if self._on_chunk:
+            self._on_chunk(self.frames)
+
+    def finish(self) -> None:
+        """Stop the stream, write what is left and close the file."""
+        try:
+            self._stream.stop()
+            self._stream.close()
+        finally:
+            self._stop.set()
+            self._thread.join()
+            with contextlib.suppress(OSError):
+                self._wav.close()
+                os.fsync(self._file.fileno())
+            self._file.close()
+        if self._ring.dropped:
+            log.warning("Registrazione: %d frame persi (scrittura su disco troppo lenta)", self._ring.dropped)
+
+
+def record_audio(on_chunk: Callable[[int], None] | None = None, save_path: str | None = None) -> bool:
+    """Avvia registrazione in background, scritta man mano in `save_path` (o in un file temporaneo).
+
+    on_chunk(frame scritti) viene chiamato dal thread di scrittura. Ritorna True se avviata.
+    """
+    global _recorder
 
     with _recording_lock:
-        if _recording_stream is not None:
+        if _recorder is not None:
             return False
-        _recording_frames = []
-
-    samplerate = 44100
-    channels = 1
-
-    def callback(indata: Any, frames: int, time_info: Any, status: Any) -> None:
-        with _recording_lock:
-            _recording_frames.append(indata.copy())
-        if on_chunk:
-            on_chunk(len(_recording_frames))
-
-    _recording_stream = sd.InputStream(samplerate=samplerate, channels=channels, dtype="int16", callback=callback)
-    _recording_stream.start()
+        recorder = _Recorder(save_path or get_temp_wav_path(), on_chunk)
+        try:
+            recorder.start()
+        except Exception:
+            recorder.finish()
+            with contextlib.suppress(OSError):
+                os.remove(recorder.path)
+            raise
+        _recorder = recorder
     return True
 
 
 def stop_recording(save_path: str) -> bool:
-    """Ferma registrazione e salva come WAV. Ritorna True se salvato."""
-    import wave
-
-    global _recording_stream, _recording_frames
+    """Ferma registrazione e completa il WAV in `save_path`. Ritorna True se salvato."""
+    global _recorder
 
     with _recording_lock:
-        if _recording_stream is None:
+        if _recorder is None:
             return False
-        stream = _recording_stream
-        frames = _recording_frames[:]
-        _recording_stream = None
-        _recording_frames = []
+        recorder = _recorder
+        _recorder = None
 
-    stream.stop()
-    stream.close()
+    recorder.finish()
 
-    if not frames:
+    if not recorder.frames or recorder.error is not None:
+        if not recorder.frames:
+            with contextlib.suppress(OSError):
+                os.remove(recorder.path)
         return False
-
-    import numpy as np
-
-    audio_data = np.concatenate(frames, axis=0)
-
-    with wave.open(save_path, "wb") as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)  # 16-bit
-        wf.setframerate(44100)
-        wf.writeframes(audio_data.tobytes())
-
+    if os.path.abspath(recorder.path) != os.path.abspath(save_path):
+        shutil.move(recorder.path, save_path)
     return True
 
 
 def is_recording() -> bool:
     """True se una registrazione e' in corso."""
-    return _recording_stream is not None
+    return _recorder is not None
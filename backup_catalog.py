@@ -0,0 +1,126 @@
+"""Catalogo dei backup: un indice JSON accanto ai backup con i metadati di ciascuno.
+
+Per ogni file di backup il catalogo registra dimensione, checksum, numero di note, versione
+dello schema ed esito delle verifiche, scritti alla creazione del backup e aggiornati dalle
+verifiche in background. Il dialog di ripristino legge solo questo file: nessun backup viene
+aperto o ri-hashato a ogni selezione.
+
+Una voce vale solo finche' la dimensione del file coincide; i backup senza voce (creati prima
+del catalogo, o copiati a mano) vengono descritti in un worker da backup_utils.describe_backup().
+"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import threading
+from typing import Any
+
+log = logging.getLogger("backup_catalog")
+
+CATALOG_NAME = "backup_catalog.json"
+CATALOG_VERSION = 1
+
+# Verifica in background e dialog scrivono lo stesso file
+_lock = threading.Lock()
+# backup_dir -> (mtime_ns del catalogo, voci): il file si rilegge solo se cambia
+_cache: dict[str, tuple[int, dict[str, dict[str, Any]]]] = {}
+
+
+def _catalog_path(backup_dir: str) -> str:
+    return os.path.join(backup_dir, CATALOG_NAME)
+
+
+def _read(backup_dir: str) -> dict[str, dict[str, Any]]:
+    path = _catalog_path(backup_dir)
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return {}
+    cached = _cache.get(backup_dir)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+    try:
+        with open(path) as f:
+            data = json.load(f)
+        if data.get("version") != CATALOG_VERSION:
+            raise ValueError(f"versione {data.get('version')}")
+        entries: dict[str, dict[str, Any]] = data["backups"]
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        # Il catalogo e' solo una cache: se illeggibile si ricostruisce voce per voce
+        log.warning("Catalogo backup illeggibile (%s): ricostruzione", e)
+        entries = {}
+    _cache[backup_dir] = (mtime, entries)
+    return entries
+
+
+def _write(backup_dir: str, entries: dict[str, dict[str, Any]]) -> None:
+    path = _catalog_path(backup_dir)
+    tmp = path + ".part"
+    with open(tmp, "w") as f:
+        json.dump({"version": CATALOG_VERSION, "backups": entries}, f, indent=1)
+    os.replace(tmp, path)
+    _cache[backup_dir] = (os.stat(path).st_mtime_ns, entries)
+
+
+def entries(backup_dir: str) -> dict[str, dict[str, Any]]:
+    """All catalog entries of `backup_dir`, by file name (a copy; may include stale entries)."""
+    with _lock:
+        return {name: dict(meta) for name, meta in _read(backup_dir).items()}
+
+
+def get(backup_path: str) -> dict[str, Any] | None:
+    """Entry of one backup; None if missing or recorded for a file of a different size."""
+    backup_dir, name = os.path.split(backup_path)
+    with _lock:
+        meta = _read(backup_dir).get(name)
+    try:
+        if meta is None or meta.get("size") != os.path.getsize(backup_path):
+            return None
+    except OSError:
+        return None
+    return dict(meta)
+
+
+def put(backup_path: str, meta: dict[str, Any]) -> None:
+    """Replace the entry of a backup (at creation, or when describing an unknown file)."""
+    backup_dir, name = os.path.split(backup_path)
+    with _lock:
+        current = _read(backup_dir)
+        current[name] = dict(meta)
+        _write(backup_dir, current)
+
+
+def update(backup_path: str, **changes: Any) -> dict[str, Any]:
+    """Merge `changes` into the entry of a backup (creating it if needed) and return it."""
+    backup_dir, name = os.path.split(backup_path)
+    with _lock:
+        current = _read(backup_dir)
+        meta = current.get(name)
+        size = os.path.getsize(backup_path)
+        if meta is None or meta.get("size") != size:
+            meta = {"size": size}
+        meta.update(changes)
+        current[name] = meta
+        _write(backup_dir, current)
+        return dict(meta)
+
+
+def remove(backup_path: str) -> None:
+    backup_dir, name = os.path.split(backup_path)
+    with _lock:
+        current = _read(backup_dir)
+        if current.pop(name, None) is not None:
+            _write(backup_dir, current)
+
+
+def prune(backup_dir: str) -> None:
+    """Drop the entries of backups that no longer exist (deleted or moved by hand)."""
+    with _lock:
+        current = _read(backup_dir)
+        gone = [name for name in current if not os.path.exists(os.path.join(backup_dir, name))]
+        for name in gone:
+            del current[name]
+        if gone:
+            _write(backup_dir, current)
@@ -2,18 +2,25 @@
 
 from __future__ import annotations
 
+import contextlib
 import hashlib
 import json
 import logging
 import os
 import shutil
 import sqlite3
+import sys
 import threading
-from collections.abc import Callable
+import time
+import zlib
+from collections.abc import Callable, Iterator
 from datetime import datetime, timedelta
-from typing import Any
+from typing import Any, Protocol, cast
 
+import backup_catalog
+import change_journal
 import database as db
+import perf_utils
 
 # Re-export GDrive functions for backward compatibility
 from gdrive_utils import (
@@ -22,11 +29,30 @@ from gdrive_utils import (
 from gdrive_utils import (
     is_gdrive_configured as is_gdrive_configured,
 )
+from gdrive_utils import (
+    upload_gdrive_backup as upload_gdrive_backup,
+)
 
 log: logging.Logger = logging.getLogger("backup")
 
 SETTINGS_PATH: str = os.path.join(db.DATA_DIR, "backup_settings.json")
 
+# Dimensione dei blocchi letti dal database e passati lungo la pipeline di backup
+PIPELINE_CHUNK: int = 1024 * 1024
+# Database letti in memoria per il backup (lock di lettura solo per la lettura del file)
+SNAPSHOT_MEMORY_MAX: int = 256 * 1024 * 1024
+# "gzip" (zlib, sempre disponibile), "zstd" (pacchetto zstandard, opzionale) o "none"
+DEFAULT_COMPRESSION: str = "gzip"
+DEFAULT_COMPRESSION_LEVEL: int = 3
+# Livelli accettati da ogni algoritmo (zstd arriva a 22, ma oltre 19 serve molta memoria)
+COMPRESSION_LEVELS: dict[str, tuple[int, int]] = {"gzip": (1, 9), "zstd": (1, 19)}
+
+# Ogni backup ha una voce nel catalogo (backup_catalog.py) con checksum, numero di note ed
+# esito delle verifiche. Ogni backup riceve un integrity_check completo (e la verifica del
+# checksum) almeno ogni FULL_CHECK_DAYS giorni, un backup per volta, in background.
+FULL_CHECK_DAYS: int = 7
+VERIFY_INTERVAL_MINUTES: int = 60
+
 
 def get_settings() -> dict[str, Any]:
     defaults = {
@@ -38,6 +64,8 @@ def get_settings() -> dict[str, Any]:
         "retention_days": 90,
         "max_gdrive_backups": 20,
         "encrypt_backups": False,
+        "backup_compression": DEFAULT_COMPRESSION,
+        "backup_compression_level": DEFAULT_COMPRESSION_LEVEL,
         "backup_interval_minutes": 0,
         "last_backup_time": "",
     }
@@ -109,6 +137,7 @@ def has_backup_password() -> bool:
 # --- Integrity & Checksum ---
 
 
+@perf_utils.timed("backup.verify_backup_integrity")
 def verify_backup_integrity(backup_path: str) -> tuple[bool, str]:
     """Esegue PRAGMA integrity_check su un backup .db. Ritorna (bool, msg)."""
     try:
@@ -122,6 +151,7 @@ def verify_backup_integrity(backup_path: str) -> tuple[bool, str]:
         return False, f"Errore verifica: {e}"
 
 
+@perf_utils.timed("backup.compute_checksum")
 def compute_checksum(file_path: str) -> str:
     """Calcola SHA-256 hex di un file."""
     h = hashlib.sha256()
@@ -131,9 +161,10 @@ def compute_checksum(file_path: str) -> str:
     return h.hexdigest()
 
 
-def save_checksum(backup_path: str) -> str:
-    """Scrive file .sha256 sidecar accanto al backup."""
-    checksum = compute_checksum(backup_path)
+def save_checksum(backup_path: str, checksum: str | None = None) -> str:
+    """Scrive file .sha256 sidecar accanto al backup (calcolandolo se non fornito)."""
+    if checksum is None:
+        checksum = compute_checksum(backup_path)
     sidecar = backup_path + ".sha256"
     with open(sidecar, "w") as f:
         f.write(checksum)
@@ -155,6 +186,7 @@ def verify_checksum(backup_path: str) -> tuple[bool | None, str]:
     return False, "Checksum non corrisponde: file modificato o corrotto"
 
 
+@perf_utils.timed("backup.get_note_count_from_backup")
 def get_note_count_from_backup(path: str) -> int:
     """Apre un backup db e conta le note non cancellate."""
     try:
@@ -166,101 +198,539 @@ def get_note_count_from_backup(path: str) -> int:
         return -1
 
 
-# --- Restore ---
+# --- Metadati e verifica a livelli ---
+
+
+def backup_status(backup_path: str) -> dict[str, Any] | None:
+    """Catalog entry of a backup, without touching the backup; None if it is not catalogued yet."""
+    return backup_catalog.get(backup_path)
+
+
+def _schema_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+@perf_utils.timed("backup.describe_backup")
+def describe_backup(backup_path: str) -> dict[str, Any]:
+    """Catalog a backup that has no entry (made before the catalog, or copied in by hand).
+
+    Plain .db backups are counted and quick_checked and their checksum sidecar is verified;
+    compressed or encrypted ones get only the recorded checksum (the full check fills in
+    the rest). Slow on big backups: meant for a worker thread.
+    """
+    meta = backup_catalog.get(backup_path)
+    if meta is not None:
+        return meta
+    changes: dict[str, Any] = {}
+    info = db.parse_backup_name(os.path.basename(backup_path))
+    if info is None or not (info["encrypted"] or info["compression"]):
+        ok, msg = quick_check_backup(backup_path)
+        changes = {
+            "note_count": get_note_count_from_backup(backup_path),
+            "quick_check": msg,
+            "quick_check_ok": ok,
+        }
+        with contextlib.suppress(sqlite3.Error), contextlib.closing(sqlite3.connect(backup_path)) as conn:
+            changes["schema_version"] = _schema_version(conn)
+    sidecar = backup_path + ".sha256"
+    if os.path.exists(sidecar):
+        with open(sidecar) as f:
+            changes["checksum"] = f.read().strip()
+        changes["checksum_ok"] = compute_checksum(backup_path) == changes["checksum"]
+        changes["checksum_checked_at"] = datetime.now().isoformat(timespec="seconds")
+    return backup_catalog.update(backup_path, **changes)
+
+
+def _quick_check(conn: sqlite3.Connection) -> tuple[bool, str]:
+    result = conn.execute("PRAGMA quick_check").fetchone()
+    if result and result[0] == "ok":
+        return True, "Verifica rapida OK"
+    return False, f"Verifica rapida fallita: {result[0] if result else 'nessun risultato'}"
+
+
+def quick_check_backup(backup_path: str) -> tuple[bool, str]:
+    """PRAGMA quick_check on a plain .db backup: O(pages), skips index cross-checks."""
+    try:
+        conn = sqlite3.connect(backup_path)
+        try:
+            return _quick_check(conn)
+        finally:
+            conn.close()
+    except Exception as e:
+        return False, f"Errore verifica: {e}"
+
+
+@perf_utils.timed("backup.verify_backup_full")
+def verify_backup_full(backup_path: str, password: str | None = None) -> dict[str, Any]:
+    """Checksum + full integrity_check of a backup, recorded in the backup catalog.
+
+    Compressed and encrypted backups are decoded to a temporary file first. Returns the
+    updated metadata; "integrity_ok" is None when the backup could not be decoded (no
+    password), so it is tried again later.
+    """
+    status = describe_backup(backup_path)
+    now = datetime.now().isoformat(timespec="seconds")
+    changes: dict[str, Any] = {}
+    if status.get("checksum"):
+        changes["checksum_ok"] = compute_checksum(backup_path) == status["checksum"]
+        changes["checksum_checked_at"] = now
+
+    info = db.parse_backup_name(os.path.basename(backup_path)) or {"compression": None, "encrypted": False}
+    if info["encrypted"] and not password:
+        return backup_catalog.update(backup_path, **changes)
+
+    source = backup_path
+    temp = None
+    try:
+        if info["encrypted"] or info["compression"]:
+            temp = backup_path + ".verify"
+            with open(temp, "wb") as out:
+                for chunk in iter_backup_plaintext(backup_path, password):
+                    out.write(chunk)
+            source = temp
+        ok, msg = verify_backup_integrity(source)
+        if temp is not None and ok:
+            changes["note_count"] = get_note_count_from_backup(source)
+            with contextlib.closing(sqlite3.connect(source)) as conn:
+                changes["schema_version"] = _schema_version(conn)
+    except Exception as e:
+        ok, msg = False, f"Errore verifica: {e}"
+    finally:
+        if temp is not None:
+            with contextlib.suppress(OSError):
+                os.remove(temp)
+    changes.update(integrity_ok=ok, integrity=msg, integrity_checked_at=now)
+    if not ok:
+        log.warning("Verifica completa fallita per %s: %s", os.path.basename(backup_path), msg)
+    if changes.get("checksum_ok") is False:
+        log.warning("Checksum non corrisponde per %s", os.path.basename(backup_path))
+    return backup_catalog.update(backup_path, **changes)
 
 
-def restore_from_backup(path: str, password: str | None = None) -> tuple[bool, str, str | None]:
-    """Ripristina un backup. Crea safety backup prima.
-    Ritorna (success, message, safety_path).
+def _stale_for_full_check(meta: dict[str, Any], cutoff: datetime) -> bool:
+    checked = meta.get("integrity_checked_at")
+    return checked is None or datetime.fromisoformat(checked) < cutoff
+
+
+def run_scheduled_verification(backup_dir: str | None = None, max_age_days: int = FULL_CHECK_DAYS) -> str | None:
+    """Fully verify the backup whose last full check is the oldest, if older than `max_age_days`.
+
+    One backup per call, so the cost is spread over the scheduler ticks; encrypted backups are
+    skipped while the backup password is not in memory. Returns the verified path, or None.
+    """
+    backup_dir = backup_dir or get_settings().get("local_backup_dir", db.BACKUP_DIR)
+    cutoff = datetime.now() - timedelta(days=max_age_days)
+    password = get_backup_password()
+    candidates: list[tuple[str, str]] = []
+    for b in db.get_backups(backup_dir):
+        if b["encrypted"] and password is None:
+            continue
+        meta = describe_backup(b["path"])
+        if _stale_for_full_check(meta, cutoff):
+            candidates.append((meta.get("integrity_checked_at") or "", b["path"]))
+    if not candidates:
+        return None
+    _checked_at, path = min(candidates)
+    meta = verify_backup_full(path, password)
+    log.info("Verifica completa %s: %s", os.path.basename(path), meta.get("integrity", "?"))
+    return path
+
+
+# ioprio_set(2): numero della syscall per architettura, classe "best effort" al livello piu' basso
+_IOPRIO_SET_SYSCALL: dict[str, int] = {"x86_64": 251, "aarch64": 30, "i686": 289}
+_IOPRIO_WHO_PROCESS = 1
+_IOPRIO_BEST_EFFORT_LOWEST = (2 << 13) | 7
+
+
+def _background_priority() -> None:
+    """Lower the CPU and I/O priority of the calling thread (best effort, per thread).
+
+    Windows: background processing mode (low CPU, I/O and memory priority). Linux: nice 19
+    and the lowest best-effort I/O priority; not the idle I/O class, which can starve the
+    backup's read transaction (and with it the writers waiting on it) under load.
     """
+    with contextlib.suppress(Exception):
+        if os.name == "nt":
+            import ctypes
+
+            thread_mode_background_begin = 0x00010000
+            ctypes.windll.kernel32.SetThreadPriority(  # type: ignore[attr-defined]
+                ctypes.windll.kernel32.GetCurrentThread(),  # type: ignore[attr-defined]
+                thread_mode_background_begin,
+            )
+            return
+        tid = threading.get_native_id()
+        # Su Linux PRIO_PROCESS con il tid agisce sul solo thread
+        os.setpriority(os.PRIO_PROCESS, tid, 19)
+        syscall = _IOPRIO_SET_SYSCALL.get(os.uname().machine)
+        if syscall is not None and sys.platform == "linux":
+            import ctypes
+
+            ctypes.CDLL(None, use_errno=True).syscall(syscall, _IOPRIO_WHO_PROCESS, tid, _IOPRIO_BEST_EFFORT_LOWEST)
+
+
+# --- Backup pipeline ---
+#
+# Il database viene letto una sola volta, a blocchi, dentro una transazione di lettura (le
+# scritture aspettano: la copia e' coerente) e ogni blocco attraversa
+#   compressione -> crittografia a blocchi -> scrittura con hash
+# fino al file finale. Il checksum sidecar e' l'hash dei byte scritti, disponibile a fine
+# scrittura senza rileggere il file.
+
+
+class _Codec(Protocol):
+    """compressobj / decompressobj di zlib e zstandard."""
+
+    def flush(self) -> bytes: ...
+
+
+class _Compressor(_Codec, Protocol):
+    def compress(self, data: bytes, /) -> bytes: ...
+
+
+class _Decompressor(_Codec, Protocol):
+    def decompress(self, data: bytes, /) -> bytes: ...
+
+
+def available_compressions() -> list[str]:
+    """Compression formats usable here ("zstd" needs the optional zstandard package)."""
+    algorithms = ["gzip"]
     try:
-        # Safety backup
-        os.makedirs(PRE_RESTORE_DIR, exist_ok=True)
-        ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-        safety_path = os.path.join(PRE_RESTORE_DIR, f"pre_restore_{ts}.db")
-        if os.path.exists(db.DB_PATH):
-            shutil.copy2(db.DB_PATH, safety_path)
-
-        source = path
-        temp_decrypted = None
-
-        # Se file crittografato, decritta in temp
-        if path.endswith(".db.enc"):
+        import zstandard  # noqa: F401
+    except ImportError:
+        pass
+    else:
+        algorithms.append("zstd")
+    return algorithms
+
+
+def _clamp_level(algorithm: str, level: int) -> int:
+    low, high = COMPRESSION_LEVELS[algorithm]
+    return max(low, min(level, high))
+
+
+def _compressor(algorithm: str, level: int) -> _Compressor:
+    level = _clamp_level(algorithm, level)
+    if algorithm == "zstd":
+        import zstandard
+
+        return cast(_Compressor, zstandard.ZstdCompressor(level=level).compressobj())
+    # wbits=31: formato gzip, il file .gz si apre anche con gli strumenti standard
+    return zlib.compressobj(level, zlib.DEFLATED, 31)
+
+
+def _decompressor(algorithm: str) -> _Decompressor:
+    if algorithm == "zstd":
+        try:
+            import zstandard
+        except ImportError as e:
+            raise ValueError("Backup zstd: installa il pacchetto zstandard per ripristinarlo") from e
+
+        return cast(_Decompressor, zstandard.ZstdDecompressor().decompressobj())
+    return zlib.decompressobj(31)
+
+
+class _HashingWriter:
+    """Last pipeline stage: write to `<path>.part` and hash what is written."""
+
+    def __init__(self, path: str) -> None:
+        self.part = path + ".part"
+        self._file = open(self.part, "wb")  # noqa: SIM115 - chiuso da close()/abort()
+        self._hash = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data: bytes) -> None:
+        if data:
+            self._hash.update(data)
+            self._file.write(data)
+            self.size += len(data)
+
+    def close(self) -> str:
+        self._file.close()
+        return self._hash.hexdigest()
+
+    def abort(self) -> None:
+        self._file.close()
+        with contextlib.suppress(OSError):
+            os.remove(self.part)
+
+
+@contextlib.contextmanager
+def _database_snapshot() -> Iterator[tuple[Iterator[bytes], dict[str, Any]]]:
+    """Chunks of the database file, read inside a read transaction so they form a consistent copy.
+
+    Up to SNAPSHOT_MEMORY_MAX the file is read into memory and the read lock is released
+    right away: compression, encryption and the write to the (possibly slow) destination
+    then run without holding up GUI writes, which would otherwise wait up to
+    database.BUSY_TIMEOUT_S. Larger databases are streamed from inside the transaction.
+
+    Also yields {"quick_check", "quick_check_ok", "note_count", "schema_version"} of the same
+    snapshot. A failed quick_check is logged (the backup is still written: it may be the
+    best copy available).
+    """
+    with db._connect() as conn:
+        conn.execute("BEGIN")
+        # Le prime letture prendono il lock condiviso: da qui il file non cambia
+        checks: dict[str, Any] = {
+            "note_count": conn.execute("SELECT COUNT(*) FROM notes WHERE is_deleted = 0").fetchone()[0],
+            "schema_version": _schema_version(conn),
+        }
+        try:
+            if os.path.getsize(db.DB_PATH) <= SNAPSHOT_MEMORY_MAX:
+                with open(db.DB_PATH, "rb") as f:
+                    data = f.read()
+            else:
+                data = None
+                _add_quick_check(checks, conn)
+
+                def _file_chunks() -> Iterator[bytes]:
+                    with open(db.DB_PATH, "rb") as f:
+                        while chunk := f.read(PIPELINE_CHUNK):
+                            yield chunk
+
+                yield _file_chunks(), checks
+        finally:
+            conn.rollback()
+    if data is None:
+        return
+
+    # Verifica sulla copia in memoria, a lock gia' rilasciato
+    copy = sqlite3.connect(":memory:")
+    try:
+        copy.deserialize(data)
+        _add_quick_check(checks, copy)
+    finally:
+        copy.close()
+    view = memoryview(data)
+    yield (view[i : i + PIPELINE_CHUNK].tobytes() for i in range(0, len(view), PIPELINE_CHUNK)), checks
+
+
+def _add_quick_check(checks: dict[str, Any], conn: sqlite3.Connection) -> None:
+    quick_ok, quick_msg = _quick_check(conn)
+    if not quick_ok:
+        log.warning("Database: %s", quick_msg)
+    checks.update(quick_check=quick_msg, quick_check_ok=quick_ok)
+
+
+@perf_utils.timed("backup.write_backup")
+def write_backup(
+    dest_dir: str,
+    compression: str | None = DEFAULT_COMPRESSION,
+    level: int = DEFAULT_COMPRESSION_LEVEL,
+    password: str | None = None,
+) -> dict[str, Any]:
+    """Write a backup of the database in one pass and return its metadata.
+
+    {"path", "size", "checksum" (sha256 of the file), "db_size", "db_sha256" (of the
+    database copy), "note_count", "quick_check", "journal_from" (first change journal
+    segment not in the backup), ...}. The file is written as `<name>.part` and renamed
+    when complete; then the .sha256 sidecar and the catalog entry.
+    """
+    if compression == "none" or compression is None:
+        compression = None
+    elif compression not in available_compressions():
+        log.warning("Compressione %s non disponibile, uso gzip", compression)
+        compression = "gzip"
+
+    os.makedirs(dest_dir, exist_ok=True)
+    path = os.path.join(dest_dir, db.backup_filename(datetime.now(), compression, encrypted=password is not None))
+    writer = _HashingWriter(path)
+    try:
+        sink: Callable[[bytes], None] = writer.write
+        encryptor = None
+        if password is not None:
+            import crypto_utils
+
+            encryptor = crypto_utils.StreamEncryptor(writer.write, password)
+            sink = encryptor.write
+        compressor = _compressor(compression, level) if compression else None
+
+        db_hash = hashlib.sha256()
+        db_size = 0
+        # Prima della lettura: i segmenti precedenti contengono solo commit gia' nel backup
+        journal_from = change_journal.rotate()
+        with _database_snapshot() as (chunks, checks):
+            for chunk in chunks:
+                db_hash.update(chunk)
+                db_size += len(chunk)
+                sink(compressor.compress(chunk) if compressor else chunk)
+        if compressor:
+            sink(compressor.flush())
+        if encryptor:
+            encryptor.close()
+        checksum = writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+
+    os.replace(writer.part, path)
+    save_checksum(path, checksum)
+    meta = {
+        "size": writer.size,
+        "checksum": checksum,
+        "db_size": db_size,
+        "db_sha256": db_hash.hexdigest(),
+        "created_at": datetime.now().isoformat(timespec="seconds"),
+        "journal_from": journal_from,
+        **checks,
+    }
+    backup_catalog.put(path, meta)
+    return {"path": path, **meta}
+
+
+def iter_backup_plaintext(path: str, password: str | None = None) -> Iterator[bytes]:
+    """Chunks of the SQLite database stored in a backup file (decrypted and decompressed).
+
+    The format comes from the file name (see database.parse_backup_name). Raises
+    ValueError when an encrypted backup has no password or cannot be decrypted.
+    """
+    info = db.parse_backup_name(os.path.basename(path)) or {"compression": None, "encrypted": False}
+    with open(path, "rb") as f:
+        chunks: Iterator[bytes]
+        if info["encrypted"]:
             if not password:
-                return False, "Password richiesta per backup crittografato", safety_path
+                raise ValueError("Password richiesta per backup crittografato")
             import crypto_utils
 
-            temp_decrypted = path + ".tmp"
-            ok, err = crypto_utils.decrypt_file(path, temp_decrypted, password)
-            if not ok:
-                if os.path.exists(temp_decrypted):
-                    os.remove(temp_decrypted)
-                detail = f"\n({err})" if err else ""
-                return False, f"Decrittografia fallita: password errata?{detail}", safety_path
-            source = temp_decrypted
+            chunks = crypto_utils.decrypt_file_chunks(f, password)
+        else:
+            chunks = iter(lambda: f.read(PIPELINE_CHUNK), b"")
+        if info["compression"] is None:
+            yield from chunks
+            return
+        decompressor = _decompressor(info["compression"])
+        for chunk in chunks:
+            if out := decompressor.decompress(chunk):
+                yield out
+        if tail := decompressor.flush():
+            yield tail
 
-        # Verifica integrita' prima del ripristino
-        ok, msg = verify_backup_integrity(source)
-        if not ok:
-            if temp_decrypted and os.path.exists(temp_decrypted):
-                os.remove(temp_decrypted)
-            return False, f"Backup corrotto: {msg}", safety_path
 
-        # Copia su DB principale
-        shutil.copy2(source, db.DB_PATH)
+# --- Restore ---
+
 
-        if temp_decrypted and os.path.exists(temp_decrypted):
-            os.remove(temp_decrypted)
+def journal_replay_range(backup_path: str) -> tuple[datetime, datetime] | None:
+    """(backup time, last journaled change) if the journal can bring this backup forward, else None.
+
+    Only the latest local backup qualifies: older ones had their journal compacted away.
+    """
+    meta = backup_catalog.get(backup_path)
+    if meta is None or not change_journal.available_from(meta.get("journal_from")):
+        return None
+    last = change_journal.last_record_time(meta["journal_from"])
+    if last is None:
+        return None
+    return datetime.fromisoformat(meta["created_at"]), last
+
+
+@perf_utils.timed("backup.restore_from_backup")
+def restore_from_backup(
+    path: str, password: str | None = None, replay_until: datetime | None = None
+) -> tuple[bool, str, str | None]:
+    """Ripristina un backup. Ritorna (success, message, safety_path).
+
+    Il backup viene decrittato, decompresso e scritto in un solo passaggio in un file
+    temporaneo accanto al database, verificato e poi sostituito al database con os.replace.
+    Con `replay_until` le modifiche del journal fino a quell'istante vengono riapplicate
+    alla copia prima della sostituzione (vedi journal_replay_range). Il database precedente
+    resta in PRE_RESTORE_DIR come hard link (nessuna copia se il filesystem lo permette).
+    Le connessioni sono aperte per operazione: dopo il ritorno le nuove letture vedono il
+    database ripristinato, senza riavviare l'app.
+    """
+    info = db.parse_backup_name(os.path.basename(path))
+    if info is not None and info["encrypted"] and not password:
+        return False, "Password richiesta per backup crittografato", None
+
+    target = db.DB_PATH + ".restore"
+    try:
+        try:
+            with open(target, "wb") as out:
+                for chunk in iter_backup_plaintext(path, password):
+                    out.write(chunk)
+            ok, msg = verify_backup_integrity(target)
+            if not ok:
+                os.remove(target)
+                return False, f"Backup corrotto: {msg}", None
+        except Exception as e:
+            with contextlib.suppress(OSError):
+                os.remove(target)
+            if info is not None and info["encrypted"]:
+                return False, f"Decrittografia fallita: password errata?\n({e})", None
+            if info is not None and info["compression"]:
+                return False, f"Decompressione fallita: {e}", None
+            raise
+
+        message = "Backup ripristinato con successo"
+        if replay_until is not None:
+            meta = backup_catalog.get(path)
+            if meta is None or not change_journal.available_from(meta.get("journal_from")):
+                os.remove(target)
+                return False, "Journal delle modifiche non disponibile per questo backup", None
+            stats = change_journal.replay(target, meta["journal_from"], replay_until)
+            message += f"\nModifiche riapplicate fino al {replay_until:%d/%m/%Y %H:%M}: {stats['applied']}"
+            if stats["conflicts"]:
+                message += f" ({stats['conflicts']} non applicabili, vedi log)"
+
+        safety_path = _keep_pre_restore_copy()
+        os.replace(target, db.DB_PATH)
+        db._secure_file(db.DB_PATH)
+        db.invalidate_cache()
+        # Il journal descriveva il database sostituito; le eliminazioni riapplicate liberano gli allegati
+        change_journal.reset()
+        db.flush_file_deletions()
 
         log.info("Backup ripristinato da %s (safety: %s)", path, safety_path)
-        return True, "Backup ripristinato con successo", safety_path
+        return True, message, safety_path
 
     except Exception as e:
+        with contextlib.suppress(OSError):
+            os.remove(target)
         log.warning("Ripristino fallito: %s", e)
         return False, f"Errore ripristino: {e}", None
 
 
+def _keep_pre_restore_copy() -> str | None:
+    """Keep the current database in PRE_RESTORE_DIR: a hard link if possible, else a copy."""
+    if not os.path.exists(db.DB_PATH):
+        return None
+    os.makedirs(PRE_RESTORE_DIR, exist_ok=True)
+    ts = datetime.now().strftime("%Y%m%d_%H%M%S")
+    safety_path = os.path.join(PRE_RESTORE_DIR, f"pre_restore_{ts}.db")
+    try:
+        # os.replace sul database stacca il link: il file resta com'era
+        os.link(db.DB_PATH, safety_path)
+    except OSError:
+        shutil.copy2(db.DB_PATH, safety_path)
+    return safety_path
+
+
 # --- Local Backup ---
 
 
+@perf_utils.timed("backup.do_local_backup")
 def do_local_backup() -> str:
     settings = get_settings()
     dest = settings.get("local_backup_dir", db.BACKUP_DIR)
     log.info("Avvio backup locale in: %s", dest)
-    backup_path = db.create_backup(dest)
-
-    # Verifica integrita'
-    ok, msg = verify_backup_integrity(backup_path)
-    if not ok:
-        log.warning("Integrita' backup fallita: %s", msg)
-    else:
-        log.info("Integrita' backup verificata: OK")
-
-    # Salva checksum sidecar
-    save_checksum(backup_path)
 
-    # Crittografia se abilitata
-    if settings.get("encrypt_backups"):
-        password = get_backup_password()
-        if password:
-            try:
-                import crypto_utils
-
-                enc_path = backup_path + ".enc"
-                crypto_utils.encrypt_file(backup_path, enc_path, password)
-                os.remove(backup_path)
-                # Aggiorna sidecar per file crittografato
-                os.remove(backup_path + ".sha256")
-                save_checksum(enc_path)
-                backup_path = enc_path
-                log.info("Backup crittografato: %s", backup_path)
-            except Exception as e:
-                log.warning("Crittografia backup fallita: %s", e)
+    password = get_backup_password() if settings.get("encrypt_backups") else None
+    if settings.get("encrypt_backups") and password is None:
+        log.warning("Crittografia backup attiva ma password non disponibile: backup in chiaro")
+    result = write_backup(
+        dest,
+        settings.get("backup_compression", DEFAULT_COMPRESSION),
+        settings.get("backup_compression_level", DEFAULT_COMPRESSION_LEVEL),
+        password=password,
+    )
+    backup_path: str = result["path"]
+    ratio = result["size"] / max(result["db_size"], 1)
+    log.info("Backup scritto: %d -> %d byte (%.0f%%)", result["db_size"], result["size"], ratio * 100)
 
     max_backups = settings.get("max_local_backups", 10)
     retention_days = settings.get("retention_days", 90)
     _cleanup_old_backups(dest, max_backups, retention_days)
     log.info("Pulizia backup locali completata")
+    change_journal.compact(result["journal_from"])
 
     # Aggiorna last_backup_time
     settings["last_backup_time"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
@@ -273,26 +743,17 @@ def do_local_backup() -> str:
 def _cleanup_old_backups(backup_dir: str, max_count: int, retention_days: int = 0) -> None:
     if not os.path.exists(backup_dir):
         return
-    backups = sorted(
-        [
-            f
-            for f in os.listdir(backup_dir)
-            if f.startswith("mynotes_backup_") and (f.endswith(".db") or f.endswith(".db.enc"))
-        ]
-    )
+    parsed = {
+        f: info
+        for f in os.listdir(backup_dir)
+        if f.startswith(db.BACKUP_PREFIX) and (info := db.parse_backup_name(f)) is not None
+    }
+    # Ordine per data (i formati diversi non si ordinano per nome)
+    backups = sorted(parsed, key=lambda f: (parsed[f]["timestamp"] or datetime.min, f))
     # Prima cancella per eta
     if retention_days > 0:
         cutoff = datetime.now() - timedelta(days=retention_days)
-        expired = []
-        for f in backups:
-            try:
-                # Rimuovi suffisso per parsing data
-                name = f.replace(".db.enc", ".db")
-                ts = datetime.strptime(name, "mynotes_backup_%Y%m%d_%H%M%S.db")
-                if ts < cutoff:
-                    expired.append(f)
-            except ValueError:
-                continue
+        expired = [f for f in backups if parsed[f]["timestamp"] is not None and parsed[f]["timestamp"] < cutoff]
         for f in expired:
             _remove_backup_file(backup_dir, f)
             backups.remove(f)
@@ -300,16 +761,16 @@ def _cleanup_old_backups(backup_dir: str, max_count: int, retention_days: int =
     while len(backups) > max_count:
         old = backups.pop(0)
         _remove_backup_file(backup_dir, old)
+    backup_catalog.prune(backup_dir)
 
 
 def _remove_backup_file(backup_dir: str, filename: str) -> None:
-    """Rimuove un file backup e il suo sidecar .sha256."""
+    """Rimuove un file backup, il suo sidecar .sha256 e la sua voce nel catalogo."""
     path = os.path.join(backup_dir, filename)
-    if os.path.exists(path):
-        os.remove(path)
-    sidecar = path + ".sha256"
-    if os.path.exists(sidecar):
-        os.remove(sidecar)
+    for f in (path, path + ".sha256"):
+        if os.path.exists(f):
+            os.remove(f)
+    backup_catalog.remove(path)
 
 
 def do_full_backup(callback: Callable[[bool, str], None] | None = None) -> None:
@@ -323,7 +784,7 @@ def do_full_backup(callback: Callable[[bool, str], None] | None = None) -> None:
             if callback:
                 callback(success, f"Backup locale: {backup_path}\n{msg}")
 
-        do_gdrive_backup(_cb)
+        do_gdrive_backup(_cb, backup_path)
     else:
         if callback:
             callback(True, f"Backup locale creato:\n{backup_path}")
@@ -333,14 +794,33 @@ def do_full_backup(callback: Callable[[bool, str], None] | None = None) -> None:
 
 
 class BackupScheduler:
-    """Scheduler per backup automatici basato su QTimer."""
+    """Scheduler per backup automatici basato su QTimer.
+
+    Ogni `backup_interval_minutes` esegue backup locale (+ Drive) solo se il database e'
+    cambiato dall'ultimo backup (database.data_generation()), e non mentre l'utente sta
+    scrivendo: `last_activity` restituisce il time.monotonic() dell'ultima modifica e il
+    backup viene rimandato finche' non passano IDLE_SECONDS. Backup e verifiche girano in
+    un thread a bassa priorita', mai due insieme.
+    """
+
+    IDLE_SECONDS = 60
+    DEFER_MS = 30 * 1000
 
-    def __init__(self, parent: Any) -> None:
+    def __init__(self, parent: Any, last_activity: Callable[[], float] | None = None) -> None:
         from PySide6.QtCore import QTimer
 
         self._timer = QTimer(parent)
+        self._timer.setSingleShot(True)
         self._timer.timeout.connect(self._tick)
         self._interval_ms = 0
+        # Verifica completa dei backup, un backup per volta
+        self._verify_timer = QTimer(parent)
+        self._verify_timer.timeout.connect(self._verify_tick)
+        self._verify_timer.start(VERIFY_INTERVAL_MINUTES * 60 * 1000)
+        self._run_lock = threading.Lock()
+        self._last_activity = last_activity
+        # data_generation() al momento dell'ultimo backup riuscito; None = da fare
+        self._backed_up_generation: int | None = None
 
     def start(self) -> None:
         """Legge intervallo da settings e schedula il prossimo backup."""
@@ -349,6 +829,8 @@ class BackupScheduler:
         minutes = settings.get("backup_interval_minutes", 0)
         if minutes <= 0:
             return
+        if self._backed_up_generation is None and self._backup_is_current(settings):
+            self._backed_up_generation = db.data_generation()
         self._interval_ms = minutes * 60 * 1000
         self._timer.start(self._interval_ms)
         log.info("Scheduler avviato: ogni %d minuti", minutes)
@@ -357,24 +839,81 @@ class BackupScheduler:
         """Cancella il timer schedulato."""
         self._timer.stop()
 
+    def shutdown(self) -> None:
+        """Ferma backup e verifiche schedulati (chiusura app)."""
+        self.stop()
+        self._verify_timer.stop()
+
+    @staticmethod
+    def _backup_is_current(settings: dict[str, Any]) -> bool:
+        """True if the database file has not changed since the last backup (previous sessions)."""
+        try:
+            last = datetime.strptime(settings.get("last_backup_time", ""), "%Y-%m-%d %H:%M:%S")
+            return datetime.fromtimestamp(os.path.getmtime(db.DB_PATH)) <= last
+        except (ValueError, OSError):
+            return False
+
+    def _user_active(self) -> bool:
+        if self._last_activity is None:
+            return False
+        last = self._last_activity()
+        return bool(last) and time.monotonic() - last < self.IDLE_SECONDS
+
+    def _verify_tick(self) -> None:
+        """Verifica completa di un backup in thread a priorita' minima."""
+        if self._user_active() or not self._run_lock.acquire(blocking=False):
+            return
+
+        def _run() -> None:
+            try:
+                _background_priority()
+                run_scheduled_verification()
+            except Exception as e:
+                log.warning("Verifica backup fallita: %s", e)
+            finally:
+                self._run_lock.release()
+
+        threading.Thread(target=_run, daemon=True).start()
+
     def _tick(self) -> None:
-        """Esegue backup in thread."""
+        """Esegue backup in thread, se serve e se l'utente non sta scrivendo."""
+        generation = db.data_generation()
+        if generation == self._backed_up_generation:
+            log.debug("Scheduler: nessuna modifica dall'ultimo backup, salto")
+            self._timer.start(self._interval_ms)
+            return
+        if self._user_active() or not self._run_lock.acquire(blocking=False):
+            # Utente attivo o backup/verifica ancora in corso: riprova tra poco
+            self._timer.start(self.DEFER_MS)
+            return
+        self._timer.start(self._interval_ms)
 
         def _run() -> None:
             try:
+                _background_priority()
                 settings = get_settings()
                 if settings.get("encrypt_backups") and not has_backup_password():
                     log.warning("Scheduler: backup saltato — password crittografia non disponibile")
                     return
-                do_local_backup()
+                path = do_local_backup()
+                # Le modifiche arrivate durante il backup restano da salvare
+                self._backed_up_generation = generation
                 if settings.get("gdrive_enabled") and is_gdrive_configured():
-                    do_gdrive_backup()
+                    upload_gdrive_backup(path)
                 log.info("Scheduler: backup completato")
             except Exception as e:
                 log.warning("Scheduler: backup fallito: %s", e)
+            finally:
+                self._run_lock.release()
 
         threading.Thread(target=_run, daemon=True).start()
 
+    @contextlib.contextmanager
+    def paused(self) -> Iterator[None]:
+        """Wait for a running backup or verification and hold new ones off (restore)."""
+        with self._run_lock:
+            yield
+
     def restart_if_settings_changed(self) -> None:
         """Riavvia lo scheduler con le nuove impostazioni."""
         self.start()
@@ -0,0 +1,580 @@
+#!/usr/bin/env python3
+"""MyNotes - Benchmark su librerie sintetiche.
+
+Genera librerie di note realistiche (categorie annidate, tag, allegati, versioni)
+in una DATA_DIR temporanea e misura i percorsi caldi di database.py e dei controller.
+
+Uso:
+    python benchmark.py                                # 1k e 10k note
+    python benchmark.py --sizes 1000 10000 100000
+    python benchmark.py --output baseline.json
+    python benchmark.py --compare baseline.json        # exit code 1 se ci sono regressioni
+    python benchmark.py --suite startup --sizes 10000  # avvio a freddo + breakdown -X importtime
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections.abc import Callable, Generator
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Any
+
+import database as db
+
+DEFAULT_SIZES = [1000, 10000]
+DEFAULT_THRESHOLD = 0.25  # +25% sulla mediana = regressione
+SAMPLE_NOTES = 50
+STARTUP_RUNS = 5
+IMPORT_TOP = 15
+
+_VOCABULARY = (
+    "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt ut labore "
+    "et dolore magna aliqua nota progetto riunione lista spesa idea codice backup server cliente fattura "
+    "ricetta viaggio libro appunti lezione esame python sqlite database rete configurazione password "
+    "documento relazione budget scadenza telefono indirizzo email domani settimana mese anno"
+)
+_WORDS = _VOCABULARY.split()
+
+type Stats = dict[str, float]
+type SuiteResults = dict[str, Any]
+
+
+# --- Ambiente temporaneo ---
+
+
+def _set_data_dir(path: str) -> None:
+    db.DATA_DIR = path
+    db.DB_PATH = os.path.join(path, "mynotes.db")
+    db.ATTACHMENTS_DIR = os.path.join(path, "attachments")
+    db.BACKUP_DIR = os.path.join(path, "backups")
+
+
+@contextmanager
+def temp_data_dir() -> Generator[str, None, None]:
+    """Redirect database.py paths to a throwaway DATA_DIR for the duration of the block."""
+    saved = (db.DATA_DIR, db.DB_PATH, db.ATTACHMENTS_DIR, db.BACKUP_DIR)
+    tmp = tempfile.mkdtemp(prefix="mynotes_bench_")
+    _set_data_dir(tmp)
+    try:
+        yield tmp
+    finally:
+        db.DATA_DIR, db.DB_PATH, db.ATTACHMENTS_DIR, db.BACKUP_DIR = saved
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+# --- Generazione libreria ---
+
+
+def _text(rng: random.Random, words: int) -> str:
+    lines = []
+    remaining = words
+    while remaining > 0:
+        n = min(remaining, rng.randint(4, 16))
+        line = " ".join(rng.choices(_WORDS, k=n))
+        if rng.random() < 0.1:
+            line = ("[x] " if rng.random() < 0.5 else "[ ] ") + line
+        elif rng.random() < 0.05:
+            line = "## " + line
+        lines.append(line)
+        remaining -= n
+    return "\n".join(lines)
+
+
+def generate_library(size: int, seed: int = 42) -> dict[str, int]:
+    """Populate the current (temporary) database with `size` synthetic notes.
+
+    Distributions: category tree up to 4 levels, Zipf-like tag usage (0-5 tags per note),
+    log-normal content length, ~10% of notes with attachments, ~20% with versions,
+    ~5% in the trash (half of them past the purge cutoff).
+    """
+    rng = random.Random(seed)
+    db.init_db()
+    now = datetime.now()
+
+    with db._connect() as conn:
+        # Categorie: albero fino a 4 livelli
+        cat_count = max(5, size // 50)
+        cat_ids: list[int] = []
+        depth: dict[int, int] = {}
+        for i in range(cat_count):
+            parents = [c for c in cat_ids if depth[c] < 4]
+            parent = rng.choice(parents) if parents and rng.random() < 0.6 else None
+            cur = conn.execute("INSERT INTO categories (name, parent_id) VALUES (?, ?)", (f"Categoria {i}", parent))
+            assert cur.lastrowid is not None
+            cat_ids.append(cur.lastrowid)
+            depth[cur.lastrowid] = 1 if parent is None else depth[parent] + 1
+
+        # Tag: uso con distribuzione Zipf
+        tag_count = max(20, size // 100)
+        conn.executemany("INSERT INTO tags (name) VALUES (?)", [(f"tag{i}",) for i in range(tag_count)])
+        tag_ids = [r["id"] for r in conn.execute("SELECT id FROM tags ORDER BY id").fetchall()]
+        tag_weights = [1.0 / (rank + 1) for rank in range(tag_count)]
+
+        notes = []
+        for i in range(size):
+            updated = now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+            created = updated - timedelta(days=rng.randint(0, 90))
+            words = min(20000, max(3, int(rng.lognormvariate(4.8, 1.0))))
+            is_deleted = rng.random() < 0.05
+            deleted_at = None
+            if is_deleted:
+                deleted_at = (now - timedelta(days=rng.randint(0, 2 * db.TRASH_PURGE_DAYS))).isoformat()
+            notes.append(
+                (
+                    f"Nota {i} " + " ".join(rng.choices(_WORDS, k=rng.randint(1, 5))),
+                    _text(rng, words),
+                    rng.choice(cat_ids) if rng.random() < 0.8 else None,
+                    int(rng.random() < 0.03),
+                    int(rng.random() < 0.08),
+                    int(is_deleted),
+                    deleted_at,
+                    created.isoformat(),
+                    updated.isoformat(),
+                )
+            )
+        conn.executemany(
+            "INSERT INTO notes (title, content, category_id, is_pinned, is_favorite, is_deleted, deleted_at,"
+            " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            notes,
+        )
+        note_ids = [r["id"] for r in conn.execute("SELECT id FROM notes ORDER BY id").fetchall()]
+
+        note_tags = []
+        for nid in note_ids:
+            k = min(rng.choice([0, 1, 1, 2, 2, 3, 4, 5]), tag_count)
+            for tid in set(rng.choices(tag_ids, weights=tag_weights, k=k)):
+                note_tags.append((nid, tid))
+        conn.executemany("INSERT INTO note_tags (note_id, tag_id) VALUES (?, ?)", note_tags)
+
+        # Allegati: piccoli file reali, perche' export/purge li leggono e cancellano
+        os.makedirs(db.ATTACHMENTS_DIR, exist_ok=True)
+        attachments = []
+        for nid in note_ids:
+            if rng.random() >= 0.1:
+                continue
+            for _ in range(rng.randint(1, 3)):
+                ext = rng.choice([".png", ".jpg", ".pdf", ".wav", ".txt"])
+                filename = f"{rng.getrandbits(64):016x}{ext}"
+                with open(os.path.join(db.ATTACHMENTS_DIR, filename), "wb") as f:
+                    f.write(rng.randbytes(rng.randint(1024, 16 * 1024)))
+                attachments.append((nid, filename, f"file{ext}", now.isoformat()))
+        conn.executemany(
+            "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)", attachments
+        )
+
+        versions = []
+        for nid, note in zip(note_ids, notes, strict=True):
+            if rng.random() >= 0.2:
+                continue
+            for v in range(rng.randint(1, 10)):
+                saved = (now - timedelta(hours=v)).isoformat()
+                versions.append((nid, note[0], note[1], saved, *db.content_fingerprint(note[1])))
+        conn.executemany(
+            "INSERT INTO note_versions (note_id, title, content, saved_at, size, content_hash)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            versions,
+        )
+        conn.commit()
+    db.invalidate_cache()
+
+    return {
+        "notes": size,
+        "categories": cat_count,
+        "tags": tag_count,
+        "note_tags": len(note_tags),
+        "attachments": len(attachments),
+        "versions": len(versions),
+        "db_bytes": os.path.getsize(db.DB_PATH),
+    }
+
+
+# --- Misure ---
+
+
+def _summarize(samples: list[float]) -> Stats:
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+        "runs": len(samples),
+    }
+
+
+def measure(fn: Callable[[], object], repeat: int = 5) -> Stats:
+    """Run fn `repeat` times (after one warm-up call) and return timings in milliseconds."""
+    fn()
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return _summarize(samples)
+
+
+def measure_each(fn: Callable[[int], object], items: list[int]) -> Stats:
+    """Time fn once per item (no warm-up: each call hits a different row)."""
+    samples = []
+    for item in items:
+        start = time.perf_counter()
+        fn(item)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "p95_ms": round(samples[int(len(samples) * 0.95) - 1], 3),
+        "max_ms": round(samples[-1], 3),
+        "runs": len(samples),
+    }
+
+
+def _display_note_db(note_id: int) -> None:
+    """DB calls issued by NoteController.display_note (editor, tags label, gallery)."""
+    db.get_note(note_id)
+    db.get_note_tags(note_id)
+    db.get_note_attachments(note_id)
+    db.get_note_attachments(note_id)
+
+
+def _category_tree_db() -> None:
+    """DB calls issued by NoteController.load_categories."""
+    db.get_all_categories()
+    db.get_all_tags()
+    db.get_navigation_counts()
+
+
+def _navigation_counts_cold() -> None:
+    """Aggregate count query after an invalidation (bulk import, category changes)."""
+    db.invalidate_cache(db.CACHE_NOTES)
+    db.get_navigation_counts()
+
+
+def _backup_formats(dest: str) -> tuple[dict[str, Stats], dict[str, dict[str, float]]]:
+    """Time write_backup() and the restore-side decoder for every compression format.
+
+    Returns (cases, {format: compression ratio and MB/s of database data}).
+    """
+    import backup_utils
+
+    cases: dict[str, Stats] = {}
+    formats: dict[str, dict[str, float]] = {}
+    for algorithm in ["none", *backup_utils.available_compressions()]:
+        written: list[dict[str, Any]] = []
+
+        def _write(compression: str = algorithm, out: list[dict[str, Any]] = written) -> None:
+            out.append(backup_utils.write_backup(dest, compression))
+
+        cases[f"backup_{algorithm}"] = measure(_write, repeat=3)
+        result = written[-1]
+
+        def _decode(path: str = result["path"]) -> None:
+            for _chunk in backup_utils.iter_backup_plaintext(path):
+                pass
+
+        cases[f"restore_decode_{algorithm}"] = measure(_decode, repeat=3)
+        mb = result["db_size"] / 1024 / 1024
+        formats[algorithm] = {
+            "ratio": round(result["db_size"] / max(result["size"], 1), 2),
+            "write_mb_s": round(mb / (cases[f"backup_{algorithm}"]["median_ms"] / 1000), 1),
+            "decode_mb_s": round(mb / (cases[f"restore_decode_{algorithm}"]["median_ms"] / 1000), 1),
+        }
+        # Stesso secondo = stesso nome: i file vanno rimossi una volta sola
+        for path in {r["path"] for r in written}:
+            os.remove(path)
+            os.remove(path + ".sha256")
+    return cases, formats
+
+
+def run_db_suite(size: int, seed: int) -> SuiteResults:
+    library: dict[str, Any]
+    with temp_data_dir() as tmp:
+        start = time.perf_counter()
+        library = dict(generate_library(size, seed))
+        library["generate_s"] = round(time.perf_counter() - start, 2)
+
+        rng = random.Random(seed + 1)
+        with db._connect() as conn:
+            active = [r["id"] for r in conn.execute("SELECT id FROM notes WHERE is_deleted = 0").fetchall()]
+            tag_id = conn.execute("SELECT tag_id FROM note_tags GROUP BY tag_id ORDER BY COUNT(*) DESC").fetchone()[0]
+            root_cat = conn.execute(
+                "SELECT parent_id FROM categories WHERE parent_id IS NOT NULL"
+                " GROUP BY parent_id ORDER BY COUNT(*) DESC LIMIT 1"
+            ).fetchone()[0]
+            leaf_cat = conn.execute(
+                "SELECT id FROM categories WHERE id NOT IN"
+                " (SELECT parent_id FROM categories WHERE parent_id IS NOT NULL) LIMIT 1"
+            ).fetchone()[0]
+        sample = rng.sample(active, min(SAMPLE_NOTES, len(active)))
+
+        cases: dict[str, Stats] = {}
+        list_filters: dict[str, dict[str, Any]] = {
+            "all": {},
+            "trash": {"show_deleted": True},
+            "favorites": {"favorites_only": True},
+            "category_tree": {"category_id": root_cat},
+            "category_leaf": {"category_id": leaf_cat},
+            "tag": {"tag_id": tag_id},
+            "search": {"search_query": "progetto"},
+            "search_miss": {"search_query": "zzzz"},
+            "category_tag_search": {"category_id": root_cat, "tag_id": tag_id, "search_query": "idea"},
+            "favorites_tag": {"favorites_only": True, "tag_id": tag_id},
+        }
+        for name, kwargs in list_filters.items():
+            cases[f"get_all_notes.{name}"] = measure(lambda kw=kwargs: db.get_all_notes(**kw))  # type: ignore[misc]
+
+        cases["load_categories"] = measure(_category_tree_db)
+        cases["navigation_counts_cold"] = measure(_navigation_counts_cold)
+        cases["display_note"] = measure_each(_display_note_db, sample)
+        cases["list_note_versions"] = measure_each(db.list_note_versions, sample)
+
+        edits = itertools.count()
+
+        def _save_current(note_id: int) -> None:
+            # Scrittura di gui.autosave per una nota non criptata: nessuna lettura prima dell'UPDATE
+            db.update_note(note_id, title=f"Nota {note_id}", content="contenuto " * 200 + str(next(edits)))
+
+        cases["save_current"] = measure_each(_save_current, sample)
+        cases["save_version"] = measure_each(
+            lambda nid: db.save_version(nid, "Titolo", "contenuto " * 200 + str(next(edits))), sample
+        )
+
+        export_dir = os.path.join(tmp, "export")
+        os.makedirs(export_dir)
+        exported: list[str] = []
+
+        def _export(note_id: int) -> None:
+            exported.append(db.export_note(note_id, os.path.join(export_dir, f"{note_id}.mynote")))
+
+        cases["export_note"] = measure_each(_export, sample[:20])
+        paths = iter(exported)
+        cases["import_note"] = measure_each(lambda _i: db.import_note(next(paths)), list(range(len(exported))))
+
+        # Import qui: backup_utils legge DATA_DIR all'import
+        import backup_utils
+
+        cases["create_backup"] = measure(
+            lambda: backup_utils.write_backup(os.path.join(tmp, "bench_backups")), repeat=3
+        )
+        backup_cases, backup_formats = _backup_formats(os.path.join(tmp, "bench_formats"))
+        cases.update(backup_cases)
+
+        # Distruttivo: misurato una volta sola, per ultimo
+        start = time.perf_counter()
+        purged = db.purge_trash()
+        cases["purge_trash"] = {"median_ms": round((time.perf_counter() - start) * 1000, 3), "runs": 1}
+        library["purged"] = purged
+
+        from plan_check import audit_note_list_plans
+
+        problems = audit_note_list_plans()
+
+    return {"library": library, "cases": cases, "query_plan_problems": problems, "backup_formats": backup_formats}
+
+
+# --- Avvio ---
+
+
+def _startup_probe(data_dir: str) -> None:
+    """Child process: replay main.py's startup on `data_dir` and print the phase timings as JSON."""
+    started_at = time.perf_counter()
+    os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+    # Prima degli import della GUI: backup_utils e gli altri moduli leggono DATA_DIR all'import
+    _set_data_dir(data_dir)
+
+    import qdarktheme
+    from PySide6.QtWidgets import QApplication
+
+    from gui import MyNotesApp
+
+    imported = time.perf_counter()
+    app = QApplication([sys.argv[0]])
+    app.setStyleSheet(qdarktheme.load_stylesheet("dark"))
+    window = MyNotesApp()
+    window.show()
+    app.processEvents()
+    painted = time.perf_counter()
+    window.finish_startup()
+    app.processEvents()
+    ready = time.perf_counter()
+    # La lista note arriva dal DB worker dopo che la finestra e' gia' interattiva
+    deadline = ready + 30
+    while not window.notes and time.perf_counter() < deadline:
+        app.processEvents()
+        time.sleep(0.001)
+    listed = time.perf_counter()
+
+    timings = {
+        "import_ms": (imported - started_at) * 1000,
+        "first_paint_ms": (painted - started_at) * 1000,
+        "interactive_ms": (ready - started_at) * 1000,
+        "note_list_ms": (listed - started_at) * 1000,
+    }
+    print(json.dumps(timings), flush=True)
+    # Niente teardown di Qt ne' backup alla chiusura: misuriamo solo l'avvio
+    os._exit(0)
+
+
+def import_breakdown(top: int = IMPORT_TOP) -> dict[str, Any]:
+    """Run `python -X importtime` on the GUI imports and aggregate self time per top-level package."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import qdarktheme, gui"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    per_package: dict[str, float] = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, _cumulative_us, name = line.removeprefix("import time:").split("|")
+        package = name.strip().split(".")[0]
+        per_package[package] = per_package.get(package, 0.0) + int(self_us) / 1000
+    ranked = sorted(per_package.items(), key=lambda item: item[1], reverse=True)
+    return {
+        "total_ms": round(sum(per_package.values()), 1),
+        "top": [{"package": name, "self_ms": round(ms, 1)} for name, ms in ranked[:top]],
+    }
+
+
+def run_startup_suite(size: int, seed: int, runs: int = STARTUP_RUNS) -> SuiteResults:
+    """Time-to-interactive of the full app on a `size`-note library, one fresh process per run.
+
+    The first run is reported separately as `cold`: it is the closest to a cold cache
+    that can be had without dropping the OS page cache.
+    """
+    library: dict[str, Any]
+    samples: dict[str, list[float]] = {}
+    with temp_data_dir() as tmp:
+        start = time.perf_counter()
+        library = dict(generate_library(size, seed))
+        library["generate_s"] = round(time.perf_counter() - start, 2)
+
+        for _ in range(runs):
+            start = time.perf_counter()
+            proc = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--startup-probe", tmp],
+                capture_output=True,
+                text=True,
+                check=True,
+            )
+            timings = json.loads(proc.stdout.strip().splitlines()[-1])
+            timings["process_ms"] = (time.perf_counter() - start) * 1000
+            for name, value in timings.items():
+                samples.setdefault(name, []).append(value)
+
+    cases: dict[str, Stats] = {f"startup.{name}": _summarize(values) for name, values in samples.items()}
+    cases["startup.cold_process"] = _summarize(samples["process_ms"][:1])
+    return {"library": library, "cases": cases, "imports": import_breakdown()}
+
+
+# --- Report ---
+
+
+def _environment() -> dict[str, str]:
+    return {
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "sqlite": sqlite3.sqlite_version,
+        "platform": platform.platform(),
+    }
+
+
+def print_results(results: dict[str, SuiteResults]) -> None:
+    for key, suite in results.items():
+        lib = suite["library"]
+        print(f"\n== {key} note  ({lib['db_bytes'] / 1024 / 1024:.1f} MB, generata in {lib['generate_s']}s)")
+        for name, stats in suite["cases"].items():
+            extra = f"  p95 {stats['p95_ms']:>9.2f}" if "p95_ms" in stats else ""
+            print(f"  {name:<36} {stats['median_ms']:>9.2f} ms{extra}")
+        for problem in suite.get("query_plan_problems", []):
+            print(f"  [PIANO] {problem}")
+        for algorithm, fmt in suite.get("backup_formats", {}).items():
+            print(
+                f"  backup {algorithm:<29} {fmt['ratio']:>6.2f}x  scrittura {fmt['write_mb_s']:>7.1f} MB/s"
+                f"  lettura {fmt['decode_mb_s']:>7.1f} MB/s"
+            )
+        if "imports" in suite:
+            print(f"  import (self time, totale {suite['imports']['total_ms']:.1f} ms):")
+            for entry in suite["imports"]["top"]:
+                print(f"    {entry['package']:<34} {entry['self_ms']:>9.1f} ms")
+
+
+def compare(results: dict[str, SuiteResults], baseline: dict[str, SuiteResults], threshold: float) -> list[str]:
+    """Return a message per case whose median got worse than baseline by more than `threshold`."""
+    regressions = []
+    print(f"\n== Confronto con baseline (soglia +{threshold:.0%})")
+    for size, suite in results.items():
+        base_suite = baseline.get(size)
+        if not base_suite:
+            print(f"  {size}: assente nella baseline")
+            continue
+        for name, stats in suite["cases"].items():
+            base = base_suite["cases"].get(name)
+            if not base or not base["median_ms"]:
+                continue
+            ratio = stats["median_ms"] / base["median_ms"]
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  << REGRESSIONE"
+                regressions.append(f"{size}/{name}: {base['median_ms']:.2f} -> {stats['median_ms']:.2f} ms")
+            timings = f"{base['median_ms']:>9.2f} -> {stats['median_ms']:>9.2f} ms"
+            print(f"  {size:>7} {name:<36} {timings} ({ratio:>5.2f}x){flag}")
+        regressions.extend(f"{size}: piano di query {p}" for p in suite.get("query_plan_problems", []))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark MyNotes su librerie sintetiche")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES, help="numero di note per libreria")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--suite", choices=["db", "startup", "all"], default="db", help="gruppo di misure da eseguire")
+    parser.add_argument("--output", help="salva i risultati JSON in questo file")
+    parser.add_argument("--compare", metavar="BASELINE", help="confronta con un JSON salvato in precedenza")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="regressione tollerata (0.25=25%%)")
+    parser.add_argument("--startup-probe", metavar="DATA_DIR", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.startup_probe:
+        _startup_probe(args.startup_probe)
+
+    results: dict[str, SuiteResults] = {}
+    for size in args.sizes:
+        print(f"Generazione libreria da {size} note...", file=sys.stderr)
+        if args.suite in ("db", "all"):
+            results[str(size)] = run_db_suite(size, args.seed)
+        if args.suite in ("startup", "all"):
+            results[f"startup-{size}"] = run_startup_suite(size, args.seed)
+
+    print_results(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": _environment(), "results": results}, f, indent=2)
+        print(f"\nRisultati salvati in {args.output}")
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} regressione/i:")
+            for r in regressions:
+                print(f"  {r}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -4,6 +4,7 @@ Build MyNotes come eseguibile standalone portabile.
 
 Uso:
     python build_portable.py
+    python build_portable.py --update-pack   (dopo la build: asset per gli aggiornamenti differenziali)
 
 Requisiti:
     pip install pyinstaller pillow
@@ -61,9 +62,28 @@ def inject_oauth_credentials() -> None:
     print("OAuth credentials iniettati in gdrive_utils.py")
 
 
+def inject_update_key() -> None:
+    """Inject the public key that verifies update manifests into version.py before build."""
+    public_key = os.environ.get("MYNOTES_UPDATE_PUBLIC_KEY", "")
+    if not public_key:
+        print("NOTA: MYNOTES_UPDATE_PUBLIC_KEY non impostato, firma degli aggiornamenti non verificata")
+        return
+
+    path = os.path.join(SCRIPT_DIR, "version.py")
+    with open(path) as f:
+        content = f.read()
+
+    content = content.replace('UPDATE_PUBLIC_KEY: str = ""', f'UPDATE_PUBLIC_KEY: str = "{public_key}"')
+
+    with open(path, "w") as f:
+        f.write(content)
+    print("Chiave pubblica aggiornamenti iniettata in version.py")
+
+
 def build() -> None:
     check_pyinstaller()
     inject_oauth_credentials()
+    inject_update_key()
 
     # PyInstaller command
     cmd = [
@@ -121,6 +141,10 @@ def build() -> None:
         "--hidden-import",
         "backup_utils",
         "--hidden-import",
+        "backup_catalog",
+        "--hidden-import",
+        "change_journal",
+        "--hidden-import",
         "gdrive_utils",
         "--hidden-import",
         "audio_utils",
@@ -131,7 +155,27 @@ def build() -> None:
         "--hidden-import",
         "gui.pastebin_controller",
         "--hidden-import",
+        "gui.trash_controller",
+        "--hidden-import",
         "dialogs.pastebin",
+        "--hidden-import",
+        "dialogs.diagnostics",
+        "--hidden-import",
+        "perf_utils",
+        "--hidden-import",
+        "export_utils",
+        "--hidden-import",
+        "bundle_utils",
+        "--hidden-import",
+        "import_utils",
+        "--hidden-import",
+        "pdf_utils",
+        "--hidden-import",
+        "gui.tasks",
+        "--hidden-import",
+        "gui.autosave",
+        "--hidden-import",
+        "gui.db_worker",
         # PySide6 — solo moduli usati + dati runtime (plugins, platforms)
         "--hidden-import",
         "PySide6",
@@ -332,5 +376,25 @@ def build() -> None:
     print()
 
 
+def write_update_pack() -> None:
+    """Pacchetto per file e manifest degli aggiornamenti differenziali, da pubblicare nella release."""
+    import updater
+    from version import VERSION
+
+    pack, manifest = updater.build_update_pack(
+        os.path.join(DIST_DIR, "MyNotes"), SCRIPT_DIR, updater.platform_assets()[1], VERSION
+    )
+    print(f"Pacchetto aggiornamento: {pack}")
+    print(f"Manifest: {manifest}")
+    signing_key = os.environ.get("MYNOTES_UPDATE_SIGNING_KEY", "")
+    if signing_key:
+        print(f"Firma: {updater.sign_manifest(manifest, signing_key)}")
+    else:
+        print("NOTA: MYNOTES_UPDATE_SIGNING_KEY non impostato, manifest non firmato")
+
+
 if __name__ == "__main__":
-    build()
+    if "--update-pack" in sys.argv:
+        write_update_pack()
+    else:
+        build()
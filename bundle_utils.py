@@ -0,0 +1,312 @@
+"""Bundle .mynote multi-nota: formato, scrittura in streaming e importazione a lotti.
+
+Un bundle e' uno zip con:
+    manifest.json           formato, versione, numero di note
+    notes/000001.json       metadati e contenuto di ogni nota (stesse chiavi di note.json)
+    attachments/<sha256>    allegati, una sola copia per contenuto
+
+I file .mynote a nota singola (note.json + attachments/<nome originale>) restano supportati
+in importazione: import_archives() accetta entrambi i formati.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import uuid
+import zipfile
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+import change_journal
+import database as db
+import perf_utils
+from _types import ProgressCallback
+from error_codes import AppError
+from version import VERSION
+
+log = logging.getLogger("bundle")
+
+BUNDLE_FORMAT = "mynote-bundle"
+BUNDLE_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+LEGACY_NOTE_NAME = "note.json"
+
+IMPORT_BATCH = 200
+_PROGRESS_EVERY = 50
+_CHUNK_SIZE = 1024 * 1024
+
+# (nome originale, membro dello zip, sha256 dichiarato o None per i file legacy)
+type AttachmentRef = tuple[str, str, str | None]
+
+
+class ImportCancelled(Exception):
+    """Raised by import_archives() when the cancel event is set; the current batch is rolled back."""
+
+
+def file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(_CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+# --- Scrittura ---
+
+
+class BundleWriter:
+    """Write notes one at a time into a bundle; attachments are stored once per content hash.
+
+    Output goes to `<path>.part` and is renamed by commit(); abort() removes it.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._part = f"{path}.part"
+        self._zip = zipfile.ZipFile(self._part, "w", zipfile.ZIP_DEFLATED)
+        self._category_paths = db.get_category_paths()
+        self._hash_by_filename: dict[str, str] = {}
+        self._members: set[str] = set()
+        self.note_count = 0
+
+    def add_note(self, note: dict[str, Any]) -> None:
+        """Add a note dict as produced by database.iter_export_notes()."""
+        attachments = []
+        for filename, original_name in note["attachments"]:
+            src = os.path.join(db.ATTACHMENTS_DIR, filename)
+            if not os.path.exists(src):
+                continue
+            digest = self._hash_by_filename.get(filename)
+            if digest is None:
+                digest = self._hash_by_filename[filename] = file_sha256(src)
+            member = f"attachments/{digest}"
+            if member not in self._members:
+                self._zip.write(src, member, compress_type=db.zip_compress_type(filename))
+                self._members.add(member)
+            attachments.append({"name": original_name, "member": member, "sha256": digest})
+
+        category_path = self._category_paths.get(note["category_id"], []) if note["category_id"] else []
+        metadata = db.mynote_metadata(note, note["tags"], [], category_path)
+        metadata["attachments"] = attachments
+        self.note_count += 1
+        self._zip.writestr(f"notes/{self.note_count:06d}.json", json.dumps(metadata, ensure_ascii=False))
+
+    def commit(self) -> str:
+        manifest = {
+            "format": BUNDLE_FORMAT,
+            "version": BUNDLE_VERSION,
+            "app_version": VERSION,
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "note_count": self.note_count,
+            "attachment_count": len(self._members),
+        }
+        self._zip.writestr(MANIFEST_NAME, json.dumps(manifest, indent=2))
+        self._zip.close()
+        os.replace(self._part, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._zip.close()
+        if os.path.exists(self._part):
+            os.remove(self._part)
+
+
+# --- Lettura ---
+
+
+def _read_manifest(zf: zipfile.ZipFile) -> dict[str, Any] | None:
+    if MANIFEST_NAME not in zf.namelist():
+        return None
+    manifest: dict[str, Any] = json.loads(zf.read(MANIFEST_NAME))
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError("manifest.json non riconosciuto")
+    if manifest.get("version", 0) > BUNDLE_VERSION:
+        raise ValueError("Bundle creato da una versione piu' recente di MyNotes")
+    return manifest
+
+
+def archive_note_count(path: str) -> int:
+    """Number of notes in a .mynote file (1 for single-note archives); reads only the zip directory."""
+    with zipfile.ZipFile(path) as zf:
+        manifest = _read_manifest(zf)
+        return int(manifest["note_count"]) if manifest else 1
+
+
+def _iter_records(zf: zipfile.ZipFile) -> Iterator[tuple[dict[str, Any], list[AttachmentRef]]]:
+    """Yield (metadata, attachment refs) for every note in the archive, one JSON member at a time."""
+    if _read_manifest(zf) is None:
+        meta = json.loads(zf.read(LEGACY_NOTE_NAME))
+        refs: list[AttachmentRef] = []
+        for name in zf.namelist():
+            original_name = os.path.basename(name)
+            if name.startswith("attachments/") and original_name:
+                refs.append((original_name, name, None))
+        yield meta, refs
+        return
+
+    for name in sorted(n for n in zf.namelist() if n.startswith("notes/") and n.endswith(".json")):
+        meta = json.loads(zf.read(name))
+        yield meta, [(a["name"], a["member"], a.get("sha256")) for a in meta.get("attachments", [])]
+
+
+# --- Importazione ---
+
+
+class _BatchImporter:
+    """Insert notes on one connection; the caller commits every IMPORT_BATCH notes."""
+
+    def __init__(self, conn: sqlite3.Connection, category_id: int | None) -> None:
+        self.conn = conn
+        self.category_id = category_id
+        self.tag_ids: dict[str, int] = {r["name"]: r["id"] for r in conn.execute("SELECT id, name FROM tags")}
+        self.category_cache: dict[tuple[str, ...], int | None] = {}
+        # sha256 -> file in ATTACHMENTS_DIR estratto da questa importazione (dedup tra note)
+        self.stored_by_hash: dict[str, str] = {}
+        self._batch_files: list[tuple[str, str]] = []  # (sha256, filename) scritti nel lotto corrente
+
+    def add(self, zf: zipfile.ZipFile, meta: dict[str, Any], refs: list[AttachmentRef]) -> int:
+        conn = self.conn
+        category_id = self.category_id
+        if category_id is None and meta.get("category_path"):
+            category_id = db.ensure_category_path_in(conn, meta["category_path"], self.category_cache)
+
+        now = datetime.now().isoformat()
+        cur = conn.execute(
+            "INSERT INTO notes (title, content, category_id, is_pinned, is_favorite, is_encrypted,"
+            " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                meta["title"],
+                meta.get("content", ""),
+                category_id,
+                meta.get("is_pinned", 0),
+                meta.get("is_favorite", 0),
+                meta.get("is_encrypted", 0),
+                now,
+                now,
+            ),
+        )
+        note_id = cur.lastrowid
+        assert note_id is not None
+
+        tag_rows = [(note_id, self._tag_id(name)) for name in meta.get("tags", [])]
+        if tag_rows:
+            conn.executemany("INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)", tag_rows)
+
+        att_rows = [
+            (note_id, self._store_attachment(zf, member, original_name, digest), original_name, now)
+            for original_name, member, digest in refs
+        ]
+        if att_rows:
+            conn.executemany(
+                "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)", att_rows
+            )
+        return note_id
+
+    def _tag_id(self, name: str) -> int:
+        tag_id = self.tag_ids.get(name)
+        if tag_id is None:
+            self.conn.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (name,))
+            tag_id = int(self.conn.execute("SELECT id FROM tags WHERE name = ?", (name,)).fetchone()[0])
+            self.tag_ids[name] = tag_id
+        return tag_id
+
+    def _store_attachment(self, zf: zipfile.ZipFile, member: str, original_name: str, digest: str | None) -> str:
+        if digest is not None and digest in self.stored_by_hash:
+            return self.stored_by_hash[digest]
+
+        filename = f"{uuid.uuid4().hex}{os.path.splitext(original_name)[1]}"
+        dest = os.path.join(db.ATTACHMENTS_DIR, filename)
+        h = hashlib.sha256()
+        with zf.open(member) as src, open(dest, "wb") as dst:
+            while chunk := src.read(_CHUNK_SIZE):
+                h.update(chunk)
+                dst.write(chunk)
+        actual = h.hexdigest()
+
+        if digest is not None and digest != actual:
+            os.remove(dest)
+            raise ValueError(f"Allegato danneggiato: {original_name}")
+        if actual in self.stored_by_hash:
+            # Archivi legacy: stesso contenuto gia' estratto per un'altra nota
+            os.remove(dest)
+            return self.stored_by_hash[actual]
+        self.stored_by_hash[actual] = filename
+        self._batch_files.append((actual, filename))
+        return filename
+
+    def commit(self) -> None:
+        self.conn.commit()
+        db.invalidate_cache()
+        self._batch_files.clear()
+
+    def rollback(self) -> None:
+        """Roll back the current batch and delete the files it extracted."""
+        self.conn.rollback()
+        for digest, filename in self._batch_files:
+            self.stored_by_hash.pop(digest, None)
+            with contextlib.suppress(OSError):
+                os.remove(os.path.join(db.ATTACHMENTS_DIR, filename))
+        self._batch_files.clear()
+
+
+@perf_utils.timed("bundle.import_archives")
+def import_archives(
+    paths: list[str],
+    category_id: int | None = None,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None,
+    batch_size: int = IMPORT_BATCH,
+) -> list[int]:
+    """Import .mynote files (bundles or single notes) and return the new note ids.
+
+    Notes are inserted on a single connection and committed every `batch_size` notes.
+    `category_id` overrides the category paths stored in the archives. On error or
+    cancellation the current batch is rolled back (earlier batches stay imported) and
+    AppError("EXP-002") / ImportCancelled is raised.
+    """
+    total = 0
+    for path in paths:
+        try:
+            total += archive_note_count(path)
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile) as e:
+            raise AppError("EXP-002", f"{os.path.basename(path)}: {e}") from e
+    os.makedirs(db.ATTACHMENTS_DIR, exist_ok=True)
+    imported: list[int] = []
+    committed = 0
+
+    with db._connect() as conn:
+        importer = _BatchImporter(conn, category_id)
+        path = ""
+        try:
+            for path in paths:
+                with zipfile.ZipFile(path) as zf:
+                    for meta, refs in _iter_records(zf):
+                        if cancel is not None and cancel.is_set():
+                            raise ImportCancelled()
+                        imported.append(importer.add(zf, meta, refs))
+                        if len(imported) - committed >= batch_size:
+                            importer.commit()
+                            committed = len(imported)
+                        if progress and len(imported) % _PROGRESS_EVERY == 0:
+                            progress(len(imported) * 100 // max(total, 1), f"Importate {len(imported)}/{total} note")
+            importer.commit()
+        except ImportCancelled:
+            importer.rollback()
+            change_journal.record_inserted_notes(imported[:committed])
+            raise
+        except (OSError, ValueError, KeyError, zipfile.BadZipFile, sqlite3.Error) as e:
+            importer.rollback()
+            change_journal.record_inserted_notes(imported[:committed])
+            log.warning("Importazione interrotta su %s dopo %d note: %s", path, committed, e)
+            raise AppError("EXP-002", f"{os.path.basename(path)}: {e} ({committed} note importate)") from e
+
+    change_journal.record_inserted_notes(imported)
+    log.info("Importate %d note da %d file", len(imported), len(paths))
+    return imported
@@ -0,0 +1,474 @@
+"""Journal delle modifiche alle note: recupero a un istante qualsiasi dopo l'ultimo backup.
+
+Il livello database (database.py) aggiunge un record JSON per riga dopo ogni commit che
+modifica note: inserimento (nota completa), aggiornamento (solo i campi cambiati; il
+contenuto come delta prefisso/suffisso rispetto all'ultimo contenuto registrato per la
+nota), eliminazione definitiva, tag. Ogni record porta l'ora: il ripristino applica al
+backup piu' recente i record fino all'istante scelto.
+
+I record stanno in segmenti journal/<id>.jsonl. Ogni backup apre un segmento nuovo prima
+di leggere il database (il suo id finisce nel catalogo come "journal_from"): tutto cio'
+che e' nei segmenti precedenti e' gia' nel backup, e dopo un backup locale riuscito quei
+segmenti vengono eliminati (compattazione). I record di un commit avvenuto a cavallo della
+rotazione possono finire sia nel backup sia nel segmento nuovo: la riapplicazione e'
+idempotente (gli hash del contenuto dicono se un delta e' gia' applicato).
+
+Il contenuto delle note criptate e' registrato cifrato, come nel database.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from collections.abc import Iterable, Iterator
+from datetime import datetime
+from typing import IO, Any
+
+import database as db
+
+log = logging.getLogger("journal")
+
+JOURNAL_DIRNAME = "journal"
+SEGMENT_SUFFIX = ".jsonl"
+# Note di cui si tiene in memoria l'ultimo contenuto registrato (base dei delta)
+DELTA_CACHE_NOTES = 256
+# Sotto questa lunghezza il contenuto si registra intero: il delta non farebbe risparmiare
+MIN_DELTA_CONTENT = 256
+_READ_BATCH = 500
+
+_lock = threading.Lock()
+_file: IO[str] | None = None
+_file_path: str | None = None
+# note_id -> ultimo contenuto registrato
+_last_content: OrderedDict[int, str] = OrderedDict()
+
+
+def journal_dir() -> str:
+    # Letto a ogni chiamata: DATA_DIR puo' cambiare a runtime (benchmark, test)
+    return os.path.join(db.DATA_DIR, JOURNAL_DIRNAME)
+
+
+def _segment_ids() -> list[int]:
+    try:
+        names = os.listdir(journal_dir())
+    except OSError:
+        return []
+    stems = [n[: -len(SEGMENT_SUFFIX)] for n in names if n.endswith(SEGMENT_SUFFIX)]
+    return sorted(int(stem) for stem in stems if stem.isdigit())
+
+
+def _segment_path(segment_id: int) -> str:
+    return os.path.join(journal_dir(), f"{segment_id:020d}{SEGMENT_SUFFIX}")
+
+
+def _content_hash(content: str) -> str:
+    return hashlib.blake2b(content.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _common_prefix(a: str, b: str) -> int:
+    # Ricerca binaria su confronti di slice (memcmp in C): niente ciclo per carattere
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[len(a) - mid : len(a) - lo] == b[len(b) - mid : len(b) - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def content_delta(old: str, new: str) -> list[Any]:
+    """[prefix length, suffix length, replacement]: `new` is old[:p] + replacement + old[len(old) - s:]."""
+    prefix = _common_prefix(old, new)
+    suffix = _common_suffix(old, new, min(len(old), len(new)) - prefix)
+    return [prefix, suffix, new[prefix : len(new) - suffix]]
+
+
+def apply_delta(old: str, delta: list[Any]) -> str:
+    prefix, suffix, middle = delta
+    return str(old[:prefix] + middle + old[len(old) - suffix :])
+
+
+# --- Scrittura ---
+
+
+def _open_current() -> IO[str]:
+    """Append handle on the newest segment (a new one if there is none); caller holds _lock."""
+    global _file, _file_path
+    if _file is not None and _file_path is not None and os.path.dirname(_file_path) == journal_dir():
+        return _file
+    if _file is not None:
+        _file.close()
+    ids = _segment_ids()
+    path = _segment_path(ids[-1]) if ids else _new_segment()
+    _file = open(path, "a", encoding="utf-8")  # noqa: SIM115 - resta aperto tra un record e l'altro
+    _file_path = path
+    return _file
+
+
+def _new_segment() -> str:
+    os.makedirs(journal_dir(), exist_ok=True)
+    ids = _segment_ids()
+    # Gli id sono crescenti anche se l'orologio torna indietro
+    segment_id = max(time.time_ns(), ids[-1] + 1 if ids else 0)
+    path = _segment_path(segment_id)
+    open(path, "a").close()
+    db._secure_file(path)
+    return path
+
+
+def _append(records: Iterable[dict[str, Any]]) -> None:
+    try:
+        with _lock:
+            f = _open_current()
+            ts = datetime.now().isoformat()
+            for record in records:
+                f.write(json.dumps({"ts": ts, **record}, ensure_ascii=False, separators=(",", ":")) + "\n")
+            # flush verso il sistema operativo (sopravvive a un crash dell'app), senza fsync:
+            # costa un write() per salvataggio automatico
+            f.flush()
+    except OSError as e:
+        # Il journal e' un complemento dei backup: un errore non deve bloccare il salvataggio
+        log.warning("Scrittura journal fallita: %s", e)
+
+
+def _remember(note_id: int, content: str) -> None:
+    _last_content[note_id] = content
+    _last_content.move_to_end(note_id)
+    while len(_last_content) > DELTA_CACHE_NOTES:
+        _last_content.popitem(last=False)
+
+
+def _category_path(category_id: int | None) -> list[str] | None:
+    if category_id is None:
+        return None
+    return db.get_category_paths().get(category_id)
+
+
+def _insert_record(row: sqlite3.Row, tags: list[str]) -> dict[str, Any]:
+    return {
+        "op": "insert",
+        "id": row["id"],
+        "title": row["title"],
+        "content": row["content"] or "",
+        "category": _category_path(row["category_id"]),
+        "is_pinned": row["is_pinned"],
+        "is_favorite": row["is_favorite"],
+        "is_deleted": row["is_deleted"],
+        "deleted_at": row["deleted_at"],
+        "is_encrypted": row["is_encrypted"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+        "tags": tags,
+    }
+
+
+def record_insert(conn: sqlite3.Connection, note_id: int) -> None:
+    """Journal a note just committed on `conn` (read back whole, with its tags)."""
+    row = conn.execute("SELECT * FROM notes WHERE id = ?", (note_id,)).fetchone()
+    if row is None:
+        return
+    tags = [
+        r["name"]
+        for r in conn.execute(
+            "SELECT t.name FROM tags t JOIN note_tags nt ON t.id = nt.tag_id WHERE nt.note_id = ?", (note_id,)
+        )
+    ]
+    _append([_insert_record(row, tags)])
+    with _lock:
+        _remember(note_id, row["content"] or "")
+
+
+def record_inserted_notes(note_ids: list[int]) -> None:
+    """Journal notes committed by a bulk import, reading them back in batches."""
+    for start in range(0, len(note_ids), _READ_BATCH):
+        batch = note_ids[start : start + _READ_BATCH]
+        placeholders = ",".join("?" * len(batch))
+        with db._connect() as conn:
+            rows = conn.execute(f"SELECT * FROM notes WHERE id IN ({placeholders})", batch).fetchall()
+            tags: dict[int, list[str]] = {}
+            for r in conn.execute(
+                "SELECT nt.note_id, t.name FROM tags t JOIN note_tags nt ON t.id = nt.tag_id"
+                f" WHERE nt.note_id IN ({placeholders})",
+                batch,
+            ):
+                tags.setdefault(r["note_id"], []).append(r["name"])
+        _append(_insert_record(row, tags.get(row["id"], [])) for row in rows)
+
+
+def record_update(note_ids: list[int], fields: dict[str, Any], content: str | None = None) -> None:
+    """Journal changed columns of `note_ids`; `content` (single note only) is stored as a delta when possible.
+
+    A "category_id" field is journaled as the category path, so replay resolves it by name.
+    """
+    fields = dict(fields)
+    if "category_id" in fields:
+        fields["category"] = _category_path(fields.pop("category_id"))
+    record: dict[str, Any] = {"op": "update", "ids": list(note_ids), "fields": fields}
+    if content is not None:
+        (note_id,) = note_ids
+        with _lock:
+            base = _last_content.get(note_id)
+            _remember(note_id, content)
+        if base is not None and len(content) >= MIN_DELTA_CONTENT:
+            record["delta"] = content_delta(base, content)
+            record["base"] = _content_hash(base)
+        else:
+            record["content"] = content
+        record["hash"] = _content_hash(content)
+    _append([record])
+
+
+def record_delete(note_ids: list[int]) -> None:
+    _append([{"op": "delete", "ids": list(note_ids)}])
+    with _lock:
+        for note_id in note_ids:
+            _last_content.pop(note_id, None)
+
+
+def record_tags(note_id: int, names: list[str]) -> None:
+    _append([{"op": "tags", "id": note_id, "tags": names}])
+
+
+def forget_content(note_id: int) -> None:
+    """Next content change of the note is journaled whole (content replaced outside update_note)."""
+    with _lock:
+        _last_content.pop(note_id, None)
+
+
+# --- Rotazione e compattazione ---
+
+
+def rotate() -> int:
+    """Start a new segment and return its id; called by a backup before it reads the database.
+
+    Every record in older segments was committed before the backup's snapshot, so the
+    backup contains it.
+    """
+    global _file, _file_path
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file, _file_path = None, None
+        path = _new_segment()
+        # Ogni segmento parte da contenuti completi: i delta non dipendono da segmenti compattati
+        _last_content.clear()
+    return int(os.path.basename(path)[: -len(SEGMENT_SUFFIX)])
+
+
+def compact(covered_by: int) -> int:
+    """Delete the segments older than `covered_by` (folded into a backup). Returns how many."""
+    removed = 0
+    with _lock:
+        for segment_id in _segment_ids():
+            if segment_id >= covered_by:
+                break
+            with contextlib.suppress(OSError):
+                os.remove(_segment_path(segment_id))
+                removed += 1
+    if removed:
+        log.info("Journal compattato: %d segmenti inclusi nel backup", removed)
+    return removed
+
+
+def reset() -> None:
+    """Drop the whole journal: after a restore its records no longer describe the database."""
+    global _file, _file_path
+    with _lock:
+        if _file is not None:
+            _file.close()
+            _file, _file_path = None, None
+        _last_content.clear()
+        for segment_id in _segment_ids():
+            with contextlib.suppress(OSError):
+                os.remove(_segment_path(segment_id))
+
+
+def available_from(segment_id: int | None) -> bool:
+    """True if the journal still holds everything written since the backup that opened `segment_id`."""
+    return segment_id is not None and segment_id in _segment_ids()
+
+
+def last_record_time(segment_id: int) -> datetime | None:
+    """Time of the newest record from `segment_id` on (None if there are none)."""
+    last = None
+    for record in _iter_records(segment_id):
+        last = record["ts"]
+    return datetime.fromisoformat(last) if last else None
+
+
+# --- Riapplicazione ---
+
+
+def _iter_records(from_segment: int) -> Iterator[dict[str, Any]]:
+    for segment_id in _segment_ids():
+        if segment_id < from_segment:
+            continue
+        path = _segment_path(segment_id)
+        with open(path, encoding="utf-8") as f:
+            for lineno, line in enumerate(f, 1):
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    # Riga troncata da un crash a meta' scrittura: e' sempre l'ultima del segmento
+                    log.warning("Journal: riga %d illeggibile in %s, ignorata", lineno, os.path.basename(path))
+                    break
+
+
+class _Replayer:
+    """Apply journal records on one connection; every operation is idempotent."""
+
+    def __init__(self, conn: sqlite3.Connection) -> None:
+        self.conn = conn
+        self.category_cache: dict[tuple[str, ...], int | None] = {}
+        self.stats = {"applied": 0, "skipped": 0, "conflicts": 0}
+
+    def _category_id(self, path: list[str] | None) -> int | None:
+        return db.ensure_category_path_in(self.conn, path, self.category_cache) if path else None
+
+    def apply(self, record: dict[str, Any]) -> None:
+        op = record["op"]
+        if op == "insert":
+            self._insert(record)
+        elif op == "update":
+            self._update(record)
+        elif op == "delete":
+            ids = record["ids"]
+            placeholders = ",".join("?" * len(ids))
+            db._queue_attachment_files(self.conn, ids)
+            self.conn.execute(f"DELETE FROM notes WHERE id IN ({placeholders})", ids)
+            self.stats["applied"] += 1
+        elif op == "tags":
+            self._tags(record["id"], record["tags"])
+            self.stats["applied"] += 1
+        else:
+            log.warning("Journal: operazione sconosciuta %r ignorata", op)
+            self.stats["skipped"] += 1
+
+    def _insert(self, r: dict[str, Any]) -> None:
+        if self.conn.execute("SELECT 1 FROM notes WHERE id = ?", (r["id"],)).fetchone():
+            # Commit avvenuto a cavallo della rotazione: la nota e' gia' nel backup
+            self.stats["skipped"] += 1
+            return
+        self.conn.execute(
+            "INSERT INTO notes (id, title, content, category_id, is_pinned, is_favorite, is_deleted, deleted_at,"
+            " is_encrypted, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                r["id"],
+                r["title"],
+                r["content"],
+                self._category_id(r["category"]),
+                r["is_pinned"],
+                r["is_favorite"],
+                r["is_deleted"],
+                r["deleted_at"],
+                r["is_encrypted"],
+                r["created_at"],
+                r["updated_at"],
+            ),
+        )
+        self._tags(r["id"], r["tags"])
+        self.stats["applied"] += 1
+
+    def _update(self, r: dict[str, Any]) -> None:
+        fields = dict(r["fields"])
+        if "category" in fields:
+            fields["category_id"] = self._category_id(fields.pop("category"))
+        ids = r["ids"]
+        if "hash" in r:
+            (note_id,) = ids
+            row = self.conn.execute("SELECT content FROM notes WHERE id = ?", (note_id,)).fetchone()
+            if row is None:
+                self.stats["skipped"] += 1
+                return
+            current = row["content"] or ""
+            current_hash = _content_hash(current)
+            if "content" in r:
+                fields["content"] = r["content"]
+            elif current_hash == r["base"]:
+                fields["content"] = apply_delta(current, r["delta"])
+            elif current_hash != r["hash"]:
+                # Il delta non parte da questo contenuto (nota modificata fuori dal journal)
+                log.warning("Journal: nota %d non allineata, modifica del %s non applicata", note_id, r["ts"])
+                self.stats["conflicts"] += 1
+                return
+        if fields:
+            placeholders = ",".join("?" * len(ids))
+            assignments = ", ".join(f"{name} = ?" for name in fields)
+            self.conn.execute(f"UPDATE notes SET {assignments} WHERE id IN ({placeholders})", [*fields.values(), *ids])
+        self.stats["applied"] += 1
+
+    def _tags(self, note_id: int, names: list[str]) -> None:
+        if not self.conn.execute("SELECT 1 FROM notes WHERE id = ?", (note_id,)).fetchone():
+            return
+        self.conn.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
+        for name in names:
+            self.conn.execute("INSERT OR IGNORE INTO tags (name) VALUES (?)", (name,))
+            self.conn.execute(
+                "INSERT OR IGNORE INTO note_tags (note_id, tag_id) SELECT ?, id FROM tags WHERE name = ?",
+                (note_id, name),
+            )
+
+
+# Colonne che un record "update" puo' scrivere: il journal non e' fidato come SQL
+_UPDATABLE = {
+    "title",
+    "content",
+    "category",
+    "is_pinned",
+    "is_favorite",
+    "is_deleted",
+    "deleted_at",
+    "is_encrypted",
+    "updated_at",
+}
+
+
+def replay(db_path: str, from_segment: int, until: datetime | None = None) -> dict[str, int]:
+    """Apply the records from `from_segment` on, up to `until` (all if None), to the database at `db_path`.
+
+    Meant for a freshly restored copy, before it replaces the live database; runs in one
+    transaction. Returns {"applied", "skipped", "conflicts"}.
+    """
+    with _lock:
+        if _file is not None:
+            _file.flush()
+    conn = sqlite3.connect(db_path)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    try:
+        replayer = _Replayer(conn)
+        for record in _iter_records(from_segment):
+            if until is not None and datetime.fromisoformat(record["ts"]) > until:
+                break
+            if record["op"] == "update" and not set(record["fields"]) <= _UPDATABLE:
+                log.warning("Journal: campi non validi in %s, record ignorato", record["ts"])
+                replayer.stats["skipped"] += 1
+                continue
+            replayer.apply(record)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        conn.close()
+    log.info("Journal riapplicato fino a %s: %s", until or "fine", replayer.stats)
+    return replayer.stats
@@ -1,4 +1,4 @@
-"""Crittografia note e backup con AES-128-CBC (Fernet) + PBKDF2."""
+"""Crittografia note (AES-128-CBC, Fernet) e backup (AES-256-GCM a blocchi) con chiave PBKDF2."""
 
 from __future__ import annotations
 
@@ -6,11 +6,18 @@ import base64
 import hashlib
 import logging
 import os
+import struct
+from collections.abc import Callable, Iterator
+from typing import BinaryIO
+
+import perf_utils
 
 log: logging.Logger = logging.getLogger("crypto")
 
 try:
+    from cryptography.exceptions import InvalidTag
     from cryptography.fernet import Fernet, InvalidToken
+    from cryptography.hazmat.primitives.ciphers.aead import AESGCM
 except ImportError:
     raise ImportError(
         "Libreria 'cryptography' richiesta per la crittografia.\nInstalla con: pip install cryptography"
@@ -20,6 +27,7 @@ _ITERATIONS: int = 600_000
 _LEGACY_ITERATIONS: int = 100_000
 
 
+@perf_utils.timed("crypto.pbkdf2")
 def _derive_key(password: str, salt: bytes | None = None, iterations: int = _ITERATIONS) -> tuple[bytes, bytes]:
     """Derive a 32-byte key from password using PBKDF2."""
     if salt is None:
@@ -28,6 +36,7 @@ def _derive_key(password: str, salt: bytes | None = None, iterations: int = _ITE
     return key, salt
 
 
+@perf_utils.timed("crypto.encrypt")
 def encrypt(plaintext: str, password: str) -> str:
     """Encrypt text with password. Returns base64-encoded string."""
     key, salt = _derive_key(password)
@@ -47,6 +56,7 @@ def _try_decrypt(ciphertext_raw: bytes, password: str, iterations: int) -> str:
     return decrypted.decode("utf-8")
 
 
+@perf_utils.timed("crypto.decrypt")
 def decrypt(ciphertext: str, password: str) -> str | None:
     """Decrypt text with password. Returns plaintext or None if wrong password."""
     try:
@@ -62,46 +72,148 @@ def decrypt(ciphertext: str, password: str) -> str | None:
         return None
 
 
+# --- Streaming encryption (backup) ---
+#
+# Formato: STREAM_MAGIC | salt (16) | prefisso nonce (8) | record...
+#   record = lunghezza (4 byte, big endian) | AES-256-GCM(blocco di al piu' STREAM_CHUNK byte)
+# Il nonce e' prefisso + numero del record. I dati associati legano ogni record
+# all'intestazione, alla sua posizione e al flag "ultimo": record scambiati, tolti o un
+# file troncato fanno fallire la decrittografia invece di produrre un backup monco.
+
+STREAM_MAGIC = b"MYNENC2\n"
+STREAM_CHUNK = 1024 * 1024
+_SALT_SIZE = 16
+_PREFIX_SIZE = 8
+_HEADER_SIZE = len(STREAM_MAGIC) + _SALT_SIZE + _PREFIX_SIZE
+_TAG_SIZE = 16
+
+
+def _record_aad(header: bytes, index: int, final: bool) -> bytes:
+    return header + struct.pack(">Q?", index, final)
+
+
+class StreamEncryptor:
+    """Encrypt a byte stream chunk by chunk; memory use is bounded by STREAM_CHUNK.
+
+    Feed plaintext with write() and finish with close(), which writes the final record.
+    `sink` receives the encrypted bytes (header first).
+    """
+
+    def __init__(self, sink: Callable[[bytes], object], password: str) -> None:
+        key, salt = _derive_key(password)
+        prefix = os.urandom(_PREFIX_SIZE)
+        self._sink = sink
+        self._aead = AESGCM(key)
+        self._header = STREAM_MAGIC + salt + prefix
+        self._prefix = prefix
+        self._index = 0
+        self._buffer = bytearray()
+        sink(self._header)
+
+    def write(self, data: bytes) -> None:
+        self._buffer += data
+        while len(self._buffer) > STREAM_CHUNK:
+            self._emit(bytes(self._buffer[:STREAM_CHUNK]), final=False)
+            del self._buffer[:STREAM_CHUNK]
+
+    def close(self) -> None:
+        self._emit(bytes(self._buffer), final=True)
+        self._buffer.clear()
+
+    def _emit(self, chunk: bytes, final: bool) -> None:
+        nonce = self._prefix + struct.pack(">I", self._index)
+        sealed = self._aead.encrypt(nonce, chunk, _record_aad(self._header, self._index, final))
+        self._sink(struct.pack(">I", len(sealed)) + sealed)
+        self._index += 1
+
+
+def decrypt_stream(read: Callable[[int], bytes], password: str) -> Iterator[bytes]:
+    """Yield the plaintext chunks of a StreamEncryptor stream read through `read(n)`.
+
+    Raises ValueError for a wrong password, a damaged record or a truncated stream.
+    """
+    header = read(_HEADER_SIZE)
+    if len(header) != _HEADER_SIZE or not header.startswith(STREAM_MAGIC):
+        raise ValueError("Formato non riconosciuto")
+    salt = header[len(STREAM_MAGIC) : len(STREAM_MAGIC) + _SALT_SIZE]
+    prefix = header[-_PREFIX_SIZE:]
+    key, _ = _derive_key(password, salt)
+    aead = AESGCM(key)
+    index = 0
+    while True:
+        size_raw = read(4)
+        if len(size_raw) != 4:
+            raise ValueError("File troncato")
+        (size,) = struct.unpack(">I", size_raw)
+        if size < _TAG_SIZE or size > STREAM_CHUNK + _TAG_SIZE:
+            raise ValueError("Record danneggiato")
+        sealed = read(size)
+        if len(sealed) != size:
+            raise ValueError("File troncato")
+        nonce = prefix + struct.pack(">I", index)
+        try:
+            # Il flag "ultimo" non e' scritto in chiaro: e' il record che si autentica con uno dei due
+            try:
+                chunk = aead.decrypt(nonce, sealed, _record_aad(header, index, False))
+                final = False
+            except InvalidTag:
+                chunk = aead.decrypt(nonce, sealed, _record_aad(header, index, True))
+                final = True
+        except InvalidTag:
+            raise ValueError("Password errata o file danneggiato") from None
+        yield chunk
+        if final:
+            if read(1):
+                raise ValueError("Dati dopo la fine del backup")
+            return
+        index += 1
+
+
 # --- File encryption/decryption ---
 
 
+@perf_utils.timed("crypto.encrypt_file")
 def encrypt_file(source: str, dest: str, password: str) -> None:
-    """Critta un file binario. Scrive salt + encrypted_data nel dest."""
-    with open(source, "rb") as src_f:
-        data = src_f.read()
-
-    key, salt = _derive_key(password)
-    fernet_key = base64.urlsafe_b64encode(key)
-    fern: Fernet = Fernet(fernet_key)
-    encrypted = fern.encrypt(data)
-    with open(dest, "wb") as out:
-        out.write(salt + encrypted)
+    """Critta un file binario a blocchi (formato StreamEncryptor), senza caricarlo in memoria."""
+    with open(source, "rb") as src_f, open(dest, "wb") as out:
+        enc = StreamEncryptor(out.write, password)
+        while chunk := src_f.read(STREAM_CHUNK):
+            enc.write(chunk)
+        enc.close()
 
 
-def decrypt_file(source: str, dest: str, password: str) -> tuple[bool, str | None]:
-    """Decritta un file binario. Ritorna (True, None) se ok, (False, errore) se fallisce."""
+def _decrypt_legacy(raw: bytes, password: str) -> bytes:
+    """salt (16) + token Fernet, il formato dei backup crittografati prima di StreamEncryptor."""
+    salt = raw[:16]
     try:
-        with open(source, "rb") as src_f:
-            raw = src_f.read()
+        key, _ = _derive_key(password, salt, _ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(key)).decrypt(raw[16:])
+    except InvalidToken:
+        # Fallback to legacy iterations
+        key, _ = _derive_key(password, salt, _LEGACY_ITERATIONS)
+        return Fernet(base64.urlsafe_b64encode(key)).decrypt(raw[16:])
 
-        salt = raw[:16]
 
-        # Try modern iterations first
-        decrypted = None
-        try:
-            key, _ = _derive_key(password, salt, _ITERATIONS)
-            fernet_key = base64.urlsafe_b64encode(key)
-            fern: Fernet = Fernet(fernet_key)
-            decrypted = fern.decrypt(raw[16:])
-        except InvalidToken:
-            # Fallback to legacy iterations
-            key, _ = _derive_key(password, salt, _LEGACY_ITERATIONS)
-            fernet_key = base64.urlsafe_b64encode(key)
-            fern2: Fernet = Fernet(fernet_key)
-            decrypted = fern2.decrypt(raw[16:])
-
-        with open(dest, "wb") as out:
-            out.write(decrypted)
+def decrypt_file_chunks(f: BinaryIO, password: str) -> Iterator[bytes]:
+    """Plaintext of an encrypted file: streamed for the chunked format, in one piece for legacy files."""
+    is_stream = f.read(len(STREAM_MAGIC)) == STREAM_MAGIC
+    f.seek(0)
+    if is_stream:
+        yield from decrypt_stream(f.read, password)
+    else:
+        yield _decrypt_legacy(f.read(), password)
+
+
+@perf_utils.timed("crypto.decrypt_file")
+def decrypt_file(source: str, dest: str, password: str) -> tuple[bool, str | None]:
+    """Decritta un file binario. Ritorna (True, None) se ok, (False, errore) se fallisce.
+
+    Accetta sia il formato a blocchi sia quello Fernet dei backup precedenti.
+    """
+    try:
+        with open(source, "rb") as src_f, open(dest, "wb") as out:
+            for chunk in decrypt_file_chunks(src_f, password):
+                out.write(chunk)
         return True, None
     except Exception as e:
         log.warning("decrypt_file fallito: %s: %s", type(e).__name__, e)
@@ -1,14 +1,24 @@
 from __future__ import annotations
 
+import functools
+import hashlib
+import json
+import logging
 import os
 import sqlite3
 import stat
 import sys
-from collections.abc import Generator
+import threading
+from collections.abc import Callable, Generator
 from contextlib import contextmanager
 from datetime import datetime, timedelta
 from typing import Any
 
+import change_journal
+import perf_utils
+
+log = logging.getLogger("database")
+
 
 class _Sentinel:
     """Sentinel value for explicit NULL."""
@@ -31,24 +41,51 @@ ATTACHMENTS_DIR: str = os.path.join(DATA_DIR, "attachments")
 BACKUP_DIR: str = os.path.join(DATA_DIR, "backups")
 
 TRASH_PURGE_DAYS: int = 30
+TRASH_PURGE_BATCH: int = 200
+EXPORT_BATCH: int = 64
+# Attesa massima di una scrittura mentre un backup tiene il database in lettura
+BUSY_TIMEOUT_S: float = 30.0
+
+# Bump whenever init_db()/_migrate() change the schema: databases already at this
+# version skip the CREATE/ALTER pass entirely on startup (see PRAGMA user_version).
+SCHEMA_VERSION: int = 3
+
+# Bumped by every _connect() connection that modified rows: the backup scheduler compares
+# it with the value at its last run and skips the backup when nothing changed.
+_data_generation = 0
+_data_generation_lock = threading.Lock()
+
+
+def data_generation() -> int:
+    """Counter of database modifications made by this process (through _connect())."""
+    return _data_generation
+
+
+def _bump_data_generation() -> None:
+    global _data_generation
+    with _data_generation_lock:
+        _data_generation += 1
 
 
 @contextmanager
 def _connect() -> Generator[sqlite3.Connection, None, None]:
     """Context manager for safe database connections."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_S)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     conn.execute("PRAGMA secure_delete = ON")
     try:
         yield conn
     finally:
+        # Anche le modifiche annullate contano: al piu' un backup in piu'
+        if conn.total_changes:
+            _bump_data_generation()
         conn.close()
 
 
 def get_connection() -> sqlite3.Connection:
     """Legacy helper - prefer _connect() context manager."""
-    conn = sqlite3.connect(DB_PATH)
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT_S)
     conn.row_factory = sqlite3.Row
     conn.execute("PRAGMA foreign_keys = ON")
     conn.execute("PRAGMA secure_delete = ON")
@@ -68,11 +105,123 @@ def _secure_file(path: str) -> None:
         os.chmod(path, stat.S_IRUSR | stat.S_IWUSR)
 
 
+# --- Query cache ---
+#
+# Small, read-mostly results (categories, tags, counts) are kept in memory. Each belongs to
+# one or more domains; every function that writes a domain bumps its generation, and entries
+# computed under an older generation are recomputed on the next read.
+
+CACHE_CATEGORIES = "categories"
+CACHE_TAGS = "tags"
+CACHE_NOTES = "notes"  # conteggi di navigazione da ricaricare (le singole scritture li aggiornano a delta)
+_CACHE_DOMAINS = (CACHE_CATEGORIES, CACHE_TAGS, CACHE_NOTES)
+
+
+class _QueryCache:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._generations: dict[str, int] = dict.fromkeys(_CACHE_DOMAINS, 0)
+        self._entries: dict[tuple[Any, ...], tuple[tuple[int, ...], Any]] = {}
+        self._stats: dict[str, list[int]] = {}  # nome funzione -> [hit, miss]
+        self._invalidations: dict[str, int] = dict.fromkeys(_CACHE_DOMAINS, 0)
+
+    def generations(self, domains: tuple[str, ...]) -> tuple[int, ...]:
+        with self._lock:
+            return tuple(self._generations[d] for d in domains)
+
+    def lookup(self, name: str, key: tuple[Any, ...], generations: tuple[int, ...]) -> tuple[bool, Any]:
+        with self._lock:
+            stats = self._stats.setdefault(name, [0, 0])
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == generations:
+                stats[0] += 1
+                return True, entry[1]
+            stats[1] += 1
+            return False, None
+
+    def store(self, key: tuple[Any, ...], generations: tuple[int, ...], value: Any) -> None:
+        with self._lock:
+            self._entries[key] = (generations, value)
+
+    def invalidate(self, domains: tuple[str, ...]) -> None:
+        with self._lock:
+            for domain in domains:
+                self._generations[domain] += 1
+                self._invalidations[domain] += 1
+
+    def stats(self) -> dict[str, Any]:
+        with self._lock:
+            return {
+                "functions": {name: {"hits": h, "misses": m} for name, (h, m) in sorted(self._stats.items())},
+                "invalidations": dict(self._invalidations),
+                "entries": len(self._entries),
+            }
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self._stats.clear()
+            self._invalidations = dict.fromkeys(_CACHE_DOMAINS, 0)
+
+
+_cache = _QueryCache()
+
+
+def _cached[**P, R](*domains: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Cache the result per argument tuple until one of `domains` is invalidated.
+
+    Lists and dicts are returned as shallow copies, so callers may modify what they get.
+    """
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        name = func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            # DB_PATH nella chiave: benchmark e ripristini possono cambiare database nello stesso processo
+            key = (DB_PATH, name, args, tuple(sorted(kwargs.items())))
+            # Generazione letta prima della query: una scrittura concorrente rende stale il risultato
+            generations = _cache.generations(domains)
+            hit, value = _cache.lookup(name, key, generations)
+            if not hit:
+                value = func(*args, **kwargs)
+                _cache.store(key, generations, value)
+            if isinstance(value, (list, dict)):
+                return value.copy()  # type: ignore[return-value]
+            return value  # type: ignore[no-any-return]
+
+        return wrapper
+
+    return decorator
+
+
+def invalidate_cache(*domains: str) -> None:
+    """Mark cached results of `domains` (all domains if none given) as stale.
+
+    Called by every writer in this module; modules that write through _connect() directly
+    (bulk import, backup restore) must call it after committing.
+    """
+    _cache.invalidate(domains or _CACHE_DOMAINS)
+
+
+def cache_stats() -> dict[str, Any]:
+    """Hit/miss counts per cached function and invalidations per domain (diagnostics)."""
+    return _cache.stats()
+
+
+def reset_cache_stats() -> None:
+    _cache.reset_stats()
+
+
+@perf_utils.timed("db.init_db")
 def init_db() -> None:
     _secure_dir(DATA_DIR)
     _secure_dir(ATTACHMENTS_DIR)
     _secure_dir(BACKUP_DIR)
     with _connect() as conn:
+        if conn.execute("PRAGMA user_version").fetchone()[0] >= SCHEMA_VERSION:
+            _secure_file(DB_PATH)
+            return
+        log.info("Migrazione schema database alla versione %d", SCHEMA_VERSION)
         conn.executescript("""
             CREATE TABLE IF NOT EXISTS categories (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -120,16 +269,13 @@ def init_db() -> None:
                 title TEXT NOT NULL,
                 content TEXT DEFAULT '',
                 saved_at TEXT NOT NULL,
+                size INTEGER NOT NULL DEFAULT 0,
+                content_hash TEXT,
                 FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
             );
 
-            -- Indici per query frequenti
-            CREATE INDEX IF NOT EXISTS idx_notes_category ON notes(category_id);
-            CREATE INDEX IF NOT EXISTS idx_notes_deleted ON notes(is_deleted);
-            CREATE INDEX IF NOT EXISTS idx_notes_pinned ON notes(is_pinned);
-            CREATE INDEX IF NOT EXISTS idx_notes_favorite ON notes(is_favorite);
+            -- Indici per query frequenti (indici composti su notes creati in _migrate())
             CREATE INDEX IF NOT EXISTS idx_note_tags_tag ON note_tags(tag_id);
-            CREATE INDEX IF NOT EXISTS idx_note_versions_note ON note_versions(note_id);
             CREATE INDEX IF NOT EXISTS idx_attachments_note ON attachments(note_id);
 
             CREATE TABLE IF NOT EXISTS pastebin_shares (
@@ -144,11 +290,23 @@ def init_db() -> None:
                 FOREIGN KEY (note_id) REFERENCES notes(id) ON DELETE CASCADE
             );
             CREATE INDEX IF NOT EXISTS idx_pastebin_shares_note ON pastebin_shares(note_id);
+
+            -- Journal dei file allegati da eliminare dopo il commit
+            CREATE TABLE IF NOT EXISTS pending_file_deletions (
+                filename TEXT PRIMARY KEY,
+                queued_at TEXT NOT NULL
+            );
+
+            -- Impostazioni legate alla libreria (viaggiano con il database nei backup)
+            CREATE TABLE IF NOT EXISTS app_settings (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
         """)
         _migrate(conn)
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
         conn.commit()
     _secure_file(DB_PATH)
-    purge_trash(TRASH_PURGE_DAYS)
 
 
 def _migrate(conn: sqlite3.Connection) -> None:
@@ -177,6 +335,36 @@ def _migrate(conn: sqlite3.Connection) -> None:
     conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_cat_name_parent ON categories(name, COALESCE(parent_id, 0))")
     conn.execute("CREATE INDEX IF NOT EXISTS idx_cat_parent ON categories(parent_id)")
 
+    # Attachment files can be shared by several rows (bundle import dedup): flush_file_deletions()
+    # looks up remaining references by filename
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_attachments_filename ON attachments(filename)")
+
+    # Version history: metadata columns so the dialog can list versions without their content
+    version_cols = {row[1] for row in conn.execute("PRAGMA table_info(note_versions)").fetchall()}
+    if "size" not in version_cols:
+        conn.execute("ALTER TABLE note_versions ADD COLUMN size INTEGER NOT NULL DEFAULT 0")
+    if "content_hash" not in version_cols:
+        conn.execute("ALTER TABLE note_versions ADD COLUMN content_hash TEXT")
+    _backfill_version_fingerprints(conn)
+    conn.execute("DROP INDEX IF EXISTS idx_note_versions_note")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_note_versions_list ON note_versions(note_id, saved_at)")
+
+    # Trash purge filters on deleted_at, which older DBs only get via the ALTER above
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_trash ON notes(is_deleted, deleted_at)")
+
+    # Note list: one composite index per filter shape, each ending with the ORDER BY columns
+    # so SQLite walks the index in order instead of sorting (checked by plan_check.py).
+    # They supersede the old single-column indexes.
+    for old_index in ("idx_notes_category", "idx_notes_deleted", "idx_notes_pinned", "idx_notes_favorite"):
+        conn.execute(f"DROP INDEX IF EXISTS {old_index}")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_notes_list ON notes(is_deleted, is_pinned, updated_at)")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_favorite_list ON notes(is_deleted, is_favorite, is_pinned, updated_at)"
+    )
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_notes_category_list ON notes(category_id, is_deleted, is_pinned, updated_at)"
+    )
+
     # Migrate pastebin_shares table for existing DBs
     tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'").fetchall()}
     if "pastebin_shares" not in tables:
@@ -196,9 +384,41 @@ def _migrate(conn: sqlite3.Connection) -> None:
         conn.execute("CREATE INDEX IF NOT EXISTS idx_pastebin_shares_note ON pastebin_shares(note_id)")
 
 
+def _backfill_version_fingerprints(conn: sqlite3.Connection, batch_size: int = 200) -> None:
+    ids = [r[0] for r in conn.execute("SELECT id FROM note_versions WHERE content_hash IS NULL").fetchall()]
+    for start in range(0, len(ids), batch_size):
+        chunk = ids[start : start + batch_size]
+        placeholders = ",".join("?" * len(chunk))
+        rows = conn.execute(f"SELECT id, content FROM note_versions WHERE id IN ({placeholders})", chunk).fetchall()
+        conn.executemany(
+            "UPDATE note_versions SET size = ?, content_hash = ? WHERE id = ?",
+            [(*content_fingerprint(r["content"] or ""), r["id"]) for r in rows],
+        )
+
+
+# --- App settings ---
+
+
+def get_setting(key: str, default: str | None = None) -> str | None:
+    with _connect() as conn:
+        row = conn.execute("SELECT value FROM app_settings WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+
+def set_setting(key: str, value: str) -> None:
+    with _connect() as conn:
+        conn.execute(
+            "INSERT INTO app_settings (key, value) VALUES (?, ?) ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+            (key, value),
+        )
+        conn.commit()
+
+
 # --- Categories ---
 
 
+@perf_utils.timed("db.get_all_categories")
+@_cached(CACHE_CATEGORIES)
 def get_all_categories() -> list[sqlite3.Row]:
     with _connect() as conn:
         return conn.execute(
@@ -211,6 +431,7 @@ def add_category(name: str, parent_id: int | None = None) -> int | None:
         try:
             cur = conn.execute("INSERT INTO categories (name, parent_id) VALUES (?, ?)", (name, parent_id))
             conn.commit()
+            invalidate_cache(CACHE_CATEGORIES)
             return cur.lastrowid
         except sqlite3.IntegrityError:
             return None
@@ -221,16 +442,38 @@ def rename_category(cat_id: int, new_name: str) -> None:
         try:
             conn.execute("UPDATE categories SET name = ? WHERE id = ?", (new_name, cat_id))
             conn.commit()
+            invalidate_cache(CACHE_CATEGORIES)
         except sqlite3.IntegrityError:
-            pass
+            return
+    _journal_category_paths(cat_id)
+
+
+def _journal_category_paths(cat_id: int) -> None:
+    """Journal the new category path of every note in `cat_id` and its subcategories (after a rename or move)."""
+    cat_ids = [cat_id, *get_descendant_category_ids(cat_id)]
+    placeholders = ",".join("?" * len(cat_ids))
+    with _connect() as conn:
+        rows = conn.execute(f"SELECT id, category_id FROM notes WHERE category_id IN ({placeholders})", cat_ids)
+        by_category: dict[int, list[int]] = {}
+        for r in rows:
+            by_category.setdefault(r["category_id"], []).append(r["id"])
+    for category_id, note_ids in by_category.items():
+        change_journal.record_update(note_ids, {"category_id": category_id})
 
 
 def delete_category(cat_id: int) -> None:
     with _connect() as conn:
+        note_ids = [r["id"] for r in conn.execute("SELECT id FROM notes WHERE category_id = ?", (cat_id,))]
         conn.execute("DELETE FROM categories WHERE id = ?", (cat_id,))
         conn.commit()
+        invalidate_cache(CACHE_CATEGORIES, CACHE_NOTES)
+    if note_ids:
+        # ON DELETE SET NULL: le note restano senza categoria
+        change_journal.record_update(note_ids, {"category_id": None})
 
 
+@perf_utils.timed("db.get_descendant_category_ids")
+@_cached(CACHE_CATEGORIES)
 def get_descendant_category_ids(cat_id: int) -> list[int]:
     """BFS to find all descendant category IDs."""
     with _connect() as conn:
@@ -256,6 +499,8 @@ def move_category(cat_id: int, new_parent_id: int | None) -> bool:
     with _connect() as conn:
         conn.execute("UPDATE categories SET parent_id = ? WHERE id = ?", (new_parent_id, cat_id))
         conn.commit()
+        invalidate_cache(CACHE_CATEGORIES)
+    _journal_category_paths(cat_id)
     return True
 
 
@@ -264,19 +509,26 @@ def delete_category_tree(cat_id: int) -> None:
     descendants = get_descendant_category_ids(cat_id)
     all_ids = [cat_id] + descendants
     # Soft-delete all notes in these categories
+    now = datetime.now().isoformat()
     with _connect() as conn:
-        if all_ids:
-            placeholders = ",".join("?" * len(all_ids))
-            now = datetime.now().isoformat()
-            conn.execute(
-                "UPDATE notes SET is_deleted = 1, deleted_at = ?"
-                f" WHERE category_id IN ({placeholders}) AND is_deleted = 0",
-                [now, *all_ids],
-            )
-            # Delete categories (children first to avoid FK issues)
-            for cid in reversed(all_ids):
-                conn.execute("DELETE FROM categories WHERE id = ?", (cid,))
+        placeholders = ",".join("?" * len(all_ids))
+        notes = conn.execute(
+            f"SELECT id, is_deleted FROM notes WHERE category_id IN ({placeholders})", all_ids
+        ).fetchall()
+        conn.execute(
+            f"UPDATE notes SET is_deleted = 1, deleted_at = ? WHERE category_id IN ({placeholders}) AND is_deleted = 0",
+            [now, *all_ids],
+        )
+        # Delete categories (children first to avoid FK issues)
+        for cid in reversed(all_ids):
+            conn.execute("DELETE FROM categories WHERE id = ?", (cid,))
         conn.commit()
+        invalidate_cache(CACHE_CATEGORIES, CACHE_NOTES)
+    trashed = [r["id"] for r in notes if not r["is_deleted"]]
+    if trashed:
+        change_journal.record_update(trashed, {"is_deleted": 1, "deleted_at": now})
+    if notes:
+        change_journal.record_update([r["id"] for r in notes], {"category_id": None})
 
 
 def promote_children(cat_id: int) -> None:
@@ -288,8 +540,11 @@ def promote_children(cat_id: int) -> None:
         parent_id = cat["parent_id"]
         conn.execute("UPDATE categories SET parent_id = ? WHERE parent_id = ?", (parent_id, cat_id))
         conn.commit()
+        invalidate_cache(CACHE_CATEGORIES)
 
 
+@perf_utils.timed("db.get_category_path")
+@_cached(CACHE_CATEGORIES)
 def get_category_path(cat_id: int) -> list[sqlite3.Row]:
     """Return path from root to this category (list of Row)."""
     with _connect() as conn:
@@ -310,6 +565,41 @@ def get_category_path(cat_id: int) -> list[sqlite3.Row]:
 # --- Notes ---
 
 
+def _note_list_query(
+    category_ids: list[int] | None,
+    tag_id: int | None,
+    search_query: str | None,
+    show_deleted: bool,
+    favorites_only: bool,
+) -> tuple[str, list[int | str]]:
+    source = "notes n"
+    conditions = ["n.is_deleted = 1" if show_deleted else "n.is_deleted = 0"]
+    params: list[int | str] = []
+
+    if tag_id is not None:
+        # Drive the query from idx_note_tags_tag: only the tagged notes are visited and sorted,
+        # instead of walking idx_notes_list over every note to probe note_tags for each one.
+        # CROSS JOIN pins note_tags as the outer loop; (note_id, tag_id) is the primary key, so no duplicates.
+        source = "note_tags nt CROSS JOIN notes n ON n.id = nt.note_id"
+        conditions.insert(0, "nt.tag_id = ?")
+        params.append(tag_id)
+    if favorites_only:
+        conditions.append("n.is_favorite = 1")
+    if category_ids:
+        cat_placeholders = ",".join("?" * len(category_ids))
+        conditions.append(f"n.category_id IN ({cat_placeholders})")
+        params.extend(category_ids)
+    if search_query:
+        conditions.append("(n.title LIKE ? OR n.content LIKE ?)")
+        like = f"%{search_query}%"
+        params.extend([like, like])
+
+    query = f"SELECT n.* FROM {source} WHERE " + " AND ".join(conditions)
+    query += " ORDER BY n.is_pinned DESC, n.updated_at DESC"
+    return query, params
+
+
+@perf_utils.timed("db.get_all_notes")
 def get_all_notes(
     category_id: int | None = None,
     tag_id: int | None = None,
@@ -317,40 +607,15 @@ def get_all_notes(
     show_deleted: bool = False,
     favorites_only: bool = False,
 ) -> list[sqlite3.Row]:
+    category_ids = None
+    if category_id is not None:
+        category_ids = [category_id] + get_descendant_category_ids(category_id)
+    query, params = _note_list_query(category_ids, tag_id, search_query, show_deleted, favorites_only)
     with _connect() as conn:
-        query = "SELECT DISTINCT n.* FROM notes n"
-        joins = []
-        conditions = []
-        params: list[int | str] = []
-
-        conditions.append("n.is_deleted = 1" if show_deleted else "n.is_deleted = 0")
-
-        if favorites_only:
-            conditions.append("n.is_favorite = 1")
-        if tag_id is not None:
-            joins.append("JOIN note_tags nt ON n.id = nt.note_id")
-            conditions.append("nt.tag_id = ?")
-            params.append(tag_id)
-        if category_id is not None:
-            descendant_ids = get_descendant_category_ids(category_id)
-            all_cat_ids = [category_id] + descendant_ids
-            cat_placeholders = ",".join("?" * len(all_cat_ids))
-            conditions.append(f"n.category_id IN ({cat_placeholders})")
-            params.extend(all_cat_ids)
-        if search_query:
-            conditions.append("(n.title LIKE ? OR n.content LIKE ?)")
-            like = f"%{search_query}%"
-            params.extend([like, like])
-
-        if joins:
-            query += " " + " ".join(joins)
-        if conditions:
-            query += " WHERE " + " AND ".join(conditions)
-        query += " ORDER BY n.is_pinned DESC, n.updated_at DESC"
-
         return conn.execute(query, params).fetchall()
 
 
+@perf_utils.timed("db.get_note")
 def get_note(note_id: int) -> sqlite3.Row | None:
     with _connect() as conn:
         return conn.execute("SELECT * FROM notes WHERE id = ?", (note_id,)).fetchone()  # type: ignore[no-any-return]
@@ -365,61 +630,81 @@ def get_note_by_title(title: str) -> sqlite3.Row | None:
         ).fetchone()
 
 
+@perf_utils.timed("db.add_note")
 def add_note(title: str, content: str = "", category_id: int | None = None) -> int:
     now = datetime.now().isoformat()
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, []) as tracked:
         cur = conn.execute(
             "INSERT INTO notes (title, content, category_id, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
             (title, content, category_id, now, now),
         )
         note_id = cur.lastrowid
-        conn.commit()
         assert note_id is not None
+        tracked.append(note_id)
+        conn.commit()
+        change_journal.record_insert(conn, note_id)
         return note_id
 
 
+@perf_utils.timed("db.update_note")
 def update_note(
     note_id: int, title: str | None = None, content: str | None = None, category_id: int | _Sentinel | None = None
-) -> None:
-    with _connect() as conn:
-        note = conn.execute("SELECT * FROM notes WHERE id = ?", (note_id,)).fetchone()
-        if not note:
-            return
-        now = datetime.now().isoformat()
-        # _UNSET sentinel means "set to NULL explicitly"
-        if category_id is _UNSET:
-            effective_category = None
-        elif category_id is not None:
-            effective_category = category_id
-        else:
-            effective_category = note["category_id"]
-        conn.execute(
-            "UPDATE notes SET title = ?, content = ?, category_id = ?, updated_at = ? WHERE id = ?",
-            (
-                title if title is not None else note["title"],
-                content if content is not None else note["content"],
-                effective_category,
-                now,
-                note_id,
-            ),
+) -> bool:
+    """Update the given fields and return True if the row actually changed.
+
+    A single conditional UPDATE: when every given field already has that value nothing is
+    written and updated_at is left alone (the note keeps its place in the list).
+    """
+    fields: list[tuple[str, Any]] = []
+    if title is not None:
+        fields.append(("title", title))
+    if content is not None:
+        fields.append(("content", content))
+    # _UNSET sentinel means "set to NULL explicitly"
+    if category_id is _UNSET:
+        fields.append(("category_id", None))
+    elif category_id is not None:
+        fields.append(("category_id", category_id))
+    if not fields:
+        return False
+
+    assignments = ", ".join(f"{name} = ?" for name, _value in fields)
+    changed = " OR ".join(f"{name} IS NOT ?" for name, _value in fields)
+    values = [value for _name, value in fields]
+    # Solo lo spostamento di categoria cambia i conteggi: il salvataggio del testo non li legge
+    tracked = [note_id] if category_id is not None else []
+    now = datetime.now().isoformat()
+    with _connect() as conn, _tracking_counts(conn, tracked):
+        cur = conn.execute(
+            f"UPDATE notes SET {assignments}, updated_at = ? WHERE id = ? AND ({changed})",
+            [*values, now, note_id, *values],
         )
         conn.commit()
+    if cur.rowcount == 0:
+        return False
+    changes = {name: value for name, value in fields if name != "content"}
+    change_journal.record_update([note_id], {**changes, "updated_at": now}, content=content)
+    return True
 
 
 def toggle_pin(note_id: int) -> None:
     with _connect() as conn:
         note = conn.execute("SELECT is_pinned FROM notes WHERE id = ?", (note_id,)).fetchone()
         if note:
-            conn.execute("UPDATE notes SET is_pinned = ? WHERE id = ?", (0 if note["is_pinned"] else 1, note_id))
+            value = 0 if note["is_pinned"] else 1
+            conn.execute("UPDATE notes SET is_pinned = ? WHERE id = ?", (value, note_id))
             conn.commit()
+            change_journal.record_update([note_id], {"is_pinned": value})
 
 
 def toggle_favorite(note_id: int) -> None:
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, [note_id]):
         note = conn.execute("SELECT is_favorite FROM notes WHERE id = ?", (note_id,)).fetchone()
         if note:
-            conn.execute("UPDATE notes SET is_favorite = ? WHERE id = ?", (0 if note["is_favorite"] else 1, note_id))
+            value = 0 if note["is_favorite"] else 1
+            conn.execute("UPDATE notes SET is_favorite = ? WHERE id = ?", (value, note_id))
             conn.commit()
+            change_journal.record_update([note_id], {"is_favorite": value})
 
 
 # --- Trash ---
@@ -427,91 +712,134 @@ def toggle_favorite(note_id: int) -> None:
 
 def soft_delete_note(note_id: int) -> None:
     now = datetime.now().isoformat()
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, [note_id]):
         conn.execute("UPDATE notes SET is_deleted = 1, deleted_at = ? WHERE id = ?", (now, note_id))
         conn.commit()
+    change_journal.record_update([note_id], {"is_deleted": 1, "deleted_at": now})
 
 
 def restore_note(note_id: int) -> None:
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, [note_id]):
         conn.execute("UPDATE notes SET is_deleted = 0, deleted_at = NULL WHERE id = ?", (note_id,))
         conn.commit()
+    change_journal.record_update([note_id], {"is_deleted": 0, "deleted_at": None})
 
 
-def permanent_delete_note(note_id: int) -> None:
+def _queue_attachment_files(conn: sqlite3.Connection, note_ids: list[int]) -> None:
+    """Journal the attachment files of note_ids for deletion, inside the caller's transaction."""
+    placeholders = ",".join("?" * len(note_ids))
+    conn.execute(
+        "INSERT OR IGNORE INTO pending_file_deletions (filename, queued_at)"
+        f" SELECT filename, ? FROM attachments WHERE note_id IN ({placeholders})",
+        [datetime.now().isoformat(), *note_ids],
+    )
+
+
+@perf_utils.timed("db.flush_file_deletions")
+def flush_file_deletions() -> int:
+    """Unlink files journaled by committed deletions. Returns number of journal entries cleared.
+
+    Called after every commit that queues files, and at startup to finish the work
+    interrupted by a crash between the commit and the unlink. Files still referenced by
+    another attachment row (shared by a bundle import) are kept.
+    """
     with _connect() as conn:
-        attachments = conn.execute("SELECT filename FROM attachments WHERE note_id = ?", (note_id,)).fetchall()
-        for att in attachments:
-            path = os.path.join(ATTACHMENTS_DIR, att["filename"])
-            if os.path.exists(path):
+        rows = conn.execute("SELECT filename FROM pending_file_deletions").fetchall()
+        done: list[tuple[str]] = []
+        for row in rows:
+            if conn.execute("SELECT 1 FROM attachments WHERE filename = ? LIMIT 1", (row["filename"],)).fetchone():
+                done.append((row["filename"],))
+                continue
+            path = os.path.join(ATTACHMENTS_DIR, row["filename"])
+            try:
                 os.remove(path)
-        conn.execute("DELETE FROM notes WHERE id = ?", (note_id,))
-        conn.commit()
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # Lascia la voce nel journal: verra' ritentata al prossimo flush
+                log.warning("Impossibile eliminare allegato %s: %s", row["filename"], e)
+                continue
+            done.append((row["filename"],))
+        if done:
+            conn.executemany("DELETE FROM pending_file_deletions WHERE filename = ?", done)
+            conn.commit()
+        return len(done)
+
+
+def permanent_delete_note(note_id: int) -> None:
+    permanent_delete_notes([note_id])
 
 
-def purge_trash(days: int = TRASH_PURGE_DAYS) -> None:
+@perf_utils.timed("db.purge_trash")
+def purge_trash(days: int = TRASH_PURGE_DAYS, batch_size: int = TRASH_PURGE_BATCH) -> int:
+    """Permanently delete notes trashed more than `days` ago, `batch_size` notes per transaction.
+
+    Returns the number of purged notes.
+    """
     cutoff = (datetime.now() - timedelta(days=days)).isoformat()
-    with _connect() as conn:
-        old_notes = conn.execute(
-            "SELECT n.id, a.filename FROM notes n "
-            "LEFT JOIN attachments a ON a.note_id = n.id "
-            "WHERE n.is_deleted = 1 AND n.deleted_at < ?",
-            (cutoff,),
-        ).fetchall()
-        # Cancella file allegati
-        for row in old_notes:
-            if row["filename"]:
-                path = os.path.join(ATTACHMENTS_DIR, row["filename"])
-                if os.path.exists(path):
-                    os.remove(path)
-        # Cancella note (CASCADE elimina note_tags, attachments, versions)
-        note_ids = list({row["id"] for row in old_notes})
-        if note_ids:
-            placeholders = ",".join("?" * len(note_ids))
-            conn.execute(f"DELETE FROM notes WHERE id IN ({placeholders})", note_ids)
-            conn.commit()
+    purged = 0
+    while True:
+        with _connect() as conn:
+            note_ids = [
+                row["id"]
+                for row in conn.execute(
+                    "SELECT id FROM notes WHERE is_deleted = 1 AND deleted_at < ? LIMIT ?",
+                    (cutoff, batch_size),
+                ).fetchall()
+            ]
+            if not note_ids:
+                break
+            with _tracking_counts(conn, note_ids):
+                _queue_attachment_files(conn, note_ids)
+                # CASCADE elimina note_tags, attachments, versions
+                placeholders = ",".join("?" * len(note_ids))
+                conn.execute(f"DELETE FROM notes WHERE id IN ({placeholders})", note_ids)
+                conn.commit()
+        change_journal.record_delete(note_ids)
+        flush_file_deletions()
+        purged += len(note_ids)
+    return purged
 
 
+@perf_utils.timed("db.soft_delete_notes")
 def soft_delete_notes(note_ids: list[int]) -> None:
     if not note_ids:
         return
     now = datetime.now().isoformat()
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, list(note_ids)):
         placeholders = ",".join("?" * len(note_ids))
         conn.execute(
             f"UPDATE notes SET is_deleted = 1, deleted_at = ? WHERE id IN ({placeholders})",
             [now] + list(note_ids),
         )
         conn.commit()
+    change_journal.record_update(note_ids, {"is_deleted": 1, "deleted_at": now})
 
 
+@perf_utils.timed("db.permanent_delete_notes")
 def permanent_delete_notes(note_ids: list[int]) -> None:
     if not note_ids:
         return
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, list(note_ids)):
+        _queue_attachment_files(conn, list(note_ids))
         placeholders = ",".join("?" * len(note_ids))
-        attachments = conn.execute(
-            f"SELECT filename FROM attachments WHERE note_id IN ({placeholders})",
-            list(note_ids),
-        ).fetchall()
-        for att in attachments:
-            path = os.path.join(ATTACHMENTS_DIR, att["filename"])
-            if os.path.exists(path):
-                os.remove(path)
         conn.execute(f"DELETE FROM notes WHERE id IN ({placeholders})", list(note_ids))
         conn.commit()
+    change_journal.record_delete(note_ids)
+    flush_file_deletions()
 
 
 def restore_notes(note_ids: list[int]) -> None:
     if not note_ids:
         return
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, list(note_ids)):
         placeholders = ",".join("?" * len(note_ids))
         conn.execute(
             f"UPDATE notes SET is_deleted = 0, deleted_at = NULL WHERE id IN ({placeholders})",
             list(note_ids),
         )
         conn.commit()
+    change_journal.record_update(note_ids, {"is_deleted": 0, "deleted_at": None})
 
 
 def set_pinned_notes(note_ids: list[int], value: bool) -> None:
@@ -524,31 +852,34 @@ def set_pinned_notes(note_ids: list[int], value: bool) -> None:
             [1 if value else 0] + list(note_ids),
         )
         conn.commit()
+    change_journal.record_update(note_ids, {"is_pinned": 1 if value else 0})
 
 
 def set_favorite_notes(note_ids: list[int], value: bool) -> None:
     if not note_ids:
         return
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, list(note_ids)):
         placeholders = ",".join("?" * len(note_ids))
         conn.execute(
             f"UPDATE notes SET is_favorite = ? WHERE id IN ({placeholders})",
             [1 if value else 0] + list(note_ids),
         )
         conn.commit()
+    change_journal.record_update(note_ids, {"is_favorite": 1 if value else 0})
 
 
 def move_notes_to_category(note_ids: list[int], category_id: int | _Sentinel | None) -> None:
     if not note_ids:
         return
     effective = None if category_id is _UNSET else category_id
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, list(note_ids)):
         placeholders = ",".join("?" * len(note_ids))
         conn.execute(
             f"UPDATE notes SET category_id = ? WHERE id IN ({placeholders})",
             [effective] + list(note_ids),
         )
         conn.commit()
+    change_journal.record_update(note_ids, {"category_id": effective})
 
 
 def get_note_ids_by_category(cat_id: int, include_descendants: bool = False) -> list[int]:
@@ -571,50 +902,257 @@ def delete_category_with_notes(cat_id: int) -> None:
 
 
 def get_trash_count() -> int:
-    with _connect() as conn:
-        row = conn.execute("SELECT COUNT(*) as c FROM notes WHERE is_deleted = 1").fetchone()
-        return row["c"]  # type: ignore[no-any-return]
+    return int(get_navigation_counts()["trash"])
+
+
+# --- Navigation counts ---
+#
+# Counts shown next to categories (including subcategories), tags, "all", favorites and trash.
+# Loaded with one aggregate query over the category closure, then kept current by the note
+# writers below, which apply the before/after membership of the notes they touch instead of
+# invalidating. Structural changes (categories, tags, bulk import) bump a cache generation and
+# force a reload.
+
+# (category_id, is_deleted, is_favorite, tag ids) of a note; None = note does not exist
+type _Membership = tuple[int | None, bool, bool, tuple[int, ...]] | None
+
+_NAVIGATION_COUNTS_QUERY = """
+    WITH RECURSIVE closure(ancestor, descendant) AS (
+        SELECT id, id FROM categories
+        UNION
+        SELECT closure.ancestor, c.id FROM closure JOIN categories c ON c.parent_id = closure.descendant
+    ),
+    direct(category_id, n) AS (
+        SELECT category_id, COUNT(*) FROM notes
+        WHERE is_deleted = 0 AND category_id IS NOT NULL GROUP BY category_id
+    )
+    SELECT 'category', closure.ancestor, SUM(direct.n)
+        FROM direct JOIN closure ON closure.descendant = direct.category_id GROUP BY closure.ancestor
+    UNION ALL
+    SELECT 'tag', nt.tag_id, COUNT(*)
+        FROM note_tags nt JOIN notes n ON n.id = nt.note_id WHERE n.is_deleted = 0 GROUP BY nt.tag_id
+    UNION ALL
+    SELECT 'all', NULL, COUNT(*) FROM notes WHERE is_deleted = 0
+    UNION ALL
+    SELECT 'favorites', NULL, COUNT(*) FROM notes WHERE is_deleted = 0 AND is_favorite = 1
+    UNION ALL
+    SELECT 'trash', NULL, COUNT(*) FROM notes WHERE is_deleted = 1
+"""
+
+
+class _NavigationCounts:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._key: tuple[Any, ...] | None = None
+        # Scritture in corso e concluse: un caricamento che si sovrappone a una scrittura non
+        # viene tenuto, altrimenti il delta di quella scrittura verrebbe contato due volte
+        self._writers = 0
+        self._writes = 0
+        self._categories: dict[int, int] = {}
+        self._tags: dict[int, int] = {}
+        self._totals: dict[str, int] = {}
+
+    @staticmethod
+    def _current_key() -> tuple[Any, ...]:
+        return (DB_PATH, *_cache.generations(_CACHE_DOMAINS))
+
+    def get(self) -> dict[str, Any]:
+        with self._lock:
+            if self._key == self._current_key():
+                return self._snapshot(self._categories, self._tags, self._totals)
+            writes = self._writes if self._writers == 0 else None
+        key = self._current_key()
+        categories: dict[int, int] = {}
+        tags: dict[int, int] = {}
+        totals = {"all": 0, "favorites": 0, "trash": 0}
+        with _connect() as conn:
+            for kind, item_id, count in conn.execute(_NAVIGATION_COUNTS_QUERY):
+                if kind == "category":
+                    categories[item_id] = count
+                elif kind == "tag":
+                    tags[item_id] = count
+                else:
+                    totals[kind] = count
+        with self._lock:
+            if writes == self._writes and self._writers == 0 and key == self._current_key():
+                self._key = key
+                self._categories, self._tags, self._totals = categories, tags, totals
+        return self._snapshot(categories, tags, totals)
+
+    @staticmethod
+    def _snapshot(categories: dict[int, int], tags: dict[int, int], totals: dict[str, int]) -> dict[str, Any]:
+        return {"categories": dict(categories), "tags": dict(tags), **totals}
+
+    def begin_write(self) -> None:
+        with self._lock:
+            self._writers += 1
+
+    def end_write(self, changes: list[tuple[_Membership, _Membership]] | None) -> None:
+        """Apply the (before, after) memberships of a committed write; None = unknown, reload."""
+        parents = {c["id"]: c["parent_id"] for c in get_all_categories()} if changes else {}
+        with self._lock:
+            self._writers -= 1
+            self._writes += 1
+            if changes is None:
+                self._key = None
+            elif self._key == self._current_key():
+                for before, after in changes:
+                    self._add(before, -1, parents)
+                    self._add(after, 1, parents)
+
+    def _add(self, membership: _Membership, sign: int, parents: dict[int, int | None]) -> None:
+        if membership is None:
+            return
+        category_id, is_deleted, is_favorite, tag_ids = membership
+        if is_deleted:
+            self._totals["trash"] += sign
+            return
+        self._totals["all"] += sign
+        if is_favorite:
+            self._totals["favorites"] += sign
+        seen: set[int] = set()
+        while category_id is not None and category_id not in seen:
+            seen.add(category_id)
+            self._categories[category_id] = self._categories.get(category_id, 0) + sign
+            category_id = parents.get(category_id)
+        for tag_id in tag_ids:
+            self._tags[tag_id] = self._tags.get(tag_id, 0) + sign
+
+
+_navigation_counts = _NavigationCounts()
+
+
+@perf_utils.timed("db.get_navigation_counts")
+def get_navigation_counts() -> dict[str, Any]:
+    """Active-note counts: {"categories": {id: n incl. subcategories}, "tags": {id: n}, "all", "favorites", "trash"}."""
+    return _navigation_counts.get()
+
+
+def _memberships(conn: sqlite3.Connection, note_ids: list[int]) -> dict[int, _Membership]:
+    placeholders = ",".join("?" * len(note_ids))
+    rows = conn.execute(
+        "SELECT n.id, n.category_id, n.is_deleted, n.is_favorite,"
+        " (SELECT json_group_array(tag_id) FROM note_tags WHERE note_id = n.id)"
+        f" FROM notes n WHERE n.id IN ({placeholders})",
+        note_ids,
+    ).fetchall()
+    return {r[0]: (r[1], bool(r[2]), bool(r[3]), tuple(json.loads(r[4]))) for r in rows}
+
+
+@contextmanager
+def _tracking_counts(conn: sqlite3.Connection, note_ids: list[int]) -> Generator[list[int], None, None]:
+    """Update the navigation counts for the notes a write touches, reading them before and after.
+
+    Yields `note_ids`; a writer that inserts notes appends the new ids to it. The body must
+    commit: the "after" state is read on the same connection once it returns.
+    """
+    before = _memberships(conn, note_ids) if note_ids else {}
+    _navigation_counts.begin_write()
+    changes: list[tuple[_Membership, _Membership]] | None = None
+    try:
+        yield note_ids
+        after = _memberships(conn, note_ids) if note_ids else {}
+        changes = [(before.get(i), after.get(i)) for i in dict.fromkeys(note_ids)]
+    finally:
+        _navigation_counts.end_write(changes)
 
 
 # --- Note Versions ---
 
-MAX_VERSIONS_PER_NOTE: int = 50
+# Spazio massimo (byte di contenuto) della cronologia di ogni nota, configurabile in app_settings
+VERSION_BUDGET_KEY = "version_budget_bytes"
+DEFAULT_VERSION_BUDGET: int = 5 * 1024 * 1024
+VERSION_PAGE_SIZE: int = 100
+
 
+def content_fingerprint(content: str) -> tuple[int, str]:
+    """(size in bytes, sha256 hex) stored with each version."""
+    data = content.encode("utf-8")
+    return len(data), hashlib.sha256(data).hexdigest()
 
-def save_version(note_id: int, title: str, content: str) -> None:
+
+def get_version_budget() -> int:
+    value = get_setting(VERSION_BUDGET_KEY)
+    return int(value) if value else DEFAULT_VERSION_BUDGET
+
+
+def set_version_budget(budget_bytes: int) -> None:
+    set_setting(VERSION_BUDGET_KEY, str(max(0, budget_bytes)))
+
+
+@perf_utils.timed("db.save_version")
+def save_version(note_id: int, title: str, content: str) -> bool:
+    """Snapshot a note; returns False when it matches the latest version already stored.
+
+    Older versions are pruned once the note's history exceeds the size budget; the newest
+    version is always kept, even if it alone is larger than the budget.
+    """
+    size, content_hash = content_fingerprint(content)
     now = datetime.now().isoformat()
     with _connect() as conn:
+        latest = conn.execute(
+            "SELECT title, content_hash FROM note_versions WHERE note_id = ? ORDER BY saved_at DESC, id DESC LIMIT 1",
+            (note_id,),
+        ).fetchone()
+        if latest and latest["content_hash"] == content_hash and latest["title"] == title:
+            return False
         conn.execute(
-            "INSERT INTO note_versions (note_id, title, content, saved_at) VALUES (?, ?, ?, ?)",
-            (note_id, title, content, now),
+            "INSERT INTO note_versions (note_id, title, content, saved_at, size, content_hash)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (note_id, title, content, now, size, content_hash),
         )
-        # Mantieni solo le ultime MAX_VERSIONS_PER_NOTE versioni
+        budget = conn.execute("SELECT value FROM app_settings WHERE key = ?", (VERSION_BUDGET_KEY,)).fetchone()
         conn.execute(
-            "DELETE FROM note_versions WHERE note_id = ? AND id NOT IN "
-            "(SELECT id FROM note_versions WHERE note_id = ? ORDER BY saved_at DESC LIMIT ?)",
-            (note_id, note_id, MAX_VERSIONS_PER_NOTE),
+            """
+            DELETE FROM note_versions WHERE id IN (
+                SELECT id FROM (
+                    SELECT id,
+                           ROW_NUMBER() OVER w AS rn,
+                           SUM(size) OVER (w ROWS UNBOUNDED PRECEDING) AS running
+                    FROM note_versions WHERE note_id = ?
+                    WINDOW w AS (ORDER BY saved_at DESC, id DESC)
+                ) WHERE rn > 1 AND running > ?
+            )
+            """,
+            (note_id, int(budget[0]) if budget else DEFAULT_VERSION_BUDGET),
         )
         conn.commit()
+        return True
 
 
-def get_note_versions(note_id: int) -> list[sqlite3.Row]:
+@perf_utils.timed("db.list_note_versions")
+def list_note_versions(note_id: int, limit: int = VERSION_PAGE_SIZE, offset: int = 0) -> list[sqlite3.Row]:
+    """Version metadata, newest first: id, title, saved_at, size, content_hash (no content)."""
     with _connect() as conn:
         return conn.execute(
-            "SELECT * FROM note_versions WHERE note_id = ? ORDER BY saved_at DESC",
-            (note_id,),
+            "SELECT id, title, saved_at, size, content_hash FROM note_versions WHERE note_id = ?"
+            " ORDER BY saved_at DESC, id DESC LIMIT ? OFFSET ?",
+            (note_id, limit, offset),
         ).fetchall()
 
 
-def restore_version(note_id: int, version_id: int) -> None:
+def get_version_stats(note_id: int) -> tuple[int, int]:
+    """(number of versions, total content bytes) of a note's history."""
     with _connect() as conn:
-        ver = conn.execute("SELECT * FROM note_versions WHERE id = ?", (version_id,)).fetchone()
-        if ver:
-            now = datetime.now().isoformat()
-            conn.execute(
-                "UPDATE notes SET title = ?, content = ?, updated_at = ? WHERE id = ?",
-                (ver["title"], ver["content"], now, note_id),
-            )
-            conn.commit()
+        row = conn.execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM note_versions WHERE note_id = ?", (note_id,)
+        ).fetchone()
+        return int(row[0]), int(row[1])
+
+
+def get_version(version_id: int) -> sqlite3.Row | None:
+    with _connect() as conn:
+        return conn.execute(  # type: ignore[no-any-return]
+            "SELECT id, note_id, title, content, saved_at FROM note_versions WHERE id = ?", (version_id,)
+        ).fetchone()
+
+
+@perf_utils.timed("db.restore_version")
+def restore_version(note_id: int, version_id: int) -> bool:
+    ver = get_version(version_id)
+    if ver is None:
+        return False
+    return update_note(note_id, title=ver["title"], content=ver["content"] or "")
 
 
 def delete_note_versions(note_id: int) -> None:
@@ -626,6 +1164,7 @@ def delete_note_versions(note_id: int) -> None:
 # --- Encryption helpers ---
 
 
+@perf_utils.timed("db.set_note_encrypted")
 def set_note_encrypted(note_id: int, encrypted_content: str, is_encrypted: bool = True) -> None:
     now = datetime.now().isoformat()
     with _connect() as conn:
@@ -634,11 +1173,18 @@ def set_note_encrypted(note_id: int, encrypted_content: str, is_encrypted: bool
             (encrypted_content, 1 if is_encrypted else 0, now, note_id),
         )
         conn.commit()
+    # Un testo cifrato non ha nulla in comune con il precedente: registrato intero
+    change_journal.forget_content(note_id)
+    change_journal.record_update(
+        [note_id], {"is_encrypted": 1 if is_encrypted else 0, "updated_at": now}, content=encrypted_content
+    )
 
 
 # --- Tags ---
 
 
+@perf_utils.timed("db.get_all_tags")
+@_cached(CACHE_TAGS)
 def get_all_tags() -> list[sqlite3.Row]:
     with _connect() as conn:
         return conn.execute("SELECT * FROM tags ORDER BY name").fetchall()
@@ -650,6 +1196,7 @@ def add_tag(name: str) -> int:
             cur = conn.execute("INSERT INTO tags (name) VALUES (?)", (name,))
             tag_id = cur.lastrowid
             conn.commit()
+            invalidate_cache(CACHE_TAGS)
         except sqlite3.IntegrityError:
             row = conn.execute("SELECT id FROM tags WHERE name = ?", (name,)).fetchone()
             tag_id = row["id"] if row else 0
@@ -659,10 +1206,24 @@ def add_tag(name: str) -> int:
 
 def delete_tag(tag_id: int) -> None:
     with _connect() as conn:
+        # Tag rimasti alle note che perdono questo, letti prima che ON DELETE CASCADE lo tolga
+        names: dict[int, list[str]] = {
+            r[0]: [] for r in conn.execute("SELECT note_id FROM note_tags WHERE tag_id = ?", (tag_id,))
+        }
+        for r in conn.execute(
+            "SELECT nt.note_id, t.name FROM note_tags nt JOIN tags t ON t.id = nt.tag_id"
+            " WHERE nt.tag_id != ? AND nt.note_id IN (SELECT note_id FROM note_tags WHERE tag_id = ?)",
+            (tag_id, tag_id),
+        ):
+            names[r[0]].append(r[1])
         conn.execute("DELETE FROM tags WHERE id = ?", (tag_id,))
         conn.commit()
+        invalidate_cache(CACHE_TAGS, CACHE_NOTES)
+    for note_id, tag_names in names.items():
+        change_journal.record_tags(note_id, tag_names)
 
 
+@perf_utils.timed("db.get_note_tags")
 def get_note_tags(note_id: int) -> list[sqlite3.Row]:
     with _connect() as conn:
         return conn.execute(
@@ -671,22 +1232,88 @@ def get_note_tags(note_id: int) -> list[sqlite3.Row]:
         ).fetchall()
 
 
+@perf_utils.timed("db.set_note_tags")
 def set_note_tags(note_id: int, tag_ids: list[int]) -> None:
-    with _connect() as conn:
+    with _connect() as conn, _tracking_counts(conn, [note_id]):
         conn.execute("DELETE FROM note_tags WHERE note_id = ?", (note_id,))
         for tid in tag_ids:
             conn.execute("INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)", (note_id, tid))
         conn.commit()
+        names = [
+            r["name"]
+            for r in conn.execute(
+                "SELECT t.name FROM tags t JOIN note_tags nt ON t.id = nt.tag_id WHERE nt.note_id = ?", (note_id,)
+            )
+        ]
+    change_journal.record_tags(note_id, names)
+
+
+@perf_utils.timed("db.get_tag_usage")
+def get_tag_usage(note_ids: list[int]) -> tuple[list[sqlite3.Row], dict[int, int]]:
+    """(all tags, {tag id: how many of `note_ids` carry it}) on one connection: what the tag dialogs show."""
+    with _connect() as conn:
+        tags = conn.execute("SELECT * FROM tags ORDER BY name").fetchall()
+        if not note_ids:
+            return tags, {}
+        placeholders = ",".join("?" * len(note_ids))
+        rows = conn.execute(
+            f"SELECT tag_id, COUNT(*) FROM note_tags WHERE note_id IN ({placeholders}) GROUP BY tag_id", note_ids
+        ).fetchall()
+        return tags, {r[0]: r[1] for r in rows}
+
+
+@perf_utils.timed("db.update_notes_tags")
+def update_notes_tags(note_ids: list[int], add: list[int], remove: list[int]) -> None:
+    """Add tags to and remove tags from several notes in one transaction."""
+    if not note_ids or not (add or remove):
+        return
+    with _connect() as conn, _tracking_counts(conn, list(note_ids)):
+        if remove:
+            conn.executemany(
+                "DELETE FROM note_tags WHERE note_id = ? AND tag_id = ?", [(n, t) for n in note_ids for t in remove]
+            )
+        if add:
+            conn.executemany(
+                "INSERT OR IGNORE INTO note_tags (note_id, tag_id) VALUES (?, ?)",
+                [(n, t) for n in note_ids for t in add],
+            )
+        conn.commit()
+        names: dict[int, list[str]] = {n: [] for n in note_ids}
+        placeholders = ",".join("?" * len(note_ids))
+        for r in conn.execute(
+            "SELECT nt.note_id, t.name FROM note_tags nt JOIN tags t ON t.id = nt.tag_id"
+            f" WHERE nt.note_id IN ({placeholders})",
+            note_ids,
+        ):
+            names[r[0]].append(r[1])
+    for note_id, tag_names in names.items():
+        change_journal.record_tags(note_id, tag_names)
 
 
 # --- Attachments ---
 
 
+@perf_utils.timed("db.get_note_attachments")
 def get_note_attachments(note_id: int) -> list[sqlite3.Row]:
     with _connect() as conn:
         return conn.execute("SELECT * FROM attachments WHERE note_id = ? ORDER BY added_at DESC", (note_id,)).fetchall()
 
 
+@perf_utils.timed("db.get_note_details")
+def get_note_details(note_id: int) -> tuple[list[sqlite3.Row], list[sqlite3.Row]]:
+    """(tags, attachments) of a note on one connection: what the editor shows under the text."""
+    with _connect() as conn:
+        tags = conn.execute(
+            "SELECT t.* FROM tags t JOIN note_tags nt ON t.id = nt.tag_id WHERE nt.note_id = ? ORDER BY t.name",
+            (note_id,),
+        ).fetchall()
+        attachments = conn.execute(
+            "SELECT * FROM attachments WHERE note_id = ? ORDER BY added_at DESC", (note_id,)
+        ).fetchall()
+        return tags, attachments
+
+
+@perf_utils.timed("db.add_attachment")
 def add_attachment(note_id: int, source_path: str) -> str:
     import shutil
     import uuid
@@ -696,12 +1323,16 @@ def add_attachment(note_id: int, source_path: str) -> str:
     filename = f"{uuid.uuid4().hex}{ext}"
     dest = os.path.join(ATTACHMENTS_DIR, filename)
     shutil.copy2(source_path, dest)
+    return add_attachment_file(note_id, filename, original_name)
 
+
+def add_attachment_file(note_id: int, filename: str, original_name: str | None = None) -> str:
+    """Record a file already written into ATTACHMENTS_DIR (screenshots) as an attachment of a note."""
     now = datetime.now().isoformat()
     with _connect() as conn:
         conn.execute(
             "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)",
-            (note_id, filename, original_name, now),
+            (note_id, filename, original_name or filename, now),
         )
         conn.commit()
     return filename
@@ -710,55 +1341,77 @@ def add_attachment(note_id: int, source_path: str) -> str:
 def delete_attachment(att_id: int) -> None:
     with _connect() as conn:
         att = conn.execute("SELECT filename FROM attachments WHERE id = ?", (att_id,)).fetchone()
-        if att:
-            path = os.path.join(ATTACHMENTS_DIR, att["filename"])
-            if os.path.exists(path):
-                os.remove(path)
-            conn.execute("DELETE FROM attachments WHERE id = ?", (att_id,))
-            conn.commit()
+        if not att:
+            return
+        conn.execute(
+            "INSERT OR IGNORE INTO pending_file_deletions (filename, queued_at) VALUES (?, ?)",
+            (att["filename"], datetime.now().isoformat()),
+        )
+        conn.execute("DELETE FROM attachments WHERE id = ?", (att_id,))
+        conn.commit()
+    flush_file_deletions()
 
 
 # --- Backup ---
 
 
-def create_backup(dest_dir: str | None = None) -> str:
-    import shutil
+# mynotes_backup_<data>.db[.gz|.zst][.enc]
+BACKUP_PREFIX = "mynotes_backup_"
+BACKUP_TIME_FORMAT = "%Y%m%d_%H%M%S"
+BACKUP_COMPRESSION_SUFFIXES: dict[str, str] = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def backup_filename(when: datetime, compression: str | None = None, encrypted: bool = False) -> str:
+    suffix = BACKUP_COMPRESSION_SUFFIXES.get(compression, "") if compression else ""
+    return f"{BACKUP_PREFIX}{when.strftime(BACKUP_TIME_FORMAT)}.db{suffix}{'.enc' if encrypted else ''}"
 
-    if dest_dir is None:
-        dest_dir = BACKUP_DIR
-    os.makedirs(dest_dir, exist_ok=True)
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    backup_name = f"mynotes_backup_{timestamp}.db"
-    backup_path = os.path.join(dest_dir, backup_name)
-    shutil.copy2(DB_PATH, backup_path)
-    return backup_path
 
+def parse_backup_name(filename: str) -> dict[str, Any] | None:
+    """{"timestamp", "compression", "encrypted"} of a backup file name; None if it is not a backup.
 
+    `timestamp` is None for backups renamed by hand (still listed, ordered last).
+    """
+    name = filename
+    encrypted = name.endswith(".enc")
+    if encrypted:
+        name = name[: -len(".enc")]
+    compression = None
+    for algorithm, suffix in BACKUP_COMPRESSION_SUFFIXES.items():
+        if name.endswith(".db" + suffix):
+            compression = algorithm
+            name = name[: -len(suffix)]
+            break
+    if not name.endswith(".db"):
+        return None
+    try:
+        timestamp: datetime | None = datetime.strptime(name, f"{BACKUP_PREFIX}{BACKUP_TIME_FORMAT}.db")
+    except ValueError:
+        timestamp = None
+    return {"timestamp": timestamp, "compression": compression, "encrypted": encrypted}
+
+
+@perf_utils.timed("db.get_backups")
 def get_backups(backup_dir: str | None = None) -> list[dict[str, Any]]:
     bdir = backup_dir or BACKUP_DIR
     if not os.path.exists(bdir):
         return []
     backups = []
     for f in sorted(os.listdir(bdir), reverse=True):
-        if f.startswith("mynotes_backup_") and (f.endswith(".db") or f.endswith(".db.enc")):
-            path = os.path.join(bdir, f)
-            size = os.path.getsize(path)
-            # Parse data dal filename
-            try:
-                name = f.replace(".db.enc", ".db")
-                ts = datetime.strptime(name, "mynotes_backup_%Y%m%d_%H%M%S.db")
-                date_str = ts.strftime("%d/%m/%Y %H:%M:%S")
-            except ValueError:
-                date_str = ""
-            backups.append(
-                {
-                    "filename": f,
-                    "path": path,
-                    "size": size,
-                    "date_str": date_str,
-                    "encrypted": f.endswith(".db.enc"),
-                }
-            )
+        info = parse_backup_name(f) if f.startswith(BACKUP_PREFIX) else None
+        if info is None:
+            continue
+        path = os.path.join(bdir, f)
+        ts = info["timestamp"]
+        backups.append(
+            {
+                "filename": f,
+                "path": path,
+                "size": os.path.getsize(path),
+                "date_str": ts.strftime("%d/%m/%Y %H:%M:%S") if ts else "",
+                "encrypted": info["encrypted"],
+                "compression": info["compression"],
+            }
+        )
     return backups
 
 
@@ -767,26 +1420,43 @@ def get_backups(backup_dir: str | None = None) -> list[dict[str, Any]]:
 
 def _ensure_category_path(path: list[str]) -> int | None:
     """Ensure category hierarchy exists and return leaf category ID."""
-    parent_id: int | None = None
     with _connect() as conn:
-        for name in path:
-            row = conn.execute(
-                "SELECT id FROM categories WHERE name = ? AND COALESCE(parent_id, 0) = ?",
-                (name, parent_id or 0),
-            ).fetchone()
-            if row:
-                parent_id = row["id"]
-            else:
-                cur = conn.execute("INSERT INTO categories (name, parent_id) VALUES (?, ?)", (name, parent_id))
-                conn.commit()
-                parent_id = cur.lastrowid
+        parent_id = ensure_category_path_in(conn, path)
+        conn.commit()
+        invalidate_cache(CACHE_CATEGORIES)
     return parent_id
 
 
-def export_note(note_id: int, dest_path: str) -> str:
-    import json
-    import zipfile
+def ensure_category_path_in(
+    conn: sqlite3.Connection, path: list[str], cache: dict[tuple[str, ...], int | None] | None = None
+) -> int | None:
+    """Like _ensure_category_path() but inside the caller's transaction (no commit).
 
+    `cache` maps path prefixes to ids and is filled as a side effect, so bulk imports
+    resolve each distinct folder once.
+    """
+    parent_id: int | None = None
+    for depth, name in enumerate(path, start=1):
+        key = tuple(path[:depth])
+        if cache is not None and key in cache:
+            parent_id = cache[key]
+            continue
+        row = conn.execute(
+            "SELECT id FROM categories WHERE name = ? AND COALESCE(parent_id, 0) = ?",
+            (name, parent_id or 0),
+        ).fetchone()
+        if row:
+            parent_id = row["id"]
+        else:
+            cur = conn.execute("INSERT INTO categories (name, parent_id) VALUES (?, ?)", (name, parent_id))
+            parent_id = cur.lastrowid
+        if cache is not None:
+            cache[key] = parent_id
+    return parent_id
+
+
+@perf_utils.timed("db.export_note")
+def export_note(note_id: int, dest_path: str) -> str:
     note = get_note(note_id)
     if not note:
         raise ValueError("Nota non trovata")
@@ -799,7 +1469,18 @@ def export_note(note_id: int, dest_path: str) -> str:
     if note["category_id"]:
         category_path = [r["name"] for r in get_category_path(note["category_id"])]
 
-    metadata = {
+    metadata = mynote_metadata(
+        note, [t["name"] for t in tags], [a["original_name"] for a in attachments], category_path
+    )
+    write_mynote_archive(dest_path, metadata, [(a["filename"], a["original_name"]) for a in attachments])
+    return dest_path
+
+
+def mynote_metadata(
+    note: sqlite3.Row | dict[str, Any], tag_names: list[str], attachment_names: list[str], category_path: list[str]
+) -> dict[str, Any]:
+    """Build the note.json payload of a .mynote archive from a notes row (or dict with the same keys)."""
+    return {
         "title": note["title"],
         "content": note["content"],
         "created_at": note["created_at"],
@@ -807,71 +1488,125 @@ def export_note(note_id: int, dest_path: str) -> str:
         "is_pinned": note["is_pinned"],
         "is_favorite": note["is_favorite"],
         "is_encrypted": note["is_encrypted"],
-        "tags": [t["name"] for t in tags],
-        "attachments": [a["original_name"] for a in attachments],
+        "tags": tag_names,
+        "attachments": attachment_names,
         "category_path": category_path,
     }
 
+
+def write_mynote_archive(dest_path: str, metadata: dict[str, Any], attachments: list[tuple[str, str]]) -> None:
+    """Write a .mynote zip; `attachments` is a list of (stored filename, original name)."""
+    import zipfile
+
     with zipfile.ZipFile(dest_path, "w", zipfile.ZIP_DEFLATED) as zf:
         zf.writestr("note.json", json.dumps(metadata, indent=2, ensure_ascii=False))
-        for att in attachments:
-            att_path = os.path.join(ATTACHMENTS_DIR, att["filename"])
+        for filename, original_name in attachments:
+            att_path = os.path.join(ATTACHMENTS_DIR, filename)
             if os.path.exists(att_path):
-                zf.write(att_path, f"attachments/{att['original_name']}")
+                zf.write(att_path, f"attachments/{original_name}", compress_type=zip_compress_type(filename))
 
-    return dest_path
 
+# Formati gia' compressi: deflate costa CPU senza ridurre la dimensione
+_COMPRESSED_EXTENSIONS: frozenset[str] = frozenset(
+    {
+        *(".png", ".jpg", ".jpeg", ".gif", ".webp", ".heic"),
+        *(".mp3", ".ogg", ".opus", ".m4a", ".aac", ".flac", ".mp4", ".mkv", ".webm", ".mov"),
+        *(".zip", ".gz", ".bz2", ".xz", ".7z", ".rar", ".zst"),
+        *(".docx", ".xlsx", ".pptx", ".odt", ".ods", ".epub", ".mynote"),
+    }
+)
 
-def import_note(source_path: str, category_id: int | None = None) -> int:
-    import json
-    import shutil
-    import uuid
+
+def zip_compress_type(filename: str) -> int:
+    """ZIP_STORED for already-compressed media, ZIP_DEFLATED for everything else."""
     import zipfile
 
-    with zipfile.ZipFile(source_path, "r") as zf:
-        meta = json.loads(zf.read("note.json"))
+    ext = os.path.splitext(filename)[1].lower()
+    return zipfile.ZIP_STORED if ext in _COMPRESSED_EXTENSIONS else zipfile.ZIP_DEFLATED
 
-        # Recreate category hierarchy from category_path if present
-        effective_category_id = category_id
-        cat_path = meta.get("category_path", [])
-        if cat_path and category_id is None:
-            effective_category_id = _ensure_category_path(cat_path)
 
-        note_id = add_note(meta["title"], meta.get("content", ""), effective_category_id)
+@_cached(CACHE_CATEGORIES)
+def get_category_paths() -> dict[int, list[str]]:
+    """Return {category_id: [root name, ..., leaf name]} for every category, from a single query."""
+    rows = {r["id"]: r for r in get_all_categories()}
+    paths: dict[int, list[str]] = {}
+    for cat_id in rows:
+        names: list[str] = []
+        current: int | None = cat_id
+        visited: set[int] = set()
+        while current is not None and current in rows and current not in visited:
+            visited.add(current)
+            names.append(rows[current]["name"])
+            current = rows[current]["parent_id"]
+        paths[cat_id] = names[::-1]
+    return paths
 
-        # Restore flags + tags in single connection
-        with _connect() as conn:
-            conn.execute(
-                "UPDATE notes SET is_pinned = ?, is_favorite = ?, is_encrypted = ? WHERE id = ?",
-                (meta.get("is_pinned", 0), meta.get("is_favorite", 0), meta.get("is_encrypted", 0), note_id),
-            )
-            conn.commit()
 
-        tag_ids = [add_tag(name) for name in meta.get("tags", [])]
-        if tag_ids:
-            set_note_tags(note_id, tag_ids)
+def _export_filter(note_ids: list[int] | None) -> tuple[str, list[str]]:
+    if note_ids is None:
+        return "n.is_deleted = 0", []
+    # Un solo parametro JSON invece di un placeholder per nota: nessun limite sul numero di id
+    return "n.id IN (SELECT value FROM json_each(?))", [json.dumps(note_ids)]
 
-        # Restore attachments
+
+def count_export_notes(note_ids: list[int] | None = None) -> int:
+    where, params = _export_filter(note_ids)
+    with _connect() as conn:
+        row = conn.execute(f"SELECT COUNT(*) FROM notes n WHERE {where}", params).fetchone()
+        return int(row[0])
+
+
+def iter_export_notes(
+    note_ids: list[int] | None = None, batch_size: int = EXPORT_BATCH
+) -> Generator[list[dict[str, Any]], None, None]:
+    """Stream the notes to export (all active notes, or `note_ids`) in list order, `batch_size` at a time.
+
+    The ids are listed first; each batch is then read on its own short connection, so no
+    read lock is held across yields (writers would wait BUSY_TIMEOUT_S and then fail while
+    a long export runs). Tag names and attachments come back with each row (as JSON
+    arrays), so no per-note queries are issued. Rows are plain dicts so they can be shipped
+    to worker processes; notes deleted meanwhile are skipped.
+    """
+    where, params = _export_filter(note_ids)
+    with _connect() as conn:
+        ids = [
+            r[0]
+            for r in conn.execute(
+                f"SELECT n.id FROM notes n WHERE {where} ORDER BY n.is_pinned DESC, n.updated_at DESC", params
+            )
+        ]
+    query = """
+        SELECT n.id, n.title, n.content, n.category_id, n.created_at, n.updated_at,
+               n.is_pinned, n.is_favorite, n.is_encrypted,
+               (SELECT json_group_array(t.name) FROM note_tags nt JOIN tags t ON t.id = nt.tag_id
+                 WHERE nt.note_id = n.id) AS tags_json,
+               (SELECT json_group_array(json_array(a.filename, a.original_name)) FROM attachments a
+                 WHERE a.note_id = n.id) AS attachments_json
+        FROM notes n WHERE n.id IN (SELECT value FROM json_each(?))
+    """
+    for start in range(0, len(ids), batch_size):
+        page = ids[start : start + batch_size]
         with _connect() as conn:
-            for name in zf.namelist():
-                if name.startswith("attachments/"):
-                    original_name = os.path.basename(name)
-                    if not original_name:
-                        continue
-                    ext = os.path.splitext(original_name)[1]
-                    filename = f"{uuid.uuid4().hex}{ext}"
-                    dest = os.path.join(ATTACHMENTS_DIR, filename)
-                    os.makedirs(ATTACHMENTS_DIR, exist_ok=True)
-                    with zf.open(name) as src, open(dest, "wb") as dst:
-                        shutil.copyfileobj(src, dst)
-                    now = datetime.now().isoformat()
-                    conn.execute(
-                        "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)",
-                        (note_id, filename, original_name, now),
-                    )
-            conn.commit()
+            rows = {row["id"]: row for row in conn.execute(query, (json.dumps(page),))}
+        batch = []
+        for note_id in page:
+            row = rows.get(note_id)
+            if row is None:
+                continue
+            note = dict(row)
+            note["tags"] = json.loads(note.pop("tags_json"))
+            note["attachments"] = [tuple(a) for a in json.loads(note.pop("attachments_json"))]
+            batch.append(note)
+        if batch:
+            yield batch
+
+
+@perf_utils.timed("db.import_note")
+def import_note(source_path: str, category_id: int | None = None) -> int:
+    """Import a single-note .mynote file and return the new note id (bulk imports: bundle_utils)."""
+    import bundle_utils
 
-    return note_id
+    return bundle_utils.import_archives([source_path], category_id=category_id)[0]
 
 
 # --- Pastebin Shares ---
@@ -1,20 +1,48 @@
-"""Dialog windows package — re-exports all dialog classes."""
+"""Dialog windows package — re-exports all dialog classes.
+
+The submodules are imported on first attribute access (PEP 562), so importing
+the package at startup does not pull in audio, pastebin or backup dependencies.
+"""
 
 from __future__ import annotations
 
-from dialogs.attachments import AttachmentDialog
-from dialogs.audio import AudioRecordDialog
-from dialogs.backup import BackupLogDialog, BackupRestoreDialog, BackupSettingsDialog
-from dialogs.category import CategoryDialog, NoteDialog
-from dialogs.history import VersionHistoryDialog
-from dialogs.password import PasswordDialog
-from dialogs.pastebin import (
-    PastebinManageDialog,
-    PastebinSettingsDialog,
-    PastebinShareDialog,
-    PastebinSuccessDialog,
-)
-from dialogs.tags import BulkTagDialog, TagManagerDialog
+import importlib
+from typing import TYPE_CHECKING, Any
+
+if TYPE_CHECKING:
+    from dialogs.attachments import AttachmentDialog
+    from dialogs.audio import AudioRecordDialog
+    from dialogs.backup import BackupLogDialog, BackupRestoreDialog, BackupSettingsDialog
+    from dialogs.category import CategoryDialog, NoteDialog
+    from dialogs.diagnostics import DiagnosticsDialog
+    from dialogs.history import VersionHistoryDialog
+    from dialogs.password import PasswordDialog
+    from dialogs.pastebin import (
+        PastebinManageDialog,
+        PastebinSettingsDialog,
+        PastebinShareDialog,
+        PastebinSuccessDialog,
+    )
+    from dialogs.tags import BulkTagDialog, TagManagerDialog
+
+_SUBMODULES: dict[str, str] = {
+    "AttachmentDialog": "dialogs.attachments",
+    "AudioRecordDialog": "dialogs.audio",
+    "BackupLogDialog": "dialogs.backup",
+    "BackupRestoreDialog": "dialogs.backup",
+    "BackupSettingsDialog": "dialogs.backup",
+    "CategoryDialog": "dialogs.category",
+    "NoteDialog": "dialogs.category",
+    "DiagnosticsDialog": "dialogs.diagnostics",
+    "VersionHistoryDialog": "dialogs.history",
+    "PasswordDialog": "dialogs.password",
+    "PastebinManageDialog": "dialogs.pastebin",
+    "PastebinSettingsDialog": "dialogs.pastebin",
+    "PastebinShareDialog": "dialogs.pastebin",
+    "PastebinSuccessDialog": "dialogs.pastebin",
+    "BulkTagDialog": "dialogs.tags",
+    "TagManagerDialog": "dialogs.tags",
+}
 
 __all__ = [
     "CategoryDialog",
@@ -32,4 +60,18 @@ __all__ = [
     "PastebinShareDialog",
     "PastebinSuccessDialog",
     "PastebinManageDialog",
+    "DiagnosticsDialog",
 ]
+
+
+def __getattr__(name: str) -> Any:
+    module_name = _SUBMODULES.get(name)
+    if module_name is None:
+        raise AttributeError(f"module 'dialogs' has no attribute {name!r}")
+    value = getattr(importlib.import_module(module_name), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__() -> list[str]:
+    return sorted(set(globals()) | set(__all__))
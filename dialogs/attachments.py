@@ -4,6 +4,7 @@ from __future__ import annotations
 
 import os
 import sqlite3
+from typing import TYPE_CHECKING
 
 from PySide6.QtWidgets import (
     QDialog,
@@ -19,12 +20,18 @@ from PySide6.QtWidgets import (
 import database as db
 import platform_utils
 
+if TYPE_CHECKING:
+    from gui.db_worker import AsyncDatabase
+
 
 class AttachmentDialog(QDialog):
-    def __init__(self, parent: QWidget, note_id: int) -> None:
+    """Attachments of one note; the list, copies and removals run on the DB worker."""
+
+    def __init__(self, parent: QWidget, note_id: int, adb: AsyncDatabase) -> None:
         super().__init__(parent)
         self.setWindowTitle("Allegati")
         self.note_id: int = note_id
+        self._adb = adb
         self.resize(450, 350)
         self.setModal(True)
 
@@ -59,17 +66,19 @@ class AttachmentDialog(QDialog):
 
         self.exec()
 
-    def _load_attachments(self) -> None:
+    def _load_attachments(self, _result: object = None) -> None:
+        self._adb.get_note_attachments(self.note_id, on_done=self._show_attachments)
+
+    def _show_attachments(self, attachments: list[sqlite3.Row]) -> None:
         self.listbox.clear()
-        self.attachments = db.get_note_attachments(self.note_id)
+        self.attachments = attachments
         for att in self.attachments:
             self.listbox.addItem(f"{att['original_name']}  ({att['added_at'][:10]})")
 
     def _add_file(self) -> None:
         path, _ = QFileDialog.getOpenFileName(self, "Seleziona file da allegare")
         if path:
-            db.add_attachment(self.note_id, path)
-            self._load_attachments()
+            self._adb.add_attachment(self.note_id, path, on_done=self._load_attachments, on_error=self._failed)
 
     def _remove_file(self) -> None:
         row = self.listbox.currentRow()
@@ -78,8 +87,10 @@ class AttachmentDialog(QDialog):
         att = self.attachments[row]
         answer = QMessageBox.question(self, "Conferma", f"Rimuovere '{att['original_name']}'?")
         if answer == QMessageBox.StandardButton.Yes:
-            db.delete_attachment(att["id"])
-            self._load_attachments()
+            self._adb.delete_attachment(att["id"], on_done=self._load_attachments, on_error=self._failed)
+
+    def _failed(self, exc: BaseException) -> None:
+        QMessageBox.critical(self, "Errore", f"Operazione non riuscita:\n{exc}")
 
     def _open_file(self) -> None:
         row = self.listbox.currentRow()
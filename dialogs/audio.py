@@ -129,7 +129,7 @@ class AudioRecordDialog(QDialog):
     def _start_recording(self) -> None:
         self._temp_path = audio_utils.get_temp_wav_path()
         try:
-            audio_utils.record_audio()
+            audio_utils.record_audio(save_path=self._temp_path)
         except Exception as e:
             QMessageBox.critical(self, "Errore", f"Impossibile avviare la registrazione:\n{e}")
             return
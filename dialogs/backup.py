@@ -2,15 +2,18 @@
 
 from __future__ import annotations
 
+import contextlib
 import os
 import threading
+from datetime import datetime
 from typing import Any
 
-from PySide6.QtCore import QTimer
+from PySide6.QtCore import QDateTime, QObject, QTimer, Signal
 from PySide6.QtGui import QFont
 from PySide6.QtWidgets import (
     QCheckBox,
     QComboBox,
+    QDateTimeEdit,
     QDialog,
     QFileDialog,
     QFrame,
@@ -86,6 +89,26 @@ class BackupSettingsDialog(QDialog):
         ret_layout.addStretch()
         layout.addLayout(ret_layout)
 
+        comp_layout = QHBoxLayout()
+        comp_layout.addWidget(QLabel("Compressione:"))
+        self.compression_combo = QComboBox()
+        self.compression_combo.addItem("Nessuna", "none")
+        for algorithm in backup_utils.available_compressions():
+            self.compression_combo.addItem(algorithm, algorithm)
+        comp_idx = self.compression_combo.findData(
+            self.settings.get("backup_compression", backup_utils.DEFAULT_COMPRESSION)
+        )
+        self.compression_combo.setCurrentIndex(max(comp_idx, 0))
+        comp_layout.addWidget(self.compression_combo)
+        comp_layout.addWidget(QLabel("Livello:"))
+        self.level_spin = QSpinBox()
+        comp_layout.addWidget(self.level_spin)
+        comp_layout.addStretch()
+        layout.addLayout(comp_layout)
+        self.compression_combo.currentIndexChanged.connect(self._update_level_range)
+        self._update_level_range()
+        self.level_spin.setValue(self.settings.get("backup_compression_level", backup_utils.DEFAULT_COMPRESSION_LEVEL))
+
         # --- Google Drive ---
         sep1 = QFrame()
         sep1.setFrameShape(QFrame.Shape.HLine)
@@ -225,6 +248,11 @@ class BackupSettingsDialog(QDialog):
             QMessageBox.critical(self, "Errore", msg)
         self._update_gdrive_status()
 
+    def _update_level_range(self) -> None:
+        low, high = self.backup_utils.COMPRESSION_LEVELS.get(self.compression_combo.currentData(), (0, 0))
+        self.level_spin.setRange(low, high)
+        self.level_spin.setEnabled(high > 0)
+
     def _browse_dir(self) -> None:
         d = QFileDialog.getExistingDirectory(self, "Cartella backup")
         if d:
@@ -235,6 +263,9 @@ class BackupSettingsDialog(QDialog):
         self.settings["local_backup_dir"] = self.dir_entry.text()
         self.settings["max_local_backups"] = self.max_spin.value()
         self.settings["retention_days"] = self.retention_spin.value()
+        self.settings["backup_compression"] = self.compression_combo.currentData()
+        if self.level_spin.isEnabled():
+            self.settings["backup_compression_level"] = self.level_spin.value()
         self.settings["gdrive_enabled"] = self.gdrive_cb.isChecked()
         self.settings["gdrive_folder_name"] = self.folder_entry.text()
         self.settings["max_gdrive_backups"] = self.gdrive_max_spin.value()
@@ -255,6 +286,25 @@ class BackupSettingsDialog(QDialog):
         self.accept()
 
 
+def _status_color(ok: bool | None) -> str:
+    if ok is None:
+        return FG_SECONDARY
+    return SUCCESS if ok else DANGER
+
+
+def _format_checked_at(iso: str) -> str:
+    try:
+        return datetime.fromisoformat(iso).strftime("il %d/%m/%Y %H:%M")
+    except ValueError:
+        return iso
+
+
+class _CatalogSignals(QObject):
+    """Signals for thread-safe UI updates."""
+
+    described = Signal(str, object)  # percorso del backup, voce del catalogo
+
+
 class BackupRestoreDialog(QDialog):
     def __init__(self, parent: QWidget) -> None:
         super().__init__(parent)
@@ -266,6 +316,13 @@ class BackupRestoreDialog(QDialog):
         import backup_utils
 
         self.backup_utils: Any = backup_utils
+        # Voci del catalogo per percorso; None = backup non ancora catalogato (descritto dal worker)
+        self._status: dict[str, dict[str, Any] | None] = {}
+        # Intervallo recuperabile dal journal delle modifiche, per percorso (None = non disponibile)
+        self._replay_ranges: dict[str, tuple[datetime, datetime] | None] = {}
+        self._catalog_signals = _CatalogSignals(self)
+        self._catalog_signals.described.connect(self._on_described)
+        self._closed = threading.Event()
 
         layout = QVBoxLayout(self)
         layout.setContentsMargins(15, 15, 15, 15)
@@ -299,6 +356,22 @@ class BackupRestoreDialog(QDialog):
         detail_layout.addWidget(self.detail_encrypted)
         local_layout.addWidget(detail_group)
 
+        replay_layout = QHBoxLayout()
+        self.replay_check = QCheckBox("Recupera le modifiche successive al backup, fino a:")
+        self.replay_check.setEnabled(False)
+        replay_layout.addWidget(self.replay_check)
+        self.replay_until = QDateTimeEdit()
+        self.replay_until.setDisplayFormat("dd/MM/yyyy HH:mm:ss")
+        self.replay_until.setCalendarPopup(True)
+        self.replay_until.setEnabled(False)
+        self.replay_check.toggled.connect(self.replay_until.setEnabled)
+        replay_layout.addWidget(self.replay_until)
+        replay_layout.addStretch()
+        local_layout.addLayout(replay_layout)
+        self.replay_hint = QLabel("")
+        self.replay_hint.setStyleSheet(f"color: {FG_SECONDARY};")
+        local_layout.addWidget(self.replay_hint)
+
         self.tabs.addTab(local_tab, "Locale")
 
         # --- Tab Google Drive ---
@@ -340,10 +413,15 @@ class BackupRestoreDialog(QDialog):
         self.backups: list[dict[str, Any]] = db.get_backups(backup_dir)
         for b in self.backups:
             enc_label = " [crittografato]" if b["encrypted"] else ""
+            if b["compression"]:
+                enc_label += f" [{b['compression']}]"
             size_kb = b["size"] / 1024
             self.backup_list.addItem(f"{b['date_str']}  ({size_kb:.0f} KB){enc_label}")
         if not self.backups:
             self.backup_list.addItem("Nessun backup disponibile.")
+        for b in self.backups:
+            self._status[b["path"]] = backup_utils.backup_status(b["path"])
+        self._describe_missing([b["path"] for b in self.backups if self._status[b["path"]] is None])
 
         # Load GDrive backups
         self.gdrive_backups: list[dict[str, Any]] = []
@@ -364,6 +442,8 @@ class BackupRestoreDialog(QDialog):
             return
         for b in self.gdrive_backups:
             enc_label = " [crittografato]" if b["encrypted"] else ""
+            if b["compression"]:
+                enc_label += f" [{b['compression']}]"
             size_kb = b["size"] / 1024
             self.gdrive_list.addItem(f"{b['date_str']}  ({size_kb:.0f} KB){enc_label}")
 
@@ -375,28 +455,99 @@ class BackupRestoreDialog(QDialog):
         size_kb = b["size"] / 1024
         self.detail_size.setText(f"Dimensione: {size_kb:.1f} KB")
 
+        details = []
         if b["encrypted"]:
-            self.detail_encrypted.setText("Crittografato: Si'")
-            self.detail_notes.setText("Note: (richiede password)")
-            self.detail_integrity.setText("Integrita': (richiede decrittografia)")
+            details.append("Crittografato: Si'")
+        if b["compression"]:
+            details.append(f"Compresso: {b['compression']}")
+        self.detail_encrypted.setText("\n".join(details))
+        self._update_replay(b["path"])
+
+        # Dal catalogo dei backup: nessuna lettura del backup a ogni selezione
+        meta = self._status.get(b["path"])
+        if meta is None:
+            for label in (self.detail_notes, self.detail_integrity, self.detail_checksum):
+                label.setStyleSheet(f"color: {FG_SECONDARY};")
+            self.detail_notes.setText("Note: analisi in corso...")
+            self.detail_integrity.setText("Integrita': analisi in corso...")
+            self.detail_checksum.setText("Checksum: analisi in corso...")
+            return
+        self.detail_notes.setStyleSheet("")
+        count = meta.get("note_count")
+        if count is None:
+            self.detail_notes.setText("Note: (richiede password)" if b["encrypted"] else "Note: -")
         else:
-            self.detail_encrypted.setText("")
-            count = self.backup_utils.get_note_count_from_backup(b["path"])
             self.detail_notes.setText(f"Note: {count}" if count >= 0 else "Note: errore lettura")
-            ok, msg = self.backup_utils.verify_backup_integrity(b["path"])
-            color = SUCCESS if ok else DANGER
-            self.detail_integrity.setText(f"Integrita': {msg}")
-            self.detail_integrity.setStyleSheet(f"color: {color};")
-
-        ok_cs, msg_cs = self.backup_utils.verify_checksum(b["path"])
-        if ok_cs is True:
-            color_cs = SUCCESS
-        elif ok_cs is False:
-            color_cs = DANGER
+
+        if meta.get("integrity_checked_at"):
+            ok = meta.get("integrity_ok")
+            when = _format_checked_at(meta["integrity_checked_at"])
+            self.detail_integrity.setText(f"Integrita': {meta.get('integrity', '-')} (verifica completa {when})")
+        elif "quick_check_ok" in meta:
+            ok = meta["quick_check_ok"]
+            self.detail_integrity.setText(f"Integrita': {meta['quick_check']}")
         else:
-            color_cs = FG_SECONDARY
-        self.detail_checksum.setText(f"Checksum: {msg_cs}")
-        self.detail_checksum.setStyleSheet(f"color: {color_cs};")
+            ok = None
+            self.detail_integrity.setText("Integrita': verifica completa in attesa")
+        self.detail_integrity.setStyleSheet(f"color: {_status_color(ok)};")
+
+        if not meta.get("checksum"):
+            self.detail_checksum.setText("Checksum: Non disponibile")
+            ok_cs = None
+        elif meta.get("checksum_checked_at"):
+            ok_cs = meta.get("checksum_ok")
+            when = _format_checked_at(meta["checksum_checked_at"])
+            state = "OK" if ok_cs else "non corrisponde: file modificato o corrotto"
+            self.detail_checksum.setText(f"Checksum: {state} (verificato {when})")
+        else:
+            ok_cs = None
+            self.detail_checksum.setText("Checksum: registrato, non ancora verificato")
+        self.detail_checksum.setStyleSheet(f"color: {_status_color(ok_cs)};")
+
+    def _update_replay(self, path: str) -> None:
+        if path not in self._replay_ranges:
+            self._replay_ranges[path] = self.backup_utils.journal_replay_range(path)
+        replay_range = self._replay_ranges[path]
+        if replay_range is None:
+            self.replay_check.setChecked(False)
+            self.replay_check.setEnabled(False)
+            self.replay_hint.setText("Nessuna modifica registrata dopo questo backup (solo per il backup piu' recente)")
+            return
+        start, end = replay_range
+        self.replay_check.setEnabled(True)
+        first, last = (QDateTime.fromMSecsSinceEpoch(int(t.timestamp() * 1000)) for t in (start, end))
+        self.replay_until.setDateTimeRange(first, last)
+        self.replay_until.setDateTime(last)
+        self.replay_hint.setText(f"Modifiche registrate fino al {end:%d/%m/%Y %H:%M:%S}")
+
+    def _describe_missing(self, paths: list[str]) -> None:
+        """Catalog backups made before the catalog existed, one at a time, off the GUI thread."""
+        if not paths:
+            return
+
+        def _work() -> None:
+            for path in paths:
+                if self._closed.is_set():
+                    return
+                try:
+                    meta = self.backup_utils.describe_backup(path)
+                except Exception as e:
+                    meta = {"quick_check": f"Errore lettura: {e}", "quick_check_ok": False}
+                # Il dialog puo' essere gia' stato chiuso
+                with contextlib.suppress(RuntimeError):
+                    self._catalog_signals.described.emit(path, meta)
+
+        threading.Thread(target=_work, daemon=True).start()
+
+    def _on_described(self, path: str, meta: dict[str, Any]) -> None:
+        self._status[path] = meta
+        row = self.backup_list.currentRow()
+        if 0 <= row < len(self.backups) and self.backups[row]["path"] == path:
+            self._on_local_select(row)
+
+    def done(self, result: int) -> None:
+        self._closed.set()
+        super().done(result)
 
     def _on_gdrive_select(self, row: int) -> None:
         if row < 0 or not self.gdrive_backups:
@@ -405,10 +556,12 @@ class BackupRestoreDialog(QDialog):
         self.gdrive_detail_date.setText(f"Data: {b['date_str']}")
         size_kb = b["size"] / 1024
         self.gdrive_detail_size.setText(f"Dimensione: {size_kb:.1f} KB")
+        details = []
         if b["encrypted"]:
-            self.gdrive_detail_encrypted.setText("Crittografato: Si'")
-        else:
-            self.gdrive_detail_encrypted.setText("")
+            details.append("Crittografato: Si'")
+        if b["compression"]:
+            details.append(f"Compresso: {b['compression']}")
+        self.gdrive_detail_encrypted.setText("\n".join(details))
 
     def _restore(self) -> None:
         if self.tabs.currentIndex() == 0:
@@ -438,6 +591,11 @@ class BackupRestoreDialog(QDialog):
             return
 
         self.result = {"path": b["path"], "password": password}
+        replay_range = self._replay_ranges.get(b["path"])
+        if self.replay_check.isChecked() and replay_range is not None:
+            until: datetime = self.replay_until.dateTime().toPython()  # type: ignore[assignment]
+            # Il widget arriva al millisecondo: al massimo dell'intervallo vale l'ultima modifica esatta
+            self.result["replay_until"] = replay_range[1] if until >= replay_range[1].replace(microsecond=0) else until
         self.accept()
 
     def _restore_gdrive(self) -> None:
@@ -473,7 +631,7 @@ class BackupRestoreDialog(QDialog):
                 return
             password = pwd_dlg.result
 
-        self.result = {"path": tmp_path, "password": password}
+        self.result = {"path": tmp_path, "password": password, "temporary": True}
         self.accept()
 
 
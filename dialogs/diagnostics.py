@@ -0,0 +1,121 @@
+"""Diagnostics dialog: live timing stats, slow calls, query plan audit."""
+
+from __future__ import annotations
+
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import (
+    QAbstractItemView,
+    QDialog,
+    QHBoxLayout,
+    QHeaderView,
+    QLabel,
+    QMessageBox,
+    QPlainTextEdit,
+    QPushButton,
+    QTableWidget,
+    QTableWidgetItem,
+    QVBoxLayout,
+    QWidget,
+)
+
+import database as db
+import perf_utils
+
+_COLUMNS = ["Funzione", "Chiamate", "Totale ms", "p50 ms", "p95 ms", "Max ms"]
+_REFRESH_MS = 1000
+
+
+class DiagnosticsDialog(QDialog):
+    def __init__(self, parent: QWidget) -> None:
+        super().__init__(parent)
+        self.setWindowTitle("Diagnostica prestazioni")
+        self.resize(760, 560)
+
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(15, 15, 15, 15)
+
+        if perf_utils.ENABLED:
+            status = f"Strumentazione attiva. Chiamate lente: oltre {perf_utils.SLOW_THRESHOLD_MS:.0f} ms."
+        else:
+            status = "Strumentazione disattivata: avvia MyNotes con la variabile d'ambiente MYNOTES_PROFILE=1."
+        layout.addWidget(QLabel(status))
+
+        self.table = QTableWidget(0, len(_COLUMNS))
+        self.table.setHorizontalHeaderLabels(_COLUMNS)
+        self.table.setEditTriggers(QAbstractItemView.EditTrigger.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        header = self.table.horizontalHeader()
+        header.setSectionResizeMode(0, QHeaderView.ResizeMode.Stretch)
+        for col in range(1, len(_COLUMNS)):
+            header.setSectionResizeMode(col, QHeaderView.ResizeMode.ResizeToContents)
+        layout.addWidget(self.table, stretch=3)
+
+        layout.addWidget(QLabel("Chiamate lente (piu' recenti in alto):"))
+        self.slow_view = QPlainTextEdit()
+        self.slow_view.setReadOnly(True)
+        layout.addWidget(self.slow_view, stretch=1)
+
+        layout.addWidget(QLabel("Cache query (categorie, tag, conteggi):"))
+        self.cache_view = QPlainTextEdit()
+        self.cache_view.setReadOnly(True)
+        layout.addWidget(self.cache_view, stretch=1)
+
+        btn_layout = QHBoxLayout()
+        btn_layout.addStretch()
+        reset_btn = QPushButton("Azzera")
+        reset_btn.clicked.connect(self._reset)
+        btn_layout.addWidget(reset_btn)
+        dump_btn = QPushButton("Scrivi nel log")
+        dump_btn.clicked.connect(self._dump)
+        btn_layout.addWidget(dump_btn)
+        close_btn = QPushButton("Chiudi")
+        close_btn.clicked.connect(self.reject)
+        btn_layout.addWidget(close_btn)
+        layout.addLayout(btn_layout)
+
+        self._timer = QTimer(self)
+        self._timer.timeout.connect(self._refresh)
+        self._timer.start(_REFRESH_MS)
+        self._refresh()
+
+        self.exec()
+
+    def _refresh(self) -> None:
+        stats = perf_utils.snapshot()
+        self.table.setRowCount(len(stats))
+        for row, s in enumerate(stats):
+            values = [
+                s["name"],
+                str(s["count"]),
+                f"{s['total_ms']:.1f}",
+                f"{s['p50_ms']:.2f}",
+                f"{s['p95_ms']:.2f}",
+                f"{s['max_ms']:.2f}",
+            ]
+            for col, value in enumerate(values):
+                item = QTableWidgetItem(value)
+                if col > 0:
+                    item.setTextAlignment(Qt.AlignmentFlag.AlignRight | Qt.AlignmentFlag.AlignVCenter)
+                self.table.setItem(row, col, item)
+
+        lines = [f"{when}  {name:<36} {elapsed:>9.1f} ms" for when, name, elapsed in perf_utils.slow_calls()]
+        self.slow_view.setPlainText("\n".join(lines))
+
+        cache = db.cache_stats()
+        cache_lines = []
+        for name, counts in cache["functions"].items():
+            total = counts["hits"] + counts["misses"]
+            rate = counts["hits"] * 100 / total if total else 0.0
+            cache_lines.append(f"{name:<32} hit {counts['hits']:>7}  miss {counts['misses']:>6}  ({rate:.0f}%)")
+        invalidations = ", ".join(f"{domain} {n}" for domain, n in cache["invalidations"].items())
+        cache_lines.append(f"Invalidazioni: {invalidations}  |  voci in memoria: {cache['entries']}")
+        self.cache_view.setPlainText("\n".join(cache_lines))
+
+    def _reset(self) -> None:
+        perf_utils.reset()
+        db.reset_cache_stats()
+        self._refresh()
+
+    def _dump(self) -> None:
+        perf_utils.dump_snapshot()
+        QMessageBox.information(self, "Diagnostica", "Profilo scritto in mynotes.log")
@@ -1,10 +1,17 @@
-"""Version history dialog."""
+"""Version history dialog: paged metadata list, lazy content, side-by-side diff."""
 
 from __future__ import annotations
 
-import sqlite3
+import contextlib
+import difflib
+import html
+import threading
+from collections.abc import Callable
+from typing import TYPE_CHECKING
 
+from PySide6.QtCore import QObject, Signal
 from PySide6.QtWidgets import (
+    QComboBox,
     QDialog,
     QHBoxLayout,
     QLabel,
@@ -12,36 +19,157 @@ from PySide6.QtWidgets import (
     QMessageBox,
     QPlainTextEdit,
     QPushButton,
+    QSpinBox,
+    QSplitter,
+    QTabWidget,
+    QTextBrowser,
     QVBoxLayout,
     QWidget,
 )
 
 import database as db
 
+if TYPE_CHECKING:
+    import sqlite3
+
+    from gui.db_worker import AsyncDatabase
+
+# Righe invariate mostrate attorno a ogni modifica nel confronto
+DIFF_CONTEXT = 3
+# Id riservato alla versione corrente della nota (non e' una riga di note_versions)
+CURRENT = 0
+_CONTENT_CACHE_SIZE = 4
+
+_ROW_COLORS = {"delete": ("#5c2b2b", ""), "insert": ("", "#2b5c34"), "replace": ("#5c4d2b", "#5c4d2b")}
+
+
+def side_by_side_html(old: str, new: str, context: int = DIFF_CONTEXT) -> str:
+    """Two-column HTML table of the changed lines (plus `context` lines around each change)."""
+    a = old.splitlines()
+    b = new.splitlines()
+    rows: list[str] = []
+
+    def _cell(num: int | None, text: str | None, color: str) -> str:
+        style = f' style="background:{color}"' if color else ""
+        number = "" if num is None else str(num + 1)
+        line = "" if text is None else html.escape(text)
+        return f'<td class="n">{number}</td><td{style}><pre>{line}</pre></td>'
+
+    for group in difflib.SequenceMatcher(None, a, b).get_grouped_opcodes(context):
+        if rows:
+            rows.append('<tr><td colspan="4" class="sep">&hellip;</td></tr>')
+        for tag, i1, i2, j1, j2 in group:
+            left_color, right_color = _ROW_COLORS.get(tag, ("", ""))
+            for k in range(max(i2 - i1, j2 - j1)):
+                i, j = i1 + k, j1 + k
+                left = _cell(i, a[i], left_color) if i < i2 else _cell(None, None, "")
+                right = _cell(j, b[j], right_color) if j < j2 else _cell(None, None, "")
+                rows.append(f"<tr>{left}{right}</tr>")
+
+    if not rows:
+        return "<p>Nessuna differenza.</p>"
+    return (
+        "<style>table{border-collapse:collapse;width:100%} td{vertical-align:top;padding:0 4px}"
+        " td.n{color:#888;text-align:right} td.sep{color:#888;text-align:center} pre{margin:0}</style>"
+        '<table cellspacing="0">' + "".join(rows) + "</table>"
+    )
+
+
+def _read_contents(note_id: int, version_ids: list[int]) -> dict[int, str]:
+    """Text of the given versions of a note (CURRENT = the note itself); runs on the DB worker."""
+    contents: dict[int, str] = {}
+    for version_id in version_ids:
+        row = db.get_note(note_id) if version_id == CURRENT else db.get_version(version_id)
+        contents[version_id] = (row["content"] if row else "") or ""
+    return contents
+
+
+def _restore_version(note_id: int, version_id: int) -> bool:
+    """Save the current text as a version, then restore `version_id`; runs on the DB worker."""
+    note = db.get_note(note_id)
+    if note:
+        db.save_version(note_id, note["title"], note["content"])
+    return db.restore_version(note_id, version_id)
+
+
+class _DiffSignals(QObject):
+    """Signals for thread-safe UI updates."""
+
+    ready = Signal(int, str)  # generazione, html
+
 
 class VersionHistoryDialog(QDialog):
-    def __init__(self, parent: QWidget, note_id: int) -> None:
+    """Versions of a note; list pages, contents and the restore go through the DB worker."""
+
+    def __init__(self, parent: QWidget, note_id: int, adb: AsyncDatabase) -> None:
         super().__init__(parent)
         self.setWindowTitle("Cronologia versioni")
         self.note_id: int = note_id
+        self._adb = adb
         self.result: bool | None = None  # type: ignore[assignment]
-        self.resize(600, 450)
+        self.resize(900, 560)
         self.setModal(True)
 
+        # Metadati caricati a pagine; il contenuto si legge solo quando serve
+        self.version_ids: list[int] = []
+        self._contents: dict[int, str] = {}
+        self._diff_generation = 0
+        self._diff_signals = _DiffSignals(self)
+        self._diff_signals.ready.connect(self._on_diff_ready)
+
         layout = QVBoxLayout(self)
         layout.setContentsMargins(15, 15, 15, 15)
 
-        layout.addWidget(QLabel("Versioni salvate:"))
+        splitter = QSplitter()
+        layout.addWidget(splitter, stretch=1)
 
+        left = QWidget()
+        left_layout = QVBoxLayout(left)
+        left_layout.setContentsMargins(0, 0, 0, 0)
+        left_layout.addWidget(QLabel("Versioni salvate:"))
         self.version_list = QListWidget()
         self.version_list.currentRowChanged.connect(self._on_select)
-        layout.addWidget(self.version_list)
+        left_layout.addWidget(self.version_list)
+        self.more_btn = QPushButton("Carica versioni precedenti")
+        self.more_btn.clicked.connect(self._load_page)
+        left_layout.addWidget(self.more_btn)
+        splitter.addWidget(left)
+
+        right = QWidget()
+        right_layout = QVBoxLayout(right)
+        right_layout.setContentsMargins(0, 0, 0, 0)
+        compare_layout = QHBoxLayout()
+        compare_layout.addWidget(QLabel("Confronta con:"))
+        self.compare_combo = QComboBox()
+        self.compare_combo.currentIndexChanged.connect(self._update_diff)
+        compare_layout.addWidget(self.compare_combo, stretch=1)
+        right_layout.addLayout(compare_layout)
 
-        layout.addWidget(QLabel("Anteprima:"))
+        self.tabs = QTabWidget()
         self.preview = QPlainTextEdit()
         self.preview.setReadOnly(True)
-        self.preview.setMaximumHeight(200)
-        layout.addWidget(self.preview)
+        self.tabs.addTab(self.preview, "Anteprima")
+        self.diff_view = QTextBrowser()
+        self.tabs.addTab(self.diff_view, "Confronto")
+        self.tabs.currentChanged.connect(self._update_diff)
+        right_layout.addWidget(self.tabs)
+        splitter.addWidget(right)
+        splitter.setSizes([300, 600])
+
+        budget_layout = QHBoxLayout()
+        budget_layout.addWidget(QLabel("Spazio massimo cronologia per nota:"))
+        self.budget_spin = QSpinBox()
+        self.budget_spin.setRange(1, 1024)
+        self.budget_spin.setSuffix(" MB")
+        self.budget_spin.setEnabled(False)
+        self.budget_spin.valueChanged.connect(lambda mb: adb.set_version_budget(mb * 1024 * 1024))
+        budget_layout.addWidget(self.budget_spin)
+        self.stats_label = QLabel("")
+        budget_layout.addWidget(self.stats_label)
+        adb.get_version_budget(on_done=self._show_budget)
+        adb.get_version_stats(note_id, on_done=self._show_stats)
+        budget_layout.addStretch()
+        layout.addLayout(budget_layout)
 
         btn_layout = QHBoxLayout()
         btn_layout.addStretch()
@@ -53,37 +181,129 @@ class VersionHistoryDialog(QDialog):
         btn_layout.addWidget(close_btn)
         layout.addLayout(btn_layout)
 
-        self.versions: list[sqlite3.Row] = db.get_note_versions(note_id)
-        for v in self.versions:
+        self.version_list.addItem("Versione attuale")
+        self.compare_combo.addItem("Versione attuale", CURRENT)
+        self.version_ids.append(CURRENT)
+        self.more_btn.setVisible(False)
+        self._load_page()
+
+        self.exec()
+
+    def _show_budget(self, budget: int) -> None:
+        self.budget_spin.blockSignals(True)
+        self.budget_spin.setValue(max(1, budget // (1024 * 1024)))
+        self.budget_spin.blockSignals(False)
+        self.budget_spin.setEnabled(True)
+
+    def _show_stats(self, stats: tuple[int, int]) -> None:
+        count, total = stats
+        self.stats_label.setText(f"({count} versioni, {total / 1024:.0f} KB)")
+
+    def _load_page(self) -> None:
+        self.more_btn.setEnabled(False)
+        offset = len(self.version_ids) - 1
+        self._adb.list_note_versions(
+            self.note_id,
+            limit=db.VERSION_PAGE_SIZE,
+            offset=offset,
+            on_done=lambda versions: self._show_page(offset, versions),
+        )
+
+    def _show_page(self, offset: int, versions: list[sqlite3.Row]) -> None:
+        for v in versions:
             date = v["saved_at"][:19].replace("T", " ")
-            title = v["title"][:40]
-            self.version_list.addItem(f"[{date}]  {title}")
+            label = f"[{date}]  {v['title'][:40]}  ({v['size'] / 1024:.1f} KB)"
+            self.version_list.addItem(label)
+            self.compare_combo.addItem(label, v["id"])
+            self.version_ids.append(v["id"])
+        self.more_btn.setVisible(len(versions) == db.VERSION_PAGE_SIZE)
+        self.more_btn.setEnabled(True)
+        if offset == 0:
+            if not versions:
+                self.version_list.addItem("Nessuna versione precedente salvata.")
+            self.version_list.setCurrentRow(1 if len(self.version_ids) > 1 else 0)
 
-        if not self.versions:
-            self.version_list.addItem("Nessuna versione precedente salvata.")
+    def _with_contents(self, version_ids: list[int], then: Callable[[list[str]], None]) -> None:
+        """Call then(texts of `version_ids`), reading the ones not cached on the DB worker."""
+        missing = [v for v in dict.fromkeys(version_ids) if v not in self._contents]
+        if not missing:
+            then([self._contents[v] for v in version_ids])
+            return
 
-        self.exec()
+        def _loaded(found: dict[int, str]) -> None:
+            for version_id, content in found.items():
+                if len(self._contents) >= _CONTENT_CACHE_SIZE:
+                    self._contents.pop(next(iter(self._contents)))
+                self._contents[version_id] = content
+            then([self._contents.get(v, found.get(v, "")) for v in version_ids])
+
+        self._adb.worker.call(_read_contents, self.note_id, missing, on_done=_loaded)
+
+    def _selected_id(self) -> int | None:
+        row = self.version_list.currentRow()
+        return self.version_ids[row] if 0 <= row < len(self.version_ids) else None
 
     def _on_select(self, row: int) -> None:
-        if row < 0 or not self.versions:
+        version_id = self._selected_id()
+        if version_id is None:
+            return
+
+        def _show(texts: list[str]) -> None:
+            # Nel frattempo puo' essere stata selezionata un'altra versione
+            if self._selected_id() == version_id:
+                self.preview.setPlainText(texts[0])
+
+        self._with_contents([version_id], _show)
+        self._update_diff()
+
+    def _update_diff(self) -> None:
+        """Recompute the diff on a worker thread; results of older requests are dropped."""
+        if self.tabs.currentWidget() is not self.diff_view:
+            return
+        version_id = self._selected_id()
+        other_id = self.compare_combo.currentData()
+        if version_id is None or other_id is None:
             return
-        ver = self.versions[row]
-        self.preview.setPlainText(ver["content"] or "")
+        self._diff_generation += 1
+        generation = self._diff_generation
+        self.diff_view.setHtml("<p>Calcolo differenze...</p>")
+
+        def _diff(texts: list[str]) -> None:
+            if generation != self._diff_generation:
+                return
+            old, new = texts
+
+            def _work() -> None:
+                diff_html = side_by_side_html(old, new)
+                # Il dialog puo' essere gia' stato chiuso
+                with contextlib.suppress(RuntimeError):
+                    self._diff_signals.ready.emit(generation, diff_html)
+
+            threading.Thread(target=_work, daemon=True).start()
+
+        self._with_contents([version_id, other_id], _diff)
+
+    def _on_diff_ready(self, generation: int, diff_html: str) -> None:
+        if generation == self._diff_generation:
+            self.diff_view.setHtml(diff_html)
 
     def _restore(self) -> None:
-        row = self.version_list.currentRow()
-        if row < 0 or not self.versions:
+        version_id = self._selected_id()
+        if not version_id:
             return
-        ver = self.versions[row]
         if (
             QMessageBox.question(
                 self, "Ripristina", "Ripristinare questa versione?\nLa versione attuale verra' salvata."
             )
             == QMessageBox.StandardButton.Yes
         ):
-            note = db.get_note(self.note_id)
-            if note:
-                db.save_version(self.note_id, note["title"], note["content"])
-            db.restore_version(self.note_id, ver["id"])
-            self.result = True
-            self.accept()
+            self.setEnabled(False)
+            self._adb.worker.call(_restore_version, self.note_id, version_id, on_done=self._restored)
+
+    def _restored(self, ok: bool) -> None:
+        if not ok:
+            self.setEnabled(True)
+            QMessageBox.warning(self, "Ripristina", "Versione non piu' disponibile.")
+            return
+        self.result = True
+        self.accept()
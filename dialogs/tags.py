@@ -18,16 +18,22 @@ from PySide6.QtWidgets import (
 )
 
 if TYPE_CHECKING:
+    import sqlite3
+
     from PySide6.QtGui import QKeyEvent
 
-import database as db
+    from gui.db_worker import AsyncDatabase
 
 
 class TagManagerDialog(QDialog):
-    def __init__(self, parent: QWidget, note_id: int) -> None:
+    """Tags of one note; read and written on the DB worker, the checkboxes appear when loaded."""
+
+    def __init__(self, parent: QWidget, note_id: int, adb: AsyncDatabase) -> None:
         super().__init__(parent)
         self.setWindowTitle("Gestione Tag")
         self.note_id: int = note_id
+        self._adb = adb
+        self._loaded = False
         self.setFixedWidth(350)
         self.setModal(True)
 
@@ -62,33 +68,33 @@ class TagManagerDialog(QDialog):
         self.exec()
 
     def _load_tags(self) -> None:
-        while self.check_layout.count():
-            child = self.check_layout.takeAt(0)
-            if child is not None and child.widget():
-                child.widget().deleteLater()  # type: ignore[union-attr]
-
-        all_tags = db.get_all_tags()
-        note_tags = db.get_note_tags(self.note_id)
-        note_tag_ids = {t["id"] for t in note_tags}
+        self._adb.get_tag_usage([self.note_id], on_done=lambda usage: self._show_tags(*usage))
+
+    def _show_tags(self, all_tags: list[sqlite3.Row], usage: dict[int, int]) -> None:
+        # Dopo "Aggiungi" le spunte gia' cambiate dall'utente restano com'erano
+        checked = {tid for tid, cb in self.tag_vars.items() if cb.isChecked()} if self._loaded else set(usage)
+        _clear_layout(self.check_layout)
         self.tag_vars = {}
         for tag in all_tags:
             cb = QCheckBox(tag["name"])
-            cb.setChecked(tag["id"] in note_tag_ids)
+            cb.setChecked(tag["id"] in checked)
             self.tag_vars[tag["id"]] = cb
             self.check_layout.addWidget(cb)
         if not all_tags:
             self.check_layout.addWidget(QLabel("Nessun tag creato."))
+        self._loaded = True
 
     def _add_tag(self) -> None:
         name = self.new_tag_entry.text().strip()
         if name:
-            db.add_tag(name)
+            self._adb.add_tag(name, on_done=lambda _tag_id: self._load_tags())
             self.new_tag_entry.clear()
-            self._load_tags()
 
     def _on_close(self) -> None:
-        selected_ids = [tid for tid, cb in self.tag_vars.items() if cb.isChecked()]
-        db.set_note_tags(self.note_id, selected_ids)
+        # Chiuso prima che i tag arrivassero: niente da scrivere
+        if self._loaded:
+            selected_ids = [tid for tid, cb in self.tag_vars.items() if cb.isChecked()]
+            self._adb.set_note_tags(self.note_id, selected_ids)
         self.accept()
 
     def keyPressEvent(self, event: QKeyEvent) -> None:
@@ -105,10 +111,11 @@ class BulkTagDialog(QDialog):
     partial = leave unchanged (initial state when some notes have the tag).
     """
 
-    def __init__(self, parent: QWidget, note_ids: list[int]) -> None:
+    def __init__(self, parent: QWidget, note_ids: list[int], adb: AsyncDatabase) -> None:
         super().__init__(parent)
         self.setWindowTitle(f"Tag per {len(note_ids)} note")
         self.note_ids: list[int] = note_ids
+        self._adb = adb
         self.result: bool = False  # type: ignore[assignment]
         self.setFixedWidth(380)
         self.setModal(True)
@@ -158,19 +165,10 @@ class BulkTagDialog(QDialog):
         super().exec()
 
     def _load_tags(self) -> None:
-        while self.check_layout.count():
-            child = self.check_layout.takeAt(0)
-            if child is not None and child.widget():
-                child.widget().deleteLater()  # type: ignore[union-attr]
-
-        all_tags = db.get_all_tags()
-
-        # Count how many of the selected notes have each tag
-        tag_counts: dict[int, int] = {}
-        for nid in self.note_ids:
-            for t in db.get_note_tags(nid):
-                tag_counts[t["id"]] = tag_counts.get(t["id"], 0) + 1
+        self._adb.get_tag_usage(self.note_ids, on_done=lambda usage: self._show_tags(*usage))
 
+    def _show_tags(self, all_tags: list[sqlite3.Row], tag_counts: dict[int, int]) -> None:
+        _clear_layout(self.check_layout)
         total = len(self.note_ids)
         self.tag_vars = {}
         self._initial_partial: set[int] = set()
@@ -207,9 +205,8 @@ class BulkTagDialog(QDialog):
     def _add_tag(self) -> None:
         name = self.new_tag_entry.text().strip()
         if name:
-            db.add_tag(name)
+            self._adb.add_tag(name, on_done=lambda _tag_id: self._load_tags())
             self.new_tag_entry.clear()
-            self._load_tags()
 
     def _on_ok(self) -> None:
         # Collect intended add/remove sets first
@@ -223,12 +220,8 @@ class BulkTagDialog(QDialog):
                 remove_tags.add(tid)
             # PartiallyChecked = leave unchanged
 
-        # Apply to each note in one shot
-        for nid in self.note_ids:
-            current = {t["id"] for t in db.get_note_tags(nid)}
-            updated = (current | add_tags) - remove_tags
-            if updated != current:
-                db.set_note_tags(nid, list(updated))
+        # Tutte le note in una transazione, sul DB worker
+        self._adb.update_notes_tags(self.note_ids, sorted(add_tags), sorted(remove_tags))
 
         self.result = True
         self.accept()
@@ -240,3 +233,10 @@ class BulkTagDialog(QDialog):
             self._on_ok()
         else:
             super().keyPressEvent(event)
+
+
+def _clear_layout(layout: QVBoxLayout) -> None:
+    while layout.count():
+        child = layout.takeAt(0)
+        if child is not None and child.widget():
+            child.widget().deleteLater()  # type: ignore[union-attr]
@@ -11,6 +11,8 @@ ERROR_CODES: dict[str, str] = {
     "UPD-005": "Estrazione archivio fallita",
     "UPD-006": "Applicazione file aggiornamento fallita",
     "UPD-007": "Creazione script aggiornamento Windows fallita",
+    "UPD-008": "File aggiornamento danneggiato (hash non corrispondente)",
+    "UPD-009": "Manifest aggiornamento non firmato o firma non valida",
     # Backup
     "BKP-001": "Errore backup locale",
     "BKP-002": "Errore connessione Google Drive",
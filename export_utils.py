@@ -0,0 +1,302 @@
+"""Motore di esportazione in blocco: HTML unico, cartelle strutturate, bundle .mynote.
+
+Le note arrivano in streaming a blocchi (database.iter_export_notes), il Markdown
+viene convertito in un pool di processi e ogni nota viene scritta appena pronta, con
+progresso e annullamento. Nessuna dipendenza da Qt: il chiamante decide in quale thread girare.
+"""
+
+from __future__ import annotations
+
+import html as html_mod
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+from collections import deque
+from collections.abc import Callable, Iterator
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import date
+from pathlib import Path
+from typing import Any
+
+import bundle_utils
+import database as db
+import perf_utils
+from _types import ProgressCallback
+
+log = logging.getLogger("export")
+
+FORMAT_HTML = "html"
+FORMAT_FOLDER = "folder"
+FORMAT_BUNDLE = "bundle"
+
+# Sotto questa soglia avviare i processi costa piu' di quanto fanno risparmiare
+POOL_MIN_NOTES = 200
+POOL_MAX_WORKERS = 4
+# Lotti in volo nel pool: limita la memoria a pochi lotti indipendentemente dalla libreria
+MAX_INFLIGHT_BATCHES = POOL_MAX_WORKERS * 2
+
+_MARKDOWN_EXTENSIONS = ["fenced_code", "tables", "nl2br"]
+_INVALID_CHARS_RE = re.compile(r'[<>:"/\\|?*]')
+
+type Note = dict[str, Any]
+type Renderer = Callable[[list[tuple[str, bool]]], list[str]]
+
+
+class ExportCancelled(Exception):
+    """Raised inside export_notes() when the cancel event is set; partial output is removed."""
+
+
+# --- Rendering (funzioni di modulo: devono essere picklable per il pool) ---
+
+
+def render_markdown_batch(items: list[tuple[str, bool]]) -> list[str]:
+    """Render (content, is_encrypted) pairs to HTML bodies with the same extensions as the preview."""
+    import markdown
+
+    md = markdown.Markdown(extensions=_MARKDOWN_EXTENSIONS)
+    bodies = []
+    for content, is_encrypted in items:
+        if is_encrypted:
+            bodies.append("<p><em>[Nota criptata]</em></p>")
+        else:
+            bodies.append(md.convert(content))
+            md.reset()
+    return bodies
+
+
+def render_checklist_batch(items: list[tuple[str, bool]]) -> list[str]:
+    """Line-based rendering used by the single-file HTML export (escaped text + checklist boxes)."""
+    bodies = []
+    for content, _is_encrypted in items:
+        html_lines = []
+        for line in html_mod.escape(content).split("\n"):
+            if line.strip().startswith("[x]"):
+                html_lines.append(f'<div class="checklist-done">&#9745; {line.strip()[3:].strip()}</div>')
+            elif line.strip().startswith("[ ]"):
+                html_lines.append(f"<div>&#9744; {line.strip()[3:].strip()}</div>")
+            else:
+                html_lines.append(f"<p>{line}</p>" if line.strip() else "<br>")
+        bodies.append("\n".join(html_lines))
+    return bodies
+
+
+def sanitize_filename(name: str) -> str:
+    """Remove/replace characters invalid in file/folder names."""
+    sanitized = _INVALID_CHARS_RE.sub("_", name).strip().strip(".")
+    return sanitized or "Senza_nome"
+
+
+def build_note_html(note: Note, body: str) -> str:
+    """Generate a styled standalone HTML page for a note."""
+    title = html_mod.escape(note["title"] or "Senza titolo")
+    created = (note["created_at"] or "")[:10]
+    updated = (note["updated_at"] or "")[:10]
+    tag_str = " ".join(f"#{html_mod.escape(name)}" for name in note["tags"])
+
+    return (
+        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n"
+        f"<title>{title}</title>\n"
+        "<style>\n"
+        "body { font-family: sans-serif; max-width: 800px; margin: auto; padding: 20px; }\n"
+        "h1 { color: #333; }\n"
+        ".meta { color: #888; font-size: 0.85em; margin-bottom: 1em; }\n"
+        "pre { background: #f4f4f4; padding: 12px; border-radius: 4px; overflow-x: auto; }\n"
+        "code { background: #f4f4f4; padding: 2px 4px; border-radius: 3px; }\n"
+        "table { border-collapse: collapse; }\n"
+        "th, td { border: 1px solid #ddd; padding: 8px; }\n"
+        "</style>\n</head>\n<body>\n"
+        f"<h1>{title}</h1>\n"
+        f'<div class="meta">Creata: {created} | Modificata: {updated}'
+        f"{(' | ' + tag_str) if tag_str else ''}</div>\n"
+        f"{body}\n"
+        "</body>\n</html>"
+    )
+
+
+# --- Writers ---
+
+
+class _UniqueNames:
+    """Case-insensitive unique file names per directory."""
+
+    def __init__(self) -> None:
+        self._used: dict[Path, set[str]] = {}
+
+    def pick(self, directory: Path, title: str) -> str:
+        used = self._used.setdefault(directory, set())
+        base_name = sanitize_filename(title or "Senza titolo")
+        name = base_name
+        counter = 2
+        while name.lower() in used:
+            name = f"{base_name}_{counter}"
+            counter += 1
+        used.add(name.lower())
+        return name
+
+
+class _HtmlDocumentWriter:
+    """All notes in one HTML file, written note by note to a .part file and renamed at the end."""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._part = f"{path}.part"
+        self._file = open(self._part, "w", encoding="utf-8")  # noqa: SIM115 - chiuso in commit()/abort()
+        self._file.write(
+            "\n".join(
+                [
+                    "<!DOCTYPE html><html><head><meta charset='utf-8'>",
+                    "<title>MyNotes Export</title>",
+                    "<style>body{font-family:sans-serif;max-width:800px;margin:auto;padding:20px}",
+                    ".note{border:1px solid #ddd;padding:20px;margin:20px 0;border-radius:8px}",
+                    ".note h2{margin-top:0;color:#333}.meta{color:#888;font-size:0.85em}",
+                    ".checklist-done{text-decoration:line-through;color:#888}</style></head><body>",
+                    "<h1>MyNotes Export</h1>",
+                ]
+            )
+            + "\n"
+        )
+
+    def write(self, note: Note, body: str) -> None:
+        tag_str = " ".join(f"#{name}" for name in note["tags"])
+        self._file.write('<div class="note">\n')
+        self._file.write(f"<h2>{html_mod.escape(note['title'])}</h2>\n")
+        self._file.write(f'<div class="meta">{note["created_at"][:10]} | {tag_str}</div>\n')
+        self._file.write(body)
+        self._file.write("\n</div>\n")
+
+    def commit(self) -> str:
+        self._file.write("</body></html>")
+        self._file.close()
+        os.replace(self._part, self.path)
+        return self.path
+
+    def abort(self) -> None:
+        self._file.close()
+        if os.path.exists(self._part):
+            os.remove(self._part)
+
+
+class _FolderWriter:
+    """One standalone HTML page per note, in a new folder tree mirroring the category hierarchy."""
+
+    def __init__(self, base_dir: str) -> None:
+        folder_name = f"MyNotes_export_{date.today().isoformat()}"
+        export_dir = Path(base_dir) / folder_name
+        suffix = 1
+        while export_dir.exists():
+            suffix += 1
+            export_dir = Path(base_dir) / f"{folder_name}_{suffix}"
+        export_dir.mkdir(parents=True)
+        self.export_dir = export_dir
+        self._category_paths = db.get_category_paths()
+        self._names = _UniqueNames()
+
+    def write(self, note: Note, body: str) -> None:
+        note_dir = self.export_dir
+        cat_id: int | None = note["category_id"]
+        if cat_id and cat_id in self._category_paths:
+            note_dir = note_dir.joinpath(*(sanitize_filename(name) for name in self._category_paths[cat_id]))
+        note_dir.mkdir(parents=True, exist_ok=True)
+        file_name = self._names.pick(note_dir, note["title"])
+        (note_dir / f"{file_name}.html").write_text(build_note_html(note, body), encoding="utf-8")
+
+    def commit(self) -> str:
+        return str(self.export_dir)
+
+    def abort(self) -> None:
+        shutil.rmtree(self.export_dir, ignore_errors=True)
+
+
+class _BundleExportWriter(bundle_utils.BundleWriter):
+    """All notes in one multi-note .mynote bundle (see bundle_utils)."""
+
+    def write(self, note: Note, body: str) -> None:
+        self.add_note(note)
+
+
+_WRITERS: dict[str, type[_HtmlDocumentWriter] | type[_FolderWriter] | type[_BundleExportWriter]] = {
+    FORMAT_HTML: _HtmlDocumentWriter,
+    FORMAT_FOLDER: _FolderWriter,
+    FORMAT_BUNDLE: _BundleExportWriter,
+}
+# Formati senza renderer (bundle) copiano il contenuto grezzo
+_RENDERERS: dict[str, Renderer] = {
+    FORMAT_HTML: render_checklist_batch,
+    FORMAT_FOLDER: render_markdown_batch,
+}
+
+
+# --- Pipeline ---
+
+
+def _render_inputs(batch: list[Note]) -> list[tuple[str, bool]]:
+    return [(note["content"] or "", bool(note["is_encrypted"])) for note in batch]
+
+
+def _rendered(
+    batches: Iterator[list[Note]], renderer: Renderer | None, use_pool: bool
+) -> Iterator[tuple[list[Note], list[str]]]:
+    """Yield (batch, bodies) in input order; with a pool, up to MAX_INFLIGHT_BATCHES render ahead."""
+    if renderer is None:
+        for batch in batches:
+            yield batch, [""] * len(batch)
+        return
+    if not use_pool:
+        for batch in batches:
+            yield batch, renderer(_render_inputs(batch))
+        return
+
+    # spawn anche su Linux: fork di un processo con thread Qt attivi non e' sicuro
+    workers = min(POOL_MAX_WORKERS, os.cpu_count() or 1)
+    pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    pending: deque[tuple[list[Note], Future[list[str]]]] = deque()
+    try:
+        for batch in batches:
+            pending.append((batch, pool.submit(renderer, _render_inputs(batch))))
+            if len(pending) >= MAX_INFLIGHT_BATCHES:
+                done_batch, future = pending.popleft()
+                yield done_batch, future.result()
+        while pending:
+            done_batch, future = pending.popleft()
+            yield done_batch, future.result()
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+@perf_utils.timed("export.export_notes")
+def export_notes(
+    fmt: str,
+    dest: str,
+    note_ids: list[int] | None = None,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None,
+) -> tuple[int, str]:
+    """Export all active notes (or `note_ids`) as `fmt` into `dest`.
+
+    `dest` is the output file for FORMAT_HTML and FORMAT_BUNDLE, a directory for FORMAT_FOLDER.
+    Returns (exported count, output path). Raises ExportCancelled if `cancel` gets set;
+    in that case nothing partial is left behind.
+    """
+    total = db.count_export_notes(note_ids)
+    writer = _WRITERS[fmt](dest)
+    renderer = _RENDERERS.get(fmt)
+    use_pool = total >= POOL_MIN_NOTES
+    exported = 0
+    try:
+        for batch, bodies in _rendered(db.iter_export_notes(note_ids), renderer, use_pool):
+            for note, body in zip(batch, bodies, strict=True):
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                writer.write(note, body)
+                exported += 1
+            if progress:
+                progress(exported * 100 // max(total, 1), f"Esportate {exported}/{total} note")
+        output = writer.commit()
+    except BaseException:
+        writer.abort()
+        raise
+    log.info("Esportazione %s: %d note in %s", fmt, exported, output)
+    return exported, output
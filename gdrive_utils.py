@@ -171,8 +171,41 @@ def _cleanup_old_gdrive_backups(service: Any, folder_id: str, max_count: int, re
             service.files().delete(fileId=old["id"]).execute()
 
 
-def do_gdrive_backup(callback: Callable[[bool, str], None] | None = None) -> None:
-    """Upload backup to Google Drive in background thread."""
+def upload_gdrive_backup(backup_path: str) -> str:
+    """Upload an existing local backup to Google Drive and prune old ones; returns a summary.
+
+    Synchronous: raises on failure.
+    """
+    from backup_utils import get_settings
+
+    backup_name = os.path.basename(backup_path)
+    service = _get_gdrive_service()
+    log.info("Autenticazione Google Drive OK")
+
+    settings = get_settings()
+    folder_name = settings.get("gdrive_folder_name", "MyNotes Backup")
+    folder_id = _get_or_create_folder(service, folder_name)
+    log.info("Cartella Drive trovata: %s", folder_name)
+
+    from googleapiclient.http import MediaFileUpload
+
+    file_metadata = {"name": backup_name, "parents": [folder_id]}
+    media = MediaFileUpload(backup_path, mimetype="application/octet-stream")
+    log.info("Upload file in corso: %s", backup_name)
+    service.files().create(body=file_metadata, media_body=media, fields="id").execute()
+
+    # Cleanup vecchi backup su Google Drive
+    retention_days = settings.get("retention_days", 90)
+    max_gdrive = settings.get("max_gdrive_backups", 20)
+    _cleanup_old_gdrive_backups(service, folder_id, max_gdrive, retention_days)
+    log.info("Pulizia backup vecchi completata")
+
+    log.info("Backup caricato su Google Drive: %s/%s", folder_name, backup_name)
+    return f"Backup caricato su Google Drive\nCartella: {folder_name}\nFile: {backup_name}"
+
+
+def do_gdrive_backup(callback: Callable[[bool, str], None] | None = None, backup_path: str | None = None) -> None:
+    """Upload backup to Google Drive in background thread (a new local backup unless `backup_path` is given)."""
 
     def _upload() -> None:
         try:
@@ -182,37 +215,16 @@ def do_gdrive_backup(callback: Callable[[bool, str], None] | None = None) -> Non
                 return
 
             log.info("Avvio upload Google Drive")
+            path = backup_path
+            if path is None:
+                from backup_utils import do_local_backup
 
-            from backup_utils import do_local_backup, get_settings
-
-            backup_path = do_local_backup()
-            backup_name = os.path.basename(backup_path)
-            log.info("Backup locale creato: %s", backup_name)
-
-            service = _get_gdrive_service()
-            log.info("Autenticazione Google Drive OK")
-
-            settings = get_settings()
-            folder_name = settings.get("gdrive_folder_name", "MyNotes Backup")
-            folder_id = _get_or_create_folder(service, folder_name)
-            log.info("Cartella Drive trovata: %s", folder_name)
-
-            from googleapiclient.http import MediaFileUpload
-
-            file_metadata = {"name": backup_name, "parents": [folder_id]}
-            media = MediaFileUpload(backup_path, mimetype="application/octet-stream")
-            log.info("Upload file in corso: %s", backup_name)
-            service.files().create(body=file_metadata, media_body=media, fields="id").execute()
-
-            # Cleanup vecchi backup su Google Drive
-            retention_days = settings.get("retention_days", 90)
-            max_gdrive = settings.get("max_gdrive_backups", 20)
-            _cleanup_old_gdrive_backups(service, folder_id, max_gdrive, retention_days)
-            log.info("Pulizia backup vecchi completata")
+                path = do_local_backup()
+                log.info("Backup locale creato: %s", os.path.basename(path))
 
-            log.info("Backup caricato su Google Drive: %s/%s", folder_name, backup_name)
+            msg = upload_gdrive_backup(path)
             if callback:
-                callback(True, f"Backup caricato su Google Drive\nCartella: {folder_name}\nFile: {backup_name}")
+                callback(True, msg)
 
         except Exception as e:
             log.warning("Upload Google Drive fallito: %s", e)
@@ -249,7 +261,8 @@ def list_gdrive_backups() -> list[dict[str, Any]]:
         backups = []
         for f in results.get("files", []):
             name = f.get("name", "")
-            if not (name.endswith(".db") or name.endswith(".db.enc")):
+            info = db.parse_backup_name(name)
+            if info is None:
                 continue
             try:
                 ct = datetime.strptime(f["createdTime"], "%Y-%m-%dT%H:%M:%S.%fZ")
@@ -262,7 +275,8 @@ def list_gdrive_backups() -> list[dict[str, Any]]:
                     "name": name,
                     "size": int(f.get("size", 0)),
                     "date_str": date_str,
-                    "encrypted": name.endswith(".db.enc"),
+                    "encrypted": info["encrypted"],
+                    "compression": info["compression"],
                 }
             )
         return backups
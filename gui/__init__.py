@@ -3,6 +3,7 @@
 from __future__ import annotations
 
 import logging
+import time
 from typing import TYPE_CHECKING, Any
 
 if TYPE_CHECKING:
@@ -28,6 +29,9 @@ from PySide6.QtCore import QTimer
 from PySide6.QtWidgets import QMainWindow
 
 import backup_utils
+import database as db
+import perf_utils
+from gui.autosave import AutosaveService
 from gui.backup_controller import BackupController
 from gui.constants import (
     ACCENT,
@@ -43,12 +47,14 @@ from gui.constants import (
     SELECT_BG,
     SELECT_FG,
 )
+from gui.db_worker import AsyncDatabase, DbWorker
 from gui.export_controller import ExportController
 from gui.layout import build_main_layout, build_toolbar
 from gui.media_controller import MediaController
 from gui.menu import build_menu
 from gui.note_controller import NoteController
 from gui.pastebin_controller import PastebinController
+from gui.trash_controller import TrashController
 from gui.update_controller import UpdateController
 from version import VERSION
 
@@ -68,15 +74,14 @@ class MyNotesApp(QMainWindow):
         self.current_tag_id: int | None = None
         self.show_trash: bool = False
         self.show_favorites: bool = False
-        self._save_job: QTimer | None = None
         self._image_refs: list[Any] = []
-        self._version_counter: int = 0
         self._decrypted_cache: dict[int, tuple[str, str]] = {}  # note_id -> (text, password)
         self._detached_windows: dict[int, Any] = {}
 
         # Data
         self.categories: list[sqlite3.Row] = []
         self.notes: list[sqlite3.Row] = []
+        self._note_rows: dict[int, int] = {}  # note_id -> riga in note_listbox / notes
         self.all_tags: list[sqlite3.Row] = []
         self.gallery_attachments: list[sqlite3.Row] = []
 
@@ -111,6 +116,13 @@ class MyNotesApp(QMainWindow):
         build_toolbar(self)
         build_main_layout(self)
 
+        # Database fuori dal thread GUI: self.adb.<funzione>(..., on_done=...) come database.<funzione>
+        self.db_worker = DbWorker(self)
+        self.adb = AsyncDatabase(self.db_worker)
+
+        # Salvataggio automatico condiviso con le finestre staccate
+        self.autosave = AutosaveService(self, self.db_worker)
+
         # Controllers
         self.notes_ctl = NoteController(self)
         self.export_ctl = ExportController(self)
@@ -118,13 +130,24 @@ class MyNotesApp(QMainWindow):
         self.backup_ctl = BackupController(self)
         self.update_ctl = UpdateController(self)
         self.pastebin_ctl = PastebinController(self)
+        self.trash_ctl = TrashController(self)
 
         # Connect preview link clicks to wikilink handler
         self.preview_browser.anchorClicked.connect(self.notes_ctl._on_preview_link_clicked)
+        self.autosave.signals.saved.connect(self.notes_ctl.on_note_saved)
+        self.autosave.signals.failed.connect(
+            lambda _note_id, err: self.statusBar().showMessage(f"Salvataggio fallito: {err}")
+        )
+
+        self._backup_scheduler = backup_utils.BackupScheduler(self, last_activity=lambda: self.autosave.last_edit)
+
+    def finish_startup(self, started_at: float | None = None) -> None:
+        """Seconda fase dell'avvio, eseguita dopo che la finestra e' stata mostrata."""
+        # Migrazioni: con lo schema gia' aggiornato e' un solo PRAGMA
+        db.init_db()
 
         # Backup: migrate legacy password, prompt if needed
         backup_utils.migrate_legacy_password()
-        self._backup_scheduler = backup_utils.BackupScheduler(self)
         self._backup_scheduler.start()
         QTimer.singleShot(500, self._check_backup_password)
 
@@ -132,8 +155,14 @@ class MyNotesApp(QMainWindow):
         self.notes_ctl.load_categories()
         self.notes_ctl.load_notes()
 
+        self.trash_ctl.schedule_purge()
         QTimer.singleShot(2000, self.update_ctl.check_silent)
 
+        if started_at is not None:
+            elapsed_ms = (time.perf_counter() - started_at) * 1000
+            perf_utils.record("startup.interactive", elapsed_ms)
+            log.info("Avvio completato: interattiva in %.0f ms", elapsed_ms)
+
     def open_in_window(self, note_id: int) -> None:
         if note_id is None:
             return
@@ -152,6 +181,16 @@ class MyNotesApp(QMainWindow):
         self._detached_windows[note_id] = win
         win.show()
 
+    def reload_after_restore(self) -> None:
+        """Reset editor, caches and navigation and reload everything from the restored database."""
+        self.autosave.reset()
+        self._decrypted_cache.clear()
+        self.notes_ctl._clear_editor()
+        self.current_category_id = None
+        self.current_tag_id = None
+        self.notes_ctl.load_categories()
+        self.notes_ctl.load_notes(preserve_selection=False)
+
     def _check_backup_password(self) -> None:
         """Se crittografia backup attiva ma password non in memoria, chiedi all'utente."""
         settings = backup_utils.get_settings()
@@ -169,15 +208,19 @@ class MyNotesApp(QMainWindow):
     def closeEvent(self, event: QCloseEvent) -> None:
         for win in list(self._detached_windows.values()):
             win._on_close()
-        self.notes_ctl.save_current()
-        self._backup_scheduler.stop()
+        self.autosave.shutdown()
+        # Via d'uscita sincrona: tutto cio' che e' in coda arriva al database prima del backup
+        self.db_worker.shutdown()
+        self._backup_scheduler.shutdown()
         settings = backup_utils.get_settings()
         if settings.get("auto_backup", True):
             if settings.get("encrypt_backups") and not backup_utils.has_backup_password():
                 log.warning("Auto-backup: crittografia abilitata ma password non disponibile, salto")
             else:
                 try:
-                    backup_utils.do_local_backup()
+                    # Attende un backup o una verifica schedulati ancora in corso: mai due backup insieme
+                    with self._backup_scheduler.paused():
+                        backup_utils.do_local_backup()
                 except Exception as e:
                     log.warning("Auto-backup alla chiusura fallito: %s", e)
         event.accept()
@@ -0,0 +1,162 @@
+"""Salvataggio automatico write-behind condiviso da finestra principale e finestre staccate (PySide6).
+
+Le modifiche vengono accumulate per nota dietro un unico timer di debounce: al timeout ogni
+nota in attesa viene letta dall'editor una sola volta, confrontata con l'hash dell'ultimo
+salvataggio e, se cambiata, scritta tramite DbWorker nella corsia della nota: i salvataggi
+di una nota arrivano al database nell'ordine in cui sono stati chiesti, e le letture chieste
+dopo (lista, cronologia) li vedono.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from collections.abc import Callable
+from concurrent.futures import Future
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+import database as db
+import perf_utils
+from gui.constants import AUTO_SAVE_MS, VERSION_SAVE_EVERY
+
+if TYPE_CHECKING:
+    from gui.db_worker import DbWorker
+
+log = logging.getLogger("autosave")
+
+# (titolo, contenuto in chiaro, password se la nota e' criptata e va ricifrata)
+type Snapshot = tuple[str, str, str | None]
+# Letta sul thread GUI al momento del salvataggio; None = niente da salvare
+type SnapshotSource = Callable[[], Snapshot | None]
+
+
+def _digest(title: str, content: str) -> bytes:
+    h = hashlib.blake2b(digest_size=16)
+    h.update(title.encode("utf-8"))
+    h.update(b"\0")
+    h.update(content.encode("utf-8"))
+    return h.digest()
+
+
+class _SaveSignals(QObject):
+    """Signals for thread-safe UI updates."""
+
+    saved = Signal(int, str)  # note_id, titolo
+    failed = Signal(int, str)  # note_id, errore
+
+
+class AutosaveService:
+    """Coalesce edits per note and write them behind the UI on the note's DbWorker lane.
+
+    Editors call schedule() on every change; flush() forces the pending save of one note
+    (waiting for it by default, for callers that read the note back from the database).
+    `signals.saved` fires on the GUI thread after each write.
+    """
+
+    def __init__(self, parent: QObject, worker: DbWorker, delay_ms: int = AUTO_SAVE_MS) -> None:
+        self.signals = _SaveSignals(parent)
+        self._timer = QTimer(parent)
+        self._timer.setSingleShot(True)
+        self._timer.setInterval(delay_ms)
+        self._timer.timeout.connect(self.flush_all)
+        self._sources: dict[int, SnapshotSource] = {}
+        self._saved_digest: dict[int, bytes] = {}
+        self._edit_count: dict[int, int] = {}
+        self._inflight: dict[int, Future[None]] = {}
+        self._worker = worker
+        # time.monotonic() dell'ultima modifica in un editor (0 = nessuna): i lavori in
+        # background (backup pianificati) aspettano che l'utente smetta di scrivere
+        self.last_edit = 0.0
+
+    def schedule(self, note_id: int, source: SnapshotSource) -> None:
+        """Mark `note_id` dirty; the snapshot is taken when the debounce timer fires."""
+        self._sources[note_id] = source
+        self.last_edit = time.monotonic()
+        self._timer.start()
+
+    def mark_clean(self, note_id: int, title: str, content: str) -> None:
+        """Record what the editor just loaded, so saving it back unchanged is skipped."""
+        self._saved_digest[note_id] = _digest(title, content)
+
+    def discard(self, note_id: int) -> None:
+        """Drop a pending save (note deleted, encrypted or reloaded from elsewhere)."""
+        self._sources.pop(note_id, None)
+        self._saved_digest.pop(note_id, None)
+
+    def flush(self, note_id: int, wait: bool = True) -> None:
+        source = self._sources.pop(note_id, None)
+        if source is not None:
+            self._submit(note_id, source)
+        if wait:
+            future = self._inflight.get(note_id)
+            if future is not None:
+                future.result()
+
+    def flush_all(self, wait: bool = False) -> None:
+        self._timer.stop()
+        for note_id in list(self._sources):
+            self.flush(note_id, wait=False)
+        if wait:
+            for future in list(self._inflight.values()):
+                future.result()
+
+    def reset(self) -> None:
+        """Forget pending saves and saved-content hashes (database replaced by a restore)."""
+        self._timer.stop()
+        self._sources.clear()
+        self._saved_digest.clear()
+        self._edit_count.clear()
+
+    def shutdown(self) -> None:
+        """Write everything pending and wait for it (application exit)."""
+        self.flush_all(wait=True)
+
+    def _submit(self, note_id: int, source: SnapshotSource) -> None:
+        snapshot = source()
+        if snapshot is None or not snapshot[0]:
+            return
+        title, content, password = snapshot
+        digest = _digest(title, content)
+        if self._saved_digest.get(note_id) == digest:
+            return
+        self._saved_digest[note_id] = digest
+
+        save_version = False
+        # Niente versioni in chiaro per le note criptate
+        if password is None:
+            count = self._edit_count.get(note_id, 0) + 1
+            save_version = count >= VERSION_SAVE_EVERY
+            self._edit_count[note_id] = 0 if save_version else count
+
+        future = self._worker.submit(self._write, note_id, title, content, password, save_version, order_key=note_id)
+        self._inflight[note_id] = future
+
+        def _done(f: Future[None]) -> None:
+            if self._inflight.get(note_id) is f:
+                del self._inflight[note_id]
+
+        future.add_done_callback(_done)
+
+    @perf_utils.timed("autosave.write")
+    def _write(self, note_id: int, title: str, content: str, password: str | None, save_version: bool) -> None:
+        """Runs on the worker thread, with its own database connections."""
+        try:
+            if password is not None:
+                import crypto_utils
+
+                db.set_note_encrypted(note_id, crypto_utils.encrypt(content, password), True)
+            elif not db.update_note(note_id, title=title, content=content):
+                # Gia' uguale nel database: niente versione, niente aggiornamento della lista
+                return
+            elif save_version:
+                db.save_version(note_id, title, content)
+        except Exception as e:
+            # Al prossimo flush la nota va riscritta anche se il testo non cambia
+            self._saved_digest.pop(note_id, None)
+            log.warning("Salvataggio nota %d fallito: %s", note_id, e)
+            self.signals.failed.emit(note_id, str(e))
+            return
+        self.signals.saved.emit(note_id, title)
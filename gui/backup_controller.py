@@ -4,15 +4,13 @@ from __future__ import annotations
 
 import contextlib
 import logging
-import subprocess
+import os
 from typing import TYPE_CHECKING
 
-from PySide6.QtCore import QTimer
-from PySide6.QtWidgets import QMessageBox
+from PySide6.QtCore import Qt, QTimer
+from PySide6.QtWidgets import QApplication, QMessageBox
 
 import backup_utils
-import updater
-from dialogs import BackupLogDialog, BackupRestoreDialog, BackupSettingsDialog
 
 if TYPE_CHECKING:
     from gui import MyNotesApp
@@ -52,6 +50,8 @@ class BackupController:
             QMessageBox.warning(self.app, "Google Drive", msg)
 
     def do_restore(self) -> None:
+        from dialogs import BackupRestoreDialog
+
         dlg = BackupRestoreDialog(self.app)
         if not dlg.result:
             return
@@ -59,20 +59,43 @@ class BackupController:
         path = dlg.result["path"]
         password = dlg.result.get("password")
 
-        success, msg, safety_path = backup_utils.restore_from_backup(path, password)
+        # Finestre staccate e scritture in coda finirebbero nel database ripristinato:
+        # chiudile e scrivile prima, poi niente backup pianificati durante la sostituzione
+        for win in list(self.app._detached_windows.values()):
+            win._on_close()
+        self.app.notes_ctl.save_current()
+        self.app.autosave.flush_all(wait=True)
+        self.app.db_worker.drain()
+        self.app.statusBar().showMessage("Ripristino in corso...")
+        QApplication.setOverrideCursor(Qt.CursorShape.WaitCursor)
+        try:
+            with self.app._backup_scheduler.paused():
+                success, msg, safety_path = backup_utils.restore_from_backup(
+                    path, password, replay_until=dlg.result.get("replay_until")
+                )
+        finally:
+            QApplication.restoreOverrideCursor()
+            if dlg.result.get("temporary"):
+                with contextlib.suppress(OSError):
+                    os.remove(path)
+
         if success:
-            info = f"{msg}\n\nBackup di sicurezza: {safety_path}\n\nL'app verra' riavviata."
-            QMessageBox.information(self.app, "Ripristino completato", info)
-            with contextlib.suppress(Exception):
-                subprocess.Popen(updater.get_restart_command())
-            self.app.close()
+            self.app.reload_after_restore()
+            self.app.statusBar().showMessage("Backup ripristinato")
+            safety = f"\n\nBackup di sicurezza: {safety_path}" if safety_path else ""
+            QMessageBox.information(self.app, "Ripristino completato", f"{msg}{safety}")
         else:
+            self.app.statusBar().showMessage("Ripristino fallito")
             QMessageBox.critical(self.app, "Errore ripristino", msg)
 
     def show_backup_log(self) -> None:
+        from dialogs import BackupLogDialog
+
         BackupLogDialog(self.app)
 
     def open_settings(self) -> None:
+        from dialogs import BackupSettingsDialog
+
         BackupSettingsDialog(self.app)
         if hasattr(self.app, "_backup_scheduler"):
             self.app._backup_scheduler.restart_if_settings_changed()
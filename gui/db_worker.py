@@ -0,0 +1,198 @@
+"""Accesso al database fuori dal thread GUI, con ordine garantito per nota (PySide6).
+
+Le chiamate vanno su una piccola serie di "corsie", ognuna un thread singolo. Le
+operazioni su una nota (primo parametro `note_id`) vanno sempre nella stessa corsia e
+vengono quindi eseguite nell'ordine in cui sono state chieste; quelle su piu' note
+(`note_ids`) e quelle senza nota (liste, categorie, tag) aspettano tutto cio' che e' stato
+chiesto prima nelle corsie che toccano, e tutto cio' che viene chiesto dopo le aspetta.
+Una lettura vede quindi sempre le scritture chieste prima di lei, senza serializzare i
+salvataggi di note diverse.
+
+I risultati arrivano sul thread GUI tramite segnale. closeEvent usa drain()/call_sync(),
+che bloccano: sono la via d'uscita sincrona per quando la finestra sta per chiudersi.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import functools
+import inspect
+import logging
+import threading
+from collections.abc import Callable
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any
+
+from PySide6.QtCore import QObject, Signal
+
+import database as db
+
+log = logging.getLogger("db_worker")
+
+DEFAULT_LANES = 3
+
+# Chiave di ordinamento: una nota, un gruppo di note, o None = tutte le corsie
+type Key = int | tuple[int, ...] | None
+
+
+class _Auto:
+    """Sentinel: derive the ordering key from the call's arguments."""
+
+    def __repr__(self) -> str:
+        return "<AUTO>"
+
+
+AUTO = _Auto()
+
+
+class _DeliverSignals(QObject):
+    """Signals for thread-safe UI updates."""
+
+    deliver = Signal(object)  # callable senza argomenti da eseguire sul thread GUI
+
+
+@functools.cache
+def _key_param(func: Callable[..., Any]) -> str | None:
+    """Name of the parameter that identifies the notes a database function touches."""
+    try:
+        params = list(inspect.signature(func).parameters)
+    except (TypeError, ValueError):
+        return None
+    if params and params[0] in ("note_id", "note_ids"):
+        return params[0]
+    return None
+
+
+def _derive_key(func: Callable[..., Any], args: tuple[Any, ...], kwargs: dict[str, Any]) -> Key:
+    name = _key_param(func)
+    if name is None:
+        return None
+    value = args[0] if args else kwargs.get(name)
+    if isinstance(value, int):
+        return value
+    if isinstance(value, (list, tuple)) and value:
+        return tuple(value)
+    return None
+
+
+class DbWorker:
+    """Run database calls on worker lanes and deliver the results on the GUI thread.
+
+    call() returns a Future; on_done(result) / on_error(exc) run on the GUI thread. Errors
+    without an on_error are logged. The `order_key` of a call defaults to its `note_id` /
+    `note_ids` argument; pass order_key=... to override it.
+    """
+
+    def __init__(self, parent: QObject, lanes: int = DEFAULT_LANES) -> None:
+        self._signals = _DeliverSignals(parent)
+        self._signals.deliver.connect(self._run_delivered)
+        self._lanes = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"db-{i}") for i in range(lanes)]
+        self._lock = threading.Lock()
+        # Ultimo lavoro chiesto in ogni corsia: chi arriva dopo in quella corsia lo aspetta
+        self._tails: list[Future[Any] | None] = [None] * lanes
+        self._closed = False
+
+    def _lanes_for(self, key: Key) -> list[int]:
+        n = len(self._lanes)
+        if key is None:
+            return list(range(n))
+        if isinstance(key, int):
+            return [key % n]
+        return sorted({k % n for k in key})
+
+    def submit(self, func: Callable[..., Any], *args: Any, order_key: Key = None, **kwargs: Any) -> Future[Any]:
+        """Queue func(*args, **kwargs) after everything already queued on the lanes of `order_key`."""
+        lanes = self._lanes_for(order_key)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("DbWorker chiuso")
+            # Anche la corsia di partenza: il suo ultimo lavoro puo' girare in un'altra corsia
+            deps = [f for i in lanes if (f := self._tails[i]) is not None]
+
+            def _run() -> Any:
+                for dep in deps:
+                    # L'esito delle dipendenze non conta: il loro errore e' di chi le ha chieste
+                    wait([dep])
+                return func(*args, **kwargs)
+
+            future = self._lanes[lanes[0]].submit(_run)
+            for i in lanes:
+                self._tails[i] = future
+        return future
+
+    def call(
+        self,
+        func: Callable[..., Any],
+        *args: Any,
+        order_key: Key | _Auto = AUTO,
+        on_done: Callable[[Any], None] | None = None,
+        on_error: Callable[[BaseException], None] | None = None,
+        **kwargs: Any,
+    ) -> Future[Any]:
+        """Like submit(), with callbacks on the GUI thread."""
+        if isinstance(order_key, _Auto):
+            order_key = _derive_key(func, args, kwargs)
+        future = self.submit(func, *args, order_key=order_key, **kwargs)
+        name = getattr(func, "__name__", repr(func))
+
+        def _done(f: Future[Any]) -> None:
+            exc = f.exception()
+            if exc is not None:
+                if on_error is not None:
+                    self._post(lambda: on_error(exc))
+                else:
+                    log.warning("Operazione %s fallita: %s", name, exc)
+            elif on_done is not None:
+                result = f.result()
+                self._post(lambda: on_done(result))
+
+        future.add_done_callback(_done)
+        return future
+
+    def call_sync(self, func: Callable[..., Any], *args: Any, order_key: Key | _Auto = AUTO, **kwargs: Any) -> Any:
+        """Run a call in order with the queued ones and block until it returns (closeEvent, modal dialogs)."""
+        if isinstance(order_key, _Auto):
+            order_key = _derive_key(func, args, kwargs)
+        return self.submit(func, *args, order_key=order_key, **kwargs).result()
+
+    def drain(self, timeout: float | None = None) -> bool:
+        """Block until everything queued so far has run; False if `timeout` expired first."""
+        with self._lock:
+            pending = [f for f in self._tails if f is not None]
+        _done, not_done = wait(pending, timeout=timeout)
+        return not not_done
+
+    def shutdown(self) -> None:
+        """Run what is queued and stop the lanes; later calls raise RuntimeError."""
+        with self._lock:
+            self._closed = True
+        for lane in self._lanes:
+            lane.shutdown(wait=True)
+
+    def _post(self, fn: Callable[[], None]) -> None:
+        # Il parent puo' essere gia' stato distrutto durante la chiusura
+        with contextlib.suppress(RuntimeError):
+            self._signals.deliver.emit(fn)
+
+    @staticmethod
+    def _run_delivered(fn: Callable[[], None]) -> None:
+        # Il widget che aspettava il risultato puo' essere stato chiuso nel frattempo
+        with contextlib.suppress(RuntimeError):
+            fn()
+
+
+class AsyncDatabase:
+    """`database` with every function returning a Future instead of blocking.
+
+    adb.get_note(note_id, on_done=cb) is db.get_note(note_id) run by DbWorker.call();
+    constants and non-callables are read straight from the module.
+    """
+
+    def __init__(self, worker: DbWorker) -> None:
+        self.worker = worker
+
+    def __getattr__(self, name: str) -> Any:
+        attr = getattr(db, name)
+        if not callable(attr) or isinstance(attr, type):
+            return attr
+        return functools.partial(self.worker.call, attr)
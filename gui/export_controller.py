@@ -2,19 +2,20 @@
 
 from __future__ import annotations
 
-import html as html_mod
 import os
-import re
-import sqlite3
-import types
-from datetime import date
-from pathlib import Path
+import threading
+from collections.abc import Callable
 from typing import TYPE_CHECKING
 
 from PySide6.QtWidgets import QFileDialog, QMessageBox
 
+import bundle_utils
 import database as db
+import export_utils
+import import_utils
 import platform_utils
+from _types import ProgressCallback
+from gui.tasks import BackgroundTask
 
 if TYPE_CHECKING:
     from gui import MyNotesApp
@@ -33,7 +34,8 @@ class ExportController:
             return
         path, _ = QFileDialog.getSaveFileName(app, "Esporta HTML", f"{note['title']}.html", "HTML (*.html)")
         if path:
-            self._write_html(path, [note])
+            app.notes_ctl.save_current()
+            export_utils.export_notes(export_utils.FORMAT_HTML, path, [app.current_note_id])
             app.statusBar().showMessage(f"Esportato: {path}")
             platform_utils.open_file(path)
 
@@ -41,46 +43,51 @@ class ExportController:
         app = self.app
         path, _ = QFileDialog.getSaveFileName(app, "Esporta tutte le note HTML", "MyNotes_export.html", "HTML (*.html)")
         if path:
-            notes = db.get_all_notes()
-            self._write_html(path, notes)
-            app.statusBar().showMessage(f"Esportate {len(notes)} note: {path}")
-
-    def _write_html(self, path: str, notes: list[sqlite3.Row]) -> None:
-        import html as html_mod
-
-        lines = [
-            "<!DOCTYPE html><html><head><meta charset='utf-8'>",
-            "<title>MyNotes Export</title>",
-            "<style>body{font-family:sans-serif;max-width:800px;margin:auto;padding:20px}",
-            ".note{border:1px solid #ddd;padding:20px;margin:20px 0;border-radius:8px}",
-            ".note h2{margin-top:0;color:#333}.meta{color:#888;font-size:0.85em}",
-            ".checklist-done{text-decoration:line-through;color:#888}</style></head><body>",
-            "<h1>MyNotes Export</h1>",
-        ]
-
-        for note in notes:
-            content = html_mod.escape(note["content"] or "")
-            html_lines = []
-            for line in content.split("\n"):
-                if line.strip().startswith("[x]"):
-                    html_lines.append(f'<div class="checklist-done">&#9745; {line.strip()[3:].strip()}</div>')
-                elif line.strip().startswith("[ ]"):
-                    html_lines.append(f"<div>&#9744; {line.strip()[3:].strip()}</div>")
-                else:
-                    html_lines.append(f"<p>{line}</p>" if line.strip() else "<br>")
-
-            tags = db.get_note_tags(note["id"])
-            tag_str = " ".join(f"#{t['name']}" for t in tags)
-
-            lines.append('<div class="note">')
-            lines.append(f"<h2>{html_mod.escape(note['title'])}</h2>")
-            lines.append(f'<div class="meta">{note["created_at"][:10]} | {tag_str}</div>')
-            lines.append("\n".join(html_lines))
-            lines.append("</div>")
-
-        lines.append("</body></html>")
-        with open(path, "w", encoding="utf-8") as f:
-            f.write("\n".join(lines))
+            self._run_export(export_utils.FORMAT_HTML, path, None, "Esportazione HTML")
+
+    def export_all_structured(self) -> None:
+        """Export all notes as HTML files in a folder tree mirroring the category hierarchy."""
+        base_dir = QFileDialog.getExistingDirectory(self.app, "Scegli cartella destinazione")
+        if base_dir:
+            self._run_export(export_utils.FORMAT_FOLDER, base_dir, None, "Esportazione in cartelle")
+
+    def export_all_mynote(self) -> None:
+        self._export_bundle(None)
+
+    def export_mynote_multiple(self, note_ids: list[int]) -> None:
+        self._export_bundle(note_ids)
+
+    def _export_bundle(self, note_ids: list[int] | None) -> None:
+        default_name = "MyNotes_export.mynote" if note_ids is None else f"MyNotes_{len(note_ids)}_note.mynote"
+        path, _ = QFileDialog.getSaveFileName(self.app, "Condividi note", default_name, "MyNotes (*.mynote)")
+        if path:
+            self._run_export(export_utils.FORMAT_BUNDLE, path, note_ids, "Esportazione .mynote")
+
+    def _run_export(self, fmt: str, dest: str, note_ids: list[int] | None, title: str) -> None:
+        app = self.app
+        app.notes_ctl.save_current()
+        if db.count_export_notes(note_ids) == 0:
+            app.statusBar().showMessage("Nessuna nota da esportare.")
+            return
+
+        def _work(progress: ProgressCallback, cancel: threading.Event) -> tuple[int, str]:
+            return export_utils.export_notes(fmt, dest, note_ids, progress=progress, cancel=cancel)
+
+        def _done(result: tuple[int, str]) -> None:
+            exported, output = result
+            app.statusBar().showMessage(f"Esportate {exported} note: {output}")
+
+        def _error(exc: BaseException) -> None:
+            QMessageBox.critical(app, "Errore", f"Esportazione fallita: {exc}")
+
+        BackgroundTask(
+            app,
+            title,
+            _work,
+            on_done=_done,
+            on_error=_error,
+            on_cancel=lambda: app.statusBar().showMessage("Esportazione annullata"),
+        ).start()
 
     def export_pdf(self) -> None:
         app = self.app
@@ -90,31 +97,26 @@ class ExportController:
         if note is None:
             return
         path, _ = QFileDialog.getSaveFileName(app, "Esporta PDF", f"{note['title']}.pdf", "PDF (*.pdf)")
-        if not path:
+        if path:
+            self._run_pdf_export([app.current_note_id], path)
+
+    def export_category_pdf(self, cat_id: int, name: str) -> None:
+        """Export every note in a category and its subcategories into one PDF."""
+        app = self.app
+        path, _ = QFileDialog.getSaveFileName(
+            app, "Esporta categoria in PDF", f"{export_utils.sanitize_filename(name)}.pdf", "PDF (*.pdf)"
+        )
+        if path:
+            self._run_pdf_export(db.get_note_ids_by_category(cat_id, include_descendants=True), path)
+
+    def _run_pdf_export(self, note_ids: list[int], path: str) -> None:
+        app = self.app
+        app.notes_ctl.save_current()
+        if not note_ids:
+            app.statusBar().showMessage("Nessuna nota da esportare.")
             return
         try:
-            from reportlab.lib.pagesizes import A4
-            from reportlab.pdfgen import canvas
-
-            c = canvas.Canvas(path, pagesize=A4)
-            w, h = A4
-            y = h - 50
-            c.setFont("Helvetica-Bold", 16)
-            c.drawString(40, y, note["title"])
-            y -= 20
-            c.setFont("Helvetica", 9)
-            c.drawString(40, y, f"Creata: {note['created_at'][:10]}  |  Modificata: {note['updated_at'][:10]}")
-            y -= 30
-            c.setFont("Helvetica", 11)
-            for line in (note["content"] or "").split("\n"):
-                if y < 50:
-                    c.showPage()
-                    y = h - 50
-                    c.setFont("Helvetica", 11)
-                c.drawString(40, y, line[:100])
-                y -= 15
-            c.save()
-            app.statusBar().showMessage(f"PDF esportato: {path}")
+            import reportlab  # noqa: F401
         except ImportError:
             QMessageBox.warning(
                 app,
@@ -123,6 +125,27 @@ class ExportController:
                 "Installa con: pip install reportlab\n\n"
                 "In alternativa usa l'esportazione HTML.",
             )
+            return
+
+        def _work(progress: ProgressCallback, cancel: threading.Event) -> int:
+            import pdf_utils
+
+            return pdf_utils.export_notes_pdf(note_ids, path, progress=progress, cancel=cancel)
+
+        def _done(exported: int) -> None:
+            app.statusBar().showMessage(f"PDF esportato ({exported} note): {path}")
+
+        def _error(exc: BaseException) -> None:
+            QMessageBox.critical(app, "Errore", f"Esportazione PDF fallita: {exc}")
+
+        BackgroundTask(
+            app,
+            "Esportazione PDF",
+            _work,
+            on_done=_done,
+            on_error=_error,
+            on_cancel=lambda: app.statusBar().showMessage("Esportazione annullata"),
+        ).start()
 
     def export_mynote(self) -> None:
         app = self.app
@@ -149,138 +172,62 @@ class ExportController:
         paths, _ = QFileDialog.getOpenFileNames(app, "Importa nota", "", "MyNotes (*.mynote);;Tutti (*.*)")
         if not paths:
             return
-        imported = 0
-        for path in paths:
-            try:
-                db.import_note(path, category_id=None)
-                imported += 1
-            except Exception as e:
-                QMessageBox.critical(app, "Errore", f"Importazione fallita per {os.path.basename(path)}:\n{e}")
-        if imported:
-            app.notes_ctl.load_notes()
-            app.statusBar().showMessage(f"Importate {imported} nota/e")
-            QMessageBox.information(app, "Importa", f"{imported} nota/e importate con successo!")
 
-    def import_markdown(self) -> None:
-        app = self.app
-        paths, _ = QFileDialog.getOpenFileNames(app, "Importa Markdown", "", "Markdown (*.md);;Tutti (*.*)")
-        if not paths:
-            return
-        imported = 0
-        for path in paths:
-            try:
-                title = Path(path).stem
-                with open(path, encoding="utf-8") as f:
-                    content = f.read()
-                db.add_note(title, content)
-                imported += 1
-            except Exception as e:
-                QMessageBox.critical(app, "Errore", f"Importazione fallita per {os.path.basename(path)}:\n{e}")
-        if imported:
+        def _work(progress: ProgressCallback, cancel: threading.Event) -> list[int]:
+            return bundle_utils.import_archives(paths, progress=progress, cancel=cancel)
+
+        def _refresh() -> None:
+            app.notes_ctl.load_categories()
             app.notes_ctl.load_notes()
-            app.statusBar().showMessage(f"Importate {imported} nota/e Markdown")
-            QMessageBox.information(app, "Importa Markdown", f"{imported} nota/e Markdown importate con successo!")
 
-    # ------------------------------------------------------------------
-    # Structured folder export
-    # ------------------------------------------------------------------
+        def _done(note_ids: list[int]) -> None:
+            _refresh()
+            app.statusBar().showMessage(f"Importate {len(note_ids)} nota/e")
+            QMessageBox.information(app, "Importa", f"{len(note_ids)} nota/e importate con successo!")
 
-    def export_all_structured(self) -> None:
-        """Export all notes as HTML files in a folder tree mirroring the category hierarchy."""
-        import markdown
+        def _error(exc: BaseException) -> None:
+            # I lotti gia' confermati restano importati
+            _refresh()
+            QMessageBox.critical(app, "Errore", f"Importazione fallita:\n{exc}")
+
+        def _cancelled() -> None:
+            _refresh()
+            app.statusBar().showMessage("Importazione annullata")
+
+        BackgroundTask(app, "Importazione .mynote", _work, on_done=_done, on_error=_error, on_cancel=_cancelled).start()
+
+    def import_markdown(self) -> None:
+        paths, _ = QFileDialog.getOpenFileNames(self.app, "Importa Markdown", "", "Markdown (*.md);;Tutti (*.*)")
+        if paths:
+            sources: list[import_utils.MarkdownSource] = [(path, []) for path in paths]
+            self._run_markdown_import(
+                lambda progress, cancel: import_utils.import_markdown(sources, progress=progress, cancel=cancel)
+            )
+
+    def import_folder(self) -> None:
+        """Import a folder of Markdown files (e.g. an Obsidian vault); subfolders become categories."""
+        root = QFileDialog.getExistingDirectory(self.app, "Importa cartella Markdown")
+        if root:
+            self._run_markdown_import(lambda progress, cancel: import_utils.import_folder(root, progress, cancel))
 
+    def _run_markdown_import(self, work: Callable[[ProgressCallback, threading.Event], int]) -> None:
         app = self.app
-        base_dir = QFileDialog.getExistingDirectory(app, "Scegli cartella destinazione")
-        if not base_dir:
-            return
+        app.notes_ctl.save_current()
 
-        # Create unique export folder
-        folder_name = f"MyNotes_export_{date.today().isoformat()}"
-        export_dir = Path(base_dir) / folder_name
-        suffix = 1
-        while export_dir.exists():
-            suffix += 1
-            export_dir = Path(base_dir) / f"{folder_name}_{suffix}"
-        export_dir.mkdir(parents=True)
-
-        notes = db.get_all_notes()
-        if not notes:
-            app.statusBar().showMessage("Nessuna nota da esportare.")
-            return
+        def _done(imported: int) -> None:
+            app.notes_ctl.load_categories()
+            app.notes_ctl.load_notes()
+            app.statusBar().showMessage(f"Importate {imported} nota/e Markdown")
+            QMessageBox.information(app, "Importa Markdown", f"{imported} nota/e Markdown importate con successo!")
 
-        # Track used filenames per directory to handle duplicates
-        used_names: dict[str, set[str]] = {}
-        exported = 0
-
-        for note in notes:
-            # Determine folder path from category hierarchy
-            cat_id: int | None = note["category_id"]
-            if cat_id:
-                cat_path = db.get_category_path(cat_id)
-                rel_parts = [_sanitize_filename(c["name"]) for c in cat_path]
-                note_dir = export_dir / Path(*rel_parts)
-            else:
-                note_dir = export_dir
-
-            note_dir.mkdir(parents=True, exist_ok=True)
-            dir_key = str(note_dir)
-            if dir_key not in used_names:
-                used_names[dir_key] = set()
-
-            # Pick a unique filename
-            base_name = _sanitize_filename(note["title"] or "Senza titolo")
-            file_name = base_name
-            counter = 2
-            while file_name.lower() in used_names[dir_key]:
-                file_name = f"{base_name}_{counter}"
-                counter += 1
-            used_names[dir_key].add(file_name.lower())
-
-            tags = db.get_note_tags(note["id"])
-            html_content = _build_note_html(note, tags, markdown)
-            (note_dir / f"{file_name}.html").write_text(html_content, encoding="utf-8")
-            exported += 1
-
-        app.statusBar().showMessage(f"Esportate {exported} note in {export_dir}")
-
-
-_INVALID_CHARS_RE = re.compile(r'[<>:"/\\|?*]')
-
-
-def _sanitize_filename(name: str) -> str:
-    """Remove/replace characters invalid in file/folder names."""
-    sanitized = _INVALID_CHARS_RE.sub("_", name).strip().strip(".")
-    return sanitized or "Senza_nome"
-
-
-def _build_note_html(note: sqlite3.Row, tags: list[sqlite3.Row], markdown_mod: types.ModuleType) -> str:
-    """Generate a styled standalone HTML page for a note."""
-    title = html_mod.escape(note["title"] or "Senza titolo")
-    created = (note["created_at"] or "")[:10]
-    updated = (note["updated_at"] or "")[:10]
-    tag_str = " ".join(f"#{html_mod.escape(t['name'])}" for t in tags)
-
-    if note["is_encrypted"]:
-        body = "<p><em>[Nota criptata]</em></p>"
-    else:
-        content = note["content"] or ""
-        body = markdown_mod.markdown(content, extensions=["fenced_code", "tables", "nl2br"])
-
-    return (
-        "<!DOCTYPE html>\n<html>\n<head>\n<meta charset='utf-8'>\n"
-        f"<title>{title}</title>\n"
-        "<style>\n"
-        "body { font-family: sans-serif; max-width: 800px; margin: auto; padding: 20px; }\n"
-        "h1 { color: #333; }\n"
-        ".meta { color: #888; font-size: 0.85em; margin-bottom: 1em; }\n"
-        "pre { background: #f4f4f4; padding: 12px; border-radius: 4px; overflow-x: auto; }\n"
-        "code { background: #f4f4f4; padding: 2px 4px; border-radius: 3px; }\n"
-        "table { border-collapse: collapse; }\n"
-        "th, td { border: 1px solid #ddd; padding: 8px; }\n"
-        "</style>\n</head>\n<body>\n"
-        f"<h1>{title}</h1>\n"
-        f'<div class="meta">Creata: {created} | Modificata: {updated}'
-        f"{(' | ' + tag_str) if tag_str else ''}</div>\n"
-        f"{body}\n"
-        "</body>\n</html>"
-    )
+        def _error(exc: BaseException) -> None:
+            QMessageBox.critical(app, "Errore", f"Importazione fallita:\n{exc}")
+
+        BackgroundTask(
+            app,
+            "Importazione Markdown",
+            work,
+            on_done=_done,
+            on_error=_error,
+            on_cancel=lambda: app.statusBar().showMessage("Importazione annullata: nessuna nota importata"),
+        ).start()
@@ -5,7 +5,7 @@ from __future__ import annotations
 import os
 import sqlite3
 import threading
-from datetime import datetime
+from collections.abc import Callable
 from typing import TYPE_CHECKING
 
 from PySide6.QtCore import Qt, QTimer
@@ -18,10 +18,7 @@ if TYPE_CHECKING:
     from gui import MyNotesApp
 import contextlib
 
-import image_utils
 import platform_utils
-from annotator import AnnotationTool
-from dialogs import AudioRecordDialog
 from gui.constants import BG_ELEVATED, BG_SURFACE, BORDER, FG_SECONDARY, FONT_XS
 
 
@@ -32,7 +29,10 @@ class MediaController:
 
     # --- Gallery ---
 
-    def load_gallery(self, note_id: int) -> None:
+    def show_gallery(self, note_id: int, attachments: list[sqlite3.Row]) -> None:
+        """Fill the gallery with the image attachments of `note_id` (read by display_note)."""
+        import image_utils
+
         app = self.app
         app._image_refs.clear()
         app.gallery_labels.clear()
@@ -46,7 +46,6 @@ class MediaController:
             if child is not None and child.widget():
                 child.widget().deleteLater()  # type: ignore[union-attr]
 
-        attachments = db.get_note_attachments(note_id)
         app.gallery_attachments = [a for a in attachments if image_utils.is_image_file(a["original_name"])]
 
         if not app.gallery_attachments:
@@ -145,10 +144,10 @@ class MediaController:
         att = app.gallery_attachments[app.selected_image_index]
         reply = QMessageBox.question(app, "Conferma", f"Rimuovere '{att['original_name']}'?")
         if reply == QMessageBox.StandardButton.Yes:
-            db.delete_attachment(att["id"])
-            if app.current_note_id:
-                self.load_gallery(app.current_note_id)
-                app.notes_ctl.display_note(app.current_note_id)
+            note_id = app.current_note_id
+            app.adb.delete_attachment(
+                att["id"], on_done=lambda _none: self._refresh(note_id), on_error=app.notes_ctl.report_db_error
+            )
 
     def annotate_selected(self) -> None:
         app = self.app
@@ -159,12 +158,19 @@ class MediaController:
         path = os.path.join(db.ATTACHMENTS_DIR, att["filename"])
         if not os.path.exists(path):
             return
+        from annotator import AnnotationTool
+
         tool = AnnotationTool(app, path)
         if tool.result_path and os.path.exists(tool.result_path) and app.current_note_id is not None:
-            db.add_attachment(app.current_note_id, tool.result_path)
-            os.remove(tool.result_path)
-            self.load_gallery(app.current_note_id)
-            app.notes_ctl.display_note(app.current_note_id)
+            note_id = app.current_note_id
+            result_path = tool.result_path
+
+            def _added(_filename: str) -> None:
+                with contextlib.suppress(OSError):
+                    os.remove(result_path)
+                self._refresh(note_id)
+
+            app.adb.add_attachment(note_id, result_path, on_done=_added, on_error=app.notes_ctl.report_db_error)
 
     # --- Screenshots ---
 
@@ -196,15 +202,12 @@ class MediaController:
             success = False
         app.show()
         if success and os.path.exists(save_path) and app.current_note_id is not None:
-            now = datetime.now().isoformat()
-            with db._connect() as conn:
-                conn.execute(
-                    "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)",
-                    (app.current_note_id, filename, filename, now),
-                )
-                conn.commit()
-            app.notes_ctl.display_note(app.current_note_id)
-            app.statusBar().showMessage("Screenshot catturato!")
+            app.adb.add_attachment_file(
+                app.current_note_id,
+                filename,
+                on_done=self._attachment_added(app.current_note_id, "Screenshot catturato!"),
+                on_error=app.notes_ctl.report_db_error,
+            )
         else:
             msg = "Impossibile catturare lo screenshot.\n"
             if platform_utils.IS_LINUX:
@@ -219,9 +222,12 @@ class MediaController:
             app, "Seleziona immagine", "", "Immagini (*.png *.jpg *.jpeg *.gif *.bmp *.tiff *.webp);;Tutti (*.*)"
         )
         if path:
-            db.add_attachment(app.current_note_id, path)
-            app.notes_ctl.display_note(app.current_note_id)
-            app.statusBar().showMessage("Immagine aggiunta")
+            app.adb.add_attachment(
+                app.current_note_id,
+                path,
+                on_done=self._attachment_added(app.current_note_id, "Immagine aggiunta"),
+                on_error=app.notes_ctl.report_db_error,
+            )
 
     # --- Audio ---
 
@@ -231,6 +237,8 @@ class MediaController:
             QMessageBox.information(app, "Info", "Crea o seleziona una nota prima.")
             return
 
+        from dialogs import AudioRecordDialog
+
         dlg = AudioRecordDialog(app, mode="record")
         if dlg.result is None:
             return
@@ -238,13 +246,14 @@ class MediaController:
         temp_path = dlg.result["path"]
         description = dlg.result["description"]
 
-        att_filename = db.add_attachment(app.current_note_id, temp_path)
-        with contextlib.suppress(OSError):
-            os.remove(temp_path)
+        note_id = app.current_note_id
 
-        app.notes_ctl.insert_audio_marker(att_filename, description)
-        app.notes_ctl.display_note(app.current_note_id)
-        app.statusBar().showMessage("Audio registrato")
+        def _added(att_filename: str) -> None:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            self._audio_added(note_id, att_filename, description, "Audio registrato")
+
+        app.adb.add_attachment(note_id, temp_path, on_done=_added, on_error=app.notes_ctl.report_db_error)
 
     def import_audio(self) -> None:
         app = self.app
@@ -258,13 +267,37 @@ class MediaController:
         if not path:
             return
 
+        from dialogs import AudioRecordDialog
+
         dlg = AudioRecordDialog(app, mode="describe", audio_path=path)
         if dlg.result is None:
             return
 
         description = dlg.result["description"]
-        att_filename = db.add_attachment(app.current_note_id, path)
+        note_id = app.current_note_id
+        app.adb.add_attachment(
+            note_id,
+            path,
+            on_done=lambda att_filename: self._audio_added(note_id, att_filename, description, "Audio importato"),
+            on_error=app.notes_ctl.report_db_error,
+        )
+
+    # --- Completion callbacks (GUI thread, after the DbWorker write) ---
+
+    def _refresh(self, note_id: int | None) -> None:
+        # Solo se la nota e' ancora quella aperta: nel frattempo l'utente puo' averne scelta un'altra
+        if note_id is not None and self.app.current_note_id == note_id:
+            self.app.notes_ctl.refresh_details(note_id)
+
+    def _attachment_added(self, note_id: int, message: str) -> Callable[[str], None]:
+        def _done(_filename: str) -> None:
+            self._refresh(note_id)
+            self.app.statusBar().showMessage(message)
+
+        return _done
 
-        app.notes_ctl.insert_audio_marker(att_filename, description)
-        app.notes_ctl.display_note(app.current_note_id)
-        app.statusBar().showMessage("Audio importato")
+    def _audio_added(self, note_id: int, att_filename: str, description: str, message: str) -> None:
+        if self.app.current_note_id == note_id:
+            self.app.notes_ctl.insert_audio_marker(att_filename, description)
+            self.app.notes_ctl.refresh_details(note_id)
+        self.app.statusBar().showMessage(message)
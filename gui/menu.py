@@ -26,10 +26,12 @@ def build_menu(app: MyNotesApp) -> None:
     file_menu.addAction(_action(app, "Esporta nota PDF...", lambda: app.export_ctl.export_pdf(), "Ctrl+Shift+E"))
     file_menu.addAction(_action(app, "Esporta tutte (HTML)...", lambda: app.export_ctl.export_all_html()))
     file_menu.addAction(_action(app, "Esporta tutte (cartelle)...", lambda: app.export_ctl.export_all_structured()))
+    file_menu.addAction(_action(app, "Esporta tutte (.mynote)...", lambda: app.export_ctl.export_all_mynote()))
     file_menu.addSeparator()
     file_menu.addAction(_action(app, "Condividi nota (.mynote)...", lambda: app.export_ctl.export_mynote()))
     file_menu.addAction(_action(app, "Importa nota (.mynote)...", lambda: app.export_ctl.import_mynote()))
     file_menu.addAction(_action(app, "Importa Markdown (.md)...", lambda: app.export_ctl.import_markdown()))
+    file_menu.addAction(_action(app, "Importa cartella Markdown...", lambda: app.export_ctl.import_folder()))
     file_menu.addSeparator()
     file_menu.addAction(_action(app, "Esci", lambda: app.close(), "Ctrl+Q"))
 
@@ -104,9 +106,16 @@ def build_menu(app: MyNotesApp) -> None:
     ver_action = help_menu.addAction(f"MyNotes v{VERSION}")
     ver_action.setEnabled(False)
 
-    # Standalone shortcuts (Ctrl+F, Escape)
+    # Standalone shortcuts (Ctrl+F, Escape, diagnostica nascosta)
     QShortcut(QKeySequence("Ctrl+F"), app, lambda: app.notes_ctl.focus_search())
     QShortcut(QKeySequence("Escape"), app, lambda: app.notes_ctl.clear_search())
+    QShortcut(QKeySequence("Ctrl+Shift+F12"), app, lambda: _open_diagnostics(app))
+
+
+def _open_diagnostics(app: MyNotesApp) -> None:
+    from dialogs import DiagnosticsDialog
+
+    DiagnosticsDialog(app)
 
 
 def _action(parent: MyNotesApp, text: str, callback: Callable[..., object], shortcut: str | None = None) -> QAction:
@@ -3,18 +3,29 @@
 from __future__ import annotations
 
 import re
-from typing import TYPE_CHECKING
+from collections.abc import Callable
+from typing import TYPE_CHECKING, Any
 from urllib.parse import quote, unquote
 
-from PySide6.QtCore import QPoint, Qt, QTimer, QUrl
+from PySide6.QtCore import QPoint, Qt, QUrl
 from PySide6.QtGui import QColor, QDesktopServices
-from PySide6.QtWidgets import QListWidgetItem, QMenu, QMessageBox, QTreeWidgetItem
+from PySide6.QtWidgets import (
+    QListWidgetItem,
+    QMenu,
+    QMessageBox,
+    QTreeWidgetItem,
+    QTreeWidgetItemIterator,
+    QWidget,
+)
 
 import database as db
+import perf_utils
 
 if TYPE_CHECKING:
+    import sqlite3
+
     from gui import MyNotesApp
-import crypto_utils
+    from gui.autosave import Snapshot, SnapshotSource
 from dialogs import (
     AttachmentDialog,
     BulkTagDialog,
@@ -25,29 +36,77 @@ from dialogs import (
     VersionHistoryDialog,
 )
 from gui.constants import (
-    AUTO_SAVE_MS,
     BG_DARK,
     DANGER,
     FG_PRIMARY,
     FONT_BASE,
     UI_FONT,
-    VERSION_SAVE_EVERY,
     WARNING,
 )
 from gui.formatting import apply_audio_formatting, apply_checklist_formatting
 
+# Nome senza conteggio delle voci dell'albero categorie, per riscrivere l'etichetta
+_NAME_ROLE = Qt.ItemDataRole.UserRole + 1
+
+
+def _navigation() -> tuple[list[sqlite3.Row], list[sqlite3.Row]]:
+    """Categories and tags for the sidebar; runs on the DB worker."""
+    return db.get_all_categories(), db.get_all_tags()
+
+
+def store_encrypted(note_id: int, content: str, password: str) -> None:
+    """Encrypt a note and drop its plaintext versions; runs on the DB worker (key derivation is slow)."""
+    import crypto_utils
+
+    db.set_note_encrypted(note_id, crypto_utils.encrypt(content, password), True)
+    db.delete_note_versions(note_id)
+
+
+def _delete_category(cat_id: int, note_ids: list[int], promote_children: bool) -> None:
+    """Trash the notes of a category, lift its subcategories and delete it; runs on the DB worker."""
+    if promote_children:
+        db.promote_children(cat_id)
+    if note_ids:
+        db.soft_delete_notes(note_ids)
+    db.delete_category(cat_id)
+
 
 class NoteController:
     def __init__(self, app: MyNotesApp) -> None:
         self.app = app
         self.app.text_editor.set_app(app)
+        # Ricaricamenti della lista in corso: arriva a video solo l'ultimo chiesto
+        self._list_generation = 0
+        self._nav_generation = 0
         # Connect inline decrypt overlay
         self.app.decrypt_btn.clicked.connect(self._inline_decrypt)
         self.app.decrypt_entry.returnPressed.connect(self._inline_decrypt)
 
     # --- Data Loading ---
 
-    def load_categories(self) -> None:
+    def load_categories(self, select_category_id: int | None = None) -> None:
+        """Rebuild the category tree and tag filter when the DB worker returns them.
+
+        Like the note list, the read runs after every write already queued. The tree shows
+        "Tutte le note" selected, or `select_category_id` (opened as if clicked).
+        """
+        self._nav_generation += 1
+        generation = self._nav_generation
+        self.app.adb.worker.call(
+            _navigation,
+            on_done=lambda nav: self._show_navigation(generation, nav[0], nav[1], select_category_id),
+            on_error=self.report_db_error,
+        )
+
+    def _show_navigation(
+        self,
+        generation: int,
+        categories: list[sqlite3.Row],
+        all_tags: list[sqlite3.Row],
+        select_category_id: int | None,
+    ) -> None:
+        if generation != self._nav_generation:
+            return
         app = self.app
         tree = app.cat_tree
         tree.clear()
@@ -56,13 +115,15 @@ class NoteController:
         # Special items (top-level)
         item_all = QTreeWidgetItem(tree, ["Tutte le note"])
         item_all.setData(0, Qt.ItemDataRole.UserRole, "__all__")
+        item_all.setData(0, _NAME_ROLE, "Tutte le note")
 
         item_fav = QTreeWidgetItem(tree, ["Preferite"])
         item_fav.setData(0, Qt.ItemDataRole.UserRole, "__favorites__")
+        item_fav.setData(0, _NAME_ROLE, "Preferite")
         item_fav.setForeground(0, QColor(WARNING))
 
         # Build category tree
-        app.categories = db.get_all_categories()
+        app.categories = categories
         # Multi-pass: first root categories, then children iteratively
         remaining = list(app.categories)
         for _pass in range(20):
@@ -72,11 +133,13 @@ class NoteController:
                 if parent_id is None:
                     item = QTreeWidgetItem(tree, [cat["name"]])
                     item.setData(0, Qt.ItemDataRole.UserRole, cat["id"])
+                    item.setData(0, _NAME_ROLE, cat["name"])
                     app._cat_items[cat["id"]] = item
                 elif parent_id in app._cat_items:
                     parent_item = app._cat_items[parent_id]
                     item = QTreeWidgetItem(parent_item, [cat["name"]])
                     item.setData(0, Qt.ItemDataRole.UserRole, cat["id"])
+                    item.setData(0, _NAME_ROLE, cat["name"])
                     app._cat_items[cat["id"]] = item
                 else:
                     still_remaining.append(cat)
@@ -85,16 +148,15 @@ class NoteController:
                 break
 
         # Cestino (always last)
-        trash_count = db.get_trash_count()
-        item_trash = QTreeWidgetItem(tree, [f"Cestino ({trash_count})"])
+        item_trash = QTreeWidgetItem(tree, ["Cestino"])
         item_trash.setData(0, Qt.ItemDataRole.UserRole, "__trash__")
+        item_trash.setData(0, _NAME_ROLE, "Cestino")
         item_trash.setForeground(0, QColor(DANGER))
 
         tree.expandAll()
         tree.setCurrentItem(item_all)
 
         # Tags combo
-        all_tags = db.get_all_tags()
         app.tag_combo.blockSignals(True)
         app.tag_combo.clear()
         app.tag_combo.addItem("(Tutti)")
@@ -103,33 +165,116 @@ class NoteController:
         app.tag_combo.setCurrentIndex(0)
         app.tag_combo.blockSignals(False)
         app.all_tags = all_tags
-
-    def load_notes(self, preserve_selection: bool = True) -> None:
+        self.refresh_counts()
+        if select_category_id in app._cat_items:
+            tree.setCurrentItem(app._cat_items[select_category_id])
+            self.on_category_select()
+
+    def category_label(self, cat_id: int) -> str:
+        """ "Padre > Figlia" path of a category, from the tree already loaded."""
+        by_id = {c["id"]: c for c in self.app.categories}
+        names: list[str] = []
+        cat = by_id.get(cat_id)
+        while cat is not None and len(names) <= len(by_id):
+            names.append(cat["name"])
+            cat = by_id.get(cat["parent_id"])
+        return " > ".join(reversed(names))
+
+    def _descendant_ids(self, cat_id: int) -> set[int]:
+        children: dict[int | None, list[int]] = {}
+        for c in self.app.categories:
+            children.setdefault(c["parent_id"], []).append(c["id"])
+        found: set[int] = set()
+        stack = list(children.get(cat_id, []))
+        while stack:
+            cid = stack.pop()
+            if cid not in found:
+                found.add(cid)
+                stack.extend(children.get(cid, []))
+        return found
+
+    def _current_row(self) -> sqlite3.Row | None:
+        """List row of the current note (flags and title as last listed)."""
         app = self.app
-        prev_note_id = app.current_note_id if preserve_selection else None
+        row = app._note_rows.get(app.current_note_id) if app.current_note_id is not None else None
+        return app.notes[row] if row is not None else None
 
-        app.note_listbox.clear()
-        search = app.search_entry.text().strip() or None
+    def report_db_error(self, exc: BaseException) -> None:
+        """on_error of the database calls issued by the controllers (runs on the GUI thread)."""
+        QMessageBox.critical(self.app, "Errore", f"Operazione sul database non riuscita:\n{exc}")
+
+    def read_note(self, note_id: int) -> sqlite3.Row | None:
+        """The note as stored once the writes already queued for it (pending autosave included) have run.
 
-        app.notes = db.get_all_notes(
+        Blocks on the note's DbWorker lane: only for the editor text, which must be in
+        place before the user can type into it.
+        """
+        self.app.autosave.flush(note_id, wait=False)
+        note: sqlite3.Row | None = self.app.adb.worker.call_sync(db.get_note, note_id)
+        return note
+
+    def refresh_details(self, note_id: int) -> None:
+        """Reload the tags line and gallery of the current note (after attachment or tag changes)."""
+        self.app.adb.get_note_details(note_id, on_done=lambda details: self._show_details(note_id, *details))
+
+    def refresh_counts(self) -> None:
+        """Rewrite the note counts in the category tree and tag filter without rebuilding them.
+
+        Enough after adding, moving, tagging or deleting notes: the counts come from
+        db.get_navigation_counts(), which those writes keep up to date.
+        """
+        self.app.adb.get_navigation_counts(on_done=self._show_counts)
+
+    def _show_counts(self, counts: dict[str, Any]) -> None:
+        app = self.app
+        by_role = {"__all__": counts["all"], "__favorites__": counts["favorites"], "__trash__": counts["trash"]}
+        it = QTreeWidgetItemIterator(app.cat_tree)
+        while item := it.value():
+            role = item.data(0, Qt.ItemDataRole.UserRole)
+            n = counts["categories"].get(role, 0) if isinstance(role, int) else by_role.get(role, 0)
+            item.setText(0, f"{item.data(0, _NAME_ROLE)} ({n})")
+            it += 1
+        for i, t in enumerate(app.all_tags, start=1):
+            app.tag_combo.setItemText(i, f"{t['name']} ({counts['tags'].get(t['id'], 0)})")
+
+    def load_notes(self, preserve_selection: bool = True, select_note_id: int | None = None) -> None:
+        """Reload the note list on the DB worker; it is filled in when the query returns.
+
+        The query runs after every write already queued (pending autosaves included).
+        `select_note_id` is shown once loaded; otherwise the current note if still listed.
+        """
+        app = self.app
+        self._list_generation += 1
+        generation = self._list_generation
+        search = app.search_entry.text().strip() or None
+        app.adb.get_all_notes(
             category_id=app.current_category_id,
             tag_id=app.current_tag_id,
             search_query=search,
             show_deleted=app.show_trash,
             favorites_only=app.show_favorites,
+            on_done=lambda notes: self._show_notes(generation, notes, preserve_selection, select_note_id),
         )
 
-        for note in app.notes:
-            prefix = ""
-            if note["is_pinned"]:
-                prefix += "[P] "
-            if note["is_favorite"]:
-                prefix += "[*] "
-            if note["is_encrypted"]:
-                prefix += "[E] "
-            item = QListWidgetItem(f"{prefix}{note['title']}")
+    @perf_utils.timed("ui.load_notes")
+    def _show_notes(
+        self, generation: int, notes: list[sqlite3.Row], preserve_selection: bool, select_note_id: int | None
+    ) -> None:
+        if generation != self._list_generation:
+            return
+        app = self.app
+        prev_note_id = select_note_id
+        if prev_note_id is None and preserve_selection:
+            prev_note_id = app.current_note_id
+
+        app.note_listbox.clear()
+        app.notes = notes
+        app._note_rows = {}
+        for row, note in enumerate(app.notes):
+            item = QListWidgetItem(self._list_label(note, note["title"]))
             item.setData(Qt.ItemDataRole.UserRole, note["id"])
             app.note_listbox.addItem(item)
+            app._note_rows[note["id"]] = row
 
         header = "Cestino" if app.show_trash else ("Preferite" if app.show_favorites else "Note")
         app.list_header.setText(f"{header} ({len(app.notes)})")
@@ -138,10 +283,7 @@ class NoteController:
         target_row = 0
         if app.notes:
             if prev_note_id is not None:
-                for i, note in enumerate(app.notes):
-                    if note["id"] == prev_note_id:
-                        target_row = i
-                        break
+                target_row = app._note_rows.get(prev_note_id, 0)
             app.note_listbox.setCurrentRow(target_row)
 
         if app.notes:
@@ -152,12 +294,10 @@ class NoteController:
     # --- Event Handlers ---
 
     def _flush_save(self) -> None:
-        """Stop pending autosave timer and save immediately."""
+        """Start saving the current note now; reads queued after it on the DB worker will see it."""
         app = self.app
-        if app._save_job:
-            app._save_job.stop()
-            app._save_job = None
-        self.save_current()
+        if app.current_note_id is not None:
+            app.autosave.flush(app.current_note_id, wait=False)
 
     def on_category_select(self) -> None:
         app = self.app
@@ -232,18 +372,22 @@ class NoteController:
 
     # --- Editor ---
 
+    @perf_utils.timed("ui.display_note")
     def display_note(self, note_id: int) -> None:
         app = self.app
         if note_id in app._detached_windows:
             return
-        self.save_current()
+        # Cambio nota: il salvataggio della precedente prosegue in background; la nota da
+        # mostrare si legge nella sua corsia, dopo le scritture gia' chieste
+        if app.current_note_id is not None and app.current_note_id != note_id:
+            app.autosave.flush(app.current_note_id, wait=False)
         app.current_note_id = note_id
         # Clear decrypted cache for previous note
         prev_ids = [nid for nid in app._decrypted_cache if nid != note_id]
         for nid in prev_ids:
             del app._decrypted_cache[nid]
 
-        note = db.get_note(note_id)
+        note = self.read_note(note_id)
         if not note:
             return
 
@@ -271,6 +415,8 @@ class NoteController:
             self._apply_audio_formatting()
 
         app.text_editor.blockSignals(False)
+        if not app.text_editor.isReadOnly():
+            app.autosave.mark_clean(note_id, app.title_entry.text().strip(), app.text_editor.toPlainText())
 
         app.editor_tabs.setCurrentIndex(1)
         self.update_preview()
@@ -286,14 +432,19 @@ class NoteController:
             meta += "  |  Criptata"
         app.meta_label.setText(meta)
 
-        tags = db.get_note_tags(note_id)
+        app.tags_label.setText("")
+        self.refresh_details(note_id)
+
+    def _show_details(self, note_id: int, tags: list[sqlite3.Row], attachments: list[sqlite3.Row]) -> None:
+        """Tags line and gallery, filled in when the DB worker returns them."""
+        app = self.app
+        if app.current_note_id != note_id:
+            return
         tag_str = "Tag: " + ", ".join(f"#{t['name']}" for t in tags) if tags else "Nessun tag"
-        att_count = len(db.get_note_attachments(note_id))
-        if att_count > 0:
-            tag_str += f"  |  {att_count} allegato/i"
+        if attachments:
+            tag_str += f"  |  {len(attachments)} allegato/i"
         app.tags_label.setText(tag_str)
-
-        app.media_ctl.load_gallery(note_id)
+        app.media_ctl.show_gallery(note_id, attachments)
 
     def _clear_editor(self) -> None:
         app = self.app
@@ -321,61 +472,53 @@ class NoteController:
 
     def schedule_save(self) -> None:
         app = self.app
-        if app._save_job:
-            app._save_job.stop()
-        timer = QTimer(app)
-        timer.setSingleShot(True)
-        timer.timeout.connect(self.save_current)
-        timer.start(AUTO_SAVE_MS)
-        app._save_job = timer
+        if app.current_note_id is not None:
+            app.autosave.schedule(app.current_note_id, self._snapshot_source(app.current_note_id))
 
-    def save_current(self) -> None:
+    def _snapshot_source(self, note_id: int) -> SnapshotSource:
         app = self.app
-        app._save_job = None
-        if app.current_note_id is None:
-            return
-        # Don't save if editor is read-only (encrypted placeholder)
-        if app.text_editor.isReadOnly():
-            return
-        note = db.get_note(app.current_note_id)
-        if not note or (note["is_encrypted"] and app.current_note_id not in app._decrypted_cache):
-            return
 
-        title = app.title_entry.text().strip()
-        content = app.text_editor.toPlainText()
-        if not title:
-            return
+        def _snapshot() -> Snapshot | None:
+            # Read-only = nota criptata non ancora decriptata (o editor svuotato)
+            if app.current_note_id != note_id or app.text_editor.isReadOnly():
+                return None
+            title = app.title_entry.text().strip()
+            content = app.text_editor.toPlainText()
+            password = None
+            if note_id in app._decrypted_cache:
+                password = app._decrypted_cache[note_id][1]
+                app._decrypted_cache[note_id] = (content, password)
+            return title, content, password
 
-        # Don't save plaintext versions for encrypted notes
-        if not note["is_encrypted"]:
-            app._version_counter += 1
-            if app._version_counter >= VERSION_SAVE_EVERY:
-                app._version_counter = 0
-                db.save_version(app.current_note_id, title, content)
-
-        if note["is_encrypted"] and app.current_note_id in app._decrypted_cache:
-            password = app._decrypted_cache[app.current_note_id][1]
-            encrypted = crypto_utils.encrypt(content, password)
-            db.set_note_encrypted(app.current_note_id, encrypted, True)
-            app._decrypted_cache[app.current_note_id] = (content, password)
-        else:
-            db.update_note(app.current_note_id, title=title, content=content)
-
-        # Update list item text (safe: no currentRowChanged connected)
-        items = app.note_listbox.findItems("*", Qt.MatchFlag.MatchWildcard)
-        for item in items:
-            if item.data(Qt.ItemDataRole.UserRole) == app.current_note_id:
-                prefix = ""
-                if note["is_pinned"]:
-                    prefix += "[P] "
-                if note["is_favorite"]:
-                    prefix += "[*] "
-                if note["is_encrypted"]:
-                    prefix += "[E] "
-                item.setText(f"{prefix}{title}")
-                break
+        return _snapshot
+
+    def save_current(self) -> None:
+        """Write the pending edits of the current note and wait for them to reach the database."""
+        app = self.app
+        if app.current_note_id is not None:
+            app.autosave.flush(app.current_note_id)
 
-        app.statusBar().showMessage("Salvato")
+    def on_note_saved(self, note_id: int, title: str) -> None:
+        """Autosave completed (from the main window or a detached one): refresh the list row."""
+        app = self.app
+        row = app._note_rows.get(note_id)
+        if row is not None:
+            item = app.note_listbox.item(row)
+            if item is not None:
+                item.setText(self._list_label(app.notes[row], title))
+        if note_id == app.current_note_id:
+            app.statusBar().showMessage("Salvato")
+
+    @staticmethod
+    def _list_label(note: sqlite3.Row, title: str) -> str:
+        prefix = ""
+        if note["is_pinned"]:
+            prefix += "[P] "
+        if note["is_favorite"]:
+            prefix += "[*] "
+        if note["is_encrypted"]:
+            prefix += "[E] "
+        return f"{prefix}{title}"
 
     # --- Context Menu ---
 
@@ -397,20 +540,20 @@ class NoteController:
             menu.addSeparator()
             menu.addAction("Rinomina", self.rename_category)
             # Submenu "Sposta in"
-            descendants = db.get_descendant_category_ids(cat_id)
-            excluded = {cat_id} | set(descendants)
+            excluded = {cat_id} | self._descendant_ids(cat_id)
             move_cat_menu = menu.addMenu("Sposta in")
             move_cat_menu.addAction("(Radice)", lambda cid=cat_id: self._reparent_category(cid, None))
             for cat in app.categories:
                 if cat["id"] not in excluded:
-                    path = db.get_category_path(cat["id"])
-                    display = " > ".join(r["name"] for r in path)
                     move_cat_menu.addAction(
-                        display,
+                        self.category_label(cat["id"]),
                         lambda cid=cat_id, pid=cat["id"]: self._reparent_category(cid, pid),
                     )
             menu.addAction("Elimina", self.delete_category)
             menu.addSeparator()
+            name = item.data(0, _NAME_ROLE)
+            menu.addAction("Esporta categoria in PDF...", lambda: app.export_ctl.export_category_pdf(cat_id, name))
+            menu.addSeparator()
 
         menu.addAction("Nuova Categoria", self.new_category)
         menu.popup(app.cat_tree.mapToGlobal(pos))
@@ -439,10 +582,8 @@ class NoteController:
         app.note_listbox.setCurrentRow(idx)
         self.on_note_select()
 
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
-        if not note:
+        note = self._current_row()
+        if note is None:
             return
 
         menu = QMenu(app)
@@ -489,10 +630,8 @@ class NoteController:
                 lambda nid=note_id: self._move_single_note(nid, db._UNSET),
             )
             for cat in app.categories:
-                path = db.get_category_path(cat["id"])
-                display = " > ".join(r["name"] for r in path)
                 move_menu.addAction(
-                    display,
+                    self.category_label(cat["id"]),
                     lambda nid=note_id, cid=cat["id"]: self._move_single_note(nid, cid),
                 )
             menu.addAction("Sposta nel cestino", self.delete_note)
@@ -502,16 +641,14 @@ class NoteController:
     def _restore_from_trash(self) -> None:
         if self.app.current_note_id is None:
             return
-        db.restore_note(self.app.current_note_id)
+        self.app.adb.restore_note(self.app.current_note_id, on_error=self.report_db_error)
         self.app.current_note_id = None
-        self.load_categories()
+        self.refresh_counts()
         self.load_notes()
 
     def _permanent_delete(self) -> None:
         app = self.app
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
+        note = self._current_row()
         if note is None:
             return
         if (
@@ -522,9 +659,9 @@ class NoteController:
             )
             == QMessageBox.StandardButton.Yes
         ):
-            db.permanent_delete_note(app.current_note_id)
+            app.adb.permanent_delete_note(note["id"], on_error=self.report_db_error)
             app.current_note_id = None
-            self.load_categories()
+            self.refresh_counts()
             self.load_notes()
 
     # --- Multi-select actions ---
@@ -544,25 +681,31 @@ class NoteController:
             menu.addSeparator()
             menu.addAction(f"Tag per {n} note...", lambda: self._tag_multiple(sel))
             menu.addSeparator()
+            menu.addAction(f"Condividi {n} note (.mynote)...", lambda: self._export_multiple_mynote(sel))
+            menu.addSeparator()
             move_menu = menu.addMenu("Sposta in")
             move_menu.addAction("Nessuna categoria", lambda: self._move_multiple_to_category(sel, db._UNSET))
             for cat in app.categories:
-                path = db.get_category_path(cat["id"])
-                display = " > ".join(r["name"] for r in path)
-                move_menu.addAction(display, lambda cid=cat["id"]: self._move_multiple_to_category(sel, cid))
+                move_menu.addAction(
+                    self.category_label(cat["id"]), lambda cid=cat["id"]: self._move_multiple_to_category(sel, cid)
+                )
             menu.addSeparator()
             menu.addAction(f"Sposta {n} note nel cestino", lambda: self._soft_delete_multiple(sel))
 
+    def _export_multiple_mynote(self, sel: list[int]) -> None:
+        ids = [self.app.notes[i]["id"] for i in sel if i < len(self.app.notes)]
+        self.app.export_ctl.export_mynote_multiple(ids)
+
     def _soft_delete_multiple(self, sel: list[int]) -> None:
         app = self.app
         n = len(sel)
         if QMessageBox.question(app, "Conferma", f"Spostare {n} note nel cestino?") != QMessageBox.StandardButton.Yes:
             return
-        self.save_current()
+        self._flush_save()
         ids = [app.notes[i]["id"] for i in sel if i < len(app.notes)]
-        db.soft_delete_notes(ids)
+        app.adb.soft_delete_notes(ids, on_error=self.report_db_error)
         app.current_note_id = None
-        self.load_categories()
+        self.refresh_counts()
         self.load_notes()
 
     def _permanent_delete_multiple(self, sel: list[int]) -> None:
@@ -575,52 +718,60 @@ class NoteController:
             != QMessageBox.StandardButton.Yes
         ):
             return
-        self.save_current()
+        self._flush_save()
         ids = [app.notes[i]["id"] for i in sel if i < len(app.notes)]
-        db.permanent_delete_notes(ids)
+        app.adb.permanent_delete_notes(ids, on_error=self.report_db_error)
         app.current_note_id = None
-        self.load_categories()
+        self.refresh_counts()
         self.load_notes()
 
     def _restore_multiple(self, sel: list[int]) -> None:
         app = self.app
         ids = [app.notes[i]["id"] for i in sel if i < len(app.notes)]
-        db.restore_notes(ids)
+        app.adb.restore_notes(ids, on_error=self.report_db_error)
         app.current_note_id = None
-        self.load_categories()
+        self.refresh_counts()
         self.load_notes()
 
     def _pin_multiple(self, sel: list[int], value: bool) -> None:
         ids = [self.app.notes[i]["id"] for i in sel if i < len(self.app.notes)]
-        db.set_pinned_notes(ids, value)
+        self.app.adb.set_pinned_notes(ids, value, on_error=self.report_db_error)
         self.load_notes()
 
     def _favorite_multiple(self, sel: list[int], value: bool) -> None:
         ids = [self.app.notes[i]["id"] for i in sel if i < len(self.app.notes)]
-        db.set_favorite_notes(ids, value)
+        self.app.adb.set_favorite_notes(ids, value, on_error=self.report_db_error)
+        self.refresh_counts()
         self.load_notes()
 
     def _tag_multiple(self, sel: list[int]) -> None:
         ids = [self.app.notes[i]["id"] for i in sel if i < len(self.app.notes)]
         if not ids:
             return
-        dlg = BulkTagDialog(self.app, ids)
+        dlg = BulkTagDialog(self.app, ids, self.app.adb)
         if dlg.result:
             self.load_categories()
             self.load_notes()
 
     def _move_single_note(self, note_id: int, cat_id: int | db._Sentinel) -> None:
-        self.save_current()
-        db.update_note(note_id, category_id=cat_id)
-        self.load_categories()
+        self._flush_save()
+        self.app.adb.update_note(
+            note_id,
+            category_id=cat_id,
+            on_done=lambda changed: self._after_move() if changed else None,
+            on_error=self.report_db_error,
+        )
+
+    def _after_move(self) -> None:
+        self.refresh_counts()
         self.load_notes()
 
     def _move_multiple_to_category(self, sel: list[int], cat_id: int | db._Sentinel) -> None:
-        self.save_current()
+        self._flush_save()
         ids = [self.app.notes[i]["id"] for i in sel if i < len(self.app.notes)]
-        db.move_notes_to_category(ids, cat_id)
+        self.app.adb.move_notes_to_category(ids, cat_id, on_error=self.report_db_error)
         self.app.current_note_id = None
-        self.load_categories()
+        self.refresh_counts()
         self.load_notes()
 
     # --- Checklist ---
@@ -659,30 +810,39 @@ class NoteController:
         """Handle link clicks in the preview browser."""
         if url.scheme() == "mynote":
             title = unquote(url.path().lstrip("/"))
-            note = db.get_note_by_title(title)
-            if note:
-                self.display_note(note["id"])
-                # Select the note in the list if visible
-                for i in range(self.app.note_listbox.count()):
-                    item = self.app.note_listbox.item(i)
-                    if item and item.data(Qt.ItemDataRole.UserRole) == note["id"]:
-                        self.app.note_listbox.setCurrentRow(i)
-                        break
-            else:
-                QMessageBox.information(self.app, "Nota non trovata", f"Nessuna nota con titolo '{title}'.")
+            self.app.adb.get_note_by_title(title, on_done=lambda note: self.open_linked_note(title, note))
         elif not url.scheme() and url.hasFragment():
             # Internal anchor link (#section) — scroll within preview
             self.app.preview_browser.scrollToAnchor(url.fragment())
         else:
             QDesktopServices.openUrl(url)
 
-    def update_preview(self) -> None:
-        """Render markdown content to HTML in the preview tab."""
+    def open_linked_note(self, title: str, note: sqlite3.Row | None, parent: QWidget | None = None) -> bool:
+        """Show the note a [[wikilink]] points to (looked up on the DB worker); False if there is none."""
+        if note is None:
+            QMessageBox.information(parent or self.app, "Nota non trovata", f"Nessuna nota con titolo '{title}'.")
+            return False
+        self.display_note(note["id"])
+        # Select the note in the list if visible
+        row = self.app._note_rows.get(note["id"])
+        if row is not None:
+            self.app.note_listbox.setCurrentRow(row)
+        return True
+
+    @staticmethod
+    @perf_utils.timed("markdown.render")
+    def _render_markdown(content: str) -> str:
         import markdown
 
+        html: str = markdown.markdown(content, extensions=["fenced_code", "tables", "nl2br", "toc"])
+        return html
+
+    @perf_utils.timed("ui.update_preview")
+    def update_preview(self) -> None:
+        """Render markdown content to HTML in the preview tab."""
         content = self.app.text_editor.toPlainText()
         content = self._replace_wikilinks(content)
-        html = markdown.markdown(content, extensions=["fenced_code", "tables", "nl2br", "toc"])
+        html = self._render_markdown(content)
         html = self._add_heading_anchors(html)
         styled = (
             f"<div style=\"font-family: '{UI_FONT}', sans-serif; "
@@ -713,20 +873,21 @@ class NoteController:
 
     def new_note(self) -> None:
         app = self.app
-        categories = db.get_all_categories()
-        dlg = NoteDialog(app, categories)
+        dlg = NoteDialog(app, app.categories)
         if dlg.result:
-            note_id = db.add_note(dlg.result["title"], category_id=dlg.result["category_id"])
-            app.show_trash = False
-            self.load_categories()
-            self.load_notes()
-            for i in range(app.note_listbox.count()):
-                item = app.note_listbox.item(i)
-                if item.data(Qt.ItemDataRole.UserRole) == note_id:
-                    app.note_listbox.setCurrentRow(i)
-                    self.display_note(note_id)
-                    break
-            app.text_editor.setFocus()
+            app.adb.add_note(
+                dlg.result["title"],
+                category_id=dlg.result["category_id"],
+                on_done=self._note_added,
+                on_error=self.report_db_error,
+            )
+
+    def _note_added(self, note_id: int) -> None:
+        app = self.app
+        app.show_trash = False
+        self.load_categories()
+        self.load_notes(select_note_id=note_id)
+        app.text_editor.setFocus()
 
     def delete_note(self) -> None:
         app = self.app
@@ -745,11 +906,10 @@ class NoteController:
             return
 
         # Single note
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
+        note = self._current_row()
         if note is None:
             return
+        note_id = note["id"]
         if app.show_trash:
             btn = QMessageBox.question(
                 app,
@@ -759,30 +919,31 @@ class NoteController:
                 QMessageBox.StandardButton.Cancel,
             )
             if btn == QMessageBox.StandardButton.Yes:
-                db.permanent_delete_note(app.current_note_id)
+                app.adb.permanent_delete_note(note_id, on_error=self.report_db_error)
             elif btn == QMessageBox.StandardButton.No:
-                db.restore_note(app.current_note_id)
+                app.adb.restore_note(note_id, on_error=self.report_db_error)
             else:
                 return
         else:
             reply = QMessageBox.question(app, "Conferma", f"Spostare '{note['title']}' nel cestino?")
             if reply != QMessageBox.StandardButton.Yes:
                 return
-            db.soft_delete_note(app.current_note_id)
+            app.adb.soft_delete_note(note_id, on_error=self.report_db_error)
         app.current_note_id = None
-        self.load_categories()
+        self.refresh_counts()
         self.load_notes()
 
     def toggle_pin(self) -> None:
         if self.app.current_note_id is None:
             return
-        db.toggle_pin(self.app.current_note_id)
+        self.app.adb.toggle_pin(self.app.current_note_id, on_error=self.report_db_error)
         self.load_notes()
 
     def toggle_favorite(self) -> None:
         if self.app.current_note_id is None:
             return
-        db.toggle_favorite(self.app.current_note_id)
+        self.app.adb.toggle_favorite(self.app.current_note_id, on_error=self.report_db_error)
+        self.refresh_counts()
         self.load_notes()
 
     # --- Categories ---
@@ -790,25 +951,30 @@ class NoteController:
     def new_category(self) -> None:
         dlg = CategoryDialog(self.app, title="Nuova Categoria")
         if dlg.result:
-            db.add_category(dlg.result)
+            self.app.adb.add_category(dlg.result, on_error=self.report_db_error)
             self.load_categories()
 
     def new_subcategory(self, parent_id: int) -> None:
         dlg = CategoryDialog(self.app, title="Nuova Sottocategoria")
         if dlg.result:
-            db.add_category(dlg.result, parent_id=parent_id)
+            self.app.adb.add_category(dlg.result, parent_id=parent_id, on_error=self.report_db_error)
             self.load_categories()
 
     def _reparent_category(self, cat_id: int, new_parent_id: int | None) -> None:
-        if not db.move_category(cat_id, new_parent_id):
+        self.app.adb.move_category(
+            cat_id,
+            new_parent_id,
+            on_done=lambda moved: self._category_moved(cat_id, moved),
+            on_error=self.report_db_error,
+        )
+
+    def _category_moved(self, cat_id: int, moved: bool) -> None:
+        if not moved:
             QMessageBox.warning(
                 self.app, "Errore", "Impossibile spostare: la destinazione e' un discendente della categoria."
             )
             return
-        self.load_categories()
-        if cat_id in self.app._cat_items:
-            self.app.cat_tree.setCurrentItem(self.app._cat_items[cat_id])
-        self.on_category_select()
+        self.load_categories(select_category_id=cat_id)
 
     def rename_category(self) -> None:
         app = self.app
@@ -820,7 +986,7 @@ class NoteController:
             return
         dlg = CategoryDialog(app, title="Rinomina Categoria", initial_name=cat["name"])
         if dlg.result:
-            db.rename_category(app.current_category_id, dlg.result)
+            app.adb.rename_category(app.current_category_id, dlg.result, on_error=self.report_db_error)
             self.load_categories()
 
     def delete_category(self) -> None:
@@ -832,9 +998,17 @@ class NoteController:
         if not cat:
             return
 
-        descendants = db.get_descendant_category_ids(app.current_category_id)
-        own_notes = db.get_note_ids_by_category(app.current_category_id)
-        has_children = len(descendants) > 0
+        cat_id = cat["id"]
+        app.adb.get_note_ids_by_category(
+            cat_id,
+            on_done=lambda own_notes: self._confirm_delete_category(cat, own_notes),
+            on_error=self.report_db_error,
+        )
+
+    def _confirm_delete_category(self, cat: sqlite3.Row, own_notes: list[int]) -> None:
+        app = self.app
+        cat_id = cat["id"]
+        has_children = bool(self._descendant_ids(cat_id))
 
         if own_notes or has_children:
             msg = f"Eliminare '{cat['name']}'?\n\n"
@@ -849,12 +1023,8 @@ class NoteController:
         if reply != QMessageBox.StandardButton.Yes:
             return
 
-        self.save_current()
-        if has_children:
-            db.promote_children(app.current_category_id)
-        if own_notes:
-            db.soft_delete_notes(own_notes)
-        db.delete_category(app.current_category_id)
+        self._flush_save()
+        app.adb.worker.call(_delete_category, cat_id, own_notes, has_children, on_error=self.report_db_error)
 
         app.current_category_id = None
         self.load_categories()
@@ -865,93 +1035,126 @@ class NoteController:
     def manage_tags(self) -> None:
         if self.app.current_note_id is None:
             return
-        TagManagerDialog(self.app, self.app.current_note_id)
-        self.display_note(self.app.current_note_id)
+        note_id = self.app.current_note_id
+        TagManagerDialog(self.app, note_id, self.app.adb)
+        if self.app.current_note_id == note_id:
+            self.refresh_details(note_id)
         self.load_categories()
 
     def manage_attachments(self) -> None:
-        if self.app.current_note_id is None:
+        note_id = self.app.current_note_id
+        if note_id is None:
             return
-        AttachmentDialog(self.app, self.app.current_note_id)
-        self.display_note(self.app.current_note_id)
+        AttachmentDialog(self.app, note_id, self.app.adb)
+        if self.app.current_note_id == note_id:
+            self.refresh_details(note_id)
+
+    def _with_note(self, note_id: int, then: Callable[[sqlite3.Row], None]) -> None:
+        """Read the note on its DbWorker lane, after its pending save; then(note) if it is still shown."""
+        self._flush_save()
+
+        def _loaded(note: sqlite3.Row | None) -> None:
+            if note is not None and self.app.current_note_id == note_id:
+                then(note)
+
+        self.app.adb.get_note(note_id, on_done=_loaded, on_error=self.report_db_error)
 
     # --- Version History ---
 
     def show_versions(self) -> None:
+        if self.app.current_note_id is not None:
+            self._with_note(self.app.current_note_id, self._show_versions)
+
+    def _show_versions(self, note: sqlite3.Row) -> None:
         app = self.app
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
-        if not note:
-            return
         if note["is_encrypted"]:
             QMessageBox.information(app, "Info", "La cronologia versioni non e' disponibile per le note criptate.")
             return
-        content = app.text_editor.toPlainText()
-        db.save_version(app.current_note_id, note["title"], content)
-        dlg = VersionHistoryDialog(app, app.current_note_id)
-        if dlg.result:
-            self.display_note(app.current_note_id)
+        dlg = VersionHistoryDialog(app, note["id"], app.adb)
+        if dlg.result and app.current_note_id == note["id"]:
+            self.display_note(note["id"])
 
     # --- Inline Decrypt ---
 
     def _inline_decrypt(self) -> None:
         app = self.app
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
-        if not note or not note["is_encrypted"]:
+        if app.current_note_id is None or not app.decrypt_entry.text():
             return
+        self._with_note(app.current_note_id, self._inline_decrypt_loaded)
+
+    def _inline_decrypt_loaded(self, note: sqlite3.Row) -> None:
+        app = self.app
         password = app.decrypt_entry.text()
-        if not password:
+        if not note["is_encrypted"] or not password:
             return
+        import crypto_utils
+
         decrypted = crypto_utils.decrypt(note["content"], password)
         if decrypted is None:
             app.decrypt_error_label.setText("Password errata")
             app.decrypt_entry.selectAll()
             app.decrypt_entry.setFocus()
             return
-        app._decrypted_cache[app.current_note_id] = (decrypted, password)
+        app._decrypted_cache[note["id"]] = (decrypted, password)
         app.decrypt_entry.clear()
         app.decrypt_error_label.setText("")
-        self.display_note(app.current_note_id)
+        self.display_note(note["id"])
 
     # --- Encryption ---
 
     def encrypt_note(self) -> None:
+        if self.app.current_note_id is not None:
+            self._with_note(self.app.current_note_id, self._encrypt_loaded)
+
+    def _encrypt_loaded(self, note: sqlite3.Row) -> None:
         app = self.app
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
-        if note is None:
-            return
         if note["is_encrypted"]:
             QMessageBox.information(app, "Info", "La nota e' gia' criptata.")
             return
 
         dlg = PasswordDialog(app, title="Cripta nota", confirm=True)
         if dlg.result:
+            note_id = note["id"]
             content = app.text_editor.toPlainText()
-            encrypted = crypto_utils.encrypt(content, dlg.result)
-            db.set_note_encrypted(app.current_note_id, encrypted, True)
-            db.delete_note_versions(app.current_note_id)
-            app._decrypted_cache.pop(app.current_note_id, None)
-            self.display_note(app.current_note_id)
-            app.statusBar().showMessage("Nota criptata")
+            # Fino alla fine della scrittura niente modifiche (l'autosave le salverebbe in chiaro)
+            app.autosave.discard(note_id)
+            app.text_editor.setReadOnly(True)
+            app._decrypted_cache.pop(note_id, None)
+            app.adb.worker.call(
+                store_encrypted,
+                note_id,
+                content,
+                dlg.result,
+                on_done=lambda _none: self._encryption_changed(note_id, "Nota criptata"),
+                on_error=lambda exc: self._encryption_failed(note_id, exc),
+            )
+
+    def _encryption_failed(self, note_id: int, exc: BaseException) -> None:
+        self.report_db_error(exc)
+        if self.app.current_note_id == note_id:
+            self.display_note(note_id)
+
+    def _encryption_changed(self, note_id: int, message: str) -> None:
+        if self.app.current_note_id == note_id:
+            self.display_note(note_id)
+        self.load_notes()
+        self.app.statusBar().showMessage(message)
 
     def decrypt_note(self) -> None:
+        if self.app.current_note_id is not None:
+            self._with_note(self.app.current_note_id, self._decrypt_loaded)
+
+    def _decrypt_loaded(self, note: sqlite3.Row) -> None:
         app = self.app
-        if app.current_note_id is None:
-            return
-        note = db.get_note(app.current_note_id)
-        if note is None:
-            return
         if not note["is_encrypted"]:
             QMessageBox.information(app, "Info", "La nota non e' criptata.")
             return
 
         dlg = PasswordDialog(app, title="Decripta nota")
         if dlg.result:
+            import crypto_utils
+
+            note_id = note["id"]
             decrypted = crypto_utils.decrypt(note["content"], dlg.result)
             if decrypted is None:
                 QMessageBox.critical(app, "Errore", "Password errata.")
@@ -966,10 +1169,14 @@ class NoteController:
                 QMessageBox.StandardButton.Cancel,
             )
             if btn == QMessageBox.StandardButton.Yes:
-                db.set_note_encrypted(app.current_note_id, decrypted, False)
-                app._decrypted_cache.pop(app.current_note_id, None)
+                app._decrypted_cache.pop(note_id, None)
+                app.adb.set_note_encrypted(
+                    note_id,
+                    decrypted,
+                    False,
+                    on_done=lambda _none: self._encryption_changed(note_id, "Crittografia rimossa"),
+                    on_error=self.report_db_error,
+                )
             elif btn == QMessageBox.StandardButton.No:
-                app._decrypted_cache[app.current_note_id] = (decrypted, dlg.result)
-            else:
-                return
-            self.display_note(app.current_note_id)
+                app._decrypted_cache[note_id] = (decrypted, dlg.result)
+                self.display_note(note_id)
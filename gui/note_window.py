@@ -5,7 +5,6 @@ from __future__ import annotations
 import os
 import threading
 from collections.abc import Callable
-from datetime import datetime
 from typing import TYPE_CHECKING, Any
 from urllib.parse import unquote
 
@@ -35,6 +34,7 @@ if TYPE_CHECKING:
     from PySide6.QtGui import QCloseEvent, QMouseEvent, QPixmap
 
     from gui import MyNotesApp
+    from gui.autosave import Snapshot
 
 import contextlib
 
@@ -45,7 +45,6 @@ import platform_utils
 from annotator import AnnotationTool
 from dialogs import AttachmentDialog, AudioRecordDialog, PasswordDialog, TagManagerDialog, VersionHistoryDialog
 from gui.constants import (
-    AUTO_SAVE_MS,
     BG_DARK,
     BG_ELEVATED,
     BG_SURFACE,
@@ -59,7 +58,6 @@ from gui.constants import (
     FONT_XS,
     MONO_FONT,
     UI_FONT,
-    VERSION_SAVE_EVERY,
 )
 from gui.formatting import (
     apply_audio_formatting,
@@ -83,12 +81,10 @@ class NoteWindow(QMainWindow):
         self.setAttribute(Qt.WidgetAttribute.WA_DeleteOnClose)
 
         # State
-        self._save_job: QTimer | None = None
         self._image_refs: list[Any] = []
         self._decrypted_cache: dict[int, tuple[str, str]] = {}  # note_id -> (text, password)
         if decrypted_entry is not None:
             self._decrypted_cache[note_id] = decrypted_entry
-        self._version_counter: int = 0
         self.gallery_labels: list[QLabel] = []
         self.selected_image_index: int | None = None
         self.gallery_attachments: list[Any] = []
@@ -100,6 +96,7 @@ class NoteWindow(QMainWindow):
         self.setMinimumSize(700, 450)
 
         self._build_ui()
+        self.app.autosave.signals.saved.connect(self._on_saved)
         self._display_note()
         self.editor_tabs.setCurrentIndex(1)
 
@@ -291,13 +288,11 @@ class NoteWindow(QMainWindow):
 
     def _update_preview(self) -> None:
         """Render markdown content to HTML in the preview tab."""
-        import markdown
-
         from gui.note_controller import NoteController
 
         content = self.text_editor.toPlainText()
         content = NoteController._replace_wikilinks(content)
-        html = markdown.markdown(content, extensions=["fenced_code", "tables", "nl2br", "toc"])
+        html = NoteController._render_markdown(content)
         html = NoteController._add_heading_anchors(html)
         styled = (
             f"<div style=\"font-family: '{UI_FONT}', sans-serif; "
@@ -311,23 +306,17 @@ class NoteWindow(QMainWindow):
         """Handle link clicks in the preview browser."""
         if url.scheme() == "mynote":
             title = unquote(url.path().lstrip("/"))
-            note = db.get_note_by_title(title)
-            if note:
-                self.app.notes_ctl.display_note(note["id"])
-                for i in range(self.app.note_listbox.count()):
-                    item = self.app.note_listbox.item(i)
-                    if item and item.data(Qt.ItemDataRole.UserRole) == note["id"]:
-                        self.app.note_listbox.setCurrentRow(i)
-                        break
-                self.app.raise_()
-                self.app.activateWindow()
-            else:
-                QMessageBox.information(self, "Nota non trovata", f"Nessuna nota con titolo '{title}'.")
+            self.app.adb.get_note_by_title(title, on_done=lambda note: self._open_linked_note(title, note))
         elif not url.scheme() and url.hasFragment():
             self.preview_browser.scrollToAnchor(url.fragment())
         else:
             QDesktopServices.openUrl(url)
 
+    def _open_linked_note(self, title: str, note: Any) -> None:
+        if self.app.notes_ctl.open_linked_note(title, note, parent=self):
+            self.app.raise_()
+            self.app.activateWindow()
+
     def _toggle_preview(self) -> None:
         """Toggle between edit and preview tabs."""
         tabs = self.editor_tabs
@@ -342,7 +331,8 @@ class NoteWindow(QMainWindow):
     # --- Display ---
 
     def _display_note(self) -> None:
-        note = db.get_note(self.note_id)
+        # Letta nella corsia della nota: dopo le modifiche in attesa (o in scrittura)
+        note = self.app.notes_ctl.read_note(self.note_id)
         if not note:
             self.setWindowTitle("Nota non trovata")
             return
@@ -369,10 +359,18 @@ class NoteWindow(QMainWindow):
             self._apply_audio_formatting()
 
         self.text_editor.blockSignals(False)
+        if not self.text_editor.isReadOnly():
+            self.app.autosave.mark_clean(self.note_id, self.title_entry.text().strip(), self.text_editor.toPlainText())
 
         if self.editor_tabs.currentIndex() == 1:
             self._update_preview()
 
+        self._show_meta(note)
+        self._refresh_details()
+
+    def _show_meta(self, note: Any) -> None:
+        if self._closing or note is None:
+            return
         created = note["created_at"][:16].replace("T", " ")
         updated = note["updated_at"][:16].replace("T", " ")
         meta = f"Creata: {created}  |  Modificata: {updated}"
@@ -384,57 +382,48 @@ class NoteWindow(QMainWindow):
             meta += "  |  Criptata"
         self.meta_label.setText(meta)
 
-        tags = db.get_note_tags(self.note_id)
+    def _refresh_details(self, _result: object = None) -> None:
+        """Reload tags line and gallery (after attachment or tag changes)."""
+        self.app.adb.get_note_details(self.note_id, on_done=lambda details: self._show_details(*details))
+
+    def _db_failed(self, exc: BaseException) -> None:
+        if not self._closing:
+            QMessageBox.critical(self, "Errore", f"Operazione sul database non riuscita:\n{exc}")
+
+    def _show_details(self, tags: list[Any], attachments: list[Any]) -> None:
+        """Tags line and gallery, filled in when the DB worker returns them."""
+        if self._closing:
+            return
         tag_str = "Tag: " + ", ".join(f"#{t['name']}" for t in tags) if tags else "Nessun tag"
-        att_count = len(db.get_note_attachments(self.note_id))
-        if att_count > 0:
-            tag_str += f"  |  {att_count} allegato/i"
+        if attachments:
+            tag_str += f"  |  {len(attachments)} allegato/i"
         self.tags_label.setText(tag_str)
-
-        self._load_gallery()
+        self._load_gallery(attachments)
 
     # --- Auto-save ---
 
     def schedule_save(self) -> None:
-        if self._save_job:
-            self._save_job.stop()
-        timer = QTimer(self)
-        timer.setSingleShot(True)
-        timer.timeout.connect(self.save_current)
-        timer.start(AUTO_SAVE_MS)
-        self._save_job = timer
+        self.app.autosave.schedule(self.note_id, self._snapshot)
 
-    def save_current(self) -> None:
-        self._save_job = None
+    def _snapshot(self) -> Snapshot | None:
         if self.text_editor.isReadOnly():
-            return
-        note = db.get_note(self.note_id)
-        if not note:
-            return
-        if note["is_encrypted"] and self.note_id not in self._decrypted_cache:
-            return
-
+            return None
         title = self.title_entry.text().strip()
         content = self.text_editor.toPlainText()
-        if not title:
-            return
-
-        if not note["is_encrypted"]:
-            self._version_counter += 1
-            if self._version_counter >= VERSION_SAVE_EVERY:
-                self._version_counter = 0
-                db.save_version(self.note_id, title, content)
-
-        if note["is_encrypted"] and self.note_id in self._decrypted_cache:
+        password = None
+        if self.note_id in self._decrypted_cache:
             password = self._decrypted_cache[self.note_id][1]
-            encrypted = crypto_utils.encrypt(content, password)
-            db.set_note_encrypted(self.note_id, encrypted, True)
             self._decrypted_cache[self.note_id] = (content, password)
-        else:
-            db.update_note(self.note_id, title=title, content=content)
+        return title, content, password
+
+    def save_current(self) -> None:
+        """Write the pending edits of this note and wait for them to reach the database."""
+        self.app.autosave.flush(self.note_id)
 
-        self.setWindowTitle(f"{title} - MyNotes")
-        self.status_bar.showMessage("Salvato")
+    def _on_saved(self, note_id: int, title: str) -> None:
+        if note_id == self.note_id:
+            self.setWindowTitle(f"{title} - MyNotes")
+            self.status_bar.showMessage("Salvato")
 
     # --- Checklist / Audio ---
 
@@ -460,7 +449,7 @@ class NoteWindow(QMainWindow):
 
     # --- Gallery ---
 
-    def _load_gallery(self) -> None:
+    def _load_gallery(self, attachments: list[Any]) -> None:
         self._image_refs.clear()
         self.gallery_labels.clear()
         self.selected_image_index = None
@@ -472,7 +461,6 @@ class NoteWindow(QMainWindow):
             if child is not None and child.widget():
                 child.widget().deleteLater()  # type: ignore[union-attr]
 
-        attachments = db.get_note_attachments(self.note_id)
         self.gallery_attachments = [a for a in attachments if image_utils.is_image_file(a["original_name"])]
 
         if not self.gallery_attachments:
@@ -557,8 +545,7 @@ class NoteWindow(QMainWindow):
         att = self.gallery_attachments[self.selected_image_index]
         answer = QMessageBox.question(self, "Conferma", f"Rimuovere '{att['original_name']}'?")
         if answer == QMessageBox.StandardButton.Yes:
-            db.delete_attachment(att["id"])
-            self._display_note()
+            self.app.adb.delete_attachment(att["id"], on_done=self._refresh_details, on_error=self._db_failed)
 
     def annotate_selected(self) -> None:
         if self.selected_image_index is None:
@@ -570,9 +557,14 @@ class NoteWindow(QMainWindow):
             return
         tool = AnnotationTool(self, path)
         if tool.result_path and os.path.exists(tool.result_path):
-            db.add_attachment(self.note_id, tool.result_path)
-            os.remove(tool.result_path)
-            self._display_note()
+            result_path = tool.result_path
+
+            def _added(_filename: str) -> None:
+                with contextlib.suppress(OSError):
+                    os.remove(result_path)
+                self._refresh_details()
+
+            self.app.adb.add_attachment(self.note_id, result_path, on_done=_added, on_error=self._db_failed)
 
     # --- Media ---
 
@@ -597,15 +589,12 @@ class NoteWindow(QMainWindow):
             success = False
         self.show()
         if success and os.path.exists(save_path):
-            now = datetime.now().isoformat()
-            with db._connect() as conn:
-                conn.execute(
-                    "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)",
-                    (self.note_id, filename, filename, now),
-                )
-                conn.commit()
-            self._display_note()
-            self.status_bar.showMessage("Screenshot catturato!")
+            self.app.adb.add_attachment_file(
+                self.note_id,
+                filename,
+                on_done=self._attachment_added("Screenshot catturato!"),
+                on_error=self._db_failed,
+            )
         else:
             msg = "Impossibile catturare lo screenshot.\n"
             if platform_utils.IS_LINUX:
@@ -617,9 +606,9 @@ class NoteWindow(QMainWindow):
             self, "Seleziona immagine", "", "Immagini (*.png *.jpg *.jpeg *.gif *.bmp *.tiff *.webp);;Tutti (*.*)"
         )
         if path:
-            db.add_attachment(self.note_id, path)
-            self._display_note()
-            self.status_bar.showMessage("Immagine aggiunta")
+            self.app.adb.add_attachment(
+                self.note_id, path, on_done=self._attachment_added("Immagine aggiunta"), on_error=self._db_failed
+            )
 
     def record_audio(self) -> None:
         dlg = AudioRecordDialog(self, mode="record")
@@ -627,12 +616,13 @@ class NoteWindow(QMainWindow):
             return
         temp_path = dlg.result["path"]
         description = dlg.result["description"]
-        att_filename = db.add_attachment(self.note_id, temp_path)
-        with contextlib.suppress(OSError):
-            os.remove(temp_path)
-        self._insert_audio_marker(att_filename, description)
-        self._display_note()
-        self.status_bar.showMessage("Audio registrato")
+
+        def _added(att_filename: str) -> None:
+            with contextlib.suppress(OSError):
+                os.remove(temp_path)
+            self._audio_added(att_filename, description, "Audio registrato")
+
+        self.app.adb.add_attachment(self.note_id, temp_path, on_done=_added, on_error=self._db_failed)
 
     def import_audio(self) -> None:
         path, _ = QFileDialog.getOpenFileName(
@@ -644,66 +634,112 @@ class NoteWindow(QMainWindow):
         if dlg.result is None:
             return
         description = dlg.result["description"]
-        att_filename = db.add_attachment(self.note_id, path)
+        self.app.adb.add_attachment(
+            self.note_id,
+            path,
+            on_done=lambda att_filename: self._audio_added(att_filename, description, "Audio importato"),
+            on_error=self._db_failed,
+        )
+
+    def _attachment_added(self, message: str) -> Callable[[str], None]:
+        def _done(_filename: str) -> None:
+            if not self._closing:
+                self._refresh_details()
+                self.status_bar.showMessage(message)
+
+        return _done
+
+    def _audio_added(self, att_filename: str, description: str, message: str) -> None:
+        if self._closing:
+            return
         self._insert_audio_marker(att_filename, description)
-        self._display_note()
-        self.status_bar.showMessage("Audio importato")
+        self._refresh_details()
+        self.status_bar.showMessage(message)
 
     # --- Note Actions ---
 
     def toggle_pin(self) -> None:
-        db.toggle_pin(self.note_id)
-        self._display_note()
+        self.app.adb.toggle_pin(self.note_id, on_error=self._db_failed)
+        self.app.adb.get_note(self.note_id, on_done=self._show_meta)
         self.app.notes_ctl.load_notes()
 
     def toggle_favorite(self) -> None:
-        db.toggle_favorite(self.note_id)
-        self._display_note()
+        self.app.adb.toggle_favorite(self.note_id, on_error=self._db_failed)
+        self.app.adb.get_note(self.note_id, on_done=self._show_meta)
+        self.app.notes_ctl.refresh_counts()
         self.app.notes_ctl.load_notes()
 
     def manage_tags(self) -> None:
-        TagManagerDialog(self, self.note_id)
-        self._display_note()
+        TagManagerDialog(self, self.note_id, self.app.adb)
+        self._refresh_details()
         self.app.notes_ctl.load_categories()
 
     def manage_attachments(self) -> None:
-        AttachmentDialog(self, self.note_id)
-        self._display_note()
+        AttachmentDialog(self, self.note_id, self.app.adb)
+        self._refresh_details()
+
+    def _with_note(self, then: Callable[[Any], None]) -> None:
+        """Read the note on its DbWorker lane, after its pending save, and call then(note)."""
+        self.app.autosave.flush(self.note_id, wait=False)
+
+        def _loaded(note: Any) -> None:
+            if note is not None and not self._closing:
+                then(note)
+
+        self.app.adb.get_note(self.note_id, on_done=_loaded, on_error=self._db_failed)
 
     def show_versions(self) -> None:
-        note = db.get_note(self.note_id)
-        if not note:
-            return
+        self._with_note(self._show_versions)
+
+    def _show_versions(self, note: Any) -> None:
         if note["is_encrypted"]:
             QMessageBox.information(self, "Info", "La cronologia versioni non e' disponibile per le note criptate.")
             return
-        content = self.text_editor.toPlainText()
-        db.save_version(self.note_id, note["title"], content)
-        dlg = VersionHistoryDialog(self, self.note_id)
+        dlg = VersionHistoryDialog(self, self.note_id, self.app.adb)
         if dlg.result:
             self._display_note()
 
     def encrypt_note(self) -> None:
-        note = db.get_note(self.note_id)
-        if not note:
-            return
+        self._with_note(self._encrypt_loaded)
+
+    def _encrypt_loaded(self, note: Any) -> None:
+        from gui.note_controller import store_encrypted
+
         if note["is_encrypted"]:
             QMessageBox.information(self, "Info", "La nota e' gia' criptata.")
             return
         dlg = PasswordDialog(self, title="Cripta nota", confirm=True)
         if dlg.result:
             content = self.text_editor.toPlainText()
-            encrypted = crypto_utils.encrypt(content, dlg.result)
-            db.set_note_encrypted(self.note_id, encrypted, True)
-            db.delete_note_versions(self.note_id)
+            # Fino alla fine della scrittura niente modifiche (l'autosave le salverebbe in chiaro)
+            self.app.autosave.discard(self.note_id)
+            self.text_editor.setReadOnly(True)
             self._decrypted_cache.pop(self.note_id, None)
+            self.app.adb.worker.call(
+                store_encrypted,
+                self.note_id,
+                content,
+                dlg.result,
+                on_done=lambda _none: self._encryption_changed("Nota criptata"),
+                on_error=self._encryption_failed,
+            )
+
+    def _encryption_failed(self, exc: BaseException) -> None:
+        self._db_failed(exc)
+        if not self._closing:
             self._display_note()
-            self.status_bar.showMessage("Nota criptata")
 
-    def decrypt_note(self) -> None:
-        note = db.get_note(self.note_id)
-        if not note:
+    def _encryption_changed(self, message: str) -> None:
+        if self._closing:
             return
+        self._display_note()
+        self.app.notes_ctl.load_notes()
+        self.status_bar.showMessage(message)
+
+    def decrypt_note(self) -> None:
+        self._with_note(self._decrypt_loaded)
+
+    def _decrypt_loaded(self, note: Any) -> None:
         if not note["is_encrypted"]:
             QMessageBox.information(self, "Info", "La nota non e' criptata.")
             return
@@ -722,13 +758,17 @@ class NoteWindow(QMainWindow):
                 QMessageBox.StandardButton.Cancel,
             )
             if btn == QMessageBox.StandardButton.Yes:
-                db.set_note_encrypted(self.note_id, decrypted, False)
                 self._decrypted_cache.pop(self.note_id, None)
+                self.app.adb.set_note_encrypted(
+                    self.note_id,
+                    decrypted,
+                    False,
+                    on_done=lambda _none: self._encryption_changed("Crittografia rimossa"),
+                    on_error=self._db_failed,
+                )
             elif btn == QMessageBox.StandardButton.No:
                 self._decrypted_cache[self.note_id] = (decrypted, dlg.result)
-            else:
-                return
-            self._display_note()
+                self._display_note()
 
     # --- Lifecycle ---
 
@@ -744,6 +784,7 @@ class NoteWindow(QMainWindow):
             return
         self._closing = True
         self.save_current()
+        self.app.autosave.signals.saved.disconnect(self._on_saved)
         self._sync_cache_to_app()
         self.app._detached_windows.pop(self.note_id, None)
         self.app.notes_ctl.load_notes()
@@ -753,6 +794,7 @@ class NoteWindow(QMainWindow):
         if not self._closing:
             self._closing = True
             self.save_current()
+            self.app.autosave.signals.saved.disconnect(self._on_saved)
             self._sync_cache_to_app()
             self.app._detached_windows.pop(self.note_id, None)
             self.app.notes_ctl.load_notes()
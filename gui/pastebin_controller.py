@@ -9,13 +9,6 @@ from PySide6.QtCore import Qt
 from PySide6.QtWidgets import QApplication, QMessageBox
 
 import database as db
-import pastebin_utils
-from dialogs import (
-    PastebinManageDialog,
-    PastebinSettingsDialog,
-    PastebinShareDialog,
-    PastebinSuccessDialog,
-)
 
 if TYPE_CHECKING:
     from gui import MyNotesApp
@@ -28,6 +21,10 @@ class PastebinController:
         self.app = app
 
     def share_note(self) -> None:
+        # requests viene caricato solo quando si usa Pastebin
+        import pastebin_utils
+        from dialogs import PastebinShareDialog, PastebinSuccessDialog
+
         app = self.app
         if app.current_note_id is None:
             QMessageBox.information(app, "Info", "Seleziona una nota prima.")
@@ -108,7 +105,11 @@ class PastebinController:
             log.warning("Paste fallito: %s", result)
 
     def manage_pastes(self) -> None:
+        from dialogs import PastebinManageDialog
+
         PastebinManageDialog(self.app)
 
     def open_settings(self) -> None:
+        from dialogs import PastebinSettingsDialog
+
         PastebinSettingsDialog(self.app)
@@ -0,0 +1,109 @@
+"""Operazioni lunghe in un thread con dialog di progresso e annullamento (PySide6)."""
+
+from __future__ import annotations
+
+import logging
+import threading
+from collections.abc import Callable
+from typing import Any
+
+from PySide6.QtCore import QObject, Qt, Signal
+from PySide6.QtWidgets import QProgressDialog, QWidget
+
+from _types import ProgressCallback
+
+log = logging.getLogger("tasks")
+
+# Dialog mostrato solo se l'operazione dura piu' di cosi'
+SHOW_AFTER_MS = 400
+
+# Riferimenti ai task in corso: senza, signals e dialog verrebbero raccolti dal GC
+_running: set[BackgroundTask] = set()
+
+
+class _TaskSignals(QObject):
+    """Signals for thread-safe UI updates."""
+
+    progress = Signal(int, str)
+    finished = Signal(object)
+    failed = Signal(object)
+
+
+class BackgroundTask:
+    """Run `work(progress, cancel)` in a daemon thread behind a window-modal QProgressDialog.
+
+    The window stays responsive (repaints, can be moved) but is not editable while the task
+    runs. Exactly one of on_done(result), on_error(exc) or on_cancel() is called on the GUI
+    thread; `work` should poll `cancel.is_set()` and raise when it is set.
+    """
+
+    def __init__(
+        self,
+        parent: QWidget,
+        title: str,
+        work: Callable[[ProgressCallback, threading.Event], Any],
+        on_done: Callable[[Any], None],
+        on_error: Callable[[BaseException], None] | None = None,
+        on_cancel: Callable[[], None] | None = None,
+    ) -> None:
+        self._work = work
+        self._on_done = on_done
+        self._on_error = on_error
+        self._on_cancel = on_cancel
+        self.cancel_event = threading.Event()
+
+        self._dialog = QProgressDialog(title, "Annulla", 0, 100, parent)
+        self._dialog.setWindowTitle(title)
+        self._dialog.setWindowModality(Qt.WindowModality.WindowModal)
+        self._dialog.setMinimumDuration(SHOW_AFTER_MS)
+        self._dialog.setAutoClose(False)
+        self._dialog.setAutoReset(False)
+        self._dialog.canceled.connect(self._request_cancel)
+
+        self._signals = _TaskSignals(parent)
+        self._signals.progress.connect(self._on_progress)
+        self._signals.finished.connect(self._finish)
+        self._signals.failed.connect(self._fail)
+
+    def start(self) -> None:
+        _running.add(self)
+        self._dialog.setValue(0)
+
+        def _run() -> None:
+            try:
+                result = self._work(self._signals.progress.emit, self.cancel_event)
+            except BaseException as e:
+                self._signals.failed.emit(e)
+                return
+            self._signals.finished.emit(result)
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _request_cancel(self) -> None:
+        self.cancel_event.set()
+        self._dialog.setLabelText("Annullamento in corso...")
+
+    def _on_progress(self, percent: int, message: str) -> None:
+        if self.cancel_event.is_set():
+            return
+        self._dialog.setValue(percent)
+        self._dialog.setLabelText(message)
+
+    def _close(self) -> None:
+        self._dialog.canceled.disconnect(self._request_cancel)
+        self._dialog.close()
+        _running.discard(self)
+
+    def _finish(self, result: Any) -> None:
+        self._close()
+        self._on_done(result)
+
+    def _fail(self, exc: BaseException) -> None:
+        self._close()
+        if self.cancel_event.is_set():
+            if self._on_cancel:
+                self._on_cancel()
+            return
+        log.warning("Operazione in background fallita: %s", exc)
+        if self._on_error:
+            self._on_error(exc)
@@ -0,0 +1,63 @@
+"""Svuotamento automatico del cestino in background (PySide6)."""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import TYPE_CHECKING
+
+from PySide6.QtCore import QObject, QTimer, Signal
+
+import database as db
+
+if TYPE_CHECKING:
+    from gui import MyNotesApp
+
+log = logging.getLogger("trash")
+
+# Ritardo dopo l'avvio: la pulizia non deve competere con il primo caricamento
+PURGE_DELAY_MS = 3000
+
+
+class _PurgeSignals(QObject):
+    """Signals for thread-safe UI updates."""
+
+    finished = Signal(int)
+
+
+class TrashController:
+    def __init__(self, app: MyNotesApp) -> None:
+        self.app = app
+        self._running = False
+
+    def schedule_purge(self, delay_ms: int = PURGE_DELAY_MS) -> None:
+        QTimer.singleShot(delay_ms, self.purge_in_background)
+
+    def purge_in_background(self) -> None:
+        """Elimina le note scadute nel cestino a lotti, in un thread separato."""
+        if self._running:
+            return
+        self._running = True
+        signals = _PurgeSignals(self.app)
+        signals.finished.connect(self._on_finished)
+
+        def _run() -> None:
+            purged = 0
+            try:
+                # Completa eventuali eliminazioni di file interrotte da un crash
+                db.flush_file_deletions()
+                purged = db.purge_trash(db.TRASH_PURGE_DAYS)
+            except Exception as e:
+                log.warning("Pulizia cestino fallita: %s", e)
+            signals.finished.emit(purged)
+
+        threading.Thread(target=_run, daemon=True).start()
+
+    def _on_finished(self, purged: int) -> None:
+        self._running = False
+        if not purged:
+            return
+        log.info("Cestino: eliminate definitivamente %d note scadute", purged)
+        self.app.notes_ctl.refresh_counts()
+        if self.app.show_trash:
+            self.app.notes_ctl.load_notes()
@@ -8,6 +8,8 @@ import os
 from PIL import Image
 from PySide6.QtGui import QImage, QPixmap
 
+import perf_utils
+
 
 def pil_to_pixmap(pil_image: Image.Image) -> QPixmap:
     """Convert a PIL Image to QPixmap."""
@@ -19,6 +21,7 @@ def pil_to_pixmap(pil_image: Image.Image) -> QPixmap:
     return QPixmap.fromImage(qimg)
 
 
+@perf_utils.timed("image.load_pixmap")
 def load_image_as_pixmap(path: str, max_width: int | None = None, max_height: int | None = None) -> QPixmap:
     """Load an image file and return a QPixmap, optionally resized."""
     img: Image.Image = Image.open(path)
@@ -0,0 +1,246 @@
+"""Importazione in blocco di file Markdown e di cartelle (vault Obsidian e simili).
+
+Le sottocartelle diventano la gerarchia di categorie. I file vengono letti da un pool di
+thread e inseriti a lotti con executemany dentro un'unica transazione: un errore o un
+annullamento non lascia note a meta'. I [[wikilink]] che puntano a note importate vengono
+riscritti nel formato [[Titolo]] dell'app. Le immagini e gli audio referenziati diventano
+allegati della nota.
+"""
+
+from __future__ import annotations
+
+import contextlib
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import unquote
+
+import audio_utils
+import change_journal
+import database as db
+import perf_utils
+from _types import ProgressCallback
+from bundle_utils import ImportCancelled
+from error_codes import AppError
+
+log = logging.getLogger("import")
+
+MARKDOWN_EXTENSIONS = (".md", ".markdown")
+IMPORT_BATCH = 500
+READ_WORKERS = 8
+
+# Cartelle di configurazione/cestino dei vault da non importare
+_SKIP_DIRS = {".obsidian", ".trash", ".git", ".github", "node_modules", "__pycache__"}
+
+# ![[file]] / [[Nota#titolo|alias]]
+_WIKILINK_RE = re.compile(r"(!?)\[\[([^\[\]|#]+)(#[^\[\]|]*)?(\|[^\[\]]*)?\]\]")
+# ![alt](percorso) / [testo](percorso)
+_MD_LINK_RE = re.compile(r"(!?)\[([^\]]*)\]\(<?([^)<>]+?)>?\)")
+_URL_SCHEME_RE = re.compile(r"^[a-zA-Z][a-zA-Z0-9+.-]*:")
+
+# (percorso del file, sottocartelle relative alla radice = percorso di categoria)
+type MarkdownSource = tuple[str, list[str]]
+
+
+def scan_folder(root: str) -> tuple[list[MarkdownSource], dict[str, str]]:
+    """Walk `root` and return (markdown files with their category path, {lowercase name: path} of other files)."""
+    sources: list[MarkdownSource] = []
+    other_files: dict[str, str] = {}
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(d for d in dirnames if d not in _SKIP_DIRS and not d.startswith("."))
+        rel = os.path.relpath(dirpath, root)
+        parts = [] if rel == "." else rel.split(os.sep)
+        for name in sorted(filenames):
+            path = os.path.join(dirpath, name)
+            if name.lower().endswith(MARKDOWN_EXTENSIONS):
+                sources.append((path, parts))
+            else:
+                other_files.setdefault(name.lower(), path)
+    return sources, other_files
+
+
+def _read(path: str) -> tuple[str, str]:
+    """Return (text, mtime as ISO timestamp); runs in the reader pool."""
+    with open(path, encoding="utf-8-sig", errors="replace") as f:
+        text = f.read()
+    return text, datetime.fromtimestamp(os.path.getmtime(path)).isoformat()
+
+
+class _Resolver:
+    """Rewrite links in note content and collect the attachments each note references."""
+
+    def __init__(self, sources: list[MarkdownSource], other_files: dict[str, str], root: str | None = None) -> None:
+        self.other_files = other_files
+        # Solo i file sotto la radice importata (o accanto alla nota, per file singoli) diventano allegati
+        self.root = os.path.normcase(os.path.abspath(root)) if root else None
+        self.title_by_stem: dict[str, str] = {}
+        self.title_by_path: dict[str, str] = {}
+        for path, _parts in sources:
+            title = _title(path)
+            self.title_by_stem.setdefault(title.lower(), title)
+            self.title_by_path[os.path.normcase(os.path.abspath(path))] = title
+        # Sorgente -> nome in ATTACHMENTS_DIR: un file referenziato da piu' note viene copiato una volta
+        self.copied: dict[str, str] = {}
+        self.pending_copies: list[tuple[str, str]] = []
+
+    def rewrite(self, text: str, note_path: str) -> tuple[str, list[tuple[str, str]]]:
+        """Return (content with resolved links, [(attachment filename, original name)])."""
+        note_dir = os.path.dirname(note_path)
+        attachments: list[tuple[str, str]] = []
+
+        def _attach(src: str) -> str:
+            filename = self._attachment_filename(src)
+            original_name = os.path.basename(src)
+            if (filename, original_name) not in attachments:
+                attachments.append((filename, original_name))
+            if audio_utils.is_audio_file(original_name):
+                return f"[♪:{filename} {os.path.splitext(original_name)[0]}]"
+            return f"[allegato: {original_name}]"
+
+        def _wikilink(m: re.Match[str]) -> str:
+            embed, target = m.group(1), m.group(2).strip()
+            base = os.path.basename(target)
+            if not base.lower().endswith(MARKDOWN_EXTENSIONS) and os.path.splitext(base)[1]:
+                src = self.other_files.get(base.lower())
+                return _attach(src) if embed and src else m.group(0)
+            stem = os.path.splitext(base)[0] if base.lower().endswith(MARKDOWN_EXTENSIONS) else base
+            title = self.title_by_stem.get(stem.lower())
+            return f"[[{title}]]" if title else m.group(0)
+
+        def _md_link(m: re.Match[str]) -> str:
+            text, url = m.group(2).strip(), m.group(3).strip()
+            if _URL_SCHEME_RE.match(url) or url.startswith("#"):
+                return m.group(0)
+            target = unquote(url.split("#")[0])
+            path = os.path.normcase(os.path.abspath(os.path.join(note_dir, target)))
+            base = os.path.basename(target)
+            title = self.title_by_path.get(path)
+            if title is None and base.lower().endswith(MARKDOWN_EXTENSIONS):
+                # Link "shortest path" di Obsidian: solo il nome, la nota e' altrove nel vault
+                title = self.title_by_stem.get(os.path.splitext(base)[0].lower())
+            if title:
+                # [[Titolo]] non ha alias: un testo diverso dal titolo resta davanti al link
+                return f"[[{title}]]" if text in ("", title) else f"{text} ([[{title}]])"
+            if not (os.path.isfile(path) and self._allowed(path, note_dir)):
+                path = self.other_files.get(base.lower(), "")
+            if path:
+                return _attach(path)
+            return m.group(0)
+
+        text = _WIKILINK_RE.sub(_wikilink, text)
+        text = _MD_LINK_RE.sub(_md_link, text)
+        return text, attachments
+
+    def _allowed(self, path: str, note_dir: str) -> bool:
+        root = self.root or os.path.normcase(os.path.abspath(note_dir))
+        return os.path.commonpath([root, path]) == root
+
+    def _attachment_filename(self, src: str) -> str:
+        key = os.path.normcase(os.path.abspath(src))
+        filename = self.copied.get(key)
+        if filename is None:
+            filename = f"{uuid.uuid4().hex}{os.path.splitext(src)[1]}"
+            self.copied[key] = filename
+            self.pending_copies.append((src, os.path.join(db.ATTACHMENTS_DIR, filename)))
+        return filename
+
+
+def _title(path: str) -> str:
+    return os.path.splitext(os.path.basename(path))[0] or "Senza titolo"
+
+
+def _copy(job: tuple[str, str]) -> None:
+    shutil.copyfile(*job)
+
+
+def _next_note_id(conn: sqlite3.Connection) -> int:
+    """First id AUTOINCREMENT would hand out; ids are assigned up front so executemany can be used."""
+    max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM notes").fetchone()[0]
+    seq = conn.execute("SELECT seq FROM sqlite_sequence WHERE name = 'notes'").fetchone()
+    return int(max(max_id, seq[0] if seq else 0)) + 1
+
+
+@perf_utils.timed("import.import_markdown")
+def import_markdown(
+    sources: list[MarkdownSource],
+    other_files: dict[str, str] | None = None,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None,
+    batch_size: int = IMPORT_BATCH,
+    root: str | None = None,
+) -> int:
+    """Import Markdown files as notes in a single transaction and return how many were imported.
+
+    Each source carries its category path (created on demand). `other_files` is the
+    {lowercase name: path} index used to resolve ![[embeds]] and links by file name; linked
+    files become attachments only if they are under `root` (or, without a root, in the
+    note's own folder). Raises ImportCancelled or
+    AppError("EXP-002"); in both cases nothing is imported and copied attachments are removed.
+    """
+    resolver = _Resolver(sources, other_files or {}, root)
+    total = len(sources)
+    os.makedirs(db.ATTACHMENTS_DIR, exist_ok=True)
+    category_cache: dict[tuple[str, ...], int | None] = {}
+    imported = 0
+
+    with db._connect() as conn, ThreadPoolExecutor(max_workers=READ_WORKERS) as pool:
+        try:
+            # Lock di scrittura subito: gli id pre-assegnati non possono essere presi da altri
+            conn.execute("BEGIN IMMEDIATE")
+            first_id = next_id = _next_note_id(conn)
+            for start in range(0, total, batch_size):
+                if cancel is not None and cancel.is_set():
+                    raise ImportCancelled()
+                chunk = sources[start : start + batch_size]
+                note_rows = []
+                att_rows: list[tuple[int, str, str, str]] = []
+                texts = pool.map(_read, [path for path, _parts in chunk])
+                for (path, parts), (text, mtime) in zip(chunk, texts, strict=True):
+                    category_id = db.ensure_category_path_in(conn, parts, category_cache) if parts else None
+                    content, attachments = resolver.rewrite(text, path)
+                    note_rows.append((next_id, _title(path), content, category_id, mtime, mtime))
+                    att_rows.extend((next_id, filename, name, mtime) for filename, name in attachments)
+                    next_id += 1
+
+                copies, resolver.pending_copies = resolver.pending_copies, []
+                list(pool.map(_copy, copies))
+                conn.executemany(
+                    "INSERT INTO notes (id, title, content, category_id, created_at, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?)",
+                    note_rows,
+                )
+                if att_rows:
+                    conn.executemany(
+                        "INSERT INTO attachments (note_id, filename, original_name, added_at) VALUES (?, ?, ?, ?)",
+                        att_rows,
+                    )
+                imported += len(note_rows)
+                if progress:
+                    progress(imported * 100 // max(total, 1), f"Importate {imported}/{total} note")
+            conn.commit()
+            db.invalidate_cache()
+        except BaseException as e:
+            conn.rollback()
+            for filename in resolver.copied.values():
+                with contextlib.suppress(OSError):
+                    os.remove(os.path.join(db.ATTACHMENTS_DIR, filename))
+            if isinstance(e, (OSError, ValueError, sqlite3.Error)):
+                log.warning("Importazione Markdown fallita: %s", e)
+                raise AppError("EXP-002", str(e)) from e
+            raise
+
+    change_journal.record_inserted_notes(list(range(first_id, next_id)))
+    log.info("Importate %d note Markdown (%d allegati)", imported, len(resolver.copied))
+    return imported
+
+
+def import_folder(root: str, progress: ProgressCallback | None = None, cancel: threading.Event | None = None) -> int:
+    """Import every Markdown file under `root`, mapping subfolders to nested categories."""
+    sources, other_files = scan_folder(root)
+    return import_markdown(sources, other_files, progress=progress, cancel=cancel, root=root)
@@ -4,14 +4,18 @@
 from __future__ import annotations
 
 import logging
+import multiprocessing
 import os
 import sys
+import time
 from logging.handlers import RotatingFileHandler
 
 import database as db
 
 
 def main() -> None:
+    started_at = time.perf_counter()
+
     # Console handler (DEBUG)
     console = logging.StreamHandler()
     console.setLevel(logging.DEBUG)
@@ -38,9 +42,9 @@ def main() -> None:
     )
     logging.getLogger("backup").addHandler(backup_handler)
     db._secure_file(backup_log_path)
-    db.init_db()
 
     import qdarktheme
+    from PySide6.QtCore import QTimer
     from PySide6.QtWidgets import QApplication
 
     from gui import MyNotesApp
@@ -49,8 +53,14 @@ def main() -> None:
     app.setStyleSheet(qdarktheme.load_stylesheet("dark"))
     window = MyNotesApp()
     window.show()
+    # Prima il disegno della finestra, poi migrazioni e caricamento dati
+    app.processEvents()
+    logging.getLogger("app").info("Finestra visibile in %.0f ms", (time.perf_counter() - started_at) * 1000)
+    QTimer.singleShot(0, lambda: window.finish_startup(started_at))
     sys.exit(app.exec())
 
 
 if __name__ == "__main__":
+    # Worker del pool di esportazione nell'eseguibile PyInstaller
+    multiprocessing.freeze_support()
     main()
@@ -0,0 +1,394 @@
+"""Esportazione PDF con reportlab platypus: testo a capo, struttura Markdown, miniature.
+
+La story viene generata in modo pigro: platypus consuma i flowable dalla testa della lista
+e _LazyStory la riempie da un generatore, quindi anche note enormi o categorie intere
+restano in memoria solo per poche pagine alla volta.
+"""
+
+from __future__ import annotations
+
+import io
+import logging
+import os
+import re
+import threading
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+from xml.sax.saxutils import escape
+
+import database as db
+import perf_utils
+from _types import ProgressCallback
+from export_utils import ExportCancelled
+
+log = logging.getLogger("pdf")
+
+THUMB_MAX_PX = (600, 450)
+THUMB_MAX_CM = (8.0, 6.0)
+CODE_LINE_CHARS = 95
+_LOOKAHEAD = 64
+
+_HEADING_RE = re.compile(r"^(#{1,6})\s+(.*)$")
+_BULLET_RE = re.compile(r"^(\s*)[-*+]\s+(.*)$")
+_NUMBERED_RE = re.compile(r"^(\s*)(\d+)[.)]\s+(.*)$")
+_HR_RE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$")
+_TABLE_SEP_RE = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$")
+_AUDIO_RE = re.compile(r"\[♪:\S+\s*([^\]]*)\]")
+
+# Span atomici (codice, link, wiki-link): tolti dal testo prima dell'enfasi, che cosi' non li spezza
+_SPAN_RE = re.compile(r"`([^`]+)`|\[\[([^\[\]]+)\]\]|\[([^\]]+)\]\((https?://[^)\s]+)\)")
+_PLACEHOLDER_RE = re.compile("\x00(\\d+)\x00")
+_EMPHASIS_RE = re.compile(r"\*\*\*|\*\*|~~|\*")
+_EMPHASIS_TAGS = {
+    "***": ("<b><i>", "</i></b>"),
+    "**": ("<b>", "</b>"),
+    "~~": ("<strike>", "</strike>"),
+    "*": ("<i>", "</i>"),
+}
+
+
+class _LazyStory(list[Any]):
+    """Flowable list refilled from a generator as platypus consumes it from the front."""
+
+    def __init__(self, source: Iterator[Any]) -> None:
+        super().__init__()
+        self._source: Iterator[Any] | None = source
+
+    def _fill(self) -> None:
+        while self._source is not None and super().__len__() < _LOOKAHEAD:
+            try:
+                self.append(next(self._source))
+            except StopIteration:
+                self._source = None
+
+    def __len__(self) -> int:
+        self._fill()
+        return super().__len__()
+
+    def __getitem__(self, index: Any) -> Any:
+        self._fill()
+        return super().__getitem__(index)
+
+
+def _inline(text: str) -> str:
+    """Escape text for platypus' mini-markup and translate inline Markdown.
+
+    Code spans and links are taken out first and emphasis is matched recursively on what
+    is left, so the tags always nest (platypus rejects `<b><i></b></i>`).
+    """
+    text = _AUDIO_RE.sub(lambda m: f"[audio: {m.group(1) or 'registrazione'}]", text.replace("\x00", ""))
+    spans: list[str] = []
+
+    def _take(m: re.Match[str]) -> str:
+        code, wiki, label, url = m.groups()
+        if code is not None:
+            spans.append(f'<font face="Courier">{escape(code)}</font>')
+        elif wiki is not None:
+            spans.append(f"<i>{escape(wiki)}</i>")
+        else:
+            spans.append(f'<link href="{escape(url, {chr(34): "&quot;"})}" color="blue">{_emphasis(label)}</link>')
+        return f"\x00{len(spans) - 1}\x00"
+
+    marked = _emphasis(_SPAN_RE.sub(_take, text))
+    return _PLACEHOLDER_RE.sub(lambda m: spans[int(m.group(1))], marked)
+
+
+def _closing(text: str, delim: str, start: int) -> int:
+    """Index of the delimiter closing `delim` opened before `start`, or -1."""
+    if delim != "*":
+        return text.find(delim, start + 1)
+    j = start + 1
+    while j < len(text):
+        if text.startswith("**", j):
+            # Un ** interno e' un'enfasi annidata, non la chiusura
+            close = text.find("**", j + 2)
+            j = close + 2 if close != -1 else j + 2
+            continue
+        if text[j] == "*" and not text[j - 1].isspace():
+            return j
+        j += 1
+    return -1
+
+
+def _emphasis(text: str) -> str:
+    """Escaped `text` with **bold**, *italic* and ~~strike~~ as properly nested tags."""
+    out: list[str] = []
+    pos = 0
+    for m in _EMPHASIS_RE.finditer(text):
+        if m.start() < pos:
+            continue
+        delim = m.group()
+        start = m.end()
+        if delim == "*" and (
+            start >= len(text) or text[start].isspace() or (m.start() > 0 and text[m.start() - 1].isalnum())
+        ):
+            continue
+        close = _closing(text, delim, start)
+        if close == -1 and delim == "***":
+            # ***a** o ***a*: il primo * resta testo, il resto apre un grassetto
+            delim = "**"
+            close = _closing(text, delim, start)
+        if close == -1:
+            continue
+        open_tag, close_tag = _EMPHASIS_TAGS[delim]
+        out.append(escape(text[pos : start - len(delim)]))
+        out.append(f"{open_tag}{_emphasis(text[start:close])}{close_tag}")
+        pos = close + len(delim)
+    out.append(escape(text[pos:]))
+    return "".join(out)
+
+
+def _paragraph(markup: str, style: Any, plain: str, **kwargs: Any) -> Any:
+    """Paragraph of `markup`; if platypus cannot parse it, of the escaped source text."""
+    from reportlab.platypus import Paragraph
+
+    try:
+        return Paragraph(markup, style, **kwargs)
+    except ValueError as e:
+        log.warning("Markup PDF non valido, testo semplice: %s", e)
+        return Paragraph(escape(plain), style, **kwargs)
+
+
+class _Styles:
+    def __init__(self) -> None:
+        from reportlab.lib import colors
+        from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+
+        base = getSampleStyleSheet()
+        self.title = base["Title"]
+        self.meta = ParagraphStyle("Meta", parent=base["Normal"], fontSize=8, textColor=colors.grey, spaceAfter=10)
+        self.body = ParagraphStyle("Body", parent=base["Normal"], fontSize=10.5, leading=14, spaceAfter=6)
+        # Righe di un paragrafo tranne l'ultima: un flowable per riga, senza spazio tra l'una e l'altra
+        self.body_line = ParagraphStyle("BodyLine", parent=self.body, spaceAfter=0)
+        self.headings = [
+            ParagraphStyle(f"H{level}", parent=base[f"Heading{min(level, 6)}"], keepWithNext=1) for level in range(1, 7)
+        ]
+        self.bullet = ParagraphStyle("Bullet", parent=self.body, leftIndent=18, bulletIndent=6, spaceAfter=2)
+        self.quote = ParagraphStyle(
+            "Quote", parent=self.body, leftIndent=14, textColor=colors.HexColor("#555555"), fontName="Helvetica-Oblique"
+        )
+        self.quote_line = ParagraphStyle("QuoteLine", parent=self.quote, spaceAfter=0)
+        self.code = ParagraphStyle(
+            "Code", parent=base["Code"], fontSize=8.5, leading=10.5, backColor=colors.HexColor("#f4f4f4"), spaceAfter=6
+        )
+        self.cell = ParagraphStyle("Cell", parent=self.body, fontSize=9, leading=11, spaceAfter=0)
+
+
+def _markdown_flowables(content: str, styles: _Styles) -> Iterator[Any]:
+    """Yield flowables for a note body, one Markdown block at a time."""
+    from reportlab.lib import colors
+    from reportlab.platypus import HRFlowable, Preformatted, Table, TableStyle
+
+    lines = content.split("\n")
+    i = 0
+    n = len(lines)
+    while i < n:
+        line = lines[i]
+        stripped = line.strip()
+
+        if stripped.startswith("```"):
+            code: list[str] = []
+            i += 1
+            while i < n and not lines[i].strip().startswith("```"):
+                code.append(lines[i])
+                i += 1
+            i += 1
+            yield Preformatted("\n".join(code), styles.code, maxLineLength=CODE_LINE_CHARS, newLineChars="")
+            continue
+
+        if not stripped:
+            i += 1
+            continue
+
+        if m := _HEADING_RE.match(stripped):
+            yield _paragraph(_inline(m.group(2)), styles.headings[len(m.group(1)) - 1], m.group(2))
+        elif _HR_RE.match(stripped):
+            yield HRFlowable(width="100%", color=colors.lightgrey, spaceBefore=4, spaceAfter=8)
+        elif stripped.startswith("[x]") or stripped.startswith("[ ]"):
+            done = stripped.startswith("[x]")
+            source = stripped[3:].strip()
+            text = _inline(source)
+            box = '<font name="ZapfDingbats">4</font>' if done else '<font name="ZapfDingbats">o</font>'
+            yield _paragraph(f"<strike>{text}</strike>" if done else text, styles.bullet, source, bulletText=box)
+        elif m := _BULLET_RE.match(line):
+            yield _paragraph(_inline(m.group(2)), styles.bullet, m.group(2), bulletText="•")
+        elif m := _NUMBERED_RE.match(line):
+            yield _paragraph(_inline(m.group(3)), styles.bullet, m.group(3), bulletText=f"{m.group(2)}.")
+        elif stripped.startswith(">"):
+            # Una riga per flowable: platypus divide un paragrafo enorme in tempo quadratico
+            while i < n and lines[i].strip().startswith(">"):
+                source = lines[i].strip()[1:].strip()
+                i += 1
+                last = i == n or not lines[i].strip().startswith(">")
+                yield _paragraph(_inline(source), styles.quote if last else styles.quote_line, source)
+            continue
+        elif stripped.startswith("|") and i + 1 < n and _TABLE_SEP_RE.match(lines[i + 1]):
+            rows: list[list[Any]] = []
+            while i < n and lines[i].strip().startswith("|"):
+                if not _TABLE_SEP_RE.match(lines[i]):
+                    cells = lines[i].strip().strip("|").split("|")
+                    rows.append([_paragraph(_inline(c.strip()), styles.cell, c.strip()) for c in cells])
+                i += 1
+            width = max(len(r) for r in rows)
+            rows = [r + [""] * (width - len(r)) for r in rows]
+            table = Table(rows, repeatRows=1, hAlign="LEFT")
+            table.setStyle(
+                TableStyle(
+                    [
+                        ("GRID", (0, 0), (-1, -1), 0.5, colors.lightgrey),
+                        ("BACKGROUND", (0, 0), (-1, 0), colors.HexColor("#eeeeee")),
+                        ("VALIGN", (0, 0), (-1, -1), "TOP"),
+                    ]
+                )
+            )
+            yield table
+            continue
+        else:
+            # Paragrafo: righe consecutive una sotto l'altra (come l'estensione nl2br dell'anteprima),
+            # una per flowable come le citazioni
+            while i < n and lines[i].strip() and not _starts_block(lines, i):
+                source = lines[i].strip()
+                i += 1
+                last = i == n or not lines[i].strip() or _starts_block(lines, i)
+                yield _paragraph(_inline(source), styles.body if last else styles.body_line, source)
+            continue
+        i += 1
+
+
+def _starts_block(lines: list[str], i: int) -> bool:
+    stripped = lines[i].strip()
+    return bool(
+        stripped.startswith(("```", ">", "[x]", "[ ]"))
+        or _HEADING_RE.match(stripped)
+        or _HR_RE.match(stripped)
+        or _BULLET_RE.match(lines[i])
+        or _NUMBERED_RE.match(lines[i])
+        or (stripped.startswith("|") and i + 1 < len(lines) and _TABLE_SEP_RE.match(lines[i + 1]))
+    )
+
+
+def _thumbnail(path: str) -> Any | None:
+    """Return a reportlab Image with a downscaled JPEG of `path`, or None if it can't be read."""
+    from PIL import Image
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Image as PdfImage
+
+    try:
+        with Image.open(path) as img:
+            img.thumbnail(THUMB_MAX_PX)
+            rgb = img.convert("RGB")
+    except OSError as e:
+        log.warning("Miniatura non generata per %s: %s", path, e)
+        return None
+    buf = io.BytesIO()
+    rgb.save(buf, format="JPEG", quality=85)
+    buf.seek(0)
+    max_w, max_h = THUMB_MAX_CM[0] * cm, THUMB_MAX_CM[1] * cm
+    scale = min(max_w / rgb.width, max_h / rgb.height, 1.0)
+    return PdfImage(buf, width=rgb.width * scale, height=rgb.height * scale, hAlign="LEFT")
+
+
+def _note_flowables(note: dict[str, Any], styles: _Styles) -> Iterator[Any]:
+    from reportlab.platypus import KeepTogether, Paragraph, Spacer
+
+    from image_utils import is_image_file
+
+    yield Paragraph(escape(note["title"] or "Senza titolo"), styles.title)
+    meta = f"Creata: {note['created_at'][:10]}  |  Modificata: {note['updated_at'][:10]}"
+    if note["tags"]:
+        meta += "  |  " + " ".join(f"#{t}" for t in note["tags"])
+    yield Paragraph(escape(meta), styles.meta)
+
+    if note["is_encrypted"]:
+        yield Paragraph("<i>[Nota criptata]</i>", styles.body)
+    else:
+        yield from _markdown_flowables(note["content"] or "", styles)
+
+    if note["attachments"]:
+        yield Spacer(1, 8)
+        yield Paragraph("Allegati", styles.headings[2])
+        for filename, original_name in note["attachments"]:
+            path = os.path.join(db.ATTACHMENTS_DIR, filename)
+            thumb = _thumbnail(path) if is_image_file(filename) and os.path.exists(path) else None
+            caption = Paragraph(escape(original_name), styles.meta)
+            yield KeepTogether([thumb, caption]) if thumb is not None else caption
+
+
+def _story(
+    note_ids: list[int] | None,
+    total: int,
+    styles: _Styles,
+    progress: ProgressCallback | None,
+    cancel: threading.Event | None,
+) -> Iterator[Any]:
+    from reportlab.platypus import PageBreak
+
+    done = 0
+    for batch in db.iter_export_notes(note_ids, batch_size=16):
+        for note in batch:
+            if cancel is not None and cancel.is_set():
+                raise ExportCancelled()
+            if done:
+                yield PageBreak()
+            for flowable in _note_flowables(note, styles):
+                if cancel is not None and cancel.is_set():
+                    raise ExportCancelled()
+                yield flowable
+            done += 1
+            if progress:
+                progress(done * 100 // max(total, 1), f"PDF: {done}/{total} note")
+
+
+def _draw_footer(canvas: Any, doc: Any) -> None:
+    from reportlab.lib.units import cm
+
+    canvas.saveState()
+    canvas.setFont("Helvetica", 8)
+    canvas.setFillGray(0.5)
+    canvas.drawString(2 * cm, 1.2 * cm, f"MyNotes - {datetime.now():%Y-%m-%d}")
+    canvas.drawRightString(doc.pagesize[0] - 2 * cm, 1.2 * cm, f"Pagina {doc.page}")
+    canvas.restoreState()
+
+
+@perf_utils.timed("pdf.export_notes_pdf")
+def export_notes_pdf(
+    note_ids: list[int] | None,
+    dest_path: str,
+    progress: ProgressCallback | None = None,
+    cancel: threading.Event | None = None,
+) -> int:
+    """Render notes (all active notes if `note_ids` is None) into one PDF, a page break between notes.
+
+    Returns the number of exported notes. Raises ImportError if reportlab is missing and
+    ExportCancelled if `cancel` gets set; no partial file is left behind.
+    """
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.units import cm
+    from reportlab.platypus import SimpleDocTemplate
+
+    total = db.count_export_notes(note_ids)
+    part = f"{dest_path}.part"
+    doc = SimpleDocTemplate(
+        part,
+        pagesize=A4,
+        leftMargin=2 * cm,
+        rightMargin=2 * cm,
+        topMargin=2 * cm,
+        bottomMargin=2 * cm,
+        title="MyNotes",
+        author="MyNotes",
+    )
+    try:
+        doc.build(
+            _LazyStory(_story(note_ids, total, _Styles(), progress, cancel)),
+            onFirstPage=_draw_footer,
+            onLaterPages=_draw_footer,
+        )
+        os.replace(part, dest_path)
+    except BaseException:
+        if os.path.exists(part):
+            os.remove(part)
+        raise
+    log.info("PDF esportato: %d note in %s", total, dest_path)
+    return total
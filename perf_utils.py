@@ -0,0 +1,125 @@
+"""Strumentazione dei percorsi caldi: contatori e istogrammi dei tempi di esecuzione.
+
+Disattivata di default. Si abilita avviando l'app con la variabile d'ambiente
+MYNOTES_PROFILE=1: con la strumentazione spenta `timed` restituisce la funzione
+originale, quindi non aggiunge alcun costo alle chiamate.
+"""
+
+from __future__ import annotations
+
+import functools
+import logging
+import os
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from datetime import datetime
+from typing import Any
+
+log: logging.Logger = logging.getLogger("perf")
+
+ENABLED: bool = os.environ.get("MYNOTES_PROFILE", "") not in ("", "0")
+
+SLOW_THRESHOLD_MS: float = 100.0
+_MAX_SAMPLES: int = 1000
+_MAX_SLOW_CALLS: int = 200
+
+
+class _Metric:
+    __slots__ = ("count", "total_ms", "max_ms", "samples")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        # Finestra scorrevole degli ultimi campioni per i percentili
+        self.samples: deque[float] = deque(maxlen=_MAX_SAMPLES)
+
+
+_lock = threading.Lock()
+_metrics: dict[str, _Metric] = {}
+_slow_calls: deque[tuple[str, str, float]] = deque(maxlen=_MAX_SLOW_CALLS)
+
+
+def timed[**P, R](name: str) -> Callable[[Callable[P, R]], Callable[P, R]]:
+    """Decorator recording the duration of every call under `name` (no-op when profiling is disabled)."""
+
+    def decorator(func: Callable[P, R]) -> Callable[P, R]:
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args: P.args, **kwargs: P.kwargs) -> R:
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                record(name, (time.perf_counter() - start) * 1000)
+
+        return wrapper
+
+    return decorator
+
+
+def record(name: str, elapsed_ms: float) -> None:
+    with _lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = _metrics[name] = _Metric()
+        metric.count += 1
+        metric.total_ms += elapsed_ms
+        metric.max_ms = max(metric.max_ms, elapsed_ms)
+        metric.samples.append(elapsed_ms)
+        if elapsed_ms >= SLOW_THRESHOLD_MS:
+            _slow_calls.append((datetime.now().strftime("%H:%M:%S"), name, elapsed_ms))
+
+
+def _percentile(sorted_samples: list[float], pct: float) -> float:
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, int(round(pct / 100 * (len(sorted_samples) - 1))))
+    return sorted_samples[index]
+
+
+def snapshot() -> list[dict[str, Any]]:
+    """Return per-name stats (count, total, p50, p95, max in ms), slowest total first."""
+    with _lock:
+        items = [(name, m.count, m.total_ms, m.max_ms, sorted(m.samples)) for name, m in _metrics.items()]
+    items.sort(key=lambda item: item[2], reverse=True)
+    return [
+        {
+            "name": name,
+            "count": count,
+            "total_ms": total,
+            "p50_ms": _percentile(samples, 50),
+            "p95_ms": _percentile(samples, 95),
+            "max_ms": max_ms,
+        }
+        for name, count, total, max_ms, samples in items
+    ]
+
+
+def slow_calls() -> list[tuple[str, str, float]]:
+    """Return the most recent calls slower than SLOW_THRESHOLD_MS as (time, name, ms), newest first."""
+    with _lock:
+        return list(reversed(_slow_calls))
+
+
+def reset() -> None:
+    with _lock:
+        _metrics.clear()
+        _slow_calls.clear()
+
+
+def dump_snapshot() -> None:
+    """Write the current stats and slow calls to the log (WARNING, so they reach mynotes.log)."""
+    lines = [f"{'funzione':<40} {'chiamate':>8} {'totale':>10} {'p50':>9} {'p95':>9} {'max':>9}"]
+    for s in snapshot():
+        lines.append(
+            f"{s['name']:<40} {s['count']:>8} {s['total_ms']:>10.1f} "
+            f"{s['p50_ms']:>9.2f} {s['p95_ms']:>9.2f} {s['max_ms']:>9.2f}"
+        )
+    for when, name, elapsed in slow_calls():
+        lines.append(f"lenta: {when} {name} {elapsed:.1f} ms")
+    log.warning("Profilo prestazioni (ms):\n%s", "\n".join(lines))
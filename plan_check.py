@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""MyNotes - Verifica dei piani di query della lista note.
+
+Genera una libreria sintetica in una DATA_DIR temporanea e controlla EXPLAIN QUERY PLAN
+per ogni combinazione di filtri che la lista note puo' produrre (cestino, preferiti,
+categorie, tag, ricerca):
+
+    senza tag   nessuna SCAN e nessun ordinamento in TEMP B-TREE: l'indice composito
+                restituisce le note gia' nell'ordine di ORDER BY
+    con tag     la query parte da note_tags tramite idx_note_tags_tag, sia per il tag piu'
+                usato sia per uno raro: si visitano e ordinano solo le note con quel tag
+
+Per il tag raro il risultato viene anche confrontato con una semi-join di riferimento:
+stesse note, nessun duplicato, ordinate come la lista.
+
+Uso:
+    python plan_check.py                # exit code 1 se un piano ricade su una scansione
+    python plan_check.py --size 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import itertools
+import sqlite3
+import sys
+
+import database as db
+from benchmark import generate_library, temp_data_dir
+
+DEFAULT_SIZE = 5000
+CATEGORY_SHAPES: list[list[int] | None] = [None, [1], [1, 2, 3]]
+TAG_INDEX_STEP = "idx_note_tags_tag (tag_id=?)"
+
+
+def _plan(conn: sqlite3.Connection, query: str, params: list[int | str]) -> list[str]:
+    return [row["detail"] for row in conn.execute("EXPLAIN QUERY PLAN " + query, params).fetchall()]
+
+
+def audit_note_list_plans(tag_ids: tuple[int, ...] = (1,)) -> list[str]:
+    """Check EXPLAIN QUERY PLAN for every filter combination the note list can produce.
+
+    Returns one message per plan that scans a table or index, sorts an untagged list in a
+    temp B-tree, or does not start from idx_note_tags_tag when a tag filter is set.
+    An empty list means every combination is served by an index.
+    """
+    problems: list[str] = []
+    with db._connect() as conn:
+        for show_deleted, favorites_only, category_ids, tag_id, search in itertools.product(
+            (False, True), (False, True), CATEGORY_SHAPES, (None, *tag_ids), (None, "x")
+        ):
+            query, params = db._note_list_query(category_ids, tag_id, search, show_deleted, favorites_only)
+            plan = _plan(conn, query, params)
+            bad = [step for step in plan if step.startswith("SCAN")]
+            if tag_id is None:
+                bad += [step for step in plan if "TEMP B-TREE" in step]
+            elif not plan or not (plan[0].startswith("SEARCH nt ") and TAG_INDEX_STEP in plan[0]):
+                bad += plan[:1] or ["piano vuoto"]
+            if bad:
+                combo = (
+                    f"deleted={show_deleted} favorites={favorites_only} "
+                    f"categories={len(category_ids or [])} tag={tag_id} search={search is not None}"
+                )
+                problems.append(f"{combo}: {' | '.join(bad)}")
+    return problems
+
+
+def _tag_usage() -> tuple[int, int]:
+    """Return (most used, least used) tag id among the tags that have at least one note."""
+    with db._connect() as conn:
+        rows = conn.execute(
+            "SELECT tag_id, COUNT(*) AS uses FROM note_tags GROUP BY tag_id ORDER BY uses DESC, tag_id"
+        ).fetchall()
+    return rows[0]["tag_id"], rows[-1]["tag_id"]
+
+
+def _check_rare_tag_rows(tag_id: int) -> list[str]:
+    """The note_tags-driven query must return the same notes as a semi-join, once each and in list order."""
+    reference = (
+        "SELECT n.id FROM notes n WHERE n.is_deleted = 0"
+        " AND EXISTS (SELECT 1 FROM note_tags nt WHERE nt.note_id = n.id AND nt.tag_id = ?)"
+    )
+    with db._connect() as conn:
+        expected = sorted(row["id"] for row in conn.execute(reference, (tag_id,)).fetchall())
+    rows = db.get_all_notes(tag_id=tag_id)
+    got = [row["id"] for row in rows]
+    problems = []
+    if sorted(got) != expected:
+        problems.append(f"tag {tag_id}: {len(got)} note restituite, attese {len(expected)}")
+    keys = [(row["is_pinned"], row["updated_at"]) for row in rows]
+    if keys != sorted(keys, reverse=True):
+        problems.append(f"tag {tag_id}: note non ordinate per is_pinned, updated_at")
+    return problems
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Verifica dei piani di query della lista note")
+    parser.add_argument("--size", type=int, default=DEFAULT_SIZE, help="numero di note della libreria")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    problems: list[str] = []
+    with temp_data_dir():
+        library = generate_library(args.size, args.seed)
+        common_tag, rare_tag = _tag_usage()
+        print(f"  libreria: {library['notes']} note, tag comune {common_tag}, tag raro {rare_tag}")
+        problems.extend(audit_note_list_plans((common_tag, rare_tag)))
+        print(f"  piani      {'OK' if not problems else 'FALLITO'}")
+        rows = _check_rare_tag_rows(rare_tag)
+        print(f"  tag raro   {'OK' if not rows else 'FALLITO'}")
+        problems.extend(rows)
+
+    if problems:
+        print(f"\n{len(problems)} problema/i:")
+        for problem in problems:
+            print(f"  {problem}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
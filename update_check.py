@@ -0,0 +1,350 @@
+#!/usr/bin/env python3
+"""MyNotes - Verifica dell'aggiornamento differenziale contro un server HTTP locale.
+
+Costruisce due release sintetiche in una cartella temporanea (installazione 1 con dati
+utente, file aggiunti dall'utente e un file che la release 2 elimina), pubblica la
+release 2 come farebbe la CI (archivio completo, pacchetto per file, manifest firmato) su
+un server HTTP locale al posto di GitHub e applica l'aggiornamento con updater.py:
+
+    resume      connessione interrotta a meta' pacchetto: ripresa con Range
+    no-range    server che ignora Range: lettura sequenziale del pacchetto
+    hash        membro alterato nel pacchetto: UPD-008, installazione intatta, poi ripresa
+    signature   firma non valida: UPD-009, installazione intatta
+    unsafe      manifest con percorso "../": UPD-002, nulla scritto fuori
+    legacy      release senza manifest: archivio completo, ripreso dopo un'interruzione
+
+Ogni caso controlla anche che i file eliminati dalla release spariscano e che data/ e i file
+dell'utente restino. Nessuna installazione reale viene toccata.
+
+Uso:
+    python update_check.py                    # tutti i casi, exit code 1 se uno fallisce
+    python update_check.py --cases resume hash
+"""
+
+from __future__ import annotations
+
+import argparse
+import base64
+import json
+import os
+import random
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+from collections.abc import Callable
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any
+from unittest import mock
+
+import updater
+
+ARCHIVE, UPDATE_STEM = updater.platform_assets()
+PACK = UPDATE_STEM + updater.PACK_SUFFIX
+MANIFEST = UPDATE_STEM + updater.MANIFEST_SUFFIX
+USER_DATA = b"dati utente"
+
+
+class _ReleaseHandler(BaseHTTPRequestHandler):
+    """Release assets served from `root`, with the failure modes the cases need."""
+
+    root = "."
+    ranges = True
+    # Nomi per cui la prossima risposta di almeno DROP_MIN byte si interrompe a meta'
+    drop_once: set[str] = set()
+    DROP_MIN = 300_000
+    # (nome, header Range) di ogni richiesta
+    log: list[tuple[str, str | None]] = []
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        name = self.path.rsplit("/", 1)[1]
+        path = os.path.join(self.root, name)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        with open(path, "rb") as f:
+            data = f.read()
+        requested = self.headers.get("Range")
+        _ReleaseHandler.log.append((name, requested))
+        match = re.fullmatch(r"bytes=(\d+)-(\d*)", requested or "")
+        if match and self.ranges:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(data) - 1
+            body = data[start : end + 1]
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{len(data)}")
+        else:
+            body = data
+            self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if name in self.drop_once and len(body) >= self.DROP_MIN:
+            self.drop_once.discard(name)
+            self.wfile.write(body[: len(body) // 2])
+            self.wfile.flush()
+            self.connection.shutdown(2)
+            return
+        self.wfile.write(body)
+
+
+def _write_tree(root: str, files: dict[str, bytes]) -> None:
+    for rel, data in files.items():
+        path = os.path.join(root, *rel.split("/"))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "wb") as f:
+            f.write(data)
+
+
+def _read(path: str) -> bytes | None:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class UpdateCheck:
+    """Two synthetic releases, a local release server and one fresh v1 install per case."""
+
+    def __init__(self, work: str, seed: int) -> None:
+        self.work = work
+        rnd = random.Random(seed)
+        self.v1 = {f"lib/mod{i}.so": rnd.randbytes(150_000) for i in range(16)}
+        self.v1["MyNotes"] = b"release 1" * 1000
+        self.v1["lib/dropped.so"] = b"solo nella release 1"
+        self.v2 = {rel: data for rel, data in self.v1.items() if rel != "lib/dropped.so"}
+        self.v2["MyNotes"] = b"release 2" * 1000
+        self.v2["lib/mod3.so"] = rnd.randbytes(200_000)
+        # Due membri vicini nel pacchetto: scaricati con una sola richiesta
+        self.v2["lib/mod10.so"] = rnd.randbytes(150_000)
+        self.v2["lib/mod11.so"] = rnd.randbytes(200_000)
+        self.v2["lib/new/extra.dat"] = rnd.randbytes(20_000)
+
+        # Installazione 1 di riferimento, con il manifest che la release avrebbe installato
+        self.v1_dir = os.path.join(work, "v1")
+        _write_tree(self.v1_dir, self.v1)
+        _, v1_manifest = updater.build_update_pack(self.v1_dir, work, "v1", "1")
+        shutil.copy(v1_manifest, os.path.join(self.v1_dir, updater.INSTALLED_MANIFEST))
+        _write_tree(self.v1_dir, {"data/mynotes.db": USER_DATA, "user/appunti.txt": b"aggiunto dall'utente"})
+
+        # Release 2 come la pubblica la CI
+        v2_dir = os.path.join(work, "v2")
+        _write_tree(v2_dir, self.v2)
+        self.release = os.path.join(work, "release")
+        os.makedirs(self.release)
+        updater.build_update_pack(v2_dir, self.release, UPDATE_STEM, "2")
+        from cryptography.hazmat.primitives import serialization
+        from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+        key = Ed25519PrivateKey.generate()
+        private = key.private_bytes(
+            serialization.Encoding.Raw, serialization.PrivateFormat.Raw, serialization.NoEncryption()
+        )
+        public = key.public_key().public_bytes(serialization.Encoding.Raw, serialization.PublicFormat.Raw)
+        self.public_key = base64.b64encode(public).decode()
+        updater.sign_manifest(os.path.join(self.release, MANIFEST), base64.b64encode(private).decode())
+        with tarfile.open(os.path.join(self.release, ARCHIVE), "w:gz") as tar:
+            tar.add(v2_dir, "MyNotes")
+
+        _ReleaseHandler.root = self.release
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), _ReleaseHandler)
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/download/{ARCHIVE}"
+        self.errors: list[str] = []
+
+    def close(self) -> None:
+        self.server.shutdown()
+        self.server.server_close()
+
+    # --- Strumenti dei casi ---
+
+    def _expect(self, case: str, ok: bool, what: str) -> None:
+        if not ok:
+            self.errors.append(f"{case}: {what}")
+
+    def _install(self, case: str) -> str:
+        app_dir = os.path.join(self.work, "installs", case, "MyNotes")
+        shutil.copytree(self.v1_dir, app_dir)
+        return app_dir
+
+    def _update(self, app_dir: str, signed: bool = True) -> tuple[bool, str]:
+        """Run the updater on `app_dir`; (result, last progress message)."""
+        _ReleaseHandler.log.clear()
+        messages: list[str] = [""]
+        with (
+            mock.patch.object(updater, "APP_DIR", app_dir),
+            mock.patch.object(updater, "UPDATE_PUBLIC_KEY", self.public_key if signed else ""),
+        ):
+            ok = updater.download_and_apply_update(self.url, lambda _pct, msg: messages.append(msg))
+        return ok, messages[-1]
+
+    def _expect_updated(self, case: str, app_dir: str) -> None:
+        for rel, data in self.v2.items():
+            self._expect(case, _read(os.path.join(app_dir, *rel.split("/"))) == data, f"{rel} non aggiornato")
+        self._expect(case, not os.path.exists(os.path.join(app_dir, "lib", "dropped.so")), "file eliminato rimasto")
+        self._expect_user_files(case, app_dir)
+        self._expect(case, not os.path.exists(app_dir + updater.STAGING_SUFFIX), "cartella di preparazione rimasta")
+        self._expect(case, not os.path.exists(app_dir + updater.PREVIOUS_SUFFIX), "installazione precedente rimasta")
+
+    def _expect_untouched(self, case: str, app_dir: str) -> None:
+        for rel, data in self.v1.items():
+            self._expect(case, _read(os.path.join(app_dir, *rel.split("/"))) == data, f"{rel} modificato")
+        self._expect_user_files(case, app_dir)
+
+    def _expect_user_files(self, case: str, app_dir: str) -> None:
+        self._expect(case, _read(os.path.join(app_dir, "data", "mynotes.db")) == USER_DATA, "data/ modificata")
+        self._expect(case, os.path.exists(os.path.join(app_dir, "user", "appunti.txt")), "file dell'utente perso")
+
+    def _pack_requests(self) -> list[str | None]:
+        return [rng for name, rng in _ReleaseHandler.log if name == PACK]
+
+    # --- Casi ---
+
+    def case_resume(self) -> None:
+        app_dir = self._install("resume")
+        _ReleaseHandler.drop_once = {PACK}
+        ok, msg = self._update(app_dir)
+        self._expect("resume", ok, f"aggiornamento fallito: {msg}")
+        requests = self._pack_requests()
+        self._expect("resume", all(requests), f"richiesta del pacchetto senza Range: {requests}")
+        spans = [tuple(int(n) for n in rng.split("=")[1].split("-")) for rng in requests if rng]
+        # Ripresa: la stessa richiesta ripetuta dal primo membro non completato
+        resumed = any(b[1] == a[1] and b[0] > a[0] for i, a in enumerate(spans) for b in spans[i + 1 :])
+        self._expect("resume", resumed, f"nessuna ripresa: {requests}")
+        self._expect_updated("resume", app_dir)
+
+    def case_no_range(self) -> None:
+        app_dir = self._install("no-range")
+        _ReleaseHandler.ranges = False
+        try:
+            ok, msg = self._update(app_dir)
+        finally:
+            _ReleaseHandler.ranges = True
+        self._expect("no-range", ok, f"aggiornamento fallito: {msg}")
+        self._expect("no-range", len(self._pack_requests()) == 2, f"richieste: {self._pack_requests()}")
+        self._expect_updated("no-range", app_dir)
+
+    def case_hash(self) -> None:
+        app_dir = self._install("hash")
+        pack = os.path.join(self.release, PACK)
+        with open(os.path.join(self.release, MANIFEST)) as f:
+            member = json.load(f)["files"]["lib/mod11.so"]
+        original = _read(pack)
+        assert original is not None
+        tampered = bytearray(original)
+        tampered[member["offset"] + member["length"] // 2] ^= 0xFF
+        with open(pack, "wb") as f:
+            f.write(tampered)
+        try:
+            ok, msg = self._update(app_dir)
+        finally:
+            with open(pack, "wb") as f:
+                f.write(original)
+        self._expect("hash", not ok and "UPD-008" in msg, f"atteso UPD-008, ottenuto {ok} {msg!r}")
+        self._expect_untouched("hash", app_dir)
+        self._expect("hash", os.path.isdir(app_dir + updater.STAGING_SUFFIX), "preparazione non conservata")
+        # Il tentativo successivo scarica solo cio' che manca
+        ok, msg = self._update(app_dir)
+        self._expect("hash", ok, f"ripresa fallita: {msg}")
+        self._expect("hash", len(self._pack_requests()) == 1, f"ripresa: richieste {self._pack_requests()}")
+        self._expect_updated("hash", app_dir)
+
+    def case_signature(self) -> None:
+        app_dir = self._install("signature")
+        sig = os.path.join(self.release, MANIFEST + updater.SIGNATURE_SUFFIX)
+        good = _read(sig)
+        assert good is not None
+        with open(sig, "wb") as f:
+            f.write(base64.b64encode(b"x" * 64))
+        try:
+            ok, msg = self._update(app_dir)
+        finally:
+            with open(sig, "wb") as f:
+                f.write(good)
+        self._expect("signature", not ok and "UPD-009" in msg, f"atteso UPD-009, ottenuto {ok} {msg!r}")
+        self._expect("signature", PACK not in dict(_ReleaseHandler.log), "pacchetto scaricato con firma non valida")
+        self._expect_untouched("signature", app_dir)
+
+    def case_unsafe(self) -> None:
+        app_dir = self._install("unsafe")
+        path = os.path.join(self.release, MANIFEST)
+        original = _read(path)
+        assert original is not None
+        manifest = json.loads(original)
+        manifest["files"]["../escaped.so"] = manifest["files"].pop("lib/mod3.so")
+        with open(path, "w") as f:
+            json.dump(manifest, f)
+        try:
+            ok, msg = self._update(app_dir, signed=False)
+        finally:
+            with open(path, "wb") as f:
+                f.write(original)
+        self._expect("unsafe", not ok and "UPD-002" in msg, f"atteso UPD-002, ottenuto {ok} {msg!r}")
+        outside = os.path.join(os.path.dirname(app_dir), "escaped.so")
+        self._expect("unsafe", not os.path.exists(outside), "file scritto fuori dall'installazione")
+        self._expect_untouched("unsafe", app_dir)
+
+    def case_legacy(self) -> None:
+        app_dir = self._install("legacy")
+        hidden = os.path.join(self.work, "hidden-manifest")
+        shutil.move(os.path.join(self.release, MANIFEST), hidden)
+        _ReleaseHandler.drop_once = {ARCHIVE}
+        try:
+            ok, msg = self._update(app_dir, signed=False)
+        finally:
+            shutil.move(hidden, os.path.join(self.release, MANIFEST))
+        self._expect("legacy", ok, f"aggiornamento fallito: {msg}")
+        requests = [rng for name, rng in _ReleaseHandler.log if name == ARCHIVE]
+        self._expect("legacy", len(requests) == 2 and requests[1] is not None, f"nessuna ripresa: {requests}")
+        for rel, data in self.v2.items():
+            self._expect("legacy", _read(os.path.join(app_dir, *rel.split("/"))) == data, f"{rel} non aggiornato")
+        self._expect_user_files("legacy", app_dir)
+
+
+CASES: dict[str, Callable[[UpdateCheck], None]] = {
+    "resume": UpdateCheck.case_resume,
+    "no-range": UpdateCheck.case_no_range,
+    "hash": UpdateCheck.case_hash,
+    "signature": UpdateCheck.case_signature,
+    "unsafe": UpdateCheck.case_unsafe,
+    "legacy": UpdateCheck.case_legacy,
+}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Verifica dell'aggiornamento contro un server HTTP locale")
+    parser.add_argument("--cases", nargs="+", choices=list(CASES), default=list(CASES), help="casi da eseguire")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+    if sys.platform == "win32":
+        # Su Windows lo scambio lo fa uno script dopo la chiusura dell'app: qui non verificabile
+        print("La verifica richiede Linux o macOS.", file=sys.stderr)
+        return 2
+
+    work = tempfile.mkdtemp(prefix="mynotes-update-check-")
+    check = UpdateCheck(work, args.seed)
+    try:
+        for name in args.cases:
+            before = len(check.errors)
+            CASES[name](check)
+            status = "OK" if len(check.errors) == before else "FALLITO"
+            print(f"  {name:<10} {status}")
+    finally:
+        check.close()
+        shutil.rmtree(work, ignore_errors=True)
+
+    if check.errors:
+        print(f"\n{len(check.errors)} problema/i:")
+        for error in check.errors:
+            print(f"  {error}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
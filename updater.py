@@ -2,22 +2,28 @@
 
 from __future__ import annotations
 
+import contextlib
+import functools
+import hashlib
 import json
 import logging
 import os
 import shutil
 import ssl
+import struct
 import sys
 import tempfile
-from collections.abc import Callable
-from typing import Any
+import threading
+import time
+import zlib
+from collections.abc import Callable, Iterator
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any
 from urllib.error import URLError
 from urllib.request import Request, urlopen
 
-import certifi
-
 from error_codes import AppError
-from version import GITHUB_REPO, VERSION
+from version import GITHUB_REPO, UPDATE_PUBLIC_KEY, VERSION
 
 log: logging.Logger = logging.getLogger("updater")
 
@@ -29,6 +35,14 @@ else:
 SETTINGS_PATH: str = os.path.join(APP_DIR, "data", "update_settings.json")
 
 
+@functools.cache
+def _ssl_context() -> ssl.SSLContext:
+    # certifi viene caricato al primo accesso alla rete, non all'avvio dell'app
+    import certifi
+
+    return ssl.create_default_context(cafile=certifi.where())
+
+
 def get_update_settings() -> dict[str, Any]:
     """Ritorna le preferenze di aggiornamento con defaults."""
     defaults = {"auto_check": True, "skipped_versions": []}
@@ -61,6 +75,17 @@ def _parse_version(v: str) -> tuple[int, ...]:
     return tuple(parts)
 
 
+def platform_assets() -> tuple[str, str]:
+    """(full archive, update asset stem) of this platform in a release.
+
+    The differential update assets spell the platform in lower case: clients before them
+    take the first asset whose name contains "Windows" or "Linux".
+    """
+    if sys.platform == "win32":
+        return "MyNotes-Windows.zip", "MyNotes-update-windows"
+    return "MyNotes-Linux.tar.gz", "MyNotes-update-linux"
+
+
 def check_for_updates(skip_versions: list[str] | None = None) -> tuple[str, str, str] | None:
     """
     Controlla se esiste una versione più recente su GitHub.
@@ -77,7 +102,7 @@ def check_for_updates(skip_versions: list[str] | None = None) -> tuple[str, str,
     url = f"https://api.github.com/repos/{GITHUB_REPO}/releases/latest"
     log.info("Richiesta API: %s", url)
     try:
-        ctx = ssl.create_default_context(cafile=certifi.where())
+        ctx = _ssl_context()
         req = Request(url, headers={"Accept": "application/vnd.github.v3+json"})
         with urlopen(req, timeout=10, context=ctx) as resp:
             raw = resp.read().decode()
@@ -104,21 +129,19 @@ def check_for_updates(skip_versions: list[str] | None = None) -> tuple[str, str,
         log.info("Versione %s nella lista skip, ignorata", tag)
         return None
 
-    # Trova l'asset giusto per questa piattaforma
-    is_windows = sys.platform == "win32"
-    target = "Windows" if is_windows else "Linux"
+    # L'archivio completo di questa piattaforma, per nome esatto (non pacchetto, manifest o firma)
+    target = platform_assets()[0]
     asset_names = [a.get("name", "") for a in data.get("assets", [])]
-    log.info("Piattaforma: %s, asset disponibili: %s", target, asset_names)
+    log.info("Archivio atteso: %s, asset disponibili: %s", target, asset_names)
 
     download_url = None
     for asset in data.get("assets", []):
-        name = asset.get("name", "")
-        if target in name:
+        if asset.get("name", "") == target:
             download_url = asset.get("browser_download_url")
             break
 
     if not download_url:
-        log.warning("Nessun asset trovato per piattaforma '%s'", target)
+        log.warning("Nessun asset '%s' nella release", target)
         return None
 
     notes = data.get("body", "")
@@ -126,51 +149,572 @@ def check_for_updates(skip_versions: list[str] | None = None) -> tuple[str, str,
     return (tag, download_url, notes)
 
 
-def download_and_apply_update(download_url: str, progress_callback: Callable[[int, str], None] | None = None) -> bool:
+# --- Aggiornamento differenziale e verificato ---
+#
+# Ogni release pubblica, accanto all'archivio completo, un pacchetto "<stem>-files.zip"
+# (un membro compresso per file), un manifest "<stem>.manifest.json" con sha256, offset e
+# lunghezza di ogni membro nel pacchetto, e la firma Ed25519 del manifest (".sig"); <stem>
+# viene da platform_assets().
+# Il client verifica la firma con UPDATE_PUBLIC_KEY, confronta gli hash con i file
+# installati e scarica con richieste HTTP Range solo i membri cambiati, in parallelo: ogni
+# membro viene decompresso e verificato mentre arriva, direttamente nella nuova
+# installazione. Questa si prepara in una cartella accanto all'app (i file invariati sono
+# hard link, senza copia) e prende il posto di quella corrente con due rename; se uno
+# fallisce, l'installazione corrente torna al suo posto. Su Windows i rename li fa uno
+# script dopo la chiusura dell'app. I file gia' verificati restano nella cartella di
+# preparazione: un aggiornamento interrotto riparte da dove era arrivato.
+#
+# Le release senza manifest (precedenti) si scaricano per intero e si copiano sopra
+# l'installazione; con una chiave pubblica configurata il manifest firmato e' obbligatorio.
+
+MANIFEST_FORMAT = "mynotes-update"
+MANIFEST_VERSION = 1
+MANIFEST_SUFFIX = ".manifest.json"
+SIGNATURE_SUFFIX = ".sig"
+PACK_SUFFIX = "-files.zip"
+# Manifest dell'ultima installazione: dice quali file di una release vecchia non esistono piu'
+INSTALLED_MANIFEST = "update_manifest.json"
+# File e cartelle dell'installazione che un aggiornamento non tocca mai
+_PRESERVED = {"data", INSTALLED_MANIFEST}
+# Cartelle accanto ad APP_DIR: nuova installazione in preparazione, precedente durante lo scambio
+STAGING_SUFFIX = ".update"
+PREVIOUS_SUFFIX = ".previous"
+
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_RETRIES = 3
+# Membri separati da meno di cosi' (header, file invariati) si scaricano con una sola richiesta
+RUN_GAP = 256 * 1024
+_CHUNK_SIZE = 65536
+_LEGACY_PREFIX = "mynotes_update_"
+
+# Local file header di zip: firma, versione, flag, metodo, ora, data, crc, dimensioni, lunghezze nome/extra
+_ZIP_LOCAL_HEADER = struct.Struct("<4s5H3I2H")
+
+
+def _file_sha256(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _release_files(app_dir: str) -> Iterator[str]:
+    """Paths (relative, with "/") of the files an update manages: everything but data/."""
+    for dirpath, dirnames, filenames in os.walk(app_dir):
+        rel_dir = os.path.relpath(dirpath, app_dir)
+        if rel_dir == ".":
+            dirnames[:] = sorted(d for d in dirnames if d not in _PRESERVED)
+        else:
+            dirnames.sort()
+        for name in sorted(filenames):
+            rel = name if rel_dir == "." else os.path.join(rel_dir, name)
+            if rel not in _PRESERVED:
+                yield rel.replace(os.sep, "/")
+
+
+def _local_path(root: str, rel: str) -> str:
+    """`rel` under `root`; names from a manifest must have passed _check_manifest() first."""
+    return os.path.join(root, *rel.split("/"))
+
+
+def _is_safe_name(rel: Any) -> bool:
+    """A relative "/"-separated path that stays inside the installation and out of data/."""
+    if not isinstance(rel, str) or not rel or "\\" in rel or ":" in rel or "\0" in rel:
+        return False
+    parts = rel.split("/")
+    return parts[0] not in _PRESERVED and all(part not in ("", ".", "..") for part in parts)
+
+
+def _check_manifest(manifest: dict[str, Any]) -> None:
+    """Reject a manifest whose names could write outside the installation (AppError UPD-002).
+
+    Runs before any file is touched: absolute paths, ".." components, drive letters,
+    backslashes and the preserved data/ are refused, and so is a pack that is not a plain
+    file name next to the manifest.
     """
-    Scarica l'aggiornamento e lo applica.
-    progress_callback(percentage, message) viene chiamato durante il download.
-    Ritorna True se l'aggiornamento è stato applicato e serve un riavvio.
+    files = manifest.get("files")
+    pack = manifest.get("pack")
+    if not isinstance(files, dict) or not isinstance(pack, str) or "/" in pack or not _is_safe_name(pack):
+        raise AppError("UPD-002", "manifest non valido")
+    for rel, meta in files.items():
+        if not _is_safe_name(rel):
+            raise AppError("UPD-002", f"manifest: percorso non valido {rel!r}")
+        if not isinstance(meta, dict) or not all(
+            isinstance(meta.get(key), int) for key in ("size", "offset", "length", "method")
+        ):
+            raise AppError("UPD-002", f"manifest: voce non valida per {rel!r}")
+        if not isinstance(meta.get("sha256"), str):
+            raise AppError("UPD-002", f"manifest: hash mancante per {rel!r}")
+
+
+# --- Lato release ---
+
+
+def build_update_pack(app_dir: str, out_dir: str, asset_stem: str, version: str) -> tuple[str, str]:
+    """Write `<asset_stem>-files.zip` and `<asset_stem>.manifest.json` for a built app.
+
+    Returns (pack path, manifest path).
+    """
+    import zipfile
+
+    pack_name = asset_stem + PACK_SUFFIX
+    pack_path = os.path.join(out_dir, pack_name)
+    files: dict[str, dict[str, Any]] = {}
+    with zipfile.ZipFile(pack_path, "w", zipfile.ZIP_DEFLATED, compresslevel=9) as zf:
+        for rel in _release_files(app_dir):
+            src = _local_path(app_dir, rel)
+            zf.write(src, rel)
+            files[rel] = {"size": os.path.getsize(src), "sha256": _file_sha256(src)}
+    # Offset dei dati di ogni membro, letti dagli header locali effettivamente scritti
+    with zipfile.ZipFile(pack_path) as zf, open(pack_path, "rb") as raw:
+        for info in zf.infolist():
+            raw.seek(info.header_offset)
+            header = _ZIP_LOCAL_HEADER.unpack(raw.read(_ZIP_LOCAL_HEADER.size))
+            name_len, extra_len = header[-2], header[-1]
+            files[info.filename].update(
+                offset=info.header_offset + _ZIP_LOCAL_HEADER.size + name_len + extra_len,
+                length=info.compress_size,
+                method=info.compress_type,
+            )
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": MANIFEST_VERSION,
+        "app_version": version,
+        "pack": pack_name,
+        "files": files,
+    }
+    manifest_path = os.path.join(out_dir, asset_stem + MANIFEST_SUFFIX)
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    return pack_path, manifest_path
+
+
+def sign_manifest(manifest_path: str, private_key: str) -> str:
+    """Write `<manifest>.sig`, the base64 Ed25519 signature of the manifest bytes, and return its path.
+
+    `private_key` is the base64 of the raw 32-byte key (release workflow secret).
+    """
+    import base64
+
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey
+
+    key = Ed25519PrivateKey.from_private_bytes(base64.b64decode(private_key))
+    with open(manifest_path, "rb") as f:
+        signature = key.sign(f.read())
+    path = manifest_path + SIGNATURE_SUFFIX
+    with open(path, "w") as f:
+        f.write(base64.b64encode(signature).decode())
+    return path
+
+
+# --- Download ---
+
+
+class _Progress:
+    """Byte counter shared by the download threads."""
+
+    def __init__(self, total: int, callback: Callable[[int, str], None] | None, label: str) -> None:
+        self.total = total
+        self.done = 0
+        self._callback = callback
+        self._label = label
+        self._lock = threading.Lock()
+
+    def add(self, n: int) -> None:
+        with self._lock:
+            self.done += n
+            done = self.done
+        if self._callback and self.total > 0:
+            pct = min(100, int(done * 100 / self.total))
+            self._callback(pct, f"{self._label}: {done // 1024} / {self.total // 1024} KB")
+
+
+def _open_url(url: str, start: int = 0, end: int | None = None, timeout: int = 60) -> Any:
+    headers = {}
+    if start or end is not None:
+        headers["Range"] = f"bytes={start}-{'' if end is None else end}"
+    return urlopen(Request(url, headers=headers), timeout=timeout, context=_ssl_context())
+
+
+def _read_url(url: str) -> bytes:
+    with _open_url(url, timeout=30) as resp:
+        data: bytes = resp.read()
+    return data
+
+
+def _verify_signature(manifest_raw: bytes, signature_b64: bytes) -> None:
+    import base64
+
+    from cryptography.exceptions import InvalidSignature
+    from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PublicKey
+
+    key = Ed25519PublicKey.from_public_bytes(base64.b64decode(UPDATE_PUBLIC_KEY))
+    try:
+        key.verify(base64.b64decode(signature_b64), manifest_raw)
+    except (InvalidSignature, ValueError) as e:
+        raise AppError("UPD-009", "firma non corrispondente") from e
+
+
+def _fetch_manifest(download_url: str) -> tuple[str, dict[str, Any]] | None:
+    """(base URL of the release assets, verified manifest), or None for releases without one.
+
+    With UPDATE_PUBLIC_KEY set the manifest must carry a valid signature (AppError UPD-009).
     """
-    is_windows = sys.platform == "win32"
-    tmp_dir = tempfile.mkdtemp(prefix="mynotes_update_")
+    base = download_url.rsplit("/", 1)[0]
+    url = f"{base}/{platform_assets()[1]}{MANIFEST_SUFFIX}"
+    try:
+        raw = _read_url(url)
+    except (URLError, OSError) as e:
+        if UPDATE_PUBLIC_KEY:
+            raise AppError("UPD-009", f"manifest non disponibile: {e}") from e
+        log.info("Manifest non disponibile (%s): download completo", e)
+        return None
+    if UPDATE_PUBLIC_KEY:
+        try:
+            signature = _read_url(url + SIGNATURE_SUFFIX)
+        except (URLError, OSError) as e:
+            raise AppError("UPD-009", f"firma non disponibile: {e}") from e
+        _verify_signature(raw, signature)
+    else:
+        log.warning("Chiave pubblica aggiornamenti non configurata: firma del manifest non verificata")
+    try:
+        manifest: dict[str, Any] = json.loads(raw)
+    except ValueError as e:
+        raise AppError("UPD-002", f"manifest: {e}") from e
+    if manifest.get("format") != MANIFEST_FORMAT or manifest.get("version", 0) > MANIFEST_VERSION:
+        raise AppError("UPD-002", "manifest non riconosciuto")
+    _check_manifest(manifest)
+    return base, manifest
+
 
+def _verified(path: str, meta: dict[str, Any]) -> bool:
     try:
-        # --- Download ---
-        if progress_callback:
-            progress_callback(0, "Download in corso...")
+        return bool(os.path.getsize(path) == meta["size"] and _file_sha256(path) == meta["sha256"])
+    except OSError:
+        return False
+
+
+def _changed_files(manifest: dict[str, Any], app_dir: str) -> list[str]:
+    """Files of the manifest missing from `app_dir` or with a different hash (hashed in parallel)."""
+    files = manifest["files"]
+    names = sorted(files)
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        same = pool.map(lambda rel: _verified(_local_path(app_dir, rel), files[rel]), names)
+        return [rel for rel, ok in zip(names, same, strict=True) if not ok]
+
+
+def _foreign_files(manifest: dict[str, Any], app_dir: str) -> list[str]:
+    """Files in `app_dir` that belong to no release (added by the user): carried into the new install.
+
+    Files of the previous release (per its installed manifest) that the new one dropped are not.
+    """
+    try:
+        with open(os.path.join(app_dir, INSTALLED_MANIFEST)) as f:
+            previous = set(json.load(f)["files"])
+    except (OSError, ValueError, KeyError):
+        previous = set()
+    return [rel for rel in _release_files(app_dir) if rel not in manifest["files"] and rel not in previous]
+
+
+def _read_exact(resp: Any, n: int, sink: Callable[[bytes], None] | None = None) -> None:
+    """Read `n` bytes from the response, passing them to `sink` (discarded if None)."""
+    while n > 0:
+        chunk = resp.read(min(n, _CHUNK_SIZE))
+        if not chunk:
+            raise OSError(f"connessione chiusa con {n} byte mancanti")
+        n -= len(chunk)
+        if sink is not None:
+            sink(chunk)
+
+
+def _inflate_member(resp: Any, meta: dict[str, Any], dest: str, progress: _Progress) -> None:
+    """Decompress one member straight from the response into `dest`, hashing while bytes arrive."""
+    import zipfile
+
+    method = meta["method"]
+    if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+        raise AppError("UPD-005", f"metodo di compressione {method} non supportato")
+    decompressor = zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None
+    h = hashlib.sha256()
+    part = dest + ".part"
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    with open(part, "wb") as out:
+
+        def _write(chunk: bytes) -> None:
+            data = decompressor.decompress(chunk) if decompressor else chunk
+            h.update(data)
+            out.write(data)
+            progress.add(len(chunk))
+
+        try:
+            _read_exact(resp, meta["length"], _write)
+            if decompressor:
+                tail = decompressor.flush()
+                h.update(tail)
+                out.write(tail)
+        except BaseException as e:
+            out.close()
+            os.remove(part)
+            if isinstance(e, zlib.error):
+                raise AppError("UPD-008", f"{os.path.basename(dest)}: {e}") from e
+            raise
+    if h.hexdigest() != meta["sha256"]:
+        os.remove(part)
+        raise AppError("UPD-008", os.path.basename(dest))
+    # Il nome definitivo solo per file verificati: alla ripresa valgono come gia' scaricati
+    os.replace(part, dest)
+
+
+def _plan_runs(names: list[str], files: dict[str, Any]) -> list[list[str]]:
+    """Group members by position in the pack: each group is fetched with one Range request."""
+    runs: list[list[str]] = []
+    end = -1
+    for rel in sorted(names, key=lambda r: files[r]["offset"]):
+        meta = files[rel]
+        if runs and meta["offset"] - end <= RUN_GAP:
+            runs[-1].append(rel)
+        else:
+            runs.append([rel])
+        end = meta["offset"] + meta["length"]
+    return runs
+
 
-        archive_name = "update.zip" if is_windows else "update.tar.gz"
-        archive_path = os.path.join(tmp_dir, archive_name)
+def _stream_run(url: str, run: list[str], files: dict[str, Any], new_dir: str, progress: _Progress) -> bool:
+    """Fetch a run of members in one request and inflate them into `new_dir`, resuming after errors.
 
+    Returns False if the server ignored the Range header (the whole pack was read).
+    """
+    done = 0
+    last_error: Exception | None = None
+    for attempt in range(DOWNLOAD_RETRIES):
+        first, last = files[run[done]], files[run[-1]]
+        start = first["offset"]
         try:
-            ctx = ssl.create_default_context(cafile=certifi.where())
-            req = Request(download_url)
-            with urlopen(req, timeout=120, context=ctx) as resp:
-                total = int(resp.headers.get("Content-Length", 0))
-                downloaded = 0
-                chunk_size = 65536
-
-                with open(archive_path, "wb") as f:
-                    while True:
-                        chunk = resp.read(chunk_size)
-                        if not chunk:
-                            break
+            with _open_url(url, start, last["offset"] + last["length"] - 1) as resp:
+                # Un server che ignora Range manda il pacchetto dall'inizio: si salta fino al membro
+                ranged: bool = resp.status == 206
+                pos = start if ranged else 0
+                while done < len(run):
+                    meta = files[run[done]]
+                    _read_exact(resp, meta["offset"] - pos)
+                    _inflate_member(resp, meta, _local_path(new_dir, run[done]), progress)
+                    pos = meta["offset"] + meta["length"]
+                    done += 1
+            return ranged
+        except (URLError, OSError) as e:
+            last_error = e
+            log.warning("Download interrotto su %s (tentativo %d): %s", run[done], attempt + 1, e)
+            time.sleep(min(2**attempt, 5))
+    raise AppError("UPD-004", str(last_error))
+
+
+def _link_or_copy(src: str, dst: str) -> None:
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    with contextlib.suppress(FileNotFoundError):
+        os.remove(dst)
+    try:
+        # Stesso filesystem (cartella accanto all'app): nessun byte copiato
+        os.link(src, dst)
+    except OSError:
+        # FAT32/exFAT (chiavette USB) non hanno hard link
+        shutil.copy2(src, dst)
+
+
+def _prepare_install(
+    base_url: str, manifest: dict[str, Any], new_dir: str, progress_callback: Callable[[int, str], None] | None
+) -> None:
+    """Build the complete new installation in `new_dir` (everything but data/)."""
+    files = manifest["files"]
+    changed = _changed_files(manifest, APP_DIR)
+    os.makedirs(new_dir, exist_ok=True)
+    # Cambiati gia' scaricati e verificati da un tentativo precedente
+    todo = [rel for rel in changed if not _verified(_local_path(new_dir, rel), files[rel])]
+    total = sum(files[rel]["length"] for rel in todo)
+    log.info(
+        "Aggiornamento: %d file cambiati su %d, %d da scaricare (%d KB)",
+        len(changed),
+        len(files),
+        len(todo),
+        total // 1024,
+    )
+
+    changed_set = set(changed)
+    carried = [rel for rel in files if rel not in changed_set] + _foreign_files(manifest, APP_DIR)
+    for rel in carried:
+        _link_or_copy(_local_path(APP_DIR, rel), _local_path(new_dir, rel))
+    # Avanzi di una preparazione per un'altra release
+    expected = set(files) | set(carried)
+    for rel in list(_release_files(new_dir)):
+        if rel not in expected:
+            os.remove(_local_path(new_dir, rel))
+
+    progress = _Progress(total, progress_callback, "Download")
+    runs = _plan_runs(todo, files)
+    pack_url = f"{base_url}/{manifest['pack']}"
+    if runs and not _stream_run(pack_url, runs[0], files, new_dir, progress):
+        # Server senza Range: un solo passaggio sul pacchetto intero invece di uno per gruppo
+        log.warning("Il server non supporta richieste Range: lettura sequenziale del pacchetto")
+        runs = [sorted((rel for run in runs[1:] for rel in run), key=lambda r: files[r]["offset"])]
+        runs = [run for run in runs if run]
+    else:
+        runs = runs[1:]
+    with ThreadPoolExecutor(max_workers=DOWNLOAD_WORKERS) as pool:
+        for future in [pool.submit(_stream_run, pack_url, run, files, new_dir, progress) for run in runs]:
+            future.result()
+
+    with open(os.path.join(new_dir, INSTALLED_MANIFEST), "w") as f:
+        json.dump(manifest, f)
+
+
+# --- Applicazione ---
+
+
+def _swap_in(new_dir: str, app_dir: str) -> None:
+    """Put `new_dir` in place of `app_dir` and move data/ across; on error the old install is put back."""
+    previous = app_dir + PREVIOUS_SUFFIX
+    shutil.rmtree(previous, ignore_errors=True)
+    os.rename(app_dir, previous)
+    try:
+        os.rename(new_dir, app_dir)
+        try:
+            if os.path.exists(os.path.join(previous, "data")):
+                os.rename(os.path.join(previous, "data"), os.path.join(app_dir, "data"))
+        except OSError:
+            os.rename(app_dir, new_dir)
+            raise
+    except OSError:
+        os.rename(previous, app_dir)
+        raise
+    # I file in uso restano validi per il processo corrente (inode aperti)
+    shutil.rmtree(previous, ignore_errors=True)
+
+
+def _write_wait_for_exit(f: IO[str], exe_name: str) -> None:
+    f.write("@echo off\n")
+    f.write("echo Aggiornamento MyNotes in corso...\n")
+    f.write("echo Attendo chiusura MyNotes...\n")
+    # Attendi che MyNotes.exe non sia piu' in esecuzione (max 60s)
+    f.write(":wait_loop\n")
+    f.write(f'tasklist /FI "IMAGENAME eq {exe_name}" 2>nul | find /I "{exe_name}" >nul\n')
+    f.write("if %errorlevel%==0 (\n")
+    f.write("    timeout /t 1 /nobreak >nul\n")
+    f.write("    goto wait_loop\n")
+    f.write(")\n")
+    f.write("timeout /t 1 /nobreak >nul\n")  # extra 1s sicurezza
+
+
+def _launch_script(bat_path: str) -> None:
+    import subprocess
+
+    subprocess.Popen(
+        ["cmd", "/c", bat_path],
+        creationflags=0x00000008,  # DETACHED_PROCESS
+        close_fds=True,
+    )
+
+
+def _create_windows_swap_script(new_dir: str, app_dir: str) -> None:
+    """Crea un .bat che, chiusa l'app, fa gli stessi rename di _swap_in (con ripristino) e la riavvia."""
+    tmp_dir = tempfile.mkdtemp(prefix=_LEGACY_PREFIX)
+    bat_path = os.path.join(tmp_dir, "update.bat")
+    exe_name = "MyNotes.exe"
+    app, new, previous = (p.replace("/", "\\") for p in (app_dir, new_dir, app_dir + PREVIOUS_SUFFIX))
+
+    with open(bat_path, "w") as f:
+        _write_wait_for_exit(f, exe_name)
+        f.write(f'if exist "{previous}" rmdir /s /q "{previous}"\n')
+        f.write(f'move "{app}" "{previous}" >nul || goto failed\n')
+        f.write(f'move "{new}" "{app}" >nul || goto rollback_app\n')
+        f.write(f'if exist "{previous}\\data" move "{previous}\\data" "{app}\\data" >nul || goto rollback_data\n')
+        f.write(f'rmdir /s /q "{previous}"\n')
+        f.write("echo Aggiornamento completato!\n")
+        f.write("goto restart\n")
+        f.write(":rollback_data\n")
+        f.write(f'move "{app}" "{new}" >nul\n')
+        f.write(":rollback_app\n")
+        f.write(f'move "{previous}" "{app}" >nul\n')
+        f.write(":failed\n")
+        f.write("echo Aggiornamento non riuscito: ripristinata la versione precedente\n")
+        f.write(":restart\n")
+        # Riavvia l'app
+        f.write(f'start "" "{app}\\{exe_name}"\n')
+        # Auto-pulizia
+        f.write(f'rmdir /s /q "{tmp_dir.replace("/", chr(92))}"\n')
+        f.write("exit\n")
+
+    _launch_script(bat_path)
+
+
+def _download_archive(url: str, part_path: str, progress: _Progress) -> None:
+    """Download `url` into `part_path`, resuming from what is already there.
+
+    A network error is retried DOWNLOAD_RETRIES times from where it stopped; a server that
+    ignores Range sends the whole file again and the download restarts.
+    """
+    last_error: Exception | None = None
+    for attempt in range(DOWNLOAD_RETRIES):
+        have = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        try:
+            with _open_url(url, have, timeout=120) as resp:
+                if have and resp.status != 206:
+                    progress.add(-have)
+                    have = 0
+                expected = int(resp.headers.get("Content-Length", 0))
+                if not progress.total and expected:
+                    progress.total = have + expected
+                received = 0
+                with open(part_path, "ab" if have else "wb") as f:
+                    while chunk := resp.read(_CHUNK_SIZE):
                         f.write(chunk)
-                        downloaded += len(chunk)
-                        if progress_callback and total > 0:
-                            pct = int(downloaded * 100 / total)
-                            progress_callback(pct, f"Download: {downloaded // 1024} / {total // 1024} KB")
+                        received += len(chunk)
+                        progress.add(len(chunk))
+            if expected and received < expected:
+                raise OSError(f"connessione chiusa dopo {received} di {expected} byte")
+            return
         except (URLError, OSError) as e:
-            raise AppError("UPD-004", str(e)) from e
+            last_error = e
+            log.warning("Download archivio interrotto (tentativo %d): %s", attempt + 1, e)
+            time.sleep(min(2**attempt, 5))
+    raise AppError("UPD-004", str(last_error))
 
-        if progress_callback:
-            progress_callback(100, "Estrazione archivio...")
 
-        # --- Estrazione ---
-        extract_dir = os.path.join(tmp_dir, "extracted")
-        os.makedirs(extract_dir, exist_ok=True)
+def _legacy_dir(download_url: str) -> str:
+    """Download directory of this release, kept after a failure so the next attempt resumes.
 
+    Leftovers of other releases are removed.
+    """
+    tmp_root = tempfile.gettempdir()
+    tmp_dir = os.path.join(tmp_root, _LEGACY_PREFIX + hashlib.sha256(download_url.encode()).hexdigest()[:16])
+    with contextlib.suppress(OSError):
+        for name in os.listdir(tmp_root):
+            path = os.path.join(tmp_root, name)
+            if name.startswith(_LEGACY_PREFIX) and path != tmp_dir:
+                shutil.rmtree(path, ignore_errors=True)
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tmp_dir
+
+
+def _legacy_update(download_url: str, progress_callback: Callable[[int, str], None] | None) -> None:
+    """Release senza manifest: archivio completo scaricato, estratto e copiato sopra l'installazione."""
+    tmp_dir = _legacy_dir(download_url)
+    extract_dir = os.path.join(tmp_dir, "extracted")
+    try:
+        is_windows = sys.platform == "win32"
+        archive_path = os.path.join(tmp_dir, "update.zip" if is_windows else "update.tar.gz")
+        if not os.path.exists(archive_path):
+            part = archive_path + ".part"
+            # Totale letto dalla prima risposta; quanto gia' scaricato conta subito
+            progress = _Progress(0, progress_callback, "Download")
+            if os.path.exists(part):
+                progress.add(os.path.getsize(part))
+            _download_archive(download_url, part, progress)
+            os.replace(part, archive_path)
+
+        if progress_callback:
+            progress_callback(100, "Estrazione archivio...")
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        os.makedirs(extract_dir)
         try:
             if archive_path.endswith(".zip"):
                 import zipfile
@@ -194,30 +738,71 @@ def download_and_apply_update(download_url: str, progress_callback: Callable[[in
 
         if progress_callback:
             progress_callback(100, "Applicazione aggiornamento...")
-
-        # --- Applicazione ---
         try:
             if is_windows:
                 _create_windows_update_script(source_dir, APP_DIR, tmp_dir)
-            else:
-                _apply_files(source_dir, APP_DIR)
-                shutil.rmtree(tmp_dir, ignore_errors=True)
+                return
+            _apply_files(source_dir, APP_DIR)
         except Exception as e:
             raise AppError("UPD-006", str(e)) from e
+    except AppError as e:
+        # L'archivio (anche parziale) resta per il prossimo tentativo, se non e' lui il problema
+        if e.code == "UPD-005":
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        else:
+            shutil.rmtree(extract_dir, ignore_errors=True)
+        raise
+    except BaseException:
+        shutil.rmtree(extract_dir, ignore_errors=True)
+        raise
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def download_and_apply_update(download_url: str, progress_callback: Callable[[int, str], None] | None = None) -> bool:
+    """
+    Scarica l'aggiornamento e lo applica.
+    Con il manifest della release scarica solo i file cambiati, verificandoli mentre arrivano,
+    e sostituisce l'installazione in un colpo solo; altrimenti archivio completo.
+    progress_callback(percentage, message) viene chiamato durante il download.
+    Ritorna True se l'aggiornamento è stato applicato e serve un riavvio.
+    """
+    try:
+        if progress_callback:
+            progress_callback(0, "Download in corso...")
+
+        release = _fetch_manifest(download_url)
+        if release is None:
+            _legacy_update(download_url, progress_callback)
+            return True
+
+        base_url, manifest = release
+        new_dir = APP_DIR + STAGING_SUFFIX
+        try:
+            _prepare_install(base_url, manifest, new_dir, progress_callback)
+        except OSError as e:
+            raise AppError("UPD-006", str(e)) from e
 
+        if progress_callback:
+            progress_callback(100, "Applicazione aggiornamento...")
+        try:
+            if sys.platform == "win32":
+                _create_windows_swap_script(new_dir, APP_DIR)
+            else:
+                _swap_in(new_dir, APP_DIR)
+        except OSError as e:
+            raise AppError("UPD-006", str(e)) from e
         return True
 
     except AppError as e:
+        # La cartella di preparazione resta: il prossimo tentativo riparte dai file gia' verificati
         log.error("Aggiornamento fallito: %s", e)
         if progress_callback:
             progress_callback(-1, str(e))
-        shutil.rmtree(tmp_dir, ignore_errors=True)
         return False
     except Exception as e:
         log.error("Errore imprevisto aggiornamento: %s: %s", type(e).__name__, e)
         if progress_callback:
             progress_callback(-1, f"Errore imprevisto: {e}")
-        shutil.rmtree(tmp_dir, ignore_errors=True)
         return False
 
 
@@ -251,17 +836,7 @@ def _create_windows_update_script(source_dir: str, app_dir: str, tmp_dir: str) -
     exe_path = os.path.join(app_dir, exe_name)
 
     with open(bat_path, "w") as f:
-        f.write("@echo off\n")
-        f.write("echo Aggiornamento MyNotes in corso...\n")
-        f.write("echo Attendo chiusura MyNotes...\n")
-        # Attendi che MyNotes.exe non sia piu' in esecuzione (max 60s)
-        f.write(":wait_loop\n")
-        f.write(f'tasklist /FI "IMAGENAME eq {exe_name}" 2>nul | find /I "{exe_name}" >nul\n')
-        f.write("if %errorlevel%==0 (\n")
-        f.write("    timeout /t 1 /nobreak >nul\n")
-        f.write("    goto wait_loop\n")
-        f.write(")\n")
-        f.write("timeout /t 1 /nobreak >nul\n")  # extra 1s sicurezza
+        _write_wait_for_exit(f, exe_name)
         # Copia file (non data/)
         for item in os.listdir(source_dir):
             if item == "data":
@@ -280,14 +855,7 @@ def _create_windows_update_script(source_dir: str, app_dir: str, tmp_dir: str) -
         f.write(f'rmdir /s /q "{tmp_dir.replace("/", chr(92))}"\n')
         f.write("exit\n")
 
-    # Lancia lo script in background
-    import subprocess
-
-    subprocess.Popen(
-        ["cmd", "/c", bat_path],
-        creationflags=0x00000008,  # DETACHED_PROCESS
-        close_fds=True,
-    )
+    _launch_script(bat_path)
 
 
 def get_restart_command() -> list[str]:
@@ -2,3 +2,5 @@ from __future__ import annotations
 
 VERSION: str = "3.13.0"
 GITHUB_REPO: str = "gamerhateyou/MyNotes"
+# Chiave pubblica Ed25519 (base64) che firma i manifest degli aggiornamenti; iniettata dalla build
+UPDATE_PUBLIC_KEY: str = ""